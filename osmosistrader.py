@@ -1,531 +1,5790 @@
-import tkinter as tk
-from tkinter import ttk, messagebox, simpledialog
-import threading
 import time
+_PROCESS_START = time.perf_counter()  # For --profile-startup
+try:
+    import tkinter as tk
+    from tkinter import ttk, messagebox, simpledialog
+except ImportError:
+    # Servers without Tk can still run the order engine with --headless
+    tk = None
+import threading
 import json
+import bisect
+import functools
+import heapq
+import itertools
+import math
+import queue
+import random
+import re
+import signal
 import subprocess
-from datetime import datetime
+import tempfile
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+from decimal import Decimal
+from fractions import Fraction
 import os
+import sys
 
-class OsmosisClient:
-    """Simple client for interacting with Osmosis"""
+class Asset:
+    """Metadata for a single token denomination"""
+    __slots__ = ("symbol", "denom", "decimals", "display_decimals", "scale", "price_probe", "pools", "aliases")
     
-    def __init__(self, root=None):
-        # Wallet information
-        self.wallet_name = "cl"  # Your wallet name
-        self.wallet_address = "osmo1yjamm9zkmqmyvqc5wjfha9egg4r4ha9nzkvpsd"
-        self.root = root
+    def __init__(self, symbol, denom, decimals, display_decimals=None, price_probe=1.0, aliases=()):
+        self.symbol = sys.intern(symbol)
+        self.denom = sys.intern(denom)
+        # Other denoms that name the same token (e.g. a chain-registry unit alias)
+        self.aliases = tuple(sys.intern(alias) for alias in aliases if alias != denom)
+        self.decimals = decimals
+        # Places shown for trade amounts (never more than the token supports)
+        self.display_decimals = display_decimals if display_decimals is not None else min(decimals, 6)
+        self.scale = 10 ** decimals
+        # Amount (in display units) used for spot price probes
+        self.price_probe = price_probe
+        # Names of the trading pairs this asset belongs to
+        self.pools = set()
+    
+    def __repr__(self):
+        return f"Asset({self.symbol}, {self.decimals} decimals)"
 
-        # Initialize with the correct pool IDs and token denominations
-        self.pools = {
-            "OSMO/USDC": {
-                "pool_id": "1464", 
-                "base_denom": "uosmo", 
-                "quote_denom": "ibc/498A0751C798A0D9A389AA3691123DADA57DAA4FE165D5C75894505B876BA6E4"
-            },
-            "BTC/USDC": {
-                "pool_id": "1943", 
-                "base_denom": "factory/osmo1z6r6qdknhgsc0zeracktgpcxf43j6sekq07nw8sxduc9lg0qjjlqfu25e3/alloyed/allBTC", 
-                "quote_denom": "ibc/498A0751C798A0D9A389AA3691123DADA57DAA4FE165D5C75894505B876BA6E4"
-            },
-            "ETH/USDC": {
-                "pool_id": "1948", 
-                "base_denom": "factory/osmo1k6c8jln7ejuqwtqmay3yvzrg3kueaczl96pk067ldg8u835w0yhsw27twm/alloyed/allETH", 
-                "quote_denom": "ibc/498A0751C798A0D9A389AA3691123DADA57DAA4FE165D5C75894505B876BA6E4"
-            },
-        }
 
-        self.balances = {
-            "USDC": 0,
-            "OSMO": 0,
-            "BTC": 0,
-            "ETH": 0
-        }
-        self.last_balance_update = 0
+class AssetRegistry:
+    """Central lookup table for token decimals, symbols and pool membership
 
-    def get_wallet_balances(self, force_update=False):
-        """Get current wallet balances with caching"""
-        # Only update once per hour unless forced
-        if not force_update and time.time() - self.last_balance_update < 3600:
-            return self.balances
+    Assets come from the built-in defaults, optionally overridden by an
+    assets.json config. The config may use the simple format below (with
+    optional "aliases") or a chain-registry assetlist (assets[].base /
+    denom_units / symbol, where the base unit's aliases are registered too).
+    Aliases resolve to the same asset in every denom lookup.
+    """
+    
+    DEFAULT_ASSETS = [
+        {"symbol": "OSMO", "denom": "uosmo", "decimals": 6, "display_decimals": 6, "price_probe": 1.0},
+        {"symbol": "BTC", "denom": "factory/osmo1z6r6qdknhgsc0zeracktgpcxf43j6sekq07nw8sxduc9lg0qjjlqfu25e3/alloyed/allBTC",
+         "decimals": 8, "display_decimals": 8, "price_probe": 0.001},
+        {"symbol": "ETH", "denom": "factory/osmo1k6c8jln7ejuqwtqmay3yvzrg3kueaczl96pk067ldg8u835w0yhsw27twm/alloyed/allETH",
+         "decimals": 18, "display_decimals": 6, "price_probe": 0.001},
+        {"symbol": "USDC", "denom": "ibc/498A0751C798A0D9A389AA3691123DADA57DAA4FE165D5C75894505B876BA6E4",
+         "decimals": 6, "display_decimals": 6, "price_probe": 1.0},
+    ]
+    
+    # Unknown denoms are assumed to use the common Osmosis precision
+    DEFAULT_DECIMALS = 6
+    
+    def __init__(self, config_file="assets.json"):
+        self.config_file = config_file
+        self._by_denom = {}
+        self._by_symbol = {}
+        
+        for entry in self.DEFAULT_ASSETS:
+            self.register(Asset(**entry))
+        
+        if os.path.exists(self.config_file):
+            self.load_config(self.config_file)
+    
+    def register(self, asset):
+        """Add or replace an asset"""
+        previous = self._by_symbol.get(asset.symbol)
+        if previous is not None:
+            asset.pools |= previous.pools
+            for denom in (previous.denom,) + previous.aliases:
+                self._by_denom.pop(denom, None)
+        for denom in (asset.denom,) + asset.aliases:
+            self._by_denom[denom] = asset
+        self._by_symbol[asset.symbol] = asset
+        return asset
+    
+    def load_config(self, path):
+        """Load assets from a simple config or a chain-registry assetlist"""
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
             
+            entries = data.get("assets", []) if isinstance(data, dict) else data
+            for entry in entries:
+                if "denom_units" in entry:
+                    asset = self._from_chain_registry(entry)
+                else:
+                    asset = Asset(
+                        entry["symbol"], entry["denom"], int(entry["decimals"]),
+                        entry.get("display_decimals"), float(entry.get("price_probe", 1.0)),
+                        entry.get("aliases", ())
+                    )
+                if asset:
+                    self.register(asset)
+        except Exception as e:
+            print(f"Error loading asset config {path}: {e}")
+    
+    @staticmethod
+    def _from_chain_registry(entry):
+        """Build an asset from a chain-registry assetlist entry"""
+        display = entry.get("display")
+        exponent = 0
+        aliases = []
+        for unit in entry.get("denom_units", []):
+            if int(unit.get("exponent", 0)) == 0:
+                aliases += [unit.get("denom")] + list(unit.get("aliases", []))
+        for unit in entry.get("denom_units", []):
+            if unit.get("denom") == display:
+                exponent = int(unit.get("exponent", 0))
+                break
+        else:
+            exponent = max((int(u.get("exponent", 0)) for u in entry.get("denom_units", [])), default=0)
+        
+        if not entry.get("base") or not entry.get("symbol"):
+            return None
+        return Asset(entry["symbol"], entry["base"], exponent, aliases=[alias for alias in aliases if alias])
+    
+    def register_pool(self, pair, base_denom, quote_denom):
+        """Record that both denoms trade in the given pair"""
+        for denom in (base_denom, quote_denom):
+            asset = self._by_denom.get(denom)
+            if asset is not None:
+                asset.pools.add(pair)
+    
+    def by_denom(self, denom):
+        return self._by_denom.get(denom)
+    
+    def by_symbol(self, symbol):
+        return self._by_symbol.get(symbol)
+    
+    def symbols(self):
+        return list(self._by_symbol)
+    
+    def asset_for(self, denom):
+        """Get the asset for a denom, describing unknown denoms with default precision"""
+        asset = self._by_denom.get(denom)
+        if asset is None:
+            asset = Asset(denom.split('/')[-1], denom, self.DEFAULT_DECIMALS)
+        return asset
+    
+    def decimals(self, denom):
+        asset = self._by_denom.get(denom)
+        return asset.decimals if asset is not None else self.DEFAULT_DECIMALS
+    
+    def symbol(self, denom):
+        """Get a human-readable symbol for a denom"""
+        asset = self._by_denom.get(denom)
+        if asset is not None:
+            return asset.symbol
+        return denom.split('/')[-1]
+    
+    def display_decimals(self, symbol):
+        asset = self._by_symbol.get(symbol)
+        return asset.display_decimals if asset is not None else self.DEFAULT_DECIMALS
+    
+    def to_human(self, amount, denom):
+        """Convert a raw base-unit amount to display units"""
+        return int(amount) / self.asset_for(denom).scale
+    
+    def to_base_units(self, amount, denom):
+        """Convert a display-unit amount to integer base units (exact, truncating)"""
+        return TokenAmount.from_human(amount, self.asset_for(denom)).raw
+    
+    def amount(self, value, symbol):
+        """Build a TokenAmount from a display-unit value for a symbol"""
+        asset = self._by_symbol.get(symbol)
+        if asset is None:
+            raise ValueError(f"Unknown token: {symbol}")
+        return TokenAmount.from_human(value, asset)
+    
+    def format_amount(self, amount, symbol):
+        """Format a display-unit amount with the token's display precision"""
+        return f"{amount:.{self.display_decimals(symbol)}f}"
+
+
+@functools.lru_cache(maxsize=4096)
+def price_ratio(value):
+    """Exact (numerator, denominator) for a decimal price such as a limit price"""
+    if isinstance(value, tuple):
+        return value
+    return Decimal(str(value)).as_integer_ratio()
+
+
+def price_compare(ratio_a, ratio_b):
+    """Compare two (numerator, denominator) prices: -1, 0 or 1"""
+    left = ratio_a[0] * ratio_b[1]
+    right = ratio_b[0] * ratio_a[1]
+    return (left > right) - (left < right)
+
+
+@functools.total_ordering
+class TokenAmount:
+    """Exact token amount held as integer base units plus its asset
+
+    Scaling, comparison and conversion stay in integer arithmetic; the
+    decimal string is only produced when the amount is formatted.
+    """
+    __slots__ = ("raw", "asset")
+    
+    def __init__(self, raw, asset):
+        self.raw = int(raw)
+        self.asset = asset
+    
+    @classmethod
+    def from_human(cls, value, asset):
+        """Build from a display-unit value, truncating below the token's precision"""
+        if isinstance(value, TokenAmount):
+            return value if value.asset is asset else cls(value._aligned_raw(asset.decimals), asset)
+        if isinstance(value, int):
+            return cls(value * asset.scale, asset)
+        if not isinstance(value, Decimal):
+            # str() of a float is its shortest round-tripping form, so 0.1 stays 0.1
+            text = str(value).strip()
+            whole, _, frac = text.partition(".")
+            # Plain "123.456" strings are split with integer math; anything
+            # else (exponents, signs, junk) goes through Decimal
+            if whole.isdigit() and (not frac or frac.isdigit()):
+                decimals = asset.decimals
+                return cls(int(whole) * asset.scale + int(frac[:decimals].ljust(decimals, "0") or 0), asset)
+            value = Decimal(text)
+        # Exact ratio rather than scaleb(), which rounds past 28 digits
+        numerator, denominator = value.as_integer_ratio()
+        raw = abs(numerator) * asset.scale // denominator
+        return cls(-raw if numerator < 0 else raw, asset)
+    
+    @property
+    def decimals(self):
+        return self.asset.decimals
+    
+    @property
+    def symbol(self):
+        return self.asset.symbol
+    
+    def to_decimal(self):
+        """Exact value in display units"""
+        # Built from a string: Decimal arithmetic would round to 28 digits
+        return Decimal(f"{self.raw}E-{self.asset.decimals}")
+    
+    def __float__(self):
+        return self.raw / self.asset.scale
+    
+    def __bool__(self):
+        return self.raw != 0
+    
+    def _aligned_raw(self, decimals):
+        """Raw amount expressed with a different number of decimals (truncating)"""
+        shift = decimals - self.asset.decimals
+        if shift >= 0:
+            return self.raw * 10 ** shift
+        return self.raw // 10 ** -shift
+    
+    def _compare_key(self, other):
+        """Exact values of self and other on a common scale"""
+        if not isinstance(other, TokenAmount):
+            # Plain numbers compare by exact value, like Decimal and Fraction do
+            if not isinstance(other, (int, float, Decimal, Fraction)):
+                raise TypeError(f"can't compare TokenAmount with {type(other).__name__}")
+            return Fraction(self.raw, self.asset.scale), Fraction(other)
+        if other.asset.decimals == self.asset.decimals:
+            return self.raw, other.raw
+        decimals = max(self.asset.decimals, other.asset.decimals)
+        return self.raw * 10 ** (decimals - self.asset.decimals), other.raw * 10 ** (decimals - other.asset.decimals)
+    
+    def __eq__(self, other):
         try:
-            cmd = ["osmosisd", "q", "bank", "balances", self.wallet_address, "--output", "json"]
-            result = subprocess.run(cmd, capture_output=True, text=True)
+            mine, theirs = self._compare_key(other)
+        except (TypeError, ValueError, ArithmeticError):
+            return NotImplemented
+        return mine == theirs
+    
+    def __lt__(self, other):
+        mine, theirs = self._compare_key(other)
+        return mine < theirs
+    
+    def __hash__(self):
+        # Equal amounts (and numbers) hash alike whatever their decimals
+        return hash(Fraction(self.raw, self.asset.scale))
+    
+    def __add__(self, other):
+        if isinstance(other, TokenAmount):
+            return TokenAmount(self.raw + other._aligned_raw(self.asset.decimals), self.asset)
+        return TokenAmount(self.raw + TokenAmount.from_human(other, self.asset).raw, self.asset)
+    
+    __radd__ = __add__
+    
+    def __sub__(self, other):
+        if isinstance(other, TokenAmount):
+            return TokenAmount(self.raw - other._aligned_raw(self.asset.decimals), self.asset)
+        return TokenAmount(self.raw - TokenAmount.from_human(other, self.asset).raw, self.asset)
+    
+    def __neg__(self):
+        return TokenAmount(-self.raw, self.asset)
+    
+    def scale(self, numerator, denominator=1):
+        """Multiply by an exact ratio, rounding down"""
+        return TokenAmount(self.raw * numerator // denominator, self.asset)
+    
+    def apply_bps(self, bps):
+        """Reduce by a tolerance in basis points (e.g. 30 for 0.3% slippage)"""
+        return TokenAmount(self.raw * (10_000 - bps) // 10_000, self.asset)
+    
+    def convert(self, price, out_asset):
+        """Convert at a price quoted as out_asset per this asset (display units)
+
+        price may be a number or an exact (numerator, denominator) ratio.
+        """
+        numerator, denominator = price_ratio(price)
+        raw = self.raw * numerator * out_asset.scale // (denominator * self.asset.scale)
+        return TokenAmount(raw, out_asset)
+    
+    def format(self, places=None):
+        """Decimal string with the given (or the asset's display) precision, truncated"""
+        if places is None:
+            places = self.asset.display_decimals
+        decimals = self.asset.decimals
+        sign = "-" if self.raw < 0 else ""
+        whole, frac = divmod(abs(self.raw), self.asset.scale)
+        if places <= 0:
+            return f"{sign}{whole}"
+        digits = str(frac).rjust(decimals, "0")[:places].ljust(places, "0")
+        return f"{sign}{whole}.{digits}"
+    
+    def __format__(self, spec):
+        # Fixed-point specs (".6f") are rendered exactly; anything else goes via float
+        if not spec:
+            return self.format()
+        if spec.startswith(".") and spec.endswith("f") and spec[1:-1].isdigit():
+            return self.format(int(spec[1:-1]))
+        return format(float(self), spec)
+    
+    def __str__(self):
+        return self.format()
+    
+    def __repr__(self):
+        return f"TokenAmount({self.format(self.asset.decimals)} {self.asset.symbol})"
+
+
+class BalanceLedger:
+    """Wallet balances in base units, kept current from confirmed swaps
+
+    A full chain query seeds the ledger; after that each confirmed swap
+    applies its exact in/out/fee deltas. The ledger asks for a re-sync
+    when its sync is older than resync_interval or a drift check fails.
+    """
+    
+    def __init__(self, assets, resync_interval=900):
+        self.assets = assets
+        self.resync_interval = resync_interval
+        self._raw = {}  # denom -> base units
+        self._lock = threading.Lock()
+        
+        # Recently applied tx hashes so a confirmation is never counted twice
+        self._applied = set()
+        self._applied_order = deque(maxlen=500)
+        
+        self.last_sync = 0
+        self.sync_height = 0     # Chain height the last full query reflects
+        self.height = 0          # Highest height applied so far
+        self.drift_reason = "not synced"
+    
+    def sync(self, chain_balances, height=0):
+        """Replace the ledger with a full chain query (denom -> base units)"""
+        with self._lock:
+            if self.last_sync and not self.drift_reason:
+                # Report drift between the incremental view and the chain
+                drift = {
+                    self.assets.symbol(denom): chain_balances.get(denom, 0) - self._raw.get(denom, 0)
+                    for denom in set(chain_balances) | set(self._raw)
+                    if chain_balances.get(denom, 0) != self._raw.get(denom, 0)
+                }
+                if drift:
+                    print(f"Balance ledger drift corrected: {drift}")
             
-            if result.returncode == 0:
-                balances = json.loads(result.stdout)['balances']
-                
-                # Reset all balances first
-                self.balances = {k: 0 for k in self.balances}
-                
-                # Parse balances
-                for balance in balances:
-                    amount = balance['amount']
-                    denom = balance['denom']
-                    
-                    if denom == "uosmo":
-                        self.balances["OSMO"] = float(amount) / 1_000_000
-                    elif "allBTC" in denom:
-                        self.balances["BTC"] = float(amount) / 100_000_000
-                    elif "allETH" in denom:
-                        self.balances["ETH"] = float(amount) / 1_000_000_000_000_000_000
-                    elif "ibc/498A0751C798A0D9A389AA3691123DADA57DAA4FE165D5C75894505B876BA6E4" in denom:
-                        self.balances["USDC"] = float(amount) / 1_000_000
-                
-                self.last_balance_update = time.time()
+            self._raw = dict(chain_balances)
+            self.last_sync = time.time()
+            self.sync_height = height
+            self.height = max(self.height, height)
+            self.drift_reason = None
+    
+    def apply_swap(self, tx_hash, denom_in, amount_in_raw, denom_out, amount_out_raw, fees=(), height=0):
+        """Apply a confirmed swap's deltas; returns False if it was skipped"""
+        with self._lock:
+            if tx_hash in self._applied:
+                return False
+            
+            if len(self._applied_order) == self._applied_order.maxlen:
+                self._applied.discard(self._applied_order[0])
+            self._applied.add(tx_hash)
+            self._applied_order.append(tx_hash)
+            
+            # Balances queried at or after this block already include the swap
+            if height and height <= self.sync_height:
+                return False
+            
+            deltas = [(denom_in, -int(amount_in_raw)), (denom_out, int(amount_out_raw))]
+            deltas.extend((denom, -int(amount)) for denom, amount in fees)
+            for denom, delta in deltas:
+                self._raw[denom] = self._raw.get(denom, 0) + delta
                 
-        except Exception as e:
-            print(f"Error fetching balances: {e}")
+                # A negative balance means we missed a transfer somewhere
+                if self._raw[denom] < 0:
+                    self.drift_reason = f"negative {self.assets.symbol(denom)} balance after {tx_hash}"
             
-        return self.balances
+            self.height = max(self.height, height)
+            return True
+    
+    def warm_start(self, raw_balances):
+        """Show last known balances until the first chain sync (still counts as unsynced)"""
+        with self._lock:
+            if not self.last_sync:
+                self._raw = dict(raw_balances)
+    
+    def mark_drift(self, reason):
+        """Force a re-sync on the next balance read"""
+        with self._lock:
+            self.drift_reason = reason
+    
+    def needs_sync(self):
+        return bool(self.drift_reason) or time.time() - self.last_sync > self.resync_interval
+    
+    def balance(self, denom):
+        """Balance of a denom in base units"""
+        return self._raw.get(denom, 0)
+    
+    def amount(self, symbol):
+        """Balance of a symbol as a TokenAmount"""
+        asset = self.assets.by_symbol(symbol)
+        if asset is None:
+            raise ValueError(f"Unknown token: {symbol}")
+        return TokenAmount(self._raw.get(asset.denom, 0), asset)
+    
+    def snapshot(self, symbols):
+        """TokenAmount balances for the given symbols"""
+        with self._lock:
+            return {symbol: self.amount(symbol) for symbol in symbols}
+    
+    def raw_snapshot(self):
+        """Highest applied height and a copy of the raw balances (for warm_start on the next run)"""
+        with self._lock:
+            return self.height, dict(self._raw)
 
-    def _parse_token_amount(self, token_string):
-        """Parse a token string like '1000000uosmo' into amount and denom"""
-        try:
-            # Find the position where the numeric part ends
-            for i, char in enumerate(token_string):
-                if not (char.isdigit()):
-                    amount = token_string[:i]
-                    denom = token_string[i:]
-                    return {'amount': int(amount), 'denom': denom}
-                    
-            # If we get here, the string was only digits
+
+class BalanceReservations:
+    """Funds committed to resting orders, checked against the balance ledger
+
+    Each order reserves its input amount plus a gas allowance when it is
+    created. Creating, cancelling and filling an order are O(1) updates to
+    per-denom totals, so an order that can't be funded is rejected up front
+    instead of failing its broadcast when it triggers.
+    """
+    
+    # Gas held back per resting order (gas auto x 0.035uosmo is ~0.01 OSMO)
+    FEE_RESERVE_UOSMO = 10_000
+    
+    def __init__(self, ledger, assets):
+        self.ledger = ledger
+        self.assets = assets
+        self._reserved = {}    # denom -> reserved base units
+        self._by_key = {}      # order id -> [(denom, base units)]
+        self._tx_keys = {}     # tx hash -> order id, for fills awaiting confirmation
+        self._lock = threading.Lock()
+    
+    def _needs(self, symbol, amount):
+        """Base-unit requirements for spending amount of symbol"""
+        asset = self.assets.by_symbol(symbol)
+        if asset is None:
+            raise ValueError(f"Unknown token: {symbol}")
+        amount = TokenAmount.from_human(amount, asset)
+        needs = {amount.asset.denom: amount.raw}
+        needs["uosmo"] = needs.get("uosmo", 0) + self.FEE_RESERVE_UOSMO
+        return needs
+    
+    def available(self, denom):
+        """Balance not yet committed to resting orders"""
+        return self.ledger.balance(denom) - self._reserved.get(denom, 0)
+    
+    def _shortfall(self, needs):
+        """First (denom, missing) pair that can't be covered, or None"""
+        # Without a chain sync there is nothing to check against
+        if not self.ledger.last_sync:
             return None
+        for denom, raw in needs.items():
+            missing = raw - self.available(denom)
+            if missing > 0:
+                return denom, missing
+        return None
+    
+    def _error(self, shortfall):
+        denom, missing = shortfall
+        asset = self.assets.asset_for(denom)
+        return f"Insufficient {asset.symbol}: {TokenAmount(missing, asset)} more needed"
+    
+    def check(self, symbol, amount):
+        """Raise ValueError if amount of symbol isn't available right now"""
+        with self._lock:
+            shortfall = self._shortfall(self._needs(symbol, amount))
+        if shortfall:
+            raise ValueError(self._error(shortfall))
+    
+    def reserve(self, key, symbol, amount, force=False):
+        """Reserve funds for a resting order; raises ValueError if they aren't available"""
+        needs = self._needs(symbol, amount)
+        with self._lock:
+            if key in self._by_key:
+                return
+            shortfall = None if force else self._shortfall(needs)
+            if shortfall:
+                raise ValueError(self._error(shortfall))
+            
+            for denom, raw in needs.items():
+                self._reserved[denom] = self._reserved.get(denom, 0) + raw
+            self._by_key[key] = list(needs.items())
+    
+    def release(self, key):
+        """Return an order's reservation to the available balance"""
+        with self._lock:
+            for denom, raw in self._by_key.pop(key, ()):
+                self._reserved[denom] -= raw
+    
+    def can_fill(self, key):
+        """Whether the wallet still holds what this order reserved"""
+        with self._lock:
+            return all(self.ledger.balance(denom) >= raw for denom, raw in self._by_key.get(key, ()))
+    
+    def hold_for_tx(self, key, tx_hash):
+        """Keep a filled order's reservation until its swap is confirmed"""
+        with self._lock:
+            self._tx_keys[tx_hash] = key
+    
+    def release_tx(self, tx_hash):
+        """Release the reservation of a fill once the ledger reflects it"""
+        with self._lock:
+            key = self._tx_keys.pop(tx_hash, None)
+        if key is not None:
+            self.release(key)
+    
+    @staticmethod
+    def key_for(order):
+        """Reservation key of a resting order: the legs of an OCO group share one"""
+        return order.get('oco') or order['id']
+    
+    def rebuild(self, pending_orders):
+        """Reserve funds for orders loaded from disk (never rejects)"""
+        amounts = {}
+        for order in pending_orders:
+            key = self.key_for(order)
+            symbol, amount = amounts.get(key, (order['from_token'], 0))
+            amounts[key] = (symbol, max(amount, order['amount']))
+        for key, (symbol, amount) in amounts.items():
+            try:
+                self.reserve(key, symbol, amount, force=True)
+            except Exception as e:
+                print(f"Error reserving funds for {key}: {e}")
+    
+    def reserved(self, symbol):
+        """Reserved amount of a symbol as a TokenAmount"""
+        asset = self.assets.by_symbol(symbol)
+        if asset is None:
+            raise ValueError(f"Unknown token: {symbol}")
+        return TokenAmount(self._reserved.get(asset.denom, 0), asset)
+
+
+class PoolRegistry:
+    """Trading pools by pair name, pool id and denom pair
+
+    Named pairs (BASE/QUOTE) come from the built-in defaults, optionally
+    extended by a pools.json config:
+
+        {"pools": [{"pair": "ATOM/USDC", "pool_id": "1282", "base": "ATOM", "quote": "USDC"}]}
+
+    (base_denom / quote_denom may be given instead of symbols). Both assets
+    must be in the AssetRegistry, so ATOM above needs an assets.json entry;
+    entries that don't resolve are reported and skipped. Every pool
+    on chain can also be discovered with `osmosisd q poolmanager all-pools`;
+    discovery results are cached in pool_cache.json together with the block
+    height they were read at, and re-fetched once they are max_age_blocks
+    old. All pools are indexed by unordered denom pair, configured pools
+    first, so finding a pool for a swap is a dict lookup.
+    """
+    
+    DEFAULT_POOLS = [
+        {"pair": "OSMO/USDC", "pool_id": "1464", "base": "OSMO", "quote": "USDC"},
+        {"pair": "BTC/USDC", "pool_id": "1943", "base": "BTC", "quote": "USDC"},
+        {"pair": "ETH/USDC", "pool_id": "1948", "base": "ETH", "quote": "USDC"},
+    ]
+    
+    def __init__(self, assets, config_file="pools.json", cache_file="pool_cache.json", max_age_blocks=14_400):
+        self.assets = assets
+        self.config_file = config_file
+        self.cache_file = cache_file
+        self.max_age_blocks = max_age_blocks  # ~1 day of blocks
+        
+        self.pools = {}        # pair name -> configured pool
+        self._by_id = {}       # pool id -> pool
+        self._by_denoms = {}   # (denom, denom) sorted -> [pool, ...], configured pools first
+        self.discovered_height = 0
+        self._lock = threading.Lock()
+        
+        for entry in self.DEFAULT_POOLS:
+            self._add_configured(entry)
+        if os.path.exists(self.config_file):
+            self.load_config(self.config_file)
+        self._load_cache()
+    
+    @staticmethod
+    def _key(denom_a, denom_b):
+        return (denom_a, denom_b) if denom_a < denom_b else (denom_b, denom_a)
+    
+    def load_config(self, path):
+        """Add configured pairs from a pools.json file, skipping invalid entries"""
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
         except Exception as e:
-            print(f"Error parsing token amount '{token_string}': {str(e)}")
-            return None
+            print(f"Error loading pool config {path}: {e}")
+            return
+        for entry in data.get("pools", []) if isinstance(data, dict) else data:
+            try:
+                self._add_configured(entry)
+            except (KeyError, TypeError, ValueError) as e:
+                print(f"Skipping pool config entry {entry}: {e}")
     
-    def _convert_to_human_readable(self, amount, denom):
-        """Convert raw token amount to human-readable form based on denomination"""
+    def _resolve(self, entry, side):
+        """Denom of an entry's base or quote asset; raises ValueError if the registry doesn't know it"""
+        denom = entry.get(f"{side}_denom")
+        if denom is not None:
+            asset = self.assets.by_denom(denom)
+            if asset is None:
+                raise ValueError(f"unknown {side} denom {denom} (add it to assets.json)")
+            return asset.denom   # An alias resolves to the on-chain denom
+        if side not in entry:
+            raise ValueError(f"missing {side} or {side}_denom")
+        asset = self.assets.by_symbol(entry[side])
+        if asset is None:
+            raise ValueError(f"unknown {side} asset {entry[side]} (add it to assets.json)")
+        return asset.denom
+    
+    def _add_configured(self, entry):
+        base_denom = self._resolve(entry, "base")
+        quote_denom = self._resolve(entry, "quote")
+        if "pool_id" not in entry:
+            raise ValueError("missing pool_id")
+        pair = entry.get("pair") or f"{self.assets.symbol(base_denom)}/{self.assets.symbol(quote_denom)}"
+        
+        pool = {
+            "pool_id": str(entry["pool_id"]),
+            "base_denom": base_denom,
+            "quote_denom": quote_denom,
+            "denoms": [base_denom, quote_denom],
+            "pair": pair
+        }
+        previous = self.pools.get(pair)
+        if previous is not None:
+            self._unindex(previous)
+        self.pools[pair] = pool
+        self._index(pool, self._by_id, self._by_denoms, first=True)
+        self.assets.register_pool(pair, base_denom, quote_denom)
+    
+    def _index(self, pool, by_id, by_denoms, first=False):
+        by_id[pool["pool_id"]] = pool
+        denoms = pool["denoms"]
+        # Multi-asset pools trade every pair of their assets
+        for i, denom_a in enumerate(denoms):
+            for denom_b in denoms[i + 1:]:
+                bucket = by_denoms.setdefault(self._key(denom_a, denom_b), [])
+                if first:
+                    bucket.insert(0, pool)
+                else:
+                    bucket.append(pool)
+    
+    def _unindex(self, pool):
+        self._by_id.pop(pool["pool_id"], None)
+        for bucket in self._by_denoms.values():
+            if pool in bucket:
+                bucket.remove(pool)
+    
+    def find(self, denom_in, denom_out):
+        """Preferred pool for swapping between two denoms, or None"""
+        bucket = self._by_denoms.get(self._key(denom_in, denom_out))
+        return bucket[0] if bucket else None
+    
+    def candidates(self, denom_in, denom_out):
+        """Every known pool that trades the two denoms, configured ones first"""
+        return list(self._by_denoms.get(self._key(denom_in, denom_out), ()))
+    
+    def by_id(self, pool_id):
+        return self._by_id.get(str(pool_id))
+    
+    def denom_index(self):
+        """The (denom, denom) -> pools index; replaced, not mutated, on discovery"""
+        return self._by_denoms
+    
+    def pair_for(self, denom_in, denom_out):
+        """Configured pair name for two denoms, or None"""
+        pool = self.find(denom_in, denom_out)
+        return pool.get("pair") if pool else None
+    
+    def symbols(self):
+        """Symbols of the configured pairs, bases first, in config order"""
+        pools = list(self.pools.values())
+        return list(dict.fromkeys(
+            [self.assets.symbol(pool["base_denom"]) for pool in pools]
+            + [self.assets.symbol(pool["quote_denom"]) for pool in pools]
+        ))
+    
+    def base_symbols(self, quote_symbol):
+        """Symbols with a configured pair against quote_symbol, in config order"""
+        return [pool_pair.split('/')[0] for pool_pair in self.pools if pool_pair.endswith(f"/{quote_symbol}")]
+    
+    def __len__(self):
+        return len(self._by_id)
+    
+    # -- Discovery --
+    
+    def needs_discovery(self, height):
+        """Whether the discovered pool set is older than max_age_blocks"""
+        return not self.discovered_height or (height and height - self.discovered_height > self.max_age_blocks)
+    
+    def refresh(self, height):
+        """Re-discover pools if the cache is stale for this block height"""
+        if self.needs_discovery(height):
+            self.discover(height)
+    
+    def discover(self, height=0):
+        """Query every pool on chain, index them and cache the result; returns the count"""
         try:
-            if denom == "uosmo":
-                # OSMO has 6 decimals
-                return amount / 1_000_000
-            elif "allBTC" in denom:
-                # BTC has 8 decimals
-                return amount / 100_000_000
-            elif "allETH" in denom or "factory/osmo1k6c8jln7ejuqwtqmay3yvzrg3kueaczl96pk067ldg8u835w0yhsw27twm/alloyed/allETH" in denom:
-                # ETH has 18 decimals
-                return amount / 1_000_000_000_000_000_000
-            elif "ibc/498A0751C798A0D9A389AA3691123DADA57DAA4FE165D5C75894505B876BA6E4" in denom:
-                # USDC has 6 decimals
-                return amount / 1_000_000
-            else:
-                # Default to 6 decimals for unknown tokens
-                return amount / 1_000_000
+            cmd = ["osmosisd", "q", "poolmanager", "all-pools", "--output", "json"]
+            result = subprocess.run(cmd, capture_output=True, text=True)
+            if result.returncode != 0:
+                raise ValueError(result.stderr.strip() or "all-pools query failed")
+            raw_pools = json.loads(result.stdout).get("pools", [])
         except Exception as e:
-            print(f"Error converting amount {amount} with denom {denom}: {str(e)}")
+            print(f"Error discovering pools: {e}")
             return 0
-
-
-    def get_pool_price(self, pair: str) -> dict:
-        """Get the current price for a trading pair using poolmanager estimate-swap-exact-amount-in"""
-        # Cache for successful price queries
-        if not hasattr(self, 'price_cache'):
-            self.price_cache = {}
         
-        # Add cache cleanup to prevent memory growth
-        if len(self.price_cache) > 15:  # Limit cache to 15 entries
-            # Remove oldest entries
-            oldest_pairs = sorted(self.price_cache.keys(), 
-                                key=lambda k: self.price_cache[k]['timestamp'])[:5]
-            for old_pair in oldest_pairs:
-                del self.price_cache[old_pair]
+        pools = [pool for pool in map(self._parse_pool, raw_pools) if pool]
+        self._apply_discovered(pools, height)
         
         try:
-            pool = self.pools.get(pair)
-            if not pool:
-                raise ValueError(f"Unsupported trading pair: {pair}")
-                
-            pool_id = pool["pool_id"]
-            base_denom = pool["base_denom"]
-            quote_denom = pool["quote_denom"]
-            
-            # Use small amounts for price queries to avoid slippage
-            # Set appropriate test amounts based on token decimal places
-            test_amount_base = None
-            base_decimals = 6  # Default for most tokens
-            
-            if pair == "OSMO/USDC":
-                test_amount_base = "1000000uosmo"  # 1 OSMO (6 decimals)
-                base_decimals = 6
-            elif pair == "BTC/USDC":
-                test_amount_base = "100000factory/osmo1z6r6qdknhgsc0zeracktgpcxf43j6sekq07nw8sxduc9lg0qjjlqfu25e3/alloyed/allBTC"  # 0.001 BTC (8 decimals)
-                base_decimals = 8
-            elif pair == "ETH/USDC":
-                test_amount_base = "1000000000000000factory/osmo1k6c8jln7ejuqwtqmay3yvzrg3kueaczl96pk067ldg8u835w0yhsw27twm/alloyed/allETH"  # 0.001 ETH (18 decimals)
-                base_decimals = 18
-            
-            # USDC has 6 decimals
-            test_amount_quote = "1000000ibc/498A0751C798A0D9A389AA3691123DADA57DAA4FE165D5C75894505B876BA6E4"  # 1 USDC
-            quote_decimals = 6
-            
-            # Query price base -> quote using estimate-single-pool-swap-exact-amount-in
-            base_to_quote_cmd = [
-                "osmosisd", "query", "poolmanager", "estimate-single-pool-swap-exact-amount-in",
-                pool_id, test_amount_base, quote_denom,
-                "--output", "json"
-            ]
-            
-            base_to_quote_result = subprocess.run(base_to_quote_cmd, capture_output=True, text=True)
-            
-            if base_to_quote_result.returncode != 0:
-                # Check if this is the known spread factor error
-                if "spread factor charge must be non-negative" in base_to_quote_result.stderr:
-                    print(f"Using cached values for {pair} due to spread factor issue")
-                    # Use cached price if available
-                    if pair in self.price_cache:
-                        print(f"Using cached price from {self.price_cache[pair]['timestamp']}")
-                        return self.price_cache[pair]['data']
-                    else:
-                        raise ValueError(f"Failed to get base->quote price and no cache available")
-                else:
-                    print(f"Full stderr for {pair}: {base_to_quote_result.stderr}")
-                    print(f"Full stdout for {pair}: {base_to_quote_result.stdout}")
-                    raise ValueError(f"Failed to get base->quote price: {base_to_quote_result.stderr}")
-                    
-            base_to_quote_data = json.loads(base_to_quote_result.stdout)
-            base_to_quote_amount = int(base_to_quote_data["token_out_amount"])
-            
-            # Query price quote -> base using estimate-single-pool-swap-exact-amount-in
-            quote_to_base_cmd = [
-                "osmosisd", "query", "poolmanager", "estimate-single-pool-swap-exact-amount-in",
-                pool_id, test_amount_quote, base_denom,
-                "--output", "json"
-            ]
-            
-            quote_to_base_result = subprocess.run(quote_to_base_cmd, capture_output=True, text=True)
+            tmp_path = f"{self.cache_file}.tmp"
+            with open(tmp_path, 'w') as f:
+                f.write(json.dumps({'height': height, 'fetched_at': time.time(), 'pools': pools}))
+            os.replace(tmp_path, self.cache_file)
+        except Exception as e:
+            print(f"Error writing pool cache: {e}")
         
-            if quote_to_base_result.returncode != 0:
-                # Check if this is the known spread factor error
-                if "spread factor charge must be non-negative" in quote_to_base_result.stderr:
-                    print(f"Using cached values for {pair} due to spread factor issue")
-                    # Use cached price if available
-                    if pair in self.price_cache:
-                        print(f"Using cached price from {self.price_cache[pair]['timestamp']}")
-                        return self.price_cache[pair]['data']
-                    else:
-                        raise ValueError(f"Failed to get quote->base price and no cache available")
-                else:
-                    raise ValueError(f"Failed to get quote->base price: {quote_to_base_result.stderr}")
-                    
-            quote_to_base_data = json.loads(quote_to_base_result.stdout)
-            quote_to_base_amount = int(quote_to_base_data["token_out_amount"])
+        print(f"Discovered {len(pools)} pools at height {height}")
+        return len(pools)
+    
+    def _load_cache(self):
+        """Index pools from the discovery cache, if there is one"""
+        try:
+            with open(self.cache_file, 'r') as f:
+                cache = json.load(f)
+            self._apply_discovered(cache.get('pools', []), cache.get('height', 0))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Error loading pool cache {self.cache_file}: {e}")
+    
+    def _apply_discovered(self, pools, height):
+        with self._lock:
+            # Build a new index (configured pools first) and swap it in, so
+            # lookups never see a half-built one
+            by_id, by_denoms = {}, {}
+            for pool in self.pools.values():
+                self._index(pool, by_id, by_denoms)
+            for pool in pools:
+                configured = by_id.get(pool["pool_id"])
+                if configured is not None:
+                    # Keep the configured pair, learn type/reserves from chain
+                    configured.update({k: v for k, v in pool.items() if k != "denoms"})
+                    continue
+                self._index(pool, by_id, by_denoms)
+            self._by_id, self._by_denoms = by_id, by_denoms
+            self.discovered_height = height
+    
+    @staticmethod
+    def _parse_pool(raw):
+        """Reduce one all-pools entry to id, type, denoms and spot data"""
+        pool_id = raw.get("id") or raw.get("pool_id")
+        if pool_id is None:
+            return None
         
-            # Calculate prices with proper decimal handling
-            base_amount_factor = 10**base_decimals  # Adjust based on token decimals
-            if pair == "OSMO/USDC":
-                base_amount = 1.0  # 1 OSMO
-            else:
-                base_amount = 0.001  # 0.001 BTC/ETH
+        reserves = {}
+        if "pool_assets" in raw:       # Balancer
+            for pool_asset in raw["pool_assets"]:
+                reserves[pool_asset["token"]["denom"]] = int(pool_asset["token"]["amount"])
+        elif "pool_liquidity" in raw:  # Stableswap
+            for coin in raw["pool_liquidity"]:
+                reserves[coin["denom"]] = int(coin["amount"])
+        
+        denoms = list(reserves) or [d for d in (raw.get("token0"), raw.get("token1")) if d]
+        if len(denoms) < 2:
+            return None   # e.g. CosmWasm pools that don't list their assets
+        
+        params = raw.get("pool_params", {})
+        spread_factor = raw.get("spread_factor") or params.get("spread_factor") or params.get("swap_fee") or 0
+        
+        type_url = raw.get("@type", "")
+        for marker, pool_type in (("concentratedliquidity", "concentrated"), ("stableswap", "stableswap"),
+                                  ("cosmwasmpool", "cosmwasm"), ("gamm", "balancer")):
+            if marker in type_url:
+                break
+        else:
+            pool_type = "unknown"
+        
+        pool = {
+            "pool_id": str(pool_id),
+            "type": pool_type,
+            "denoms": denoms,
+            "spread_factor": float(spread_factor)
+        }
+        if reserves:
+            pool["reserves"] = reserves
+        if raw.get("current_sqrt_price"):
+            # Concentrated liquidity: spot price of token1 in token0 is sqrt_price^2
+            pool["sqrt_price"] = raw["current_sqrt_price"]
+        return pool
+
+
+class RouteSelector:
+    """Chooses the route to swap through for a given pair and size
+
+    Pools form a graph whose nodes are denoms. Candidate routes are every
+    direct pool for the pair plus the k best paths of up to max_hops pools,
+    found by a beam search that estimates each hop offline from the reserves
+    or sqrt price learned at discovery (keeping only the k best partial
+    paths per denom at each hop, through the deepest pools_per_edge pools
+    of each pair). Up to max_candidates of them are then
+    quoted concurrently for the actual amount on the node, whose estimates
+    are net of every pool's spread factor, and the highest output wins.
+    Results are cached per (pair, size bucket, block height), so the UI hint
+    and the executor for the same order share one set of quotes.
+
+    Large swaps can instead be split over several pool-disjoint routes
+    (split_route), allocated by water-filling their offline output curves.
+    """
+    
+    BUCKET_BASE = 1.25   # Sizes within 25% of each other share a cache entry
+    
+    def __init__(self, client, max_candidates=8, workers=8, cache_limit=256, max_hops=3, beam_width=4,
+                 pools_per_edge=3, max_split_routes=4, split_steps=64):
+        self.client = client
+        self.max_candidates = max_candidates
+        self.workers = workers
+        self.cache_limit = cache_limit
+        self.max_hops = max_hops
+        self.beam_width = beam_width
+        self.pools_per_edge = pools_per_edge
+        self.max_split_routes = max_split_routes
+        self.split_steps = split_steps
+        self.split_min_gain_bps = 5
+        self._executor = None
+        self._cache = {}   # (denom_in, denom_out, bucket) -> route
+        self._lock = threading.Lock()
+        self._graph = {}
+        self._graph_source = None
+    
+    def _bucket(self, amount_raw):
+        return int(math.log(amount_raw) / math.log(self.BUCKET_BASE)) if amount_raw > 0 else 0
+    
+    @staticmethod
+    def pool_ids(route):
+        """Comma-separated pool ids, as --swap-route-pool-ids wants them"""
+        return ",".join(pool["pool_id"] for pool in route['pools'])
+    
+    # -- Graph search --
+    
+    def graph(self):
+        """denom -> {other denom: [pool, ...]}, rebuilt when the registry re-indexes"""
+        index = self.client.pool_registry.denom_index()
+        if index is not self._graph_source:
+            graph = {}
+            for (denom_a, denom_b), pools in index.items():
+                # Only the deepest few pools per pair are worth searching through
+                pools = sorted(pools, key=lambda p: self._depth(p, denom_a, denom_b), reverse=True)[:self.pools_per_edge]
+                graph.setdefault(denom_a, {})[denom_b] = pools
+                graph.setdefault(denom_b, {})[denom_a] = pools
+            self._graph, self._graph_source = graph, index
+        return self._graph
+    
+    @staticmethod
+    def _depth(pool, denom_a, denom_b):
+        reserves = pool.get("reserves") or {}
+        return math.sqrt(reserves.get(denom_a, 0) * reserves.get(denom_b, 0)) or (1 if pool.get("sqrt_price") else 0)
+    
+    @staticmethod
+    def estimate_hop(pool, denom_in, denom_out, amount):
+        """Offline output estimate for one hop, or None if the pool has no spot data"""
+        amount *= 1 - float(pool.get("spread_factor", 0))
+        reserves = pool.get("reserves")
+        if reserves and reserves.get(denom_in) and reserves.get(denom_out):
+            # Constant product (exact for equal-weight balancer pools, a rough guide otherwise)
+            reserve_in, reserve_out = reserves[denom_in], reserves[denom_out]
+            return reserve_out * amount / (reserve_in + amount)
+        if pool.get("sqrt_price"):
+            # Concentrated liquidity: token1 per token0 is sqrt_price^2; depth unknown
+            price = float(pool["sqrt_price"]) ** 2
+            return amount * price if denom_in == pool["denoms"][0] else amount / price
+        return None
+    
+    def search(self, denom_in, denom_out, amount_raw, max_hops=None, k=None):
+        """The k best routes of up to max_hops pools by offline estimate
+
+        Returns [(estimated amount out, [pool, ...], [denom out per hop, ...]), ...],
+        best first. Pools without spot data can't be estimated and are skipped.
+        """
+        max_hops = max_hops or self.max_hops
+        k = k or self.beam_width
+        graph = self.graph()
+        tiebreak = itertools.count()
+        # Partial path: (amount, tiebreak, denom, pools, denoms visited)
+        frontier = [(float(amount_raw), 0, denom_in, (), (denom_in,))]
+        found = []
+        for hop in range(max_hops):
+            last_hop = hop == max_hops - 1
+            beams = {}   # denom -> min-heap of the k best partial paths ending there
+            for amount, _, denom, pools, visited in frontier:
+                edges = graph.get(denom, {})
+                if last_hop:
+                    # Only edges into denom_out can finish a route
+                    edges = {denom_out: edges[denom_out]} if denom_out in edges else {}
+                for other, edge_pools in edges.items():
+                    if other in visited:
+                        continue
+                    for pool in edge_pools:
+                        out = self.estimate_hop(pool, denom, other, amount)
+                        if not out:
+                            continue
+                        path = (out, next(tiebreak), other, pools + (pool,), visited + (other,))
+                        if other == denom_out:
+                            found.append(path)
+                            continue
+                        beam = beams.setdefault(other, [])
+                        if len(beam) < k:
+                            heapq.heappush(beam, path)
+                        elif out > beam[0][0]:
+                            heapq.heapreplace(beam, path)
+            frontier = [path for beam in beams.values() for path in beam]
+            if not frontier:
+                break
+        return [(out, list(pools), list(visited[1:])) for out, _, _, pools, visited in heapq.nlargest(k, found)]
+    
+    def candidates(self, denom_in, denom_out, amount_raw=None):
+        """Routes worth quoting for this pair, best guesses first
+
+        The configured direct pool always comes first; then the best
+        estimated routes (direct or multi-hop); then direct pools that have
+        no spot data to estimate from.
+        """
+        direct = self.client.pool_registry.candidates(denom_in, denom_out)
+        routes = [{'pools': [pool], 'denoms': [denom_out], 'estimate': None} for pool in direct if pool.get("pair")]
+        if amount_raw:
+            routes += [{'pools': pools, 'denoms': denoms, 'estimate': out}
+                       for out, pools, denoms in self.search(denom_in, denom_out, amount_raw, k=self.max_candidates)]
+        routes += [{'pools': [pool], 'denoms': [denom_out], 'estimate': None} for pool in direct]
+        
+        unique, seen = [], set()
+        for route in routes:
+            ids = self.pool_ids(route)
+            if ids not in seen:
+                seen.add(ids)
+                unique.append(route)
+        return unique[:self.max_candidates]
+    
+    # -- Quoting --
+    
+    def cached(self, denom_in, denom_out, amount_raw, query_height=True):
+        """Cached route for this size at the current block, or None
+
+        With query_height=False no node call is made (safe on the Tk thread):
+        the last height read is used as is.
+        """
+        key = (denom_in, denom_out, self._bucket(amount_raw))
+        route = self._cache.get(key)
+        if route and self._is_current(route, query_height):
+            return route
+        return None
+    
+    def _is_current(self, route, query_height=True):
+        height = self.client.current_height(max_age=5 if query_height else math.inf)
+        if height and route['height']:
+            return route['height'] == height
+        # Without block heights, treat ~one block time as current
+        return time.time() - route['timestamp'] < 6
+    
+    def quote(self, route, denom_in, amount_raw):
+        """Node quote (base units out) for swapping amount_raw through route, or None"""
+        if len(route['pools']) == 1:
+            return self.client.estimate_swap(route['pools'][0]["pool_id"], amount_raw, denom_in, route['denoms'][0])
+        return self.client.estimate_route(self.pool_ids(route), ",".join(route['denoms']), amount_raw, denom_in)
+    
+    def quote_all(self, routes, denom_in, amounts):
+        """Node quotes for each route at its amount, run concurrently"""
+        if self._executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="route-quote")
+        futures = [self._executor.submit(self.quote, route, denom_in, amount) for route, amount in zip(routes, amounts)]
+        return [future.result() for future in futures]
+    
+    def best_route(self, denom_in, denom_out, amount_raw):
+        """Best route for swapping amount_raw base units
+
+        Returns {'pools', 'denoms', 'amount_in', 'amount_out', 'estimate',
+        'quotes', 'height', 'timestamp'} or None if no route connects the
+        pair. amount_out is None when there was only one candidate (nothing
+        to compare, no query made).
+        """
+        route = self.cached(denom_in, denom_out, amount_raw)
+        if route:
+            return route
+        
+        routes = self.candidates(denom_in, denom_out, amount_raw)
+        if not routes:
+            return None
+        
+        height = self.client.current_height()
+        quotes = {}
+        if len(routes) > 1:
+            outputs = self.quote_all(routes, denom_in, [amount_raw] * len(routes))
+            quotes = {self.pool_ids(candidate): out for candidate, out in zip(routes, outputs)}
+        
+        quoted = [r for r in routes if quotes.get(self.pool_ids(r))]
+        best = max(quoted, key=lambda r: quotes[self.pool_ids(r)]) if quoted else routes[0]
+        route = dict(best)
+        route.update({
+            'amount_in': amount_raw,
+            'amount_out': quotes.get(self.pool_ids(best)),
+            'quotes': quotes,
+            'height': height,
+            'timestamp': time.time()
+        })
+        
+        with self._lock:
+            if len(self._cache) >= self.cache_limit:
+                # Drop everything from earlier blocks first
+                self._cache = {k: v for k, v in self._cache.items() if v['height'] == height and height}
+            self._cache[(denom_in, denom_out, self._bucket(amount_raw))] = route
+        return route
+    
+    # -- Splitting --
+    
+    def estimate_path(self, route, denom_in, amount):
+        """Offline output of a whole route, or None if a hop has no spot data
+
+        Routes with a hop that can't be estimated from reserves (e.g.
+        concentrated liquidity) use their quoted impact curve, if any.
+        """
+        denom = denom_in
+        for pool in route['pools']:
+            if not pool.get("reserves") and not pool.get("sqrt_price"):
+                return self.client.impact_curves.route_estimate(self.pool_ids(route), denom_in, amount)
+        for pool, denom_out in zip(route['pools'], route['denoms']):
+            amount = self.estimate_hop(pool, denom, denom_out, amount)
+            if not amount:
+                return None
+            denom = denom_out
+        return amount
+    
+    def allocate(self, routes, denom_in, amount_raw, steps=None):
+        """Split amount_raw over routes so their marginal outputs end up equal
+
+        Every route's output curve is concave, so handing out the amount in
+        equal chunks, each to the route whose next chunk pays most, is the
+        optimal allocation at that resolution (water-filling). Returns one
+        integer amount per route, summing to amount_raw, and the estimated
+        total output.
+        """
+        steps = steps or self.split_steps
+        chunk = amount_raw / steps
+        filled = [0] * len(routes)   # chunks given to each route
+        outputs = [0.0] * len(routes)
+        heap = [(-(self.estimate_path(route, denom_in, chunk) or 0), i) for i, route in enumerate(routes)]
+        heapq.heapify(heap)
+        for _ in range(steps):
+            neg_gain, i = heapq.heappop(heap)
+            filled[i] += 1
+            outputs[i] -= neg_gain
+            next_out = self.estimate_path(routes[i], denom_in, (filled[i] + 1) * chunk) or 0
+            heapq.heappush(heap, (-(next_out - outputs[i]), i))
+        
+        amounts = [amount_raw * n // steps for n in filled]
+        amounts[filled.index(max(filled))] += amount_raw - sum(amounts)
+        return amounts, sum(outputs)
+    
+    def split_route(self, denom_in, denom_out, amount_raw, single=None):
+        """Split plan that beats the best single route, or None
+
+        Candidate routes that can be estimated offline and share no pool
+        (so their curves are independent) are water-filled, then each leg
+        is quoted on the node at its allocated size. The plan is only
+        returned if the quoted total beats the single best route's quote by
+        split_min_gain_bps.
+        Returns {'legs': [route with 'amount_in' and 'amount_out'], 'amount_in',
+        'amount_out', 'single_out'}.
+        """
+        routes, used = [], set()
+        for route in self.candidates(denom_in, denom_out, amount_raw):
+            ids = {pool["pool_id"] for pool in route['pools']}
+            if ids & used or not self.estimate_path(route, denom_in, amount_raw):
+                continue
+            routes.append(route)
+            used |= ids
+            if len(routes) == self.max_split_routes:
+                break
+        if len(routes) < 2:
+            return None
+        
+        amounts, estimated = self.allocate(routes, denom_in, amount_raw)
+        legs = [dict(route, amount_in=amount) for route, amount in zip(routes, amounts) if amount]
+        if len(legs) < 2:
+            return None   # One route takes it all: nothing to split
+        # Extra legs cost gas; don't bother the node for a negligible gain
+        min_gain = 1 + self.split_min_gain_bps / 10_000
+        single_estimate = max(self.estimate_path(route, denom_in, amount_raw) for route in routes)
+        if estimated < single_estimate * min_gain:
+            return None
+        
+        # The single route is usually quoted already (cached); only quote the legs if they can beat it
+        single = single or self.best_route(denom_in, denom_out, amount_raw)
+        # A cached route may have been quoted for a nearby size in the same bucket
+        single_out = single['amount_out'] * amount_raw // single['amount_in'] if single and single['amount_out'] else None
+        if not single_out or estimated < single_out * min_gain:
+            return None
+        
+        outputs = self.quote_all(legs, denom_in, [leg['amount_in'] for leg in legs])
+        if not all(outputs):
+            return None   # Can't confirm the plan with the node
+        for leg, out in zip(legs, outputs):
+            leg['amount_out'] = out
+        if sum(outputs) < single_out * min_gain:
+            return None
+        return {'legs': legs, 'amount_in': amount_raw, 'amount_out': sum(outputs), 'single_out': single_out}
+
+
+class ImpactCurveCache:
+    """Output-vs-size curves for the routes of a pair, re-quoted once per block
+
+    For each pair in use, the best few candidate routes (see RouteSelector)
+    are quoted at geometric size buckets - the input asset's price probe
+    times 4^k - once per block height. estimate() interpolates the output
+    rate between buckets (linearly in log size) and takes the best route,
+    so an output estimate for any amount is a few list lookups and never a
+    node query. Amounts beyond the largest bucket add buckets on demand.
+    Building and refreshing run as jobs on the scheduler given to start().
+    """
+    
+    BUCKET_GROWTH = 4
+    MIN_BUCKETS = 8
+    
+    def __init__(self, client, routes_per_pair=3, idle_after=300):
+        self.client = client
+        self.routes_per_pair = routes_per_pair
+        self.idle_after = idle_after   # Stop refreshing pairs nobody asked about for this long
+        self.scheduler = None
+        self.on_update = None
+        self._curves = {}    # (denom_in, denom_out) -> curve
+        self._by_route = {}  # (pool ids, denom_in) -> [(size, out), ...]
+        self._wanted = {}    # (denom_in, denom_out) -> largest amount asked for
+    
+    def start(self, scheduler, on_update=None):
+        """Build and refresh curves on scheduler; on_update() runs when a requested build lands"""
+        self.scheduler = scheduler
+        self.on_update = on_update
+        scheduler.call_every(6, self.refresh, key='impact_curves', first_delay=6)
+        return self
+    
+    def _sizes(self, denom_in, max_raw):
+        asset = self.client.assets.asset_for(denom_in)
+        size = max(1, TokenAmount.from_human(asset.price_probe, asset).raw)
+        sizes = [size * self.BUCKET_GROWTH ** k for k in range(self.MIN_BUCKETS)]
+        while sizes[-1] < max_raw:
+            sizes.append(sizes[-1] * self.BUCKET_GROWTH)
+        return sizes
+    
+    @staticmethod
+    def _interpolate(points, amount):
+        """Output for amount from [(size, out), ...], or None beyond the last size"""
+        if not points or amount > points[-1][0]:
+            return None
+        if amount <= points[0][0]:
+            # Below the smallest bucket impact is negligible: use its rate
+            return amount * points[0][1] // points[0][0]
+        i = bisect.bisect_left(points, (amount,))
+        (size_lo, out_lo), (size_hi, out_hi) = points[i - 1], points[i]
+        t = math.log(amount / size_lo) / math.log(size_hi / size_lo)
+        rate = out_lo / size_lo + t * (out_hi / size_hi - out_lo / size_lo)
+        return int(amount * rate)
+    
+    def estimate(self, denom_in, denom_out, amount_raw):
+        """Best (amount out, route) for amount_raw from the cached curves, or None
+
+        Never queries the node. A miss (no curve yet, or an amount above the
+        largest bucket) schedules a build, after which on_update() is called.
+        """
+        key = (denom_in, denom_out)
+        curve = self._curves.get(key)
+        if curve is not None:
+            curve['used'] = time.time()
+        if curve is None or amount_raw > curve['max_raw']:
+            self._wanted[key] = max(self._wanted.get(key, 0), amount_raw)
+            if self.scheduler is not None:
+                self.scheduler.call_later(0, self.build, denom_in, denom_out, True, key=('impact_curve', key))
+            if curve is None:
+                return None
+        
+        best = None
+        for entry in curve['routes']:
+            out = self._interpolate(entry['points'], amount_raw)
+            if out and (best is None or out > best[0]):
+                best = (out, entry['route'])
+        return best
+    
+    def route_estimate(self, pool_ids, denom_in, amount_raw):
+        """Interpolated output of one route (by pool ids), or None if it has no curve"""
+        return self._interpolate(self._by_route.get((pool_ids, denom_in)), amount_raw)
+    
+    def build(self, denom_in, denom_out, notify=False):
+        """Quote the pair's best routes at every size bucket (concurrently)
+
+        notify calls on_update() afterwards; per-block refreshes don't, so a
+        hint left on screen doesn't keep its pair alive.
+        """
+        key = (denom_in, denom_out)
+        selector = self.client.route_selector
+        height = self.client.current_height()
+        previous = self._curves.get(key)
+        sizes = self._sizes(denom_in, max(self._wanted.get(key, 0), previous['max_raw'] if previous else 0))
+        
+        # Rank routes at a mid-sized bucket; the curves then cover every size
+        routes = selector.candidates(denom_in, denom_out, sizes[len(sizes) // 2])[:self.routes_per_pair]
+        if not routes:
+            return
+        legs = [route for route in routes for _ in sizes]
+        outputs = selector.quote_all(legs, denom_in, sizes * len(routes))
+        
+        entries = []
+        for i, route in enumerate(routes):
+            quoted = outputs[i * len(sizes):(i + 1) * len(sizes)]
+            points = [(size, out) for size, out in zip(sizes, quoted) if out]
+            if points:
+                entries.append({'route': route, 'points': points})
+                self._by_route[(selector.pool_ids(route), denom_in)] = points
+        if not entries:
+            return   # Node unreachable: keep the old curve
+        
+        self._curves[key] = {
+            'routes': entries,
+            'max_raw': max(entry['points'][-1][0] for entry in entries),
+            'height': height,
+            'built': time.time(),
+            'used': previous['used'] if previous else time.time()
+        }
+        if notify and self.on_update:
+            self.on_update()
+    
+    def refresh(self):
+        """Re-quote curves from an older block; forget pairs that went idle"""
+        height = self.client.current_height()
+        now = time.time()
+        for key, curve in list(self._curves.items()):
+            if now - curve['used'] > self.idle_after:
+                del self._curves[key]
+            elif (curve['height'] != height) if height else (now - curve['built'] >= 6):
+                self.build(*key)
+
+
+class PriceHistory:
+    """Recent ticks and OHLCV candles per pair, in fixed-size ring buffers
+
+    Every recorded tick goes into a tick ring and updates the current
+    candle of each resolution in place (O(1); a new candle only overwrites
+    the oldest slot), so memory per pair is fixed. Candle rows are
+    (start, open, high, low, close, volume); volume is the base amount of
+    our own confirmed swaps, the only trades we see.
+
+    With NumPy the rings are memory-mapped .npy files under `directory`
+    (np.lib.format.open_memmap): updates land in the page cache, save()
+    flushes them and writes the ring positions to index.json. Without
+    NumPy the rings are plain lists and history lasts for the session.
+    """
+    
+    RESOLUTIONS = (("1m", 60, 1440), ("5m", 300, 2016), ("1h", 3600, 2160), ("1d", 86400, 1825))
+    TICK_CAPACITY = 4096
+    
+    def __init__(self, directory="price_history", persist_interval=60):
+        try:
+            import numpy as np
+        except ImportError:
+            np = None
+        self._np = np
+        self.directory = directory
+        self.persist_interval = persist_interval
+        self.index_file = os.path.join(directory, "index.json")
+        self._rings = {}   # (pair, resolution or 'ticks') -> ring dict
+        self._lock = threading.Lock()
+        self._positions = {}
+        if np is not None:
+            try:
+                with open(self.index_file, 'r') as f:
+                    self._positions = json.load(f)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f"Error loading price history index: {e}")
+    
+    def start(self, scheduler):
+        """Flush to disk every persist_interval seconds"""
+        scheduler.call_every(self.persist_interval, self.save, key='price_history_save')
+        return self
+    
+    def _ring(self, pair, name, capacity, width, create=True):
+        """A pair's ring, reopened from disk or (with create) started on first use; else None"""
+        key = (pair, name)
+        ring = self._rings.get(key)
+        if ring is None:
+            head, count = self._positions.get(f"{pair}|{name}", (0, 0))
+            if not count and not create:
+                return None
+            ring = {'rows': self._buffer(pair, name, capacity, width, fresh=not count),
+                    'head': head, 'count': count, 'capacity': capacity}
+            # The forming row, kept as Python floats: NumPy scalar access per field is slow
+            ring['current'] = [float(x) for x in ring['rows'][(head - 1) % capacity]] if count else None
+            self._rings[key] = ring
+        return ring
+    
+    def _buffer(self, pair, name, capacity, width, fresh):
+        np = self._np
+        if np is None:
+            return [[0.0] * width for _ in range(capacity)]
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{pair.replace('/', '-')}.{name}.npy")
+        if not fresh:
+            try:
+                rows = np.lib.format.open_memmap(path, mode='r+')
+                if rows.shape == (capacity, width):
+                    return rows
+            except Exception as e:
+                print(f"Error opening {path}, starting it afresh: {e}")
+        return np.lib.format.open_memmap(path, mode='w+', dtype=np.float64, shape=(capacity, width))
+    
+    @staticmethod
+    def _append(ring, values):
+        ring['current'] = list(values)
+        ring['rows'][ring['head']] = ring['current']
+        ring['head'] = (ring['head'] + 1) % ring['capacity']
+        ring['count'] = min(ring['count'] + 1, ring['capacity'])
+    
+    def record(self, pair, price, timestamp=None, volume=0.0):
+        """Add one tick and roll it into every resolution's current candle"""
+        if not price or price <= 0:
+            return
+        timestamp = timestamp or time.time()
+        with self._lock:
+            self._append(self._ring(pair, "ticks", self.TICK_CAPACITY, 2), (timestamp, price))
+            for name, seconds, capacity in self.RESOLUTIONS:
+                ring = self._ring(pair, name, capacity, 6)
+                start = timestamp - timestamp % seconds
+                last = ring['current']
+                if last is not None and last[0] == start:
+                    if price > last[2]:
+                        last[2] = price
+                    if price < last[3]:
+                        last[3] = price
+                    last[4] = price
+                    last[5] += volume
+                    ring['rows'][(ring['head'] - 1) % capacity] = last
+                elif last is None or start > last[0]:
+                    self._append(ring, (start, price, price, price, price, volume))
+                # Ticks older than the current candle are dropped from the rollups
+    
+    def _ordered(self, ring, limit, width):
+        """Ring contents oldest first (the newest `limit` rows)"""
+        if ring is None:
+            return self._np.empty((0, width)) if self._np is not None else []
+        count = ring['count'] if limit is None else min(limit, ring['count'])
+        first = (ring['head'] - count) % ring['capacity']
+        rows = ring['rows']
+        if self._np is not None:
+            return self._np.asarray(rows).take(range(first, first + count), axis=0, mode='wrap')
+        return [list(rows[(first + i) % ring['capacity']]) for i in range(count)]
+    
+    def candles(self, pair, resolution="1m", limit=None):
+        """Candles (start, open, high, low, close, volume), oldest first
+
+        A NumPy array of shape (n, 6) when NumPy is available, else a list
+        of rows. The last candle is still forming.
+        """
+        capacity = {name: capacity for name, _, capacity in self.RESOLUTIONS}
+        if resolution not in capacity:
+            raise ValueError(f"Unknown resolution {resolution}")
+        with self._lock:
+            # Reading a pair that was never recorded mustn't create its files
+            return self._ordered(self._ring(pair, resolution, capacity[resolution], 6, create=False), limit, 6)
+    
+    def ticks(self, pair, limit=None):
+        """Recent (time, price) ticks, oldest first"""
+        with self._lock:
+            return self._ordered(self._ring(pair, "ticks", self.TICK_CAPACITY, 2, create=False), limit, 2)
+    
+    def pairs(self):
+        with self._lock:
+            return sorted({pair for pair, _ in self._rings} | {key.split('|')[0] for key in self._positions})
+    
+    def save(self):
+        """Flush memory-mapped rings and record their positions"""
+        if self._np is None:
+            return
+        try:
+            with self._lock:
+                for ring in self._rings.values():
+                    ring['rows'].flush()
+                positions = dict(self._positions)
+                positions.update({f"{pair}|{name}": (ring['head'], ring['count'])
+                                  for (pair, name), ring in self._rings.items()})
+                self._positions = positions
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = f"{self.index_file}.tmp"
+            with open(tmp_path, 'w') as f:
+                f.write(json.dumps(positions))
+            os.replace(tmp_path, self.index_file)
+        except Exception as e:
+            print(f"Error saving price history: {e}")
+
+
+class IndicatorBook:
+    """Rolling indicator state for conditional orders
+
+    A conditional order fires on an indicator of its pair's candle closes
+    instead of a price: an EMA cross, a Bollinger band breach or an N-sigma
+    move. Orders with the same pair, indicator, resolution and periods share
+    one group. A group's state is computed from PriceHistory when the group
+    is created and then updated in O(1) per tick: the forming candle's close
+    is folded in provisionally and committed when the next candle starts.
+    Per-order parameters (direction, band width, sigma count) are held in
+    arrays, so one vectorized comparison checks a whole group.
+    """
+    
+    INDICATORS = {'ema_cross': ('fast', 'slow'), 'bollinger': ('period',), 'sigma_move': ('period',)}
+    THRESHOLDS = {'bollinger': 'k', 'sigma_move': 'n'}
+    DEFAULTS = {'fast': 12, 'slow': 26, 'period': 20, 'k': 2.0, 'n': 3.0, 'resolution': '1m', 'direction': 'up'}
+    
+    def __init__(self, history):
+        try:
+            import numpy as np
+        except ImportError:
+            np = None
+        self._np = np
+        self.history = history
+        self._groups = {}       # (pair, indicator, resolution, *periods) -> group dict
+        self._pair_groups = {}  # pair -> [group]
+        self._order_ids = set()
+    
+    def normalize(self, condition):
+        """Validate a condition spec and fill in defaults; raises ValueError"""
+        indicator = condition.get('indicator')
+        if indicator not in self.INDICATORS:
+            raise ValueError(f"Unknown indicator {indicator}; use one of {', '.join(self.INDICATORS)}")
+        normalized = {'indicator': indicator}
+        for name in ('resolution', 'direction') + self.INDICATORS[indicator]:
+            normalized[name] = condition.get(name, self.DEFAULTS[name])
+        if normalized['resolution'] not in [name for name, _, _ in PriceHistory.RESOLUTIONS]:
+            raise ValueError(f"Unknown resolution {normalized['resolution']}")
+        if normalized['direction'] not in ('up', 'down'):
+            raise ValueError("Direction must be 'up' or 'down'")
+        for name in self.INDICATORS[indicator]:
+            normalized[name] = int(normalized[name])
+            if normalized[name] < 2:
+                raise ValueError(f"{name} must be at least 2 candles")
+        if indicator == 'ema_cross' and normalized['fast'] >= normalized['slow']:
+            raise ValueError("The fast EMA must be shorter than the slow one")
+        threshold = self.THRESHOLDS.get(indicator)
+        if threshold:
+            normalized[threshold] = float(condition.get(threshold, self.DEFAULTS[threshold]))
+            if normalized[threshold] <= 0:
+                raise ValueError(f"{threshold} must be positive")
+        return normalized
+    
+    @staticmethod
+    def describe(condition):
+        """Short text for a condition, e.g. 'EMA 12/26 cross up (1m)'"""
+        indicator = condition['indicator']
+        if indicator == 'ema_cross':
+            text = f"EMA {condition['fast']}/{condition['slow']} cross {condition['direction']}"
+        elif indicator == 'bollinger':
+            text = f"Bollinger {condition['period']}x{condition['k']:g} breach {condition['direction']}"
+        else:
+            text = f"{condition['n']:g} sigma move {condition['direction']} (EWMA {condition['period']})"
+        return f"{text} ({condition['resolution']})"
+    
+    def sync(self, entries):
+        """Track these pending conditional orders, given as (pair, order); cheap if unchanged"""
+        ids = {order['id'] for _, order in entries}
+        if ids == self._order_ids:
+            return
+        members = {}
+        for pair, order in entries:
+            condition = order['condition']
+            key = (pair, condition['indicator'], condition['resolution']) + tuple(
+                condition[name] for name in self.INDICATORS[condition['indicator']]
+            )
+            members.setdefault(key, []).append(order)
+        
+        # Existing groups keep their state; only new ones are computed from history
+        self._groups = {key: self._groups.get(key) or self._new_group(key) for key in members}
+        self._pair_groups = {}
+        for key, group in self._groups.items():
+            self._set_members(group, members[key])
+            self._pair_groups.setdefault(key[0], []).append(group)
+        self._order_ids = ids
+    
+    def _new_group(self, key):
+        pair, indicator, resolution = key[:3]
+        seconds = {name: seconds for name, seconds, _ in PriceHistory.RESOLUTIONS}[resolution]
+        group = {'indicator': indicator, 'seconds': seconds, 'start': None, 'close': None, 'count': 0, 'last': None}
+        if indicator == 'ema_cross':
+            group['alphas'] = (2 / (key[3] + 1), 2 / (key[4] + 1))
+            group['emas'] = None
+            group['warmup'] = key[4]
+        elif indicator == 'bollinger':
+            group['window'] = deque(maxlen=key[3] - 1)
+            group['sums'] = [0.0, 0.0]
+            group['ref'] = None
+            group['warmup'] = key[3] - 1
+        else:
+            group['alpha'] = 2 / (key[3] + 1)
+            group['var'] = None
+            group['warmup'] = key[3]
+        
+        # Replay the stored candles through the same O(1) updates
+        rows = self.history.candles(pair, resolution)
+        closes = rows[:, [0, 4]].tolist() if hasattr(rows, 'shape') else [(row[0], row[4]) for row in rows]
+        for start, close in closes:
+            self._observe(group, start, close)
+        return group
+    
+    def _set_members(self, group, orders):
+        # EMA crosses fire only once the order has seen the fast EMA on the other side
+        armed = dict(zip(group.get('ids', ()), group.get('armed', ())))
+        group['ids'] = [order['id'] for order in orders]
+        signs = [1.0 if order['condition']['direction'] == 'up' else -1.0 for order in orders]
+        threshold = self.THRESHOLDS.get(group['indicator'])
+        thresholds = [order['condition'][threshold] if threshold else 0.0 for order in orders]
+        armed = [bool(armed.get(order_id, False)) for order_id in group['ids']]
+        if self._np is not None:
+            np = self._np
+            group['signs'], group['thresholds'], group['armed'] = np.array(signs), np.array(thresholds), np.array(armed)
+        else:
+            group['signs'], group['thresholds'], group['armed'] = signs, thresholds, armed
+    
+    def _observe(self, group, start, close):
+        """Fold a close into the forming candle, committing the previous one if a new candle started"""
+        if group['start'] is not None and start < group['start']:
+            return  # Older than the forming candle
+        if group['start'] is not None and start > group['start']:
+            self._commit(group, group['close'])
+        group['start'], group['close'] = start, close
+    
+    @staticmethod
+    def _commit(group, close):
+        indicator = group['indicator']
+        if indicator == 'ema_cross':
+            if group['emas'] is None:
+                group['emas'] = (close, close)
+            else:
+                group['emas'] = tuple(ema + alpha * (close - ema) for ema, alpha in zip(group['emas'], group['alphas']))
+        elif indicator == 'bollinger':
+            # Sums are relative to the first close so the variance doesn't cancel out
+            if group['ref'] is None:
+                group['ref'] = close
+            value = close - group['ref']
+            window, sums = group['window'], group['sums']
+            if len(window) == window.maxlen:
+                old = window[0]
+                sums[0] -= old
+                sums[1] -= old * old
+            window.append(value)
+            sums[0] += value
+            sums[1] += value * value
+        elif group['last']:
+            r = math.log(close / group['last'])
+            group['var'] = r * r if group['var'] is None else group['var'] + group['alpha'] * (r * r - group['var'])
+        group['last'] = close
+        group['count'] += 1
+    
+    @staticmethod
+    def _value(group):
+        """(signal, scale) for the forming candle, or None while warming up
+
+        An order with direction sign s and threshold t fires when
+        s * signal > t * scale (EMA crosses: when s * signal > 0 and armed).
+        """
+        if group['count'] < group['warmup'] or group['close'] is None:
+            return None
+        close = group['close']
+        indicator = group['indicator']
+        if indicator == 'ema_cross':
+            (fast, slow), (a_fast, a_slow) = group['emas'], group['alphas']
+            return (fast + a_fast * (close - fast)) - (slow + a_slow * (close - slow)), 0.0
+        if indicator == 'bollinger':
+            window, sums = group['window'], group['sums']
+            value = close - group['ref']
+            n = len(window) + 1
+            mean = (sums[0] + value) / n
+            return value - mean, math.sqrt(max((sums[1] + value * value) / n - mean * mean, 0.0))
+        if not group['var']:
+            return None
+        return math.log(close / group['last']), math.sqrt(group['var'])
+    
+    def evaluate(self, pair, price, timestamp):
+        """Feed one price tick to the pair's groups; returns the ids of orders whose condition holds"""
+        fired = []
+        for group in self._pair_groups.get(pair, ()):
+            self._observe(group, timestamp - timestamp % group['seconds'], price)
+            value = self._value(group)
+            if value is None:
+                continue
+            signal, scale = value
+            if group['indicator'] != 'ema_cross' and scale <= 0:
+                continue
+            fired.extend(self._check(group, signal, scale))
+        return fired
+    
+    def _check(self, group, signal, scale):
+        """Ids of a group's orders whose condition holds (one vector op with NumPy)"""
+        ids = group['ids']
+        if self._np is not None:
+            moves = group['signs'] * signal
+            if group['indicator'] == 'ema_cross':
+                beyond = moves > 0
+                hits = beyond & group['armed']
+                group['armed'] |= ~beyond
+            else:
+                hits = moves > group['thresholds'] * scale
+            return [ids[i] for i in self._np.flatnonzero(hits)]
+        
+        hits = []
+        if group['indicator'] == 'ema_cross':
+            armed = group['armed']
+            for i, sign in enumerate(group['signs']):
+                beyond = sign * signal > 0
+                if beyond and armed[i]:
+                    hits.append(ids[i])
+                armed[i] = armed[i] or not beyond
+        else:
+            hits = [ids[i] for i, (sign, threshold) in enumerate(zip(group['signs'], group['thresholds']))
+                    if sign * signal > threshold * scale]
+        return hits
+
+
+class TrailingStops:
+    """High-water marks of trailing stops, indexed per pair
+
+    When the price makes a new high, every order whose mark is below it
+    moves up to it together. So orders sharing a mark are kept in one
+    bucket, and a pair's buckets sit on a min-heap by mark: a tick pops the
+    buckets below the price and merges them (smaller into larger). A max-heap
+    of each bucket's highest stop finds the orders a tick reaches. Heap
+    entries are invalidated lazily, so a tick costs amortized O(log n)
+    instead of a pass over every order. An order trails by a percentage
+    or by an absolute amount below its mark.
+    """
+    
+    def __init__(self):
+        self._books = {}    # pair -> {'marks': min-heap, 'buckets': {mark: bucket}, 'stops': max-heap}
+        self._orders = {}   # order id -> its bucket
+        self._fired = {}    # order id -> (pair, mark, kind, offset) of orders update() returned
+        self._versions = itertools.count()
+        self.changed = False  # Some mark moved since the last marks() call
+    
+    @staticmethod
+    def _stop(mark, kind, offset):
+        return mark * (1 - offset / 100) if kind == 'percent' else mark - offset
+    
+    def add(self, pair, order_id, mark, percent=None, amount=None):
+        """Track an order trailing percent % or amount below mark"""
+        book = self._books.setdefault(pair, {'marks': [], 'buckets': {}, 'stops': []})
+        bucket = book['buckets'].get(mark)
+        if bucket is None:
+            bucket = book['buckets'][mark] = {'pair': pair, 'mark': mark, 'percent': [], 'absolute': [], 'size': 0}
+            heapq.heappush(book['marks'], mark)
+        kind = 'percent' if percent is not None else 'absolute'
+        heapq.heappush(bucket[kind], (percent if percent is not None else amount, order_id))
+        bucket['size'] += 1
+        self._orders[order_id] = bucket
+        self._fired.pop(order_id, None)
+        self._push_stop(book, bucket)
+    
+    def remove(self, order_id):
+        """Stop tracking an order (its heap entries are dropped when reached)"""
+        bucket = self._orders.pop(order_id, None)
+        if bucket is not None:
+            bucket['size'] -= 1
+        self._fired.pop(order_id, None)
+    
+    def sync(self, entries):
+        """Match the tracked orders to the pending trailing stops, given as (pair, order)
+
+        New orders start at their stored high_water; orders update()
+        returned that are still pending (their swap failed or was skipped)
+        are tracked again at the mark they fired from.
+        """
+        pending = {order['id']: (pair, order) for pair, order in entries}
+        for order_id in self._orders.keys() - pending.keys():
+            self.remove(order_id)
+        for order_id in self._fired.keys() - pending.keys():
+            del self._fired[order_id]
+        for order_id in pending.keys() - self._orders.keys():
+            pair, order = pending[order_id]
+            mark = self._fired[order_id][1] if order_id in self._fired else order['high_water']
+            self.add(pair, order_id, mark, order.get('trail_percent'), order.get('trail_amount'))
+    
+    def _live_head(self, bucket, kind):
+        heap = bucket[kind]
+        while heap and self._orders.get(heap[0][1]) is not bucket:
+            heapq.heappop(heap)  # Removed, fired or merged away
+        return heap[0] if heap else None
+    
+    def _bucket_stop(self, bucket):
+        """Highest stop of the bucket's tracked orders, or None"""
+        stops = [self._stop(bucket['mark'], kind, head[0])
+                 for kind in ('percent', 'absolute') for head in [self._live_head(bucket, kind)] if head]
+        return max(stops) if stops else None
+    
+    def _push_stop(self, book, bucket):
+        """Index the bucket's highest stop under a fresh version (older entries go stale)"""
+        bucket['version'] = next(self._versions)
+        stop = self._bucket_stop(bucket)
+        if stop is not None:
+            heapq.heappush(book['stops'], (-stop, bucket['mark'], bucket['version']))
+    
+    def _merge(self, into, other):
+        if other['size'] > into['size']:
+            into, other = other, into
+        for kind in ('percent', 'absolute'):
+            for offset, order_id in other[kind]:
+                if self._orders.get(order_id) is other:
+                    heapq.heappush(into[kind], (offset, order_id))
+                    self._orders[order_id] = into
+        into['size'] += other['size']
+        return into
+    
+    def update(self, pair, price):
+        """Raise marks below price to it; returns [(order id, mark, stop)] of orders whose stop it reached
+
+        Returned orders stop being tracked until sync() sees them still pending.
+        """
+        book = self._books.get(pair)
+        if book is None:
+            return []
+        marks, buckets = book['marks'], book['buckets']
+        if marks and marks[0] < price:
+            merged = buckets.get(price)
+            new_mark = merged is None
+            while marks and marks[0] < price:
+                bucket = buckets.pop(heapq.heappop(marks))
+                merged = bucket if merged is None else self._merge(merged, bucket)
+            merged['mark'] = price
+            buckets[price] = merged
+            if new_mark:
+                heapq.heappush(marks, price)
+            self._push_stop(book, merged)
+            self.changed = True
+        
+        fired = []
+        stops = book['stops']
+        while stops and -stops[0][0] >= price:
+            _, mark, version = heapq.heappop(stops)
+            bucket = buckets.get(mark)
+            if bucket is None or bucket['version'] != version:
+                continue  # Stale entry
+            for kind in ('percent', 'absolute'):
+                while True:
+                    head = self._live_head(bucket, kind)
+                    if head is None or self._stop(mark, kind, head[0]) < price:
+                        break
+                    heapq.heappop(bucket[kind])
+                    self.remove(head[1])
+                    self._fired[head[1]] = (pair, mark, kind, head[0])
+                    fired.append((head[1], mark, self._stop(mark, kind, head[0])))
+            self._push_stop(book, bucket)
+        return fired
+    
+    def mark(self, order_id):
+        """Current high-water mark of a tracked order, or None"""
+        bucket = self._orders.get(order_id)
+        return bucket['mark'] if bucket is not None else None
+    
+    def highest_stop(self, pair):
+        """The pair's highest stop price (the first a falling price reaches), or None"""
+        book = self._books.get(pair)
+        if book is None:
+            return None
+        stops, buckets = book['stops'], book['buckets']
+        while stops:
+            neg_stop, mark, version = stops[0]
+            bucket = buckets.get(mark)
+            if bucket is None or bucket['version'] != version:
+                heapq.heappop(stops)  # Stale entry
+                continue
+            if self._bucket_stop(bucket) == -neg_stop:
+                return -neg_stop
+            # The order behind this stop was removed: re-index the bucket's live stop
+            self._push_stop(book, bucket)
+        return None
+    
+    def marks(self):
+        """Current high-water mark of every tracked order"""
+        self.changed = False
+        return {order_id: bucket['mark'] for order_id, bucket in self._orders.items()}
+
+
+class OrderDeadlines:
+    """Expiry times of good-till-time orders on a min-heap
+    
+    Forgetting an order (filled or cancelled) only drops it from the
+    deadline map; its heap entry is discarded when it reaches the top. So
+    adding, removing and expiring an order each cost O(log n), and nothing
+    looks at the order book between deadlines.
+    """
+    
+    def __init__(self):
+        self._heap = []       # (deadline, order id)
+        self._deadlines = {}  # order id -> deadline (epoch seconds)
+    
+    def __len__(self):
+        return len(self._deadlines)
+    
+    @staticmethod
+    def deadline_of(order):
+        """An order's expiry as epoch seconds, or None if it is good till cancelled"""
+        expires_at = order.get('expires_at')
+        return datetime.fromisoformat(expires_at).timestamp() if expires_at else None
+    
+    def add(self, order_id, deadline):
+        self._deadlines[order_id] = deadline
+        heapq.heappush(self._heap, (deadline, order_id))
+    
+    def remove(self, order_id):
+        self._deadlines.pop(order_id, None)
+    
+    def sync(self, pending_orders):
+        """Rebuild from the pending orders"""
+        self._deadlines = {}
+        for order in pending_orders:
+            deadline = self.deadline_of(order)
+            if deadline is not None:
+                self._deadlines[order['id']] = deadline
+        self._heap = [(deadline, order_id) for order_id, deadline in self._deadlines.items()]
+        heapq.heapify(self._heap)
+    
+    def _prune(self):
+        heap = self._heap
+        while heap and self._deadlines.get(heap[0][1]) != heap[0][0]:
+            heapq.heappop(heap)  # Forgotten or re-added with another deadline
+    
+    def next_deadline(self):
+        """The earliest deadline, or None"""
+        self._prune()
+        return self._heap[0][0] if self._heap else None
+    
+    def expired(self, order_id, now):
+        deadline = self._deadlines.get(order_id)
+        return deadline is not None and deadline <= now
+    
+    def pop_due(self, now):
+        """Forget and return the ids of orders whose deadline is at or before now"""
+        due = []
+        self._prune()
+        while self._heap and self._heap[0][0] <= now:
+            _, order_id = heapq.heappop(self._heap)
+            del self._deadlines[order_id]
+            due.append(order_id)
+            self._prune()
+        return due
+
+
+class PriceGrid:
+    """A grid strategy's levels and which of them are armed
+
+    Levels are a sorted array of prices between the grid's bounds. Every
+    level below the gap holds a buy and every level above it a sell, so the
+    whole state is the gap's index: buying levels moves it down (the
+    filled levels become sells) and selling moves it up. A tick bisects for
+    the levels it crossed, O(log n) however many levels the grid has.
+    The record is the persisted grid; fill() returns the fields it changed.
+    """
+    
+    STATE_FIELDS = ('id', 'seq', 'gap', 'buys', 'sells', 'quote_spent', 'base_bought', 'base_sold', 'quote_received')
+    
+    def __init__(self, record):
+        self.record = record
+        self.pair = f"{record['base_token']}/{record['quote_token']}"
+        self.prices = self.levels(record['lower'], record['upper'], record['levels'], record['spacing'])
+        # Quote needed to fund the buys below each gap position
+        self._sums = list(itertools.accumulate(self.prices, initial=0.0))
+    
+    @staticmethod
+    def levels(lower, upper, count, spacing='arithmetic'):
+        """count level prices from lower to upper, evenly or geometrically spaced"""
+        if spacing == 'geometric':
+            ratio = (upper / lower) ** (1 / (count - 1))
+            return [lower * ratio ** i for i in range(count)]
+        step = (upper - lower) / (count - 1)
+        return [lower + step * i for i in range(count)]
+    
+    @staticmethod
+    def nearest(prices, price):
+        """Index of the level closest to price (where the gap starts)"""
+        i = bisect.bisect_left(prices, price)
+        if i == len(prices) or (i > 0 and price - prices[i - 1] < prices[i] - price):
+            i -= 1
+        return i
+    
+    def crossed(self, price):
+        """('buy' | 'sell', level indices) the price has reached, or None"""
+        gap = self.record['gap']
+        low = bisect.bisect_left(self.prices, price, 0, gap)
+        if low < gap:
+            return 'buy', range(low, gap)
+        high = bisect.bisect_right(self.prices, price, gap + 1)
+        if high > gap + 1:
+            return 'sell', range(gap + 1, high)
+        return None
+    
+    def fill(self, side, count, amount_in, amount_out):
+        """Move the gap past count filled levels; returns the changed state"""
+        record = self.record
+        record['seq'] += 1
+        if side == 'buy':
+            record['gap'] -= count
+            record['buys'] += count
+            record['quote_spent'] += amount_in
+            record['base_bought'] += amount_out
+        else:
+            record['gap'] += count
+            record['sells'] += count
+            record['base_sold'] += amount_in
+            record['quote_received'] += amount_out
+        return {name: record[name] for name in self.STATE_FIELDS}
+    
+    def apply(self, delta):
+        """Replay a logged fill (older ones than the record's state are ignored)"""
+        if delta['seq'] > self.record['seq']:
+            self.record.update(delta)
+    
+    def buy_cost(self, levels):
+        """Quote needed to buy the grid's amount at each of levels (a range of indices)"""
+        return self.record['amount'] * (self._sums[levels.stop] - self._sums[levels.start])
+    
+    def needs(self):
+        """(base, quote) amounts the armed levels need"""
+        record = self.record
+        return record['amount'] * (record['levels'] - 1 - record['gap']), self.buy_cost(range(record['gap']))
+    
+    def triggers(self):
+        """The nearest buy and sell level prices"""
+        gap = self.record['gap']
+        return self.prices[max(0, gap - 1):gap] + self.prices[gap + 1:gap + 2]
+
+
+class OsmosisClient:
+    """Simple client for interacting with Osmosis"""
+    
+    # Every price dict carries 'source', 'height', 'timestamp' and 'confidence':
+    #   live     - quoted from the node just now
+    #   cache    - last live quote, served because the node query failed
+    #   snapshot - loaded from state_snapshot.json at startup
+    #   none     - no price known (prices are 0)
+    # Confidence starts at the source's weight and decays to 0 at PRICE_MAX_AGE.
+    PRICE_SOURCE_WEIGHTS = {"live": 1.0, "cache": 0.8, "snapshot": 0.5}
+    PRICE_MAX_AGE = 1800
+    
+    def __init__(self, root=None):
+        # Wallet information
+        self.wallet_name = "cl"  # Your wallet name
+        self.wallet_address = "osmo1yjamm9zkmqmyvqc5wjfha9egg4r4ha9nzkvpsd"
+        self.root = root
+        
+        # Token decimals and symbols
+        self.assets = AssetRegistry()
+
+        # Configured pairs plus any pools discovered on chain
+        self.pool_registry = PoolRegistry(self.assets)
+        self.pools = self.pool_registry.pools
+        self.route_selector = RouteSelector(self)
+        self.impact_curves = ImpactCurveCache(self)
+        self.price_history = PriceHistory()
+        self.split_swaps = True   # Let large market swaps spread over several routes
+
+        # Balances are exact TokenAmounts (base units + asset), one per configured asset
+        self.balances = {
+            symbol: TokenAmount(0, self.assets.by_symbol(symbol))
+            for symbol in self.pool_registry.symbols()
+        }
+        self.last_balance_update = 0
+        
+        # Balances between full queries come from confirmed swap deltas
+        self.ledger = BalanceLedger(self.assets)
+        
+        # Last successful quote per pair: {pair: {'data': ..., 'timestamp': ...}}
+        self.price_cache = {}
+        self.snapshot_file = "state_snapshot.json"
+        self._snapshot_lock = threading.Lock()
+        
+        # Block height is read at most once per block, or taken from other node responses
+        self._height = 0
+        self._height_time = 0
+
+    def get_wallet_balances(self, force_update=False):
+        """Get current wallet balances, re-querying the chain only when the ledger needs it"""
+        if not force_update and not self.ledger.needs_sync():
+            self.balances = self.ledger.snapshot(self.balances)
+            return self.balances
+            
+        try:
+            # Query the balances as of a known block, so exactly the swaps
+            # confirmed after it are applied on top
+            height = self.get_block_height()
+            if height:
+                # Quotes reuse this read (even if a node failover moved it back)
+                self._height, self._height_time = height, time.time()
+            
+            cmd = ["osmosisd", "q", "bank", "balances", self.wallet_address, "--output", "json"]
+            if height:
+                cmd += ["--height", str(height)]
+            result = subprocess.run(cmd, capture_output=True, text=True)
+            
+            if result.returncode == 0:
+                balances = json.loads(result.stdout)['balances']
+                self.ledger.sync({b['denom']: int(b['amount']) for b in balances}, height)
+                self.last_balance_update = time.time()
+                
+        except Exception as e:
+            print(f"Error fetching balances: {e}")
+        
+        self.balances = self.ledger.snapshot(self.balances)
+        return self.balances
+    
+    def save_state_snapshot(self):
+        """Persist last known prices and balances for the next start"""
+        try:
+            height, balances = self.ledger.raw_snapshot()
+            snapshot = {
+                'saved_at': time.time(),
+                'height': height,
+                'balances': balances,
+                'prices': dict(self.price_cache)
+            }
+            with self._snapshot_lock:
+                tmp_path = f"{self.snapshot_file}.tmp"
+                with open(tmp_path, 'w') as f:
+                    f.write(json.dumps(snapshot))
+                os.replace(tmp_path, self.snapshot_file)
+        except Exception as e:
+            print(f"Error saving state snapshot: {e}")
+    
+    def load_state_snapshot(self):
+        """Warm-start prices and balances from the last snapshot; returns its save time or None"""
+        try:
+            with open(self.snapshot_file, 'r') as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Error loading state snapshot: {e}")
+            return None
+        
+        for pair, entry in snapshot.get('prices', {}).items():
+            if pair not in self.pools or pair in self.price_cache:
+                continue
+            data = entry['data']
+            # JSON turns the exact ratios into lists
+            for key in ("base_per_quote_ratio", "quote_per_base_ratio"):
+                data[key] = tuple(data[key])
+            data['source'] = "snapshot"
+            self.price_cache[pair] = {'data': data, 'timestamp': entry['timestamp']}
+        
+        self.ledger.warm_start(snapshot.get('balances', {}))
+        self.balances = self.ledger.snapshot(self.balances)
+        return snapshot.get('saved_at')
+    
+    def cached_price(self, pair):
+        """Last known price data for a pair without querying (None if never seen)"""
+        entry = self.price_cache.get(pair)
+        if not entry:
+            return None
+        data = entry['data']
+        source = "cache" if data['source'] == "live" else data['source']
+        return dict(data, source=source, confidence=self.price_confidence(data, source))
+    
+    def price_confidence(self, price_info, source=None, now=None):
+        """Trust in a price dict from 0 to 1, by source and age"""
+        if not price_info.get('base_per_quote'):
+            return 0.0
+        weight = self.PRICE_SOURCE_WEIGHTS.get(source or price_info.get('source'), 0.0)
+        age = (now or time.time()) - price_info.get('timestamp', 0)
+        return max(0.0, weight * (1 - age / self.PRICE_MAX_AGE))
+    
+    def _unpriced(self, pair):
+        """Price dict for a pair with no usable quote"""
+        base_symbol, _, quote_symbol = pair.partition('/')
+        base_asset = self.assets.by_symbol(base_symbol)
+        quote_asset = self.assets.by_symbol(quote_symbol)
+        return {
+            "base_per_quote": 0.0,
+            "quote_per_base": 0.0,
+            "base_per_quote_ratio": (0, 1),
+            "quote_per_base_ratio": (0, 1),
+            "base_symbol": base_symbol if base_asset else "",
+            "quote_symbol": quote_symbol if quote_asset else "",
+            "base_decimals": base_asset.decimals if base_asset else AssetRegistry.DEFAULT_DECIMALS,
+            "quote_decimals": quote_asset.decimals if quote_asset else AssetRegistry.DEFAULT_DECIMALS,
+            "source": "none",
+            "height": 0,
+            "timestamp": 0,
+            "confidence": 0.0
+        }
+    
+    def current_height(self, max_age=5):
+        """Block height, re-read from the node at most every max_age seconds"""
+        if time.time() - self._height_time > max_age:
+            # Even a failed read is cached, so a dead node isn't asked on every quote
+            self._height_time = time.time()
+            self._height = self.get_block_height() or self._height
+        return self._height
+    
+    def note_height(self, height):
+        """Record a block height seen in a confirmed tx, unless a newer one is known"""
+        if height and height >= self._height:
+            self._height = height
+            self._height_time = time.time()
+    
+    def get_block_height(self):
+        """Get the latest block height from the node (0 if unavailable)"""
+        try:
+            result = subprocess.run(["osmosisd", "status"], capture_output=True, text=True)
+            # Older nodes print status to stderr
+            status = json.loads(result.stdout or result.stderr)
+            sync_info = status.get("sync_info") or status.get("SyncInfo") or {}
+            return int(sync_info.get("latest_block_height", 0))
+        except Exception as e:
+            print(f"Error fetching block height: {e}")
+            return 0
+    
+    def apply_confirmed_swap(self, tx_hash, tx_details):
+        """Apply a confirmed swap from query_transaction_details to the balance ledger"""
+        applied = self.ledger.apply_swap(
+            tx_hash,
+            tx_details['denom_in'], tx_details['amount_in_raw'],
+            tx_details['denom_out'], tx_details['amount_out_raw'],
+            tx_details.get('fees', ()),
+            tx_details.get('height', 0)
+        )
+        self.note_height(tx_details.get('height', 0))
+        self.balances = self.ledger.snapshot(self.balances)
+        
+        # Our fills are the only volume we see; book it in base units of the pair
+        pair = self.pool_registry.pair_for(tx_details['denom_in'], tx_details['denom_out'])
+        if applied and pair and tx_details.get('execution_price'):
+            base_in = pair.startswith(f"{self.assets.symbol(tx_details['denom_in'])}/")
+            self.price_history.record(pair, tx_details['execution_price'],
+                                      volume=tx_details['amount_in'] if base_in else tx_details['amount_out'])
+        return applied
+
+    def _parse_token_amount(self, token_string):
+        """Parse a token string like '1000000uosmo' into amount and denom"""
+        try:
+            # Find the position where the numeric part ends
+            for i, char in enumerate(token_string):
+                if not (char.isdigit()):
+                    amount = token_string[:i]
+                    denom = token_string[i:]
+                    return {'amount': int(amount), 'denom': denom}
+                    
+            # If we get here, the string was only digits
+            return None
+        except Exception as e:
+            print(f"Error parsing token amount '{token_string}': {str(e)}")
+            return None
+    
+    def _convert_to_human_readable(self, amount, denom):
+        """Convert raw token amount to human-readable form based on denomination"""
+        try:
+            # Unknown tokens default to 6 decimals
+            return self.assets.to_human(amount, denom)
+        except Exception as e:
+            print(f"Error converting amount {amount} with denom {denom}: {str(e)}")
+            return 0
+
+
+    def estimate_swap(self, pool_id, amount_raw, denom_in, denom_out):
+        """Output (base units, after spread factor) of swapping through one pool, or None"""
+        try:
+            cmd = [
+                "osmosisd", "query", "poolmanager", "estimate-single-pool-swap-exact-amount-in",
+                str(pool_id), f"{amount_raw}{denom_in}", denom_out,
+                "--output", "json"
+            ]
+            result = subprocess.run(cmd, capture_output=True, text=True)
+            if result.returncode != 0:
+                return None
+            return int(json.loads(result.stdout)["token_out_amount"])
+        except Exception as e:
+            print(f"Error estimating swap in pool {pool_id}: {e}")
+            return None
+    
+    def estimate_route(self, pool_ids, denoms, amount_raw, denom_in):
+        """Output (base units) of a multi-hop route, or None
+
+        pool_ids and denoms are comma-separated, as for --swap-route-pool-ids
+        and --swap-route-denoms.
+        """
+        try:
+            cmd = [
+                "osmosisd", "query", "poolmanager", "estimate-swap-exact-amount-in",
+                f"{amount_raw}{denom_in}",
+                "--swap-route-pool-ids", pool_ids,
+                "--swap-route-denoms", denoms,
+                "--output", "json"
+            ]
+            result = subprocess.run(cmd, capture_output=True, text=True)
+            if result.returncode != 0:
+                return None
+            return int(json.loads(result.stdout)["token_out_amount"])
+        except Exception as e:
+            print(f"Error estimating route {pool_ids}: {e}")
+            return None
+    
+    def get_pool_price(self, pair: str) -> dict:
+        """Get the current price for a trading pair using poolmanager estimate-swap-exact-amount-in"""
+        # Add cache cleanup to prevent memory growth
+        if len(self.price_cache) > 15:  # Limit cache to 15 entries
+            # Remove oldest entries
+            oldest_pairs = sorted(self.price_cache.keys(), 
+                                key=lambda k: self.price_cache[k]['timestamp'])[:5]
+            for old_pair in oldest_pairs:
+                del self.price_cache[old_pair]
+        
+        try:
+            pool = self.pools.get(pair)
+            if not pool:
+                raise ValueError(f"Unsupported trading pair: {pair}")
+                
+            pool_id = pool["pool_id"]
+            base_denom = pool["base_denom"]
+            quote_denom = pool["quote_denom"]
+            
+            # Use small amounts for price queries to avoid slippage
+            # (1 OSMO, 0.001 BTC/ETH, 1 USDC - see AssetRegistry price_probe)
+            base_asset = self.assets.asset_for(base_denom)
+            quote_asset = self.assets.asset_for(quote_denom)
+            base_decimals = base_asset.decimals
+            quote_decimals = quote_asset.decimals
+            base_probe = TokenAmount.from_human(base_asset.price_probe, base_asset)
+            quote_probe = TokenAmount.from_human(quote_asset.price_probe, quote_asset)
+            
+            test_amount_base = f"{base_probe.raw}{base_denom}"
+            test_amount_quote = f"{quote_probe.raw}{quote_denom}"
+            
+            # Query price base -> quote using estimate-single-pool-swap-exact-amount-in
+            base_to_quote_cmd = [
+                "osmosisd", "query", "poolmanager", "estimate-single-pool-swap-exact-amount-in",
+                pool_id, test_amount_base, quote_denom,
+                "--output", "json"
+            ]
+            
+            base_to_quote_result = subprocess.run(base_to_quote_cmd, capture_output=True, text=True)
+            
+            if base_to_quote_result.returncode != 0:
+                # Check if this is the known spread factor error
+                if "spread factor charge must be non-negative" in base_to_quote_result.stderr:
+                    print(f"Using cached values for {pair} due to spread factor issue")
+                    # Use cached price if available
+                    if pair in self.price_cache:
+                        print(f"Using cached price from {self.price_cache[pair]['timestamp']}")
+                        return self.cached_price(pair)
+                    else:
+                        raise ValueError(f"Failed to get base->quote price and no cache available")
+                else:
+                    print(f"Full stderr for {pair}: {base_to_quote_result.stderr}")
+                    print(f"Full stdout for {pair}: {base_to_quote_result.stdout}")
+                    raise ValueError(f"Failed to get base->quote price: {base_to_quote_result.stderr}")
+                    
+            base_to_quote_data = json.loads(base_to_quote_result.stdout)
+            base_to_quote_amount = int(base_to_quote_data["token_out_amount"])
+            
+            # Query price quote -> base using estimate-single-pool-swap-exact-amount-in
+            quote_to_base_cmd = [
+                "osmosisd", "query", "poolmanager", "estimate-single-pool-swap-exact-amount-in",
+                pool_id, test_amount_quote, base_denom,
+                "--output", "json"
+            ]
+            
+            quote_to_base_result = subprocess.run(quote_to_base_cmd, capture_output=True, text=True)
+        
+            if quote_to_base_result.returncode != 0:
+                # Check if this is the known spread factor error
+                if "spread factor charge must be non-negative" in quote_to_base_result.stderr:
+                    print(f"Using cached values for {pair} due to spread factor issue")
+                    # Use cached price if available
+                    if pair in self.price_cache:
+                        print(f"Using cached price from {self.price_cache[pair]['timestamp']}")
+                        return self.cached_price(pair)
+                    else:
+                        raise ValueError(f"Failed to get quote->base price and no cache available")
+                else:
+                    raise ValueError(f"Failed to get quote->base price: {quote_to_base_result.stderr}")
+                    
+            quote_to_base_data = json.loads(quote_to_base_result.stdout)
+            quote_to_base_amount = int(quote_to_base_data["token_out_amount"])
+        
+            # Calculate both price directions as exact ratios of base units,
+            # scaled by each token's decimals
+            base_per_quote_ratio = (base_to_quote_amount * base_asset.scale, base_probe.raw * quote_asset.scale)
+            quote_per_base_ratio = (quote_to_base_amount * quote_asset.scale, quote_probe.raw * base_asset.scale)
+            
+            price_data = {
+                "base_per_quote": base_per_quote_ratio[0] / base_per_quote_ratio[1],  # e.g., USDC per BTC (number like 60000)
+                "quote_per_base": quote_per_base_ratio[0] / quote_per_base_ratio[1],  # e.g., BTC per USDC (small number like 0.000016)
+                "base_per_quote_ratio": base_per_quote_ratio,  # Exact values for trigger comparisons
+                "quote_per_base_ratio": quote_per_base_ratio,
+                "base_symbol": self._get_token_symbol(pool["base_denom"]),
+                "quote_symbol": self._get_token_symbol(pool["quote_denom"]),
+                "base_decimals": base_decimals,
+                "quote_decimals": quote_decimals,
+                "source": "live",
+                # The last height seen; a quote doesn't pay for its own status call
+                "height": self.current_height(max_age=math.inf),
+                "timestamp": time.time(),
+                "confidence": 1.0
+            }
+            
+            # Cache the successful price
+            self.price_cache[pair] = {
+                'data': price_data,
+                'timestamp': price_data['timestamp']
+            }
+            self.price_history.record(pair, price_data['base_per_quote'], price_data['timestamp'])
+            
+            return price_data
+            
+        except Exception as e:
+            print(f"Error getting pool price: {e}")
+            
+            # Serve the last good quote, labelled with its source and age
+            if pair in self.price_cache:
+                # Check if cache is not too old (e.g., less than 30 minutes)
+                if time.time() - self.price_cache[pair]['timestamp'] < self.PRICE_MAX_AGE:
+                    print(f"Using cached price from {self.price_cache[pair]['timestamp']}")
+                    return self.cached_price(pair)
+            
+            return self._unpriced(pair)
+    
+    def _get_token_symbol(self, denom):
+        """Get a human-readable symbol from a token denomination"""
+        return self.assets.symbol(denom)
+
+    def execute_market_swap(self, from_token_symbol, to_token_symbol, amount_in, min_out=None):
+        """Execute a market swap with exact amount in
+
+        amount_in and min_out may be display-unit numbers or TokenAmounts.
+        """
+        try:
+            from_asset = self.assets.by_symbol(from_token_symbol)
+            to_asset = self.assets.by_symbol(to_token_symbol)
+            if from_asset is None or to_asset is None:
+                raise ValueError(f"Could not find pool for {from_token_symbol} to {to_token_symbol}")
+            token_in = from_asset.denom
+            token_out = to_asset.denom
+            
+            # Format the amount with proper denomination and decimals
+            amount_in_tokens = TokenAmount.from_human(amount_in, self.assets.asset_for(token_in)).raw
+            
+            # Best route for this size (shares quotes with the UI hint)
+            route = self.route_selector.best_route(token_in, token_out, amount_in_tokens)
+            if route is None:
+                raise ValueError(f"Could not find pool for {from_token_symbol} to {to_token_symbol}")
+            pool_ids = self.route_selector.pool_ids(route)
+            
+            # Large orders may pay more spread over several routes
+            split = self.route_selector.split_route(token_in, token_out, amount_in_tokens, route) if self.split_swaps else None
+                
+            # Ensure no spaces between amount and denom - this is critical
+            amount_in_formatted = f"{amount_in_tokens}{token_in}"
+        
+            # Set minimum output if provided
+            min_amount_out = ""
+            if min_out:
+                min_out_tokens = TokenAmount.from_human(min_out, self.assets.asset_for(token_out)).raw
+                    
+                # Again, ensure no spaces between amount and denom
+                min_amount_out = f"{min_out_tokens}"
+            
+            if split:
+                return self._execute_split_swap(split, token_in, min_amount_out)
+            
+            # Construct the command for a market swap with exact amount in
+            cmd = [
+                "osmosisd", "tx", "poolmanager", "swap-exact-amount-in",
+                amount_in_formatted,
+                min_amount_out,
+                "--swap-route-pool-ids", pool_ids,
+                "--swap-route-denoms", ",".join(route['denoms']),
+                "--from", self.wallet_name,
+                "--chain-id", "osmosis-1",
+                "--gas", "auto",
+                "--gas-adjustment", "1.3",
+                "--gas-prices", "0.035uosmo",
+                "-y"
+            ]
+            
+            # Execute the command
+            result = subprocess.run(cmd, capture_output=True, text=True)
+            return self._swap_result(result, pool_ids=pool_ids)
+                    
+        except Exception as e:
+            print(f"Exception during swap execution: {str(e)}")
+            return {
+                "success": False,
+                "error": str(e)
+            }
+    
+    def _execute_split_swap(self, split, token_in, min_amount_out):
+        """Send a split plan as one split-route-swap-exact-amount-in transaction"""
+        routes = {
+            "Route": [
+                {
+                    "swap_amount_in_route": [
+                        {"pool_id": int(pool["pool_id"]), "token_out_denom": denom}
+                        for pool, denom in zip(leg['pools'], leg['denoms'])
+                    ],
+                    "token_in_amount": leg['amount_in']
+                }
+                for leg in split['legs']
+            ]
+        }
+        with tempfile.NamedTemporaryFile('w', suffix=".json", prefix="routes-", delete=False) as f:
+            f.write(json.dumps(routes))
+            routes_file = f.name
+        try:
+            cmd = [
+                "osmosisd", "tx", "poolmanager", "split-route-swap-exact-amount-in",
+                token_in, min_amount_out or "1",
+                "--routes-file", routes_file,
+                "--from", self.wallet_name,
+                "--chain-id", "osmosis-1",
+                "--gas", "auto",
+                "--gas-adjustment", "1.3",
+                "--gas-prices", "0.035uosmo",
+                "-y"
+            ]
+            result = subprocess.run(cmd, capture_output=True, text=True)
+        finally:
+            os.remove(routes_file)
+        return self._swap_result(
+            result,
+            pool_ids=";".join(self.route_selector.pool_ids(leg) for leg in split['legs']),
+            split=[leg['amount_in'] for leg in split['legs']]
+        )
+    
+    def _swap_result(self, result, **details):
+        """Result dict for a completed swap command"""
+        if result.returncode != 0:
+            print(f"Error output: {result.stderr}")
+            return {
+                "success": False,
+                "error": result.stderr
+            }
+        
+        # Try to parse as JSON, but handle non-JSON responses
+        try:
+            response_data = json.loads(result.stdout)
+            tx_hash = response_data.get("txhash", "Unknown")
+            
+            return {
+                "success": True,
+                "tx_hash": tx_hash,
+                **details
+            }
+        except json.JSONDecodeError:
+            # Handle case where response is not valid JSON
+            tx_hash_match = re.search(r'txhash:\s*([A-F0-9]+)', result.stdout)
+            if tx_hash_match:
+                tx_hash = tx_hash_match.group(1)
+                return {
+                    "success": True,
+                    "tx_hash": tx_hash,
+                    **details
+                }
+            
+            return {
+                "success": True,
+                "tx_hash": "Transaction submitted (hash not found in output)",
+                "raw_output": result.stdout
+            }
+
+    def query_transaction_details(self, tx_hash):
+        """Query the blockchain for exact transaction details using REST API"""
+        try:
+            # Skip querying for synthetic transactions (like pending orders)
+            if tx_hash.startswith('order-'):
+                return None
+            
+            # Use requests library to query the Osmosis REST API
+            import requests
+            
+            # Base URL for Osmosis LCD API
+            base_url = "https://lcd.osmosis.zone"
+            
+            # Endpoint for transaction details
+            tx_url = f"{base_url}/cosmos/tx/v1beta1/txs/{tx_hash}"
+            
+            # Make the request
+            response = requests.get(tx_url)
+            
+            # Check if request was successful
+            if response.status_code != 200:
+                print(f"Error querying transaction {tx_hash}: HTTP {response.status_code}")
+                print(f"Response: {response.text}")
+                return None
+            
+            # Parse the response
+            return self._parse_swap_tx(tx_hash, response.json())
+        except Exception as e:
+            print(f"Error processing transaction {tx_hash}: {str(e)}")
+            return None
+    
+    # Swap messages the wallet sends (see execute_market_swap)
+    SWAP_MSG_TYPES = ('/osmosis.poolmanager.v1beta1.MsgSwapExactAmountIn',
+                      '/osmosis.poolmanager.v1beta1.MsgSplitRouteSwapExactAmountIn')
+    
+    @staticmethod
+    def _swap_legs(hop_attrs, msg=None):
+        """Group a swap's token_swapped events into legs, one list of hops per route
+
+        A split-route message gives each route's hop count; otherwise a hop
+        continues the current leg when it spends what the previous hop paid out.
+        """
+        routes = (msg or {}).get('routes')
+        if routes and sum(len(route.get('pools', ())) for route in routes) == len(hop_attrs):
+            legs, i = [], 0
+            for route in routes:
+                legs.append(hop_attrs[i:i + len(route['pools'])])
+                i += len(route['pools'])
+            return legs
+        legs = []
+        for attrs in hop_attrs:
+            if legs and attrs.get('tokens_in') == legs[-1][-1].get('tokens_out'):
+                legs[-1].append(attrs)
+            else:
+                legs.append([attrs])
+        return legs
+    
+    def _parse_swap_tx(self, tx_hash, tx_data):
+        """Swap details from a queried transaction (see query_transaction_details)"""
+        # Find token swap events
+        token_swapped_events = [
+            event for event in tx_data.get('tx_response', {}).get('events', [])
+            if event.get('type') == 'token_swapped'
+        ]
+        
+        # No swap events found
+        if not token_swapped_events:
+            print(f"No swap data found in transaction {tx_hash}")
+            return None
+        
+        hop_attrs = [
+            {attr['key']: attr['value'] for attr in event.get('attributes', [])}
+            for event in token_swapped_events
+        ]
+        
+        # Original transaction message, for the minimum output and the split's routes
+        original_msg = None
+        for msg in tx_data.get('tx', {}).get('body', {}).get('messages', []):
+            if msg.get('@type') in self.SWAP_MSG_TYPES:
+                original_msg = msg
+                break
+        
+        # One event per pool: each leg (route) spends what goes in to its first
+        # hop and receives what comes out of its last one
+        legs = self._swap_legs(hop_attrs, original_msg)
+        ins = [self._parse_token_amount(leg[0].get('tokens_in', '')) for leg in legs]
+        outs = [self._parse_token_amount(leg[-1].get('tokens_out', '')) for leg in legs]
+        
+        if not all(ins) or not all(outs):
+            print(f"Could not parse token amounts for {tx_hash}")
+            return None
+        if len({part['denom'] for part in ins}) > 1 or len({part['denom'] for part in outs}) > 1:
+            print(f"Swap legs of {tx_hash} don't share their input and output tokens")
+            return None
+        amount_in_parts = {'amount': sum(part['amount'] for part in ins), 'denom': ins[0]['denom']}
+        amount_out_parts = {'amount': sum(part['amount'] for part in outs), 'denom': outs[0]['denom']}
+        
+        # Convert to human-readable amounts
+        amount_in = self._convert_to_human_readable(amount_in_parts['amount'], amount_in_parts['denom'])
+        amount_out = self._convert_to_human_readable(amount_out_parts['amount'], amount_out_parts['denom'])
+        
+        # Calculate execution price
+        execution_price = None
+        from_token = self._get_token_symbol(amount_in_parts['denom'])
+        to_token = self._get_token_symbol(amount_out_parts['denom'])
+        
+        # Price in quote per base of the configured pair
+        pair = self.pool_registry.pair_for(amount_in_parts['denom'], amount_out_parts['denom'])
+        
+        if amount_in > 0 and amount_out > 0 and pair:
+            if pair.startswith(f"{from_token}/"):
+                # Selling base token (e.g., BTC/USDC)
+                execution_price = amount_out / amount_in
+            else:
+                # Buying base token (e.g., USDC/BTC)
+                execution_price = amount_in / amount_out
+        
+        # Fees paid by the wallet, for the balance ledger
+        fees = [
+            (coin['denom'], int(coin['amount']))
+            for coin in tx_data.get('tx', {}).get('auth_info', {}).get('fee', {}).get('amount', [])
+        ]
+        
+        return {
+            'amount_in_raw': amount_in_parts['amount'],
+            'denom_in': amount_in_parts['denom'],
+            'amount_out_raw': amount_out_parts['amount'],
+            'denom_out': amount_out_parts['denom'],
+            'amount_in': amount_in,
+            'amount_out': amount_out,
+            'token_in': from_token,
+            'token_out': to_token,
+            'execution_price': execution_price,
+            # Legs separated like the swap result's pool_ids
+            'pool_id': ";".join(",".join(attrs.get('pool_id', '') for attrs in leg) for leg in legs),
+            'min_out_amount': original_msg.get('token_out_min_amount') if original_msg else None,
+            'fees': fees,
+            'height': int(tx_data.get('tx_response', {}).get('height', 0))
+        }
+
+class TransactionLogger:
+    """Handles logging and retrieval of transaction history with enhanced details
+
+    History is rotated into per-month partitions (transactions/YYYY-MM.jsonl,
+    one transaction per line) tracked by a small manifest. Only the current
+    month is kept in memory; older partitions are loaded on demand when a
+    query reaches back into them. New fills are appended to their partition;
+    the manifest is rewritten when a month is rolled over, not per fill.
+    """
+    
+    def __init__(self):
+        self.transactions_file = "transactions.json"  # Legacy single-file log
+        self.transactions_dir = "transactions"
+        self.manifest_file = os.path.join(self.transactions_dir, "manifest.json")
+        self.pending_orders_file = "pending_orders.json"
+        self.parent_orders_file = "parent_orders.json"   # Active TWAP/iceberg parents
+        self.dca_schedules_file = "dca_schedules.json"   # Recurring buys
+        self.grids_file = "grids.json"                   # Grid strategies, as of the last snapshot
+        self.grid_deltas_file = "grid_deltas.jsonl"      # Grid level changes since then
+        self._grid_deltas = 0
+        
+        # Guards the in-memory partitions (updates arrive from worker threads)
+        self._lock = threading.RLock()
+        
+        # Lazily loaded older partitions, least recently used evicted first
+        self._partition_cache = OrderedDict()
+        self._partition_cache_limit = 3
+        
+        if not os.path.exists(self.transactions_dir):
+            os.makedirs(self.transactions_dir)
+        
+        self.manifest = self._load_manifest()
+        
+        # Split an old single-file history into partitions once
+        if os.path.exists(self.transactions_file):
+            self._migrate_legacy_log()
+        
+        # Load the active (current month) partition eagerly
+        self.active_partition = self._partition_key(datetime.now().isoformat())
+        self._active_transactions = self._read_partition_file(self.active_partition)
+        
+        # The manifest entry of the last active month may predate its last fills
+        previous = self.manifest.get("active")
+        if previous != self.active_partition:
+            transactions = self._read_partition_file(previous) if previous else []
+            if transactions:
+                self._index_partition(previous, transactions)
+            self.manifest["active"] = self.active_partition
+            self._save_manifest()
+                
+        if not os.path.exists(self.pending_orders_file):
+            with open(self.pending_orders_file, 'w') as f:
+                json.dump([], f)
+        self._pending_orders = None
+    
+    @staticmethod
+    def _partition_key(timestamp):
+        """Get the partition key (YYYY-MM) for an ISO timestamp"""
+        return timestamp[:7]
+    
+    def _partition_path(self, key):
+        return os.path.join(self.transactions_dir, f"{key}.jsonl")
+    
+    @staticmethod
+    def _write_json(path, data, indent=2):
+        """Write JSON atomically so a crash never leaves a half-written file"""
+        tmp_path = f"{path}.tmp"
+        # dumps() rather than dump(): with indent=None it takes the C encoder
+        with open(tmp_path, 'w') as f:
+            f.write(json.dumps(data, indent=indent))
+        os.replace(tmp_path, path)
+    
+    def _load_manifest(self):
+        """Load the partition manifest, creating an empty one if needed"""
+        try:
+            if os.path.exists(self.manifest_file):
+                with open(self.manifest_file, 'r') as f:
+                    return json.load(f)
+        except Exception as e:
+            print(f"Error reading transaction manifest: {e}")
+        return {"partitions": {}}
+    
+    def _save_manifest(self):
+        try:
+            self._write_json(self.manifest_file, self.manifest)
+        except Exception as e:
+            print(f"Error saving transaction manifest: {e}")
+    
+    def _read_partition_file(self, key):
+        """Read one partition from disk"""
+        path = self._partition_path(key)
+        try:
+            if not os.path.exists(path):
+                # Partitions used to be written as one JSON array
+                legacy_path = os.path.join(self.transactions_dir, f"{key}.json")
+                if not os.path.exists(legacy_path):
+                    return []
+                with open(legacy_path, 'r') as f:
+                    return json.load(f)
+            
+            transactions = []
+            with open(path, 'r') as f:
+                for line in f:
+                    try:
+                        transactions.append(json.loads(line))
+                    except ValueError:
+                        continue   # Torn line from a crash mid-append
+            return transactions
+        except Exception as e:
+            print(f"Error reading transaction partition {key}: {e}")
+            return []
+    
+    def _load_partition(self, key):
+        """Get a partition, serving the active one from memory and older ones lazily"""
+        if key == self.active_partition:
+            return self._active_transactions
+        
+        if key in self._partition_cache:
+            self._partition_cache.move_to_end(key)
+            return self._partition_cache[key]
+        
+        transactions = self._read_partition_file(key)
+        self._cache_partition(key, transactions)
+        return transactions
+    
+    def _cache_partition(self, key, transactions):
+        """Cache an older partition, evicting the least recently used one when full"""
+        self._partition_cache[key] = transactions
+        self._partition_cache.move_to_end(key)
+        while len(self._partition_cache) > self._partition_cache_limit:
+            self._partition_cache.popitem(last=False)
+    
+    def _save_partition(self, key, transactions):
+        """Rewrite one partition atomically (for edits; new fills are appended)"""
+        tmp_path = f"{self._partition_path(key)}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write("".join(json.dumps(tx) + "\n" for tx in transactions))
+        os.replace(tmp_path, self._partition_path(key))
+        
+        legacy_path = os.path.join(self.transactions_dir, f"{key}.json")
+        if os.path.exists(legacy_path):
+            os.remove(legacy_path)
+    
+    def _append_partition(self, key, batch):
+        """Append transactions to a partition with one write"""
+        if not os.path.exists(self._partition_path(key)):
+            # First write since the JSON-array format: convert the whole month once
+            self._save_partition(key, self._read_partition_file(key) + batch)
+            return
+        with open(self._partition_path(key), 'a+') as f:
+            # Start on a fresh line if a crash tore the last append
+            f.seek(0, os.SEEK_END)
+            torn = False
+            if f.tell():
+                f.seek(f.tell() - 1)
+                torn = f.read(1) != "\n"
+            f.write(("\n" if torn else "") + "".join(json.dumps(tx) + "\n" for tx in batch))
+    
+    def _index_partition(self, key, transactions):
+        """Refresh a partition's manifest entry (saved by the caller)"""
+        highest_order = 0
+        for tx in transactions:
+            highest_order = max(highest_order, self._order_number(tx))
+        
+        self.manifest["partitions"][key] = {
+            "count": len(transactions),
+            "first": transactions[0]['timestamp'] if transactions else None,
+            "last": transactions[-1]['timestamp'] if transactions else None,
+            "max_order_num": highest_order
+        }
+    
+    @staticmethod
+    def _order_number(tx):
+        """Extract the numeric part of a transaction's order ID, or 0"""
+        order_id = tx.get('order_id')
+        if order_id is None and str(tx.get('tx_hash', '')).startswith('order-'):
+            # Older transactions stored the order ID in the tx_hash field
+            order_id = tx['tx_hash']
+        if not order_id:
+            return 0
+        try:
+            return int(order_id.split('-')[1])
+        except (IndexError, ValueError):
+            return 0
+    
+    def _migrate_legacy_log(self):
+        """Move transactions.json into monthly partitions
+
+        Idempotent: if a crash stops it before the legacy file is renamed,
+        the next start merges only what the partitions don't have yet.
+        """
+        try:
+            with open(self.transactions_file, 'r') as f:
+                legacy = json.load(f)
+            
+            partitions = {}
+            for tx in legacy:
+                partitions.setdefault(self._partition_key(tx['timestamp']), []).append(tx)
+            
+            for key, transactions in partitions.items():
+                # Merge with anything already partitioned for that month
+                existing = self._read_partition_file(key)
+                present = {(tx.get('tx_hash'), tx['timestamp']) for tx in existing}
+                added = [tx for tx in transactions if (tx.get('tx_hash'), tx['timestamp']) not in present]
+                if not added:
+                    continue
+                merged = existing + added
+                merged.sort(key=lambda tx: tx['timestamp'])
+                self._save_partition(key, merged)
+                self._index_partition(key, merged)
+                self._save_manifest()
+            
+            os.replace(self.transactions_file, f"{self.transactions_file}.migrated")
+            print(f"Migrated {len(legacy)} transactions into {len(partitions)} partition(s)")
+        except Exception as e:
+            print(f"Error migrating transaction log: {e}")
+    
+    def _roll_partition(self, key):
+        """Switch the active partition when a new month starts"""
+        if key <= self.active_partition:
+            return
+        # The finished month becomes a regular lazily-loaded partition
+        self._index_partition(self.active_partition, self._active_transactions)
+        self._cache_partition(self.active_partition, self._active_transactions)
+        self.active_partition = key
+        self._active_transactions = self._read_partition_file(key)
+        self.manifest["active"] = key
+        self._save_manifest()
+    
+    def _partition_keys(self, start=None, end=None, newest_first=False):
+        """List partition keys overlapping an optional [start, end] ISO time range"""
+        keys = set(self.manifest["partitions"])
+        keys.add(self.active_partition)
+        
+        if start:
+            keys = {k for k in keys if k >= self._partition_key(start)}
+        if end:
+            keys = {k for k in keys if k <= self._partition_key(end)}
+        
+        return sorted(keys, reverse=newest_first)
+    
+    def log_transaction(self, tx_data):
+        """Log a completed transaction"""
+        self.log_transactions([tx_data])
+    
+    def log_transactions(self, records):
+        """Log several transactions with one write per partition"""
+        try:
+            with self._lock:
+                by_partition = {}
+                for tx_data in records:
+                    by_partition.setdefault(self._partition_key(tx_data['timestamp']), []).append(tx_data)
+                for key, batch in by_partition.items():
+                    self._roll_partition(key)
+                    
+                    transactions = self._load_partition(key)
+                    self._append_partition(key, batch)
+                    transactions.extend(batch)
+                    if key != self.active_partition:
+                        # A back-dated fill into a finished month
+                        self._index_partition(key, transactions)
+                        self._save_manifest()
+        except Exception as e:
+            print(f"Error logging transaction: {e}")
+    
+    def update_transaction(self, tx_hash, updated_data, since=None):
+        """Update an existing transaction with actual execution data; False if it isn't logged
+
+        since (ISO time) bounds the search to the partitions from then on, so
+        an unknown hash doesn't load the whole history.
+        """
+        try:
+            with self._lock:
+                # Updates almost always target recent fills, so search newest first
+                for key in self._partition_keys(since, newest_first=True):
+                    transactions = self._load_partition(key)
+                    
+                    # Find the transaction by hash
+                    for tx in reversed(transactions):
+                        if tx.get('tx_hash') == tx_hash:
+                            tx.update(updated_data)
+                            self._save_partition(key, transactions)
+                            return True
+                
+            return False
+        except Exception as e:
+            print(f"Error updating transaction: {e}")
+            return False
+    
+    def find_transaction(self, tx_hash, since=None):
+        """Find a single transaction by hash, newest partitions first (from since on, if given)"""
+        with self._lock:
+            for key in self._partition_keys(since, newest_first=True):
+                for tx in reversed(self._load_partition(key)):
+                    if tx.get('tx_hash') == tx_hash:
+                        return tx
+        return None
+            
+    def get_transactions(self, start=None, end=None):
+        """Get logged transactions, optionally limited to an ISO time range"""
+        try:
+            with self._lock:
+                transactions = []
+                for key in self._partition_keys(start, end):
+                    transactions.extend(self._load_partition(key))
+            
+            if start or end:
+                transactions = [
+                    tx for tx in transactions
+                    if (not start or tx['timestamp'] >= start) and (not end or tx['timestamp'] <= end)
+                ]
+            return transactions
+        except Exception as e:
+            print(f"Error reading transactions: {e}")
+            return []
+    
+    def iter_transactions(self, newest_first=False):
+        """Yield every logged transaction in time order, one partition in memory at a time
+
+        Partitions that aren't already loaded are read straight from disk and
+        not cached, so a full pass (e.g. an export) doesn't evict the recent ones.
+        """
+        for key in self._partition_keys(newest_first=newest_first):
+            with self._lock:
+                loaded = key == self.active_partition or key in self._partition_cache
+                transactions = list(self._load_partition(key)) if loaded else None
+            if transactions is None:
+                # Partition files are replaced atomically, so this read needs no lock
+                transactions = self._read_partition_file(key)
+            transactions.sort(key=lambda tx: tx['timestamp'], reverse=newest_first)
+            yield from transactions
+    
+    def get_recent_transactions(self, limit=50):
+        """Get the most recent transactions, touching older partitions only if needed"""
+        try:
+            with self._lock:
+                recent = []
+                for key in self._partition_keys(newest_first=True):
+                    recent = self._load_partition(key)[-(limit - len(recent)):] + recent
+                    if len(recent) >= limit:
+                        break
+            return recent
+        except Exception as e:
+            print(f"Error reading transactions: {e}")
+            return []
+    
+    def get_highest_order_number(self):
+        """Get the highest order number recorded in history, from the manifest"""
+        with self._lock:
+            highest = max(
+                (p.get("max_order_num", 0) for p in self.manifest["partitions"].values()),
+                default=0
+            )
+            for tx in self._active_transactions:
+                highest = max(highest, self._order_number(tx))
+        return highest
+    
+    def _pending(self):
+        """Pending orders, read from disk once and then served from memory"""
+        if self._pending_orders is None:
+            try:
+                with open(self.pending_orders_file, 'r') as f:
+                    self._pending_orders = json.load(f)
+            except Exception as e:
+                print(f"Error reading pending orders: {e}")
+                self._pending_orders = []
+        return self._pending_orders
+    
+    def _save_pending(self):
+        # Compact: rewritten on every order change, so encoding speed matters more than readability
+        self._write_json(self.pending_orders_file, self._pending_orders, indent=None)
+    
+    def add_pending_order(self, order_data):
+        """Add a new pending limit order"""
+        self.add_pending_orders([order_data])
+    
+    def add_pending_orders(self, orders):
+        """Add several pending orders with a single write"""
+        try:
+            with self._lock:
+                self._pending().extend(orders)
+                self._save_pending()
+        except Exception as e:
+            print(f"Error adding pending order: {e}")
+    
+    def get_pending_orders(self):
+        """Get all pending limit orders"""
+        with self._lock:
+            return list(self._pending())
+    
+    def remove_pending_order(self, order_id):
+        """Remove a completed or canceled order"""
+        self.remove_pending_orders([order_id])
+    
+    def remove_pending_orders(self, order_ids):
+        """Remove several orders with a single write"""
+        try:
+            with self._lock:
+                order_ids = set(order_ids)
+                orders = self._pending()
+                remaining = [o for o in orders if o['id'] not in order_ids]
+                if len(remaining) != len(orders):
+                    self._pending_orders = remaining
+                    self._save_pending()
+        except Exception as e:
+            print(f"Error removing pending order: {e}")
+    
+    def update_pending_orders(self, updates):
+        """Set fields of several pending orders ({order id: {field: value}}) with a single write"""
+        try:
+            with self._lock:
+                changed = False
+                for order in self._pending():
+                    if order['id'] in updates:
+                        order.update(updates[order['id']])
+                        changed = True
+                if changed:
+                    self._save_pending()
+        except Exception as e:
+            print(f"Error updating pending orders: {e}")
+    
+    def get_parent_orders(self):
+        """Active sliced (TWAP/iceberg) parent orders"""
+        try:
+            with open(self.parent_orders_file, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+        except Exception as e:
+            print(f"Error reading parent orders: {e}")
+            return []
+    
+    def save_parent_orders(self, parents):
+        """Replace the active parent orders (children are logged as transactions)"""
+        try:
+            with self._lock:
+                self._write_json(self.parent_orders_file, parents, indent=None)
+        except Exception as e:
+            print(f"Error saving parent orders: {e}")
+    
+    def get_dca_schedules(self):
+        """Active recurring (DCA) schedules"""
+        try:
+            with open(self.dca_schedules_file, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+        except Exception as e:
+            print(f"Error reading DCA schedules: {e}")
+            return []
+    
+    def save_dca_schedules(self, schedules):
+        """Replace the active DCA schedules (their buys are logged as transactions)"""
+        try:
+            with self._lock:
+                self._write_json(self.dca_schedules_file, schedules, indent=None)
+        except Exception as e:
+            print(f"Error saving DCA schedules: {e}")
+    
+    def get_grids(self):
+        """Grid strategies as of the last snapshot (see get_grid_deltas)"""
+        try:
+            with open(self.grids_file, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+        except Exception as e:
+            print(f"Error reading grids: {e}")
+            return []
+    
+    def get_grid_deltas(self):
+        """Grid level changes logged since the last snapshot, oldest first"""
+        deltas = []
+        try:
+            with open(self.grid_deltas_file, 'r') as f:
+                for line in f:
+                    try:
+                        deltas.append(json.loads(line))
+                    except ValueError:
+                        break   # Torn last line from a crash mid-append
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Error reading grid deltas: {e}")
+        self._grid_deltas = len(deltas)
+        return deltas
+    
+    def append_grid_deltas(self, deltas):
+        """Append grid level changes with one write; returns how many are logged since the snapshot"""
+        try:
+            with self._lock:
+                with open(self.grid_deltas_file, 'a') as f:
+                    f.write("".join(json.dumps(delta) + "\n" for delta in deltas))
+                self._grid_deltas += len(deltas)
+        except Exception as e:
+            print(f"Error logging grid levels: {e}")
+        return self._grid_deltas
+    
+    def save_grids(self, grids):
+        """Snapshot the grid strategies and start a fresh delta log"""
+        try:
+            with self._lock:
+                self._write_json(self.grids_file, grids, indent=None)
+                # Deltas only ever move state forward (see PriceGrid.apply), so a
+                # crash between these two steps replays nothing stale
+                with open(self.grid_deltas_file, 'w'):
+                    pass
+                self._grid_deltas = 0
+        except Exception as e:
+            print(f"Error saving grids: {e}")
+
+class ScheduledJob:
+    """A delayed or periodic call owned by a Scheduler"""
+    __slots__ = ("key", "callback", "args", "slot", "deadline", "interval", "jitter", "lane", "runs", "cancelled",
+                 "running")
+    
+    def __init__(self, key, callback, args, slot, deadline, interval=None, jitter=0.0, lane=None):
+        self.key = key
+        self.callback = callback
+        self.args = args
+        self.slot = slot            # When the run is due before jitter; periodic runs advance it by interval
+        self.deadline = deadline    # slot plus this run's jitter
+        self.interval = interval
+        self.jitter = jitter
+        self.lane = lane
+        self.runs = 0
+        self.cancelled = False
+        self.running = False
+    
+    @property
+    def name(self):
+        return getattr(self.callback, '__qualname__', repr(self.callback))
+
+
+class Scheduler:
+    """Single timer thread plus a fixed worker pool for all delayed and periodic work
+
+    Jobs sit in a heap ordered by deadline; cancelled or rescheduled jobs are
+    dropped lazily when they reach the top. A job scheduled with a key
+    coalesces with the pending job of the same key (the earlier deadline
+    wins and the newest callback runs). Periodic jobs are re-armed after
+    each run finishes, so a slow run never overlaps the next one; jitter
+    delays each run from its fixed slot without shifting later slots.
+
+    A job may name a lane: lanes have a worker of their own, so long jobs
+    there (order execution) never hold up the shared pool.
+    """
+    
+    def __init__(self, workers=2, name="scheduler"):
+        self.name = name
+        self.workers = workers
+        
+        self._heap = []           # (deadline, seq, job)
+        self._seq = itertools.count()
+        self._by_key = {}         # key -> pending job
+        self._cond = threading.Condition()
+        self._queues = {None: queue.Queue()}   # lane -> work queue; None is the shared pool
+        self._threads = []
+        self._stopped = False
+    
+    def start(self):
+        """Start the timer thread and worker pool (idempotent)"""
+        with self._cond:
+            if self._threads:
+                return self
+            self._start_thread(self._timer_loop, f"{self.name}-timer")
+            for i in range(self.workers):
+                self._start_thread(self._worker_loop, f"{self.name}-worker-{i}", self._queues[None])
+            for lane, work in self._queues.items():
+                if lane is not None:
+                    self._start_thread(self._worker_loop, f"{self.name}-{lane}", work)
+        return self
+    
+    def _start_thread(self, target, name, *args):
+        thread = threading.Thread(target=target, args=args, name=name, daemon=True)
+        self._threads.append(thread)
+        thread.start()
+    
+    def _lane_queue(self, lane):
+        """Work queue of a lane, starting its worker on first use (caller holds _cond)"""
+        work = self._queues.get(lane)
+        if work is None:
+            work = self._queues[lane] = queue.Queue()
+            if self._threads:
+                self._start_thread(self._worker_loop, f"{self.name}-{lane}", work)
+        return work
+    
+    def stop(self):
+        """Stop running jobs; pending ones are discarded"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+            queues = list(self._queues.items())
+        for lane, work in queues:
+            for _ in range(self.workers if lane is None else 1):
+                work.put(None)
+    
+    def call_later(self, delay, callback, *args, key=None, jitter=0.0, lane=None):
+        """Run callback(*args) after delay seconds (plus up to jitter seconds)"""
+        return self._schedule(key, callback, args, delay, None, jitter, lane)
+    
+    def call_every(self, interval, callback, *args, key=None, jitter=0.0, first_delay=None, lane=None):
+        """Run callback(*args) every interval seconds, first after first_delay (default: interval)"""
+        delay = interval if first_delay is None else first_delay
+        return self._schedule(key, callback, args, delay, interval, jitter, lane)
+    
+    def _schedule(self, key, callback, args, delay, interval, jitter, lane):
+        slot = time.monotonic() + delay
+        deadline = slot + (random.uniform(0, jitter) if jitter else 0.0)
+        with self._cond:
+            self._lane_queue(lane)
+            job = self._by_key.get(key) if key is not None else None
+            if job is not None and not job.running:
+                # Coalesce into the pending job
+                job.callback, job.args, job.interval, job.jitter, job.lane = callback, args, interval, jitter, lane
+                if deadline >= job.deadline:
+                    return job
+                job.slot, job.deadline = slot, deadline
+            else:
+                if job is not None:
+                    # Let the running one finish, but don't re-arm it
+                    job.cancelled = True
+                job = ScheduledJob(key, callback, args, slot, deadline, interval, jitter, lane)
+                if key is not None:
+                    self._by_key[key] = job
+            self._push(job)
+        return job
+    
+    def _push(self, job):
+        heapq.heappush(self._heap, (job.deadline, next(self._seq), job))
+        # Only wake the timer if this job is now the earliest
+        if self._heap[0][2] is job:
+            self._cond.notify()
+    
+    def cancel(self, job_or_key):
+        """Cancel a job (or the pending job with this key); False if there was none"""
+        with self._cond:
+            job = job_or_key if isinstance(job_or_key, ScheduledJob) else self._by_key.get(job_or_key)
+            if job is None or job.cancelled:
+                return False
+            job.cancelled = True
+            if job.key is not None and self._by_key.get(job.key) is job:
+                del self._by_key[job.key]
+            return True
+    
+    def jobs(self):
+        """Pending and running jobs, soonest first"""
+        now = time.monotonic()
+        with self._cond:
+            live = {id(job): job for _, _, job in self._heap if not job.cancelled}
+            live.update((id(job), job) for job in self._by_key.values() if job.running)
+            return [
+                {
+                    'key': job.key,
+                    'name': job.name,
+                    'due_in': max(0.0, job.deadline - now),
+                    'interval': job.interval,
+                    'lane': job.lane,
+                    'runs': job.runs,
+                    'running': job.running
+                }
+                for job in sorted(live.values(), key=lambda j: j.deadline)
+            ]
+    
+    def _timer_loop(self):
+        with self._cond:
+            while not self._stopped:
+                now = time.monotonic()
+                while self._heap and self._heap[0][0] <= now:
+                    deadline, _, job = heapq.heappop(self._heap)
+                    # Skip cancelled jobs and stale heap entries of rescheduled ones
+                    if job.cancelled or job.running or deadline != job.deadline:
+                        continue
+                    job.running = True
+                    self._queues[job.lane].put(job)
+                timeout = self._heap[0][0] - now if self._heap else None
+                self._cond.wait(timeout)
+    
+    def _worker_loop(self, work):
+        while True:
+            job = work.get()
+            if job is None:
+                return
+            try:
+                job.callback(*job.args)
+            except Exception as e:
+                print(f"Error in scheduled job {job.name}: {e}")
+            
+            with self._cond:
+                job.running = False
+                job.runs += 1
+                if job.cancelled:
+                    continue
+                if job.interval is not None:
+                    # Fixed rate from the unjittered slot; skip missed slots instead of catching up
+                    now = time.monotonic()
+                    job.slot += job.interval
+                    if job.slot < now:
+                        job.slot += math.ceil((now - job.slot) / job.interval) * job.interval
+                    job.deadline = job.slot + (random.uniform(0, job.jitter) if job.jitter else 0.0)
+                    self._push(job)
+                elif job.key is not None and self._by_key.get(job.key) is job:
+                    del self._by_key[job.key]
+
+
+class OrderEngine:
+    """Resting-order engine: trigger checks, execution and fill confirmation
+
+    Independent of Tk so it can run headless; the GUI is just another
+    subscriber. Events passed to subscribers as callback(event, data):
+      'fill'        - an order triggered and its swap was broadcast
+      'slice'       - a TWAP/iceberg child swap was broadcast
+      'parent_done' - a TWAP/iceberg parent completed, failed or was cancelled
+      'dca'         - due DCA schedules on one pair bought with a single swap
+      'dca_done'    - a DCA schedule completed its runs or was cancelled
+      'grid'        - a grid's crossed levels were bought or sold
+      'grid_done'   - a grid strategy was cancelled
+      'expired'     - good-till-time orders reached their deadline
+      'confirmed'   - a swap's actual amounts were recorded
+      'unconfirmed' - a swap couldn't be confirmed after retries
+      'error'       - an order check failed
+    Callbacks run on the engine's worker threads.
+    """
+    
+    # Adaptive polling: each pair with resting orders is re-quoted when the
+    # price could plausibly have reached its nearest trigger, i.e. after
+    # (distance / (POLL_SAFETY * sigma))^2 seconds, clamped to roughly one
+    # block and five minutes.
+    MIN_POLL_INTERVAL = 5
+    MAX_POLL_INTERVAL = 300
+    POLL_SAFETY = 4.0
+    VOLATILITY_ALPHA = 0.2   # EWMA weight of the newest squared return
+    
+    # Sliced (TWAP / iceberg) parent orders: one scheduler job per parent,
+    # no thread per order. Children are ordinary market swaps.
+    MIN_SLICE_INTERVAL = 6      # ~one block
+    MAX_SLICE_FAILURES = 5
+    SLICE_IMPACT_ALPHA = 0.3    # EWMA weight of the newest slice's quoted impact
+    
+    # Recurring (DCA) buys: one timer for the earliest due schedule; the
+    # schedules on a pair that are due within a block share one swap.
+    MIN_DCA_INTERVAL = 60
+    DCA_BATCH_WINDOW = 6        # ~one block
+    DCA_RETRY_DELAY = 60
+    MAX_DCA_FAILURES = 5
+    
+    # Grid strategies: level fills are appended to a delta log, folded into
+    # the grids snapshot every GRID_COMPACT_EVERY deltas.
+    MAX_GRID_LEVELS = 1000
+    GRID_COMPACT_EVERY = 500
+    
+    # Swap tolerance of triggered orders, sliced orders and grids whose spec
+    # doesn't set slippage_bps (DCA buys default to DCA_SLIPPAGE_BPS)
+    SLIPPAGE_BPS = 30
+    DCA_SLIPPAGE_BPS = 100
+    
+    # Polls, slices and DCA runs send swaps; they share one scheduler lane so
+    # a slow broadcast never takes a worker from confirmations or the UI
+    LANE = "orders"
+    
+    def __init__(self, client, logger, base_tokens=None, quote_token="USDC", scheduler=None):
+        self.client = client
+        self.logger = logger
+        self.quote_token = quote_token
+        self.base_tokens = base_tokens or client.pool_registry.base_symbols(quote_token)
+        
+        # Order polling and fill confirmations run as jobs here
+        self._owns_scheduler = scheduler is None
+        self.scheduler = scheduler or Scheduler(name="engine")
+        
+        # Funds committed to resting orders
+        self.reservations = BalanceReservations(client.ledger, client.assets)
+        
+        # Active sliced orders by id (persisted by the logger)
+        self._parents = {parent['id']: parent for parent in logger.get_parent_orders()}
+        
+        # Recurring buys by id (persisted by the logger), by next due time on a heap
+        self._dca = {schedule['id']: schedule for schedule in logger.get_dca_schedules()}
+        self._dca_due = OrderDeadlines()
+        for schedule in self._dca.values():
+            self._dca_due.add(schedule['id'], schedule['next_run'])
+        
+        # Grid strategies by id: the snapshot plus the fills logged since
+        self._grids = {record['id']: PriceGrid(record) for record in logger.get_grids()}
+        deltas = logger.get_grid_deltas()
+        for delta in deltas:
+            if delta['id'] in self._grids:
+                self._grids[delta['id']].apply(delta)
+        if deltas:
+            # Start from a clean log, so nothing is appended after a torn line
+            self._save_grids()
+        
+        # Shared rolling state of conditional (indicator) orders
+        self.indicators = IndicatorBook(client.price_history)
+        
+        # High-water marks of trailing stops, persisted to the orders every mark_save_interval
+        self.trailing = TrailingStops()
+        self.mark_save_interval = 30
+        self._marks_saved = time.time()
+        
+        # Good-till-time orders, expired by one timer at the earliest deadline
+        self.deadlines = OrderDeadlines()
+        self.deadlines.sync(logger.get_pending_orders())
+        
+        self.order_id_counter = self._get_highest_order_id() + 1
+        
+        self._listeners = []
+        # Serialises changes to orders; held around trigger checks but not their quotes and swaps
+        self._lock = threading.RLock()
+        # One trigger check at a time, so a swap in flight is never picked twice
+        self._check_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        
+        # Triggers only act on fresh live quotes
+        self.max_price_age = 60
+        self.deferred_pairs = {}   # pair -> why its orders aren't being evaluated
+        self._price_heights = {}   # pair -> highest block height quoted
+        
+        # Per-pair adaptive polling state (see _schedule_poll)
+        self.default_poll_interval = 10
+        self._polls = {}
+        self._polling = False
+    
+    def subscribe(self, callback):
+        """Register callback(event, data) for engine events"""
+        self._listeners.append(callback)
+    
+    def _emit(self, event, **data):
+        for callback in list(self._listeners):
+            try:
+                callback(event, data)
+            except Exception as e:
+                print(f"Error in {event} event handler: {e}")
+    
+    def start(self):
+        """Load balances and reserve funds for orders already on disk"""
+        self.client.get_wallet_balances(force_update=True)
+        self.reservations.rebuild(self.logger.get_pending_orders())
+    
+    def _get_highest_order_id(self):
+        """Find the highest order ID from both completed transactions and pending orders"""
+        # Completed transactions are summarised in the partition manifest
+        highest_id = self.logger.get_highest_order_number()
+        
+        # Check pending and sliced orders, DCA schedules and grids
+        active = list(self._parents.values()) + list(self._dca.values()) + [g.record for g in self._grids.values()]
+        for order in self.logger.get_pending_orders() + active:
+            try:
+                # Extract numeric part of order ID
+                order_num = int(order['id'].split('-')[1])
+                highest_id = max(highest_id, order_num)
+            except (IndexError, ValueError):
+                pass
+
+        return highest_id
+    
+    def _ensure_funds(self, check):
+        """Run a reservation check, re-checking once against fresh chain balances"""
+        try:
+            check()
+        except ValueError:
+            # A deposit may have landed since the last sync
+            if time.time() - self.client.ledger.last_sync <= 60:
+                raise
+            self.client.get_wallet_balances(force_update=True)
+            check()
+    
+    def check_funds(self, symbol, amount):
+        """Pre-trade check for a market order; raises ValueError on a shortfall"""
+        self._ensure_funds(lambda: self.reservations.check(symbol, amount))
+    
+    def create_order(self, order_type, from_token, to_token, amount, price, min_out=None, expires_in=None):
+        """Create a resting 'limit' or 'stop_loss' order; raises ValueError if invalid"""
+        order, error = self.create_orders([{
+            'order_type': order_type,
+            'from_token': from_token,
+            'to_token': to_token,
+            'amount': amount,
+            'price': price,
+            'min_out': min_out,
+            'expires_in': expires_in
+        }])[0]
+        if error:
+            raise ValueError(error)
+        return order
+    
+    def create_orders(self, specs):
+        """Create several orders with one pending-order write
+
+        Each spec is a dict with order_type ('limit' or 'stop_loss'),
+        from_token, to_token, amount, price and optional min_out and
+        slippage_bps (default SLIPPAGE_BPS); a 'trailing_stop' with
+        trail_percent or trail_amount instead of a price; a 'conditional' order with a condition instead of a price
+        (see IndicatorBook.normalize); an 'oco' group of such orders (see
+        _build_oco); a sliced 'twap' / 'iceberg' order (see
+        _build_parent); a recurring 'dca' buy (see _build_dca); or a
+        'grid' strategy (see _build_grid). Resting orders and OCO groups expire after expires_in seconds or
+        at expires_at (an ISO time or epoch seconds) if given. Returns an
+        (order, error) tuple per spec.
+        """
+        results = []
+        created = []
+        parents = []
+        schedules = []
+        grids = []
+        # Stop-loss and grid checks need each pair's price once per batch; quote them before taking the lock
+        current_prices = {pair: self.client.get_pool_price(pair)
+                          for pair in set().union(*map(self._spec_pairs, specs)) if pair in self.client.pools}
+        
+        with self._lock:
+            for spec in specs:
+                try:
+                    if spec.get('order_type') in ('twap', 'iceberg'):
+                        order_data = self._build_parent(spec)
+                    elif spec.get('order_type') == 'dca':
+                        order_data = self._build_dca(spec)
+                    elif spec.get('order_type') == 'grid':
+                        order_data = self._build_grid(spec, current_prices)
+                    elif spec.get('order_type') == 'oco':
+                        order_data = self._build_oco(spec, current_prices)
+                    else:
+                        order_data = self._build_order(spec, current_prices)
+                    
+                    # Reserve the order's funds before it exists
+                    order_id = f"order-{self.order_id_counter}"
+                    if order_data['order_type'] == 'dca':
+                        # A schedule holds nothing between runs; its funds are checked per run
+                        self._ensure_funds(
+                            lambda: self.reservations.check(order_data['from_token'], order_data['amount'])
+                        )
+                    elif order_data['order_type'] == 'grid':
+                        grid = PriceGrid({'id': order_id, **order_data})
+                        self._ensure_funds(lambda: self._reserve_grid(grid))
+                    else:
+                        self._ensure_funds(
+                            lambda: self.reservations.reserve(order_id, order_data['from_token'], order_data['amount'])
+                        )
+                    self.order_id_counter += 1
+                    
+                    order_data = {'id': order_id, **order_data}
+                    if 'legs' in order_data:
+                        # The legs are ordinary resting orders tied by the group id
+                        for i, leg in enumerate(order_data['legs']):
+                            order_data['legs'][i] = {'id': f"order-{self.order_id_counter}", **leg, 'oco': order_id}
+                            self.order_id_counter += 1
+                        created.extend(order_data['legs'])
+                    elif order_data['order_type'] == 'dca':
+                        schedules.append(order_data)
+                    elif order_data['order_type'] == 'grid':
+                        order_data = grid.record
+                        grids.append(grid)
+                    else:
+                        (parents if 'amount_raw' in order_data else created).append(order_data)
+                    results.append((order_data, None))
+                except (ValueError, TypeError, KeyError) as e:
+                    results.append((None, str(e)))
+            
+            if parents:
+                for parent in parents:
+                    self._parents[parent['id']] = parent
+                    self._schedule_slice(parent, 0)
+                self._save_parents()
+            
+            if schedules:
+                for schedule in schedules:
+                    self._dca[schedule['id']] = schedule
+                    self._dca_due.add(schedule['id'], schedule['next_run'])
+                self._save_schedules()
+                self._schedule_dca()
+            
+            if grids:
+                for grid in grids:
+                    self._grids[grid.record['id']] = grid
+                    self._poll_now(grid.pair)
+                self._save_grids()
+                if self._polling:
+                    self.scheduler.call_later(0, self._poll_tick, key='order_poll', lane=self.LANE)
+            
+            if created:
+                self.logger.add_pending_orders(created)
+                if any(order['order_type'] == 'conditional' for order in created):
+                    # New indicator groups are computed from price history now, not on the next tick
+                    self._sync_conditions(self.logger.get_pending_orders())
+                # A new trigger may be closer than anything the schedule knows about
+                for order in created:
+                    self._poll_now(self._order_pair(order))
+                if self._polling:
+                    self.scheduler.call_later(0, self._poll_tick, key='order_poll', lane=self.LANE)
+                
+                expiring = [order for order in created if order.get('expires_at')]
+                for order in expiring:
+                    self.deadlines.add(order['id'], OrderDeadlines.deadline_of(order))
+                if expiring:
+                    self._schedule_expiry()
+        return results
+    
+    def _spec_pairs(self, spec):
+        """Pairs whose current price validating a spec needs"""
+        order_type = spec.get('order_type')
+        if order_type == 'oco':
+            return set().union(*(self._spec_pairs(leg) for leg in spec.get('legs') or () if isinstance(leg, dict)))
+        if order_type in ('stop_loss', 'trailing_stop'):
+            return {f"{spec.get('from_token')}/{spec.get('to_token')}"}
+        if order_type == 'grid':
+            return {f"{spec.get('base_token')}/{spec.get('quote_token', self.quote_token)}"}
+        return set()
+    
+    def _build_order(self, spec, current_prices):
+        """Validate an order spec and build its pending-order record"""
+        order_type = spec['order_type']
+        from_token = spec['from_token']
+        to_token = spec['to_token']
+        amount = float(spec['amount'])
+        price = float(spec['price']) if order_type in ("limit", "stop_loss") else None
+        min_out = float(spec['min_out']) if spec.get('min_out') is not None else None
+        
+        if amount <= 0:
+            raise ValueError("Invalid amount")
+        if price is not None and price <= 0:
+            raise ValueError("Invalid price")
+        expires_at = self._parse_expiry(spec)
+        
+        trail = None
+        if order_type in ("stop_loss", "trailing_stop"):
+            # Stop-loss orders should only be for selling assets when price drops
+            if from_token not in self.base_tokens or to_token != self.quote_token:
+                raise ValueError("Stop-loss orders can only be used to sell assets when price drops")
+            
+            # Validate that stop price is below current price
+            pair = f"{from_token}/{to_token}"
+            if pair not in current_prices:
+                current_prices[pair] = self.client.get_pool_price(pair)
+            current_price = current_prices[pair]['base_per_quote']
+            if not current_price:
+                raise ValueError(f"No price available for {pair}; try again when the node responds")
+            if order_type == "trailing_stop":
+                # The stop follows the highest price since creation, starting from now
+                trail = {name: float(spec[name]) for name in ('trail_percent', 'trail_amount')
+                         if spec.get(name) is not None}
+                if len(trail) != 1:
+                    raise ValueError("Trailing stops need one of trail_percent or trail_amount")
+                offset = trail.get('trail_percent', trail.get('trail_amount'))
+                if offset <= 0 or trail.get('trail_percent', 0) >= 100 or trail.get('trail_amount', 0) >= current_price:
+                    raise ValueError("Invalid trailing offset")
+                price_field, price = 'high_water', current_price
+            else:
+                if price >= current_price:
+                    raise ValueError(f"Stop price ({price}) must be below current price ({current_price:.6f})")
+                price_field = 'stop_price'
+        elif order_type == "limit":
+            # Determine order type
+            if from_token == self.quote_token and to_token in self.base_tokens:
+                order_type = "buy_limit"
+            elif from_token in self.base_tokens and to_token == self.quote_token:
+                order_type = "sell_limit"
+            else:
+                raise ValueError("Invalid pair for limit order")
+            price_field = 'limit_price'
+        elif order_type == "conditional":
+            # Fires on an indicator of the pair's candles rather than a price
+            if not ((from_token == self.quote_token and to_token in self.base_tokens) or
+                    (from_token in self.base_tokens and to_token == self.quote_token)):
+                raise ValueError("Invalid pair for conditional order")
+            price_field = 'condition'
+            price = self.indicators.normalize(spec.get('condition') or {})
+        else:
+            raise ValueError(f"Unsupported order type: {order_type}")
+        
+        order_data = {
+            'timestamp': datetime.now().isoformat(),
+            'from_token': from_token,
+            'to_token': to_token,
+            'amount': amount,
+            price_field: price,
+            'order_type': order_type,
+            'slippage_bps': self._slippage_bps(spec),
+            'status': 'pending'
+        }
+        if price_field == 'limit_price':
+            order_data['min_out'] = min_out  # Store the min_out for execution
+        if trail:
+            order_data.update(trail)
+        if expires_at:
+            order_data['expires_at'] = expires_at
+        return order_data
+    
+    def _slippage_bps(self, spec, default=None):
+        """A spec's swap tolerance in basis points, or the engine default"""
+        bps = spec.get('slippage_bps')
+        bps = int(bps) if bps is not None else (self.SLIPPAGE_BPS if default is None else default)
+        if not 0 <= bps < 10_000:
+            raise ValueError("slippage_bps must be between 0 and 9999")
+        return bps
+    
+    @staticmethod
+    def _parse_time(value):
+        """Local datetime from an ISO time or epoch seconds"""
+        if isinstance(value, (int, float)):
+            return datetime.fromtimestamp(value)
+        moment = datetime.fromisoformat(value)
+        if moment.tzinfo is not None:
+            moment = moment.astimezone().replace(tzinfo=None)  # Orders use local time
+        return moment
+    
+    @staticmethod
+    def _parse_expiry(spec):
+        """ISO deadline of a good-till-time spec (expires_in or expires_at), or None"""
+        if spec.get('expires_in') is not None:
+            seconds = float(spec['expires_in'])
+            if seconds <= 0:
+                raise ValueError("Invalid expiry")
+            return (datetime.now() + timedelta(seconds=seconds)).isoformat()
+        if spec.get('expires_at') is None:
+            return None
+        deadline = OrderEngine._parse_time(spec['expires_at'])
+        if deadline <= datetime.now():
+            raise ValueError("Expiry time is in the past")
+        return deadline.isoformat()
+    
+    def _build_oco(self, spec, current_prices):
+        """Validate a one-cancels-other group: spec['legs'] is a list of order specs
+
+        When one leg fills the others are cancelled in the same write of the
+        pending-order store. All legs sell the same token and share one
+        reservation (of the largest leg), since at most one of them fills.
+        """
+        # A group's expiry applies to the legs that don't set their own
+        expiry = {name: spec[name] for name in ('expires_in', 'expires_at') if spec.get(name) is not None}
+        legs = [
+            self._build_order(leg if leg.get('expires_in') is not None or leg.get('expires_at') is not None
+                              else {**leg, **expiry}, current_prices)
+            for leg in spec.get('legs') or ()
+        ]
+        if len(legs) < 2:
+            raise ValueError("OCO groups need at least two legs")
+        if len({leg['from_token'] for leg in legs}) != 1:
+            raise ValueError("All legs of an OCO group must sell the same token")
+        return {
+            'order_type': 'oco',
+            'from_token': legs[0]['from_token'],
+            'amount': max(leg['amount'] for leg in legs),
+            'legs': legs
+        }
+    
+    def cancel_order(self, order_id):
+        """Cancel a resting order (or OCO group) and release its funds; False if it wasn't pending"""
+        return self.cancel_orders([order_id]) > 0
+    
+    def cancel_orders(self, order_ids):
+        """Cancel several orders with one write; returns how many were pending
+
+        Cancelling any leg of an OCO group, or the group id, cancels the group.
+        Sliced orders, DCA schedules and grids are cancelled by their ids too.
+        """
+        with self._lock:
+            pending = self.logger.get_pending_orders()
+            requested = set(order_ids)
+            groups = {o['oco'] for o in pending if o.get('oco') and (o['id'] in requested or o['oco'] in requested)}
+            cancelled = [o for o in pending if o['id'] in requested or o.get('oco') in groups]
+            self.logger.remove_pending_orders([o['id'] for o in cancelled])
+            for key in {BalanceReservations.key_for(o) for o in cancelled}:
+                self.reservations.release(key)
+            for order in cancelled:
+                self.trailing.remove(order['id'])
+                self.deadlines.remove(order['id'])
+            
+            parents = [self._parents[order_id] for order_id in order_ids if order_id in self._parents]
+            for parent in parents:
+                self._finish_parent(parent, 'cancelled', save=False)
+            if parents:
+                self._save_parents()
+            
+            schedules = [self._dca[order_id] for order_id in order_ids if order_id in self._dca]
+            if schedules:
+                self._finish_dca(schedules, 'cancelled')
+            
+            grids = [self._grids[order_id] for order_id in order_ids if order_id in self._grids]
+            if grids:
+                self._finish_grids(grids, 'cancelled')
+        return len(cancelled) + len(parents) + len(schedules) + len(grids)
+    
+    # -- Sliced (TWAP / iceberg) orders --
+    
+    def _build_parent(self, spec):
+        """Validate a sliced order spec and build its parent record
+
+        Spec fields: order_type 'twap' (needs duration, in seconds) or
+        'iceberg' (needs slice_amount, the visible size); from_token,
+        to_token, amount; optional interval between slices (default 60s),
+        limit_price (quote per base; slices only run while the price is at
+        least this good), max_impact_bps (default 50) and slippage_bps
+        (default 30).
+        """
+        order_type = spec['order_type']
+        from_token = spec['from_token']
+        to_token = spec['to_token']
+        amount = float(spec['amount'])
+        interval = float(spec.get('interval', 60))
+        
+        from_asset = self.client.assets.by_symbol(from_token)
+        to_asset = self.client.assets.by_symbol(to_token)
+        if from_asset is None or to_asset is None:
+            raise ValueError(f"Unknown token pair: {from_token}/{to_token}")
+        if amount <= 0:
+            raise ValueError("Invalid amount")
+        if interval < self.MIN_SLICE_INTERVAL:
+            raise ValueError(f"Slice interval must be at least {self.MIN_SLICE_INTERVAL}s")
+        amount_raw = TokenAmount.from_human(amount, from_asset).raw
+        if not self.client.route_selector.candidates(from_asset.denom, to_asset.denom, amount_raw):
+            raise ValueError(f"No route from {from_token} to {to_token}")
+        
+        now = time.time()
+        parent = {
+            'timestamp': datetime.now().isoformat(),
+            'from_token': from_token,
+            'to_token': to_token,
+            'amount': amount,
+            'amount_raw': amount_raw,
+            'filled_raw': 0,
+            'amount_out_raw': 0,    # Sum of the children's quoted outputs
+            'order_type': order_type,
+            'interval': interval,
+            'max_impact_bps': float(spec.get('max_impact_bps', 50)),
+            'slippage_bps': self._slippage_bps(spec),
+            'impact_bps': None,     # EWMA of the children's quoted impact
+            'children': [],
+            'failures': 0,
+            'status': 'active'
+        }
+        
+        if order_type == 'twap':
+            duration = float(spec['duration'])
+            if duration < interval:
+                raise ValueError("TWAP duration must be at least one slice interval")
+            parent['start'], parent['end'] = now, now + duration
+        else:
+            slice_amount = float(spec['slice_amount'])
+            if not 0 < slice_amount <= amount:
+                raise ValueError("Iceberg slice_amount must be positive and at most the order amount")
+            parent['slice_raw'] = TokenAmount.from_human(slice_amount, from_asset).raw
+        
+        if spec.get('limit_price') is not None:
+            if self.quote_token not in (from_token, to_token):
+                raise ValueError(f"limit_price needs a pair against {self.quote_token}")
+            parent['limit_price'] = float(spec['limit_price'])
+            if parent['limit_price'] <= 0:
+                raise ValueError("Invalid price")
+        return parent
+    
+    def parent_orders(self):
+        """Active sliced orders"""
+        with self._lock:
+            return [dict(parent) for parent in self._parents.values()]
+    
+    def _save_parents(self):
+        self.logger.save_parent_orders(list(self._parents.values()))
+    
+    def _schedule_slice(self, parent, delay):
+        self.scheduler.start()
+        # A little jitter keeps parents created together from slicing in lockstep
+        self.scheduler.call_later(delay, self._run_slice, parent['id'], key=('slice', parent['id']),
+                                  jitter=min(1.0, parent['interval'] / 20), lane=self.LANE)
+    
+    def _resume_parents(self):
+        """Re-reserve and re-schedule sliced orders loaded from disk"""
+        with self._lock:
+            for parent in self._parents.values():
+                remaining = TokenAmount(parent['amount_raw'] - parent['filled_raw'],
+                                        self.client.assets.by_symbol(parent['from_token']))
+                self.reservations.reserve(parent['id'], parent['from_token'], remaining, force=True)
+                self._schedule_slice(parent, 0)
+    
+    def _run_slice(self, parent_id):
+        """Scheduler job: send one child swap for a parent, then book the next"""
+        parent = self._parents.get(parent_id)
+        if parent is None or parent['status'] != 'active' or self._stop_event.is_set():
+            return
+        try:
+            delay = self._execute_slice(parent)
+        except Exception as e:
+            print(f"Error executing slice of {parent_id}: {e}")
+            self._emit('error', message=f"Slice error for {parent_id}: {e}")
+            delay = parent['interval']
+        if parent['status'] == 'active':
+            self._schedule_slice(parent, delay)
+    
+    def _execute_slice(self, parent):
+        """Size, quote and send one child swap; returns the delay until the next one"""
+        assets = self.client.assets
+        from_asset = assets.by_symbol(parent['from_token'])
+        to_asset = assets.by_symbol(parent['to_token'])
+        remaining = parent['amount_raw'] - parent['filled_raw']
+        if remaining <= 0:
+            self._finish_parent(parent, 'completed')
+            return 0
+        
+        if 'limit_price' in parent:
+            pair = self._order_pair(parent)
+            price_info = self._trigger_price(pair, {})
+            if price_info is None:
+                return self.MIN_SLICE_INTERVAL
+            # Selling base wants a high price, buying base a low one
+            direction = 1 if parent['from_token'] != self.quote_token else -1
+            if direction * price_compare(price_info['base_per_quote_ratio'], price_ratio(parent['limit_price'])) < 0:
+                return parent['interval']
+        
+        sized = self._slice_size(parent, remaining, from_asset.denom, to_asset.denom)
+        if sized is None:
+            return parent['interval']   # No quote; try again next interval
+        size, quoted_out, impact_bps = sized
+        
+        # The child carries its own share of the parent's reservation
+        child_id = f"{parent['id']}-{len(parent['children']) + 1}"
+        amount_in = TokenAmount(size, from_asset)
+        expected_out = TokenAmount(quoted_out, to_asset)
+        with self._lock:
+            self.reservations.release(parent['id'])
+            self.reservations.reserve(child_id, parent['from_token'], amount_in, force=True)
+            if remaining > size:
+                self.reservations.reserve(parent['id'], parent['from_token'], TokenAmount(remaining - size, from_asset), force=True)
+        
+        result = self.client.execute_market_swap(
+            parent['from_token'], parent['to_token'], amount_in,
+            expected_out.apply_bps(parent['slippage_bps'])
+        )
+        
+        with self._lock:
+            # The parent may have been cancelled while the swap was in flight
+            active = parent['status'] == 'active'
+            if not (result and result['success']):
+                self.reservations.release(child_id)
+                if not active:
+                    return 0
+                self.reservations.reserve(parent['id'], parent['from_token'], TokenAmount(remaining, from_asset), force=True)
+                parent['failures'] += 1
+                print(f"Slice {child_id} failed ({parent['failures']}): {result.get('error') if result else 'no result'}")
+                if parent['failures'] >= self.MAX_SLICE_FAILURES:
+                    self._finish_parent(parent, 'failed')
+                else:
+                    self._save_parents()
+                return parent['interval']
+            
+            parent['failures'] = 0
+            parent['filled_raw'] += size
+            parent['amount_out_raw'] += quoted_out
+            parent['children'].append(child_id)
+            parent['impact_bps'] = impact_bps if parent['impact_bps'] is None else (
+                self.SLICE_IMPACT_ALPHA * impact_bps + (1 - self.SLICE_IMPACT_ALPHA) * parent['impact_bps']
+            )
+            
+            # Quote per base, like every other fill price
+            rate = float(expected_out) / float(amount_in)
+            price = 1 / rate if parent['from_token'] == self.quote_token else rate
+            tx_data = {
+                'timestamp': datetime.now().isoformat(),
+                'tx_hash': result['tx_hash'],
+                'order_id': child_id,
+                'parent_id': parent['id'],
+                'from_token': parent['from_token'],
+                'to_token': parent['to_token'],
+                'amount_in': float(amount_in),
+                'expected_amount_out': float(expected_out),
+                'actual_amount_out': None,  # Will be updated after query
+                'execution_price': None,    # Will be updated after query
+                'impact_bps': round(impact_bps, 2),
+                'order_type': f"{parent['order_type']}_slice",
+                'status': 'executed'
+            }
+            self.logger.log_transaction(tx_data)
+            self.reservations.hold_for_tx(child_id, result['tx_hash'])
+            self.confirm_transaction(result['tx_hash'])
+            
+            if not active:
+                pass   # Already summarised by the cancel
+            elif parent['filled_raw'] >= parent['amount_raw']:
+                self._finish_parent(parent, 'completed')
+            else:
+                self._save_parents()
+        
+        self._emit('slice', order=parent, tx_data=tx_data, price=price)
+        return parent['interval']
+    
+    def _slice_size(self, parent, remaining, denom_in, denom_out):
+        """Next child size in base units, with its quote and impact
+
+        TWAP spreads what is left evenly over the slices left before the end
+        time (so slices that were cut short are caught up later); icebergs
+        show slice_raw at a time. Either way the size is then cut until the
+        quoted price impact - output versus a 1% probe of the same route -
+        is within max_impact_bps, starting from the impact the parent's
+        recent children measured. Returns (size, quoted out, impact bps) or
+        None if the route can't be quoted.
+        """
+        if parent['order_type'] == 'twap':
+            slices_left = max(1, math.ceil((parent['end'] - time.time()) / parent['interval']))
+            size = -(-remaining // slices_left)
+        else:
+            size = min(remaining, parent['slice_raw'])
+        floor = max(1, size // 8)
+        
+        max_impact = parent['max_impact_bps']
+        if parent['impact_bps'] and parent['impact_bps'] > max_impact:
+            size = max(floor, int(size * max_impact / parent['impact_bps']))
+        
+        # The probe only sets the reference rate, so a cached quote for a
+        # nearby size will do (parents on one pair share it). The slice itself
+        # is always quoted exactly, since min_out is derived from it.
+        selector = self.client.route_selector
+        probe = max(1, size // 100)
+        probe_route = selector.best_route(denom_in, denom_out, probe)
+        if probe_route and probe_route['amount_out']:
+            probe, probe_out = probe_route['amount_in'], probe_route['amount_out']
+        else:
+            probe_out = probe_route and selector.quote(probe_route, denom_in, probe)
+        if not probe_out:
+            return None
+        
+        for attempt in range(4):
+            route = selector.best_route(denom_in, denom_out, size)
+            out = route and selector.quote(route, denom_in, size)
+            if not out:
+                return None
+            impact = max(0.0, (1 - (out / size) / (probe_out / probe)) * 10_000)
+            if impact <= max_impact or size <= floor or attempt == 3:
+                break
+            # Impact grows roughly linearly with size for small trades
+            size = max(floor, int(size * max_impact / impact))
+        return size, out, impact
+    
+    def _finish_parent(self, parent, status, save=True):
+        """Close a parent: drop it from the active set, log a summary, free its funds"""
+        parent['status'] = status
+        self._parents.pop(parent['id'], None)
+        self.scheduler.cancel(('slice', parent['id']))
+        self.reservations.release(parent['id'])
+        
+        assets = self.client.assets
+        self.logger.log_transaction({
+            'timestamp': datetime.now().isoformat(),
+            'tx_hash': parent['id'],
+            'order_id': parent['id'],
+            'from_token': parent['from_token'],
+            'to_token': parent['to_token'],
+            'amount_in': float(TokenAmount(parent['filled_raw'], assets.by_symbol(parent['from_token']))),
+            'amount_requested': parent['amount'],
+            'expected_amount_out': float(TokenAmount(parent['amount_out_raw'], assets.by_symbol(parent['to_token']))),
+            'children': parent['children'],
+            'order_type': parent['order_type'],
+            'status': status
+        })
+        if save:
+            self._save_parents()
+        self._emit('parent_done', order=parent, status=status)
+    
+    # -- Recurring (DCA) buys --
+    
+    def _build_dca(self, spec):
+        """Validate a recurring buy spec and build its schedule
+
+        Spec fields: from_token, to_token, amount (per run) and interval
+        (seconds between runs); optional start_at (ISO time or epoch
+        seconds, default now), max_runs, slippage_bps (default 100) and
+        catch_up, which decides what happens to runs missed while the
+        engine was down: 'once' (default) makes a single buy for all of
+        them, 'all' buys all their amounts in one swap. Either way the
+        schedule then stays on its original cadence.
+        """
+        from_token = spec['from_token']
+        to_token = spec['to_token']
+        amount = float(spec['amount'])
+        interval = float(spec['interval'])
+        
+        from_asset = self.client.assets.by_symbol(from_token)
+        to_asset = self.client.assets.by_symbol(to_token)
+        if from_asset is None or to_asset is None:
+            raise ValueError(f"Unknown token pair: {from_token}/{to_token}")
+        if amount <= 0:
+            raise ValueError("Invalid amount")
+        if interval < self.MIN_DCA_INTERVAL:
+            raise ValueError(f"DCA interval must be at least {self.MIN_DCA_INTERVAL}s")
+        catch_up = spec.get('catch_up', 'once')
+        if catch_up not in ('once', 'all'):
+            raise ValueError("catch_up must be 'once' or 'all'")
+        max_runs = int(spec['max_runs']) if spec.get('max_runs') is not None else None
+        if max_runs is not None and max_runs < 1:
+            raise ValueError("max_runs must be at least 1")
+        amount_raw = TokenAmount.from_human(amount, from_asset).raw
+        if not self.client.route_selector.candidates(from_asset.denom, to_asset.denom, amount_raw):
+            raise ValueError(f"No route from {from_token} to {to_token}")
+        
+        start = self._parse_time(spec['start_at']).timestamp() if spec.get('start_at') is not None else time.time()
+        return {
+            'timestamp': datetime.now().isoformat(),
+            'from_token': from_token,
+            'to_token': to_token,
+            'amount': amount,
+            'order_type': 'dca',
+            'interval': interval,
+            'next_run': start,      # Epoch seconds; advances by whole intervals
+            'catch_up': catch_up,
+            'max_runs': max_runs,
+            'slippage_bps': self._slippage_bps(spec, self.DCA_SLIPPAGE_BPS),
+            'runs': 0,
+            'spent': 0.0,
+            'failures': 0,
+            'last_tx': None,
+            'status': 'active'
+        }
+    
+    def dca_schedules(self):
+        """Active DCA schedules"""
+        with self._lock:
+            return [dict(schedule) for schedule in self._dca.values()]
+    
+    def _save_schedules(self):
+        self.logger.save_dca_schedules(list(self._dca.values()))
+    
+    def _schedule_dca(self):
+        """Arm the DCA timer for the earliest due schedule"""
+        due = self._dca_due.next_deadline()
+        if due is None or not self._polling:
+            return
+        # Re-armed at least hourly, since the scheduler's clock isn't the wall clock
+        self.scheduler.call_later(min(max(0.0, due - time.time()), 3600), self._run_dca, key='dca', lane=self.LANE)
+    
+    def _run_dca(self):
+        """Scheduler job: run the schedules that are due, one swap per pair"""
+        if self._stop_event.is_set():
+            return
+        try:
+            now = time.time()
+            batches = {}
+            with self._lock:
+                for schedule_id in self._dca_due.pop_due(now + self.DCA_BATCH_WINDOW):
+                    schedule = self._dca.get(schedule_id)
+                    if schedule is not None:
+                        batches.setdefault((schedule['from_token'], schedule['to_token']), []).append(schedule)
+            
+            for (from_token, to_token), batch in batches.items():
+                try:
+                    self._execute_dca(batch, now)
+                except Exception as e:
+                    print(f"Error executing DCA {from_token}->{to_token}: {e}")
+                    self._emit('error', message=f"DCA error for {from_token}->{to_token}: {e}")
+                    with self._lock:
+                        for schedule in batch:
+                            if schedule['id'] in self._dca:
+                                self._dca_due.add(schedule['id'], now + self.DCA_RETRY_DELAY)
+            
+            if batches:
+                with self._lock:
+                    self._save_schedules()
+        finally:
+            self._schedule_dca()
+    
+    def _execute_dca(self, batch, now):
+        """Buy for one pair's due schedules with a single swap, then book their next runs"""
+        assets = self.client.assets
+        from_token, to_token = batch[0]['from_token'], batch[0]['to_token']
+        from_asset = assets.by_symbol(from_token)
+        to_asset = assets.by_symbol(to_token)
+        
+        runs = {}   # schedule id -> (slots passed, runs bought, base units in)
+        for schedule in batch:
+            # More than one slot has passed if the engine was down
+            missed = int((max(now, schedule['next_run']) - schedule['next_run']) // schedule['interval']) + 1
+            count = missed if schedule['catch_up'] == 'all' else 1
+            if schedule['max_runs']:
+                count = min(count, schedule['max_runs'] - schedule['runs'])
+            runs[schedule['id']] = (missed, count, TokenAmount.from_human(schedule['amount'], from_asset).raw * count)
+        
+        # If the wallet can't cover every schedule, the longest-waiting go first.
+        # Funding and reserving happen under the lock, so an order created
+        # meanwhile can't be promised the same funds; the quote and the swap don't.
+        funded = []
+        with self._lock:
+            batch = [schedule for schedule in batch if self._dca.get(schedule['id']) is schedule]
+            available = self.reservations.available(from_asset.denom) if self.client.ledger.last_sync else None
+            for schedule in sorted(batch, key=lambda s: s['next_run']):
+                raw = runs[schedule['id']][2]
+                if available is None or raw <= available:
+                    funded.append(schedule)
+                    available = available - raw if available is not None else None
+            if funded:
+                amount_in = TokenAmount(sum(runs[s['id']][2] for s in funded), from_asset)
+                key = f"dca:{funded[0]['id']}:{now:.0f}"
+                self.reservations.reserve(key, from_token, amount_in, force=True)
+        
+        result = None
+        if funded:
+            selector = self.client.route_selector
+            route = selector.best_route(from_asset.denom, to_asset.denom, amount_in.raw)
+            quoted = route and selector.quote(route, from_asset.denom, amount_in.raw)
+            if quoted:
+                expected_out = TokenAmount(quoted, to_asset)
+                result = self.client.execute_market_swap(
+                    from_token, to_token, amount_in,
+                    expected_out.apply_bps(min(s['slippage_bps'] for s in funded))
+                )
+            if not (result and result['success']):
+                self.reservations.release(key)
+        
+        filled = bool(result and result['success'])
+        skipped = len(batch) - len(funded) if filled else len(batch)
+        if skipped:
+            reason = ((result or {}).get('error') or "no quote") if funded and not filled else f"insufficient {from_token}"
+            print(f"DCA {from_token}->{to_token}: {skipped} of {len(batch)} schedule(s) not bought: {reason}")
+        
+        tx_data = None
+        with self._lock:
+            if filled:
+                tx_data = {
+                    'timestamp': datetime.now().isoformat(),
+                    'tx_hash': result['tx_hash'],
+                    'schedules': {s['id']: float(TokenAmount(runs[s['id']][2], from_asset)) for s in funded},
+                    'from_token': from_token,
+                    'to_token': to_token,
+                    'amount_in': float(amount_in),
+                    'expected_amount_out': float(expected_out),
+                    'actual_amount_out': None,  # Will be updated after query
+                    'execution_price': None,    # Will be updated after query
+                    'order_type': 'dca',
+                    'status': 'executed'
+                }
+                self.logger.log_transaction(tx_data)
+                self.reservations.hold_for_tx(key, result['tx_hash'])
+                self.confirm_transaction(result['tx_hash'])
+            
+            bought = {s['id'] for s in funded} if filled else set()
+            completed = []
+            for schedule in batch:
+                if self._dca.get(schedule['id']) is not schedule:
+                    continue   # Cancelled while the swap was in flight
+                missed, count, raw = runs[schedule['id']]
+                if schedule['id'] in bought:
+                    schedule['runs'] += count
+                    schedule['spent'] += float(TokenAmount(raw, from_asset))
+                    schedule['last_tx'] = result['tx_hash']
+                    schedule['failures'] = 0
+                else:
+                    schedule['failures'] += 1
+                    if schedule['failures'] < self.MAX_DCA_FAILURES:
+                        # Retry soon; the slot count is re-derived from next_run then
+                        self._dca_due.add(schedule['id'], now + self.DCA_RETRY_DELAY)
+                        continue
+                    # Give this run up; the schedule carries on at its next one
+                    schedule['failures'] = 0
+                schedule['next_run'] += missed * schedule['interval']
+                if schedule['max_runs'] and schedule['runs'] >= schedule['max_runs']:
+                    completed.append(schedule)
+                else:
+                    self._dca_due.add(schedule['id'], schedule['next_run'])
+            if completed:
+                self._finish_dca(completed, 'completed', save=False)
+        
+        if tx_data:
+            # Quote per base, like every other fill price
+            rate = float(expected_out) / float(amount_in)
+            price = 1 / rate if from_token == self.quote_token else rate
+            self._emit('dca', schedules=[s['id'] for s in funded], tx_data=tx_data, price=price)
+        if skipped:
+            self._emit('error', message=f"DCA {from_token}->{to_token}: {skipped} schedule(s) not bought: {reason}")
+    
+    def _finish_dca(self, schedules, status, save=True):
+        """Close schedules: drop them from the active set and log their summaries in one write"""
+        now = datetime.now().isoformat()
+        records = []
+        for schedule in schedules:
+            schedule['status'] = status
+            self._dca.pop(schedule['id'], None)
+            self._dca_due.remove(schedule['id'])
+            records.append({
+                'timestamp': now,
+                'tx_hash': schedule['id'],
+                'order_id': schedule['id'],
+                'from_token': schedule['from_token'],
+                'to_token': schedule['to_token'],
+                'amount_in': schedule['spent'],
+                'interval': schedule['interval'],
+                'runs': schedule['runs'],
+                'order_type': 'dca',
+                'status': status
+            })
+        self.logger.log_transactions(records)
+        if save:
+            self._save_schedules()
+        for schedule in schedules:
+            self._emit('dca_done', order=schedule, status=status)
+    
+    # -- Grid strategies --
+    
+    def _build_grid(self, spec, current_prices):
+        """Validate a grid spec and build its record
+
+        Spec fields: base_token (traded against the quote token), lower and
+        upper price bounds (quote per base), levels (count, 2 to
+        MAX_GRID_LEVELS) and amount (base per level); optional spacing,
+        'arithmetic' (default) or 'geometric', and slippage_bps. Levels
+        below the current price start as buys and those above it as sells.
+        """
+        base_token = spec['base_token']
+        quote_token = spec.get('quote_token', self.quote_token)
+        lower = float(spec['lower'])
+        upper = float(spec['upper'])
+        count = int(spec['levels'])
+        amount = float(spec['amount'])
+        spacing = spec.get('spacing', 'arithmetic')
+        
+        if base_token not in self.base_tokens or quote_token != self.quote_token:
+            raise ValueError(f"Unsupported grid pair: {base_token}/{quote_token}")
+        if lower <= 0 or upper <= lower:
+            raise ValueError("Grid bounds must satisfy 0 < lower < upper")
+        if not 2 <= count <= self.MAX_GRID_LEVELS:
+            raise ValueError(f"A grid needs 2 to {self.MAX_GRID_LEVELS} levels")
+        if amount <= 0:
+            raise ValueError("Invalid amount")
+        if spacing not in ('arithmetic', 'geometric'):
+            raise ValueError("spacing must be 'arithmetic' or 'geometric'")
+        
+        pair = f"{base_token}/{quote_token}"
+        if pair not in current_prices:
+            current_prices[pair] = self.client.get_pool_price(pair)
+        price = current_prices[pair]['base_per_quote']
+        if not price:
+            raise ValueError(f"No price for {pair}")
+        
+        return {
+            'timestamp': datetime.now().isoformat(),
+            'base_token': base_token,
+            'quote_token': quote_token,
+            'amount': amount,
+            'lower': lower,
+            'upper': upper,
+            'levels': count,
+            'spacing': spacing,
+            'gap': PriceGrid.nearest(PriceGrid.levels(lower, upper, count, spacing), price),
+            'order_type': 'grid',
+            'slippage_bps': self._slippage_bps(spec),
+            'seq': 0,
+            'buys': 0,
+            'sells': 0,
+            'quote_spent': 0.0,
+            'base_bought': 0.0,
+            'base_sold': 0.0,
+            'quote_received': 0.0,
+            'status': 'active'
+        }
+    
+    def grid_strategies(self):
+        """Active grid strategies"""
+        with self._lock:
+            return [dict(grid.record) for grid in self._grids.values()]
+    
+    def _save_grids(self):
+        self.logger.save_grids([grid.record for grid in self._grids.values()])
+    
+    def _reserve_grid(self, grid, force=False):
+        """(Re-)reserve the quote a grid's buys need and the base its sells need"""
+        grid_id = grid.record['id']
+        base, quote = grid.needs()
+        self.reservations.release(f"{grid_id}:buy")
+        self.reservations.release(f"{grid_id}:sell")
+        try:
+            if quote:
+                self.reservations.reserve(f"{grid_id}:buy", grid.record['quote_token'], quote, force=force)
+            if base:
+                self.reservations.reserve(f"{grid_id}:sell", grid.record['base_token'], base, force=force)
+        except ValueError:
+            self.reservations.release(f"{grid_id}:buy")
+            raise
+    
+    def _resume_grids(self):
+        """Re-reserve grids loaded from disk"""
+        with self._lock:
+            for grid in self._grids.values():
+                self._reserve_grid(grid, force=True)
+    
+    def _plan_grid_fill(self, grid, side, levels, price_info):
+        """One market swap for a grid's crossed levels, or None if the wallet can't cover it"""
+        record = grid.record
+        assets = self.client.assets
+        base_asset = assets.by_symbol(record['base_token'])
+        quote_asset = assets.by_symbol(record['quote_token'])
+        ratio = price_info['base_per_quote_ratio']
+        
+        if side == 'buy':
+            # Each level buys its amount at the level's price
+            key = f"{record['id']}:buy"
+            from_token, to_token = record['quote_token'], record['base_token']
+            amount_in = TokenAmount.from_human(grid.buy_cost(levels), quote_asset)
+            expected_out = amount_in.convert(ratio[::-1], base_asset)
+        else:
+            key = f"{record['id']}:sell"
+            from_token, to_token = record['base_token'], record['quote_token']
+            amount_in = TokenAmount.from_human(record['amount'] * len(levels), base_asset)
+            expected_out = amount_in.convert(ratio, quote_asset)
+        
+        if not self.reservations.can_fill(key):
+            print(f"Skipping grid {record['id']}: reserved funds no longer in wallet")
+            return None
+        return {
+            'grid': grid,
+            'side': side,
+            'levels': levels,
+            'expected_out': expected_out,
+            'price': price_info['base_per_quote'],
+            'args': (from_token, to_token, amount_in,
+                     expected_out.apply_bps(record.get('slippage_bps', self.SLIPPAGE_BPS)))
+        }
+    
+    def _book_grid_fill(self, swap, result):
+        """Apply a grid swap's result; returns the state delta to log, or None"""
+        grid, side, levels = swap['grid'], swap['side'], swap['levels']
+        from_token, to_token, amount_in, _ = swap['args']
+        expected_out = swap['expected_out']
+        record = grid.record
+        if not (result and result['success']):
+            print(f"Grid {record['id']} {side} failed: {(result or {}).get('error')}")
+            return None
+        
+        tx_key = f"{record['id']}:{result['tx_hash']}"
+        self.reservations.reserve(tx_key, from_token, amount_in, force=True)
+        self.reservations.hold_for_tx(tx_key, result['tx_hash'])
+        # A grid cancelled while its swap was in flight only gets the fill logged
+        delta = None
+        if self._grids.get(record['id']) is grid:
+            # The filled levels become the opposite side's orders
+            delta = grid.fill(side, len(levels), float(amount_in), float(expected_out))
+            self._reserve_grid(grid, force=True)
+        
+        tx_data = {
+            'timestamp': datetime.now().isoformat(),
+            'tx_hash': result['tx_hash'],
+            'order_id': record['id'],
+            'from_token': from_token,
+            'to_token': to_token,
+            'amount_in': float(amount_in),
+            'expected_amount_out': float(expected_out),
+            'actual_amount_out': None,  # Will be updated after query
+            'execution_price': None,    # Will be updated after query
+            'level_prices': [grid.prices[i] for i in levels],
+            'order_type': f"grid_{side}",
+            'status': 'executed'
+        }
+        self.logger.log_transaction(tx_data)
+        self.confirm_transaction(result['tx_hash'])
+        self._emit('grid', order=record, side=side, tx_data=tx_data, price=swap['price'])
+        return delta
+    
+    def _finish_grids(self, grids, status):
+        """Close grids: release their funds and log their summaries in one write"""
+        now = datetime.now().isoformat()
+        records = []
+        for grid in grids:
+            record = grid.record
+            record['status'] = status
+            self._grids.pop(record['id'], None)
+            self.reservations.release(f"{record['id']}:buy")
+            self.reservations.release(f"{record['id']}:sell")
+            records.append({
+                'timestamp': now,
+                'tx_hash': record['id'],
+                'order_id': record['id'],
+                'from_token': record['quote_token'],
+                'to_token': record['base_token'],
+                'amount_in': record['quote_spent'],
+                'amount_requested': record['amount'],
+                'lower': record['lower'],
+                'upper': record['upper'],
+                'levels': record['levels'],
+                'buys': record['buys'],
+                'sells': record['sells'],
+                'order_type': 'grid',
+                'status': status
+            })
+        self.logger.log_transactions(records)
+        self._save_grids()
+        for grid in grids:
+            self._emit('grid_done', order=grid.record, status=status)
+    
+    def check_pending_orders(self, pairs=None):
+        """Check pending orders, optionally only those on the given pairs
+
+        Only picking the triggered orders and booking their fills hold the
+        engine lock; quotes and swaps are sent without it, so creating or
+        cancelling orders never waits on the node.
+        """
+        with self._check_lock:
+            try:
+                prices = self._quote_pairs(pairs)
+                with self._lock:
+                    swaps = self._check_pending_orders(pairs, prices)
+                for swap in swaps:
+                    swap['result'] = self.client.execute_market_swap(*swap['args'])
+                with self._lock:
+                    self._apply_swaps(swaps, prices, pairs)
+            except Exception as e:
+                print(f"Error checking pending orders: {str(e)}")
+                self._emit('error', message=f"Order check error: {str(e)}")
+    
+    def _order_pair(self, order):
+        """Pool pair (BASE/QUOTE) an order trades on"""
+        if order['from_token'] == self.quote_token:
+            return f"{order['to_token']}/{order['from_token']}"
+        return f"{order['from_token']}/{order['to_token']}"
+    
+    def _sync_conditions(self, pending_orders):
+        self.indicators.sync([(self._order_pair(order), order) for order in pending_orders
+                              if order['order_type'] == 'conditional'])
+    
+    def _sync_trailing(self, pending_orders):
+        self.trailing.sync([(self._order_pair(order), order) for order in pending_orders
+                            if order['order_type'] == 'trailing_stop'])
+    
+    def order_level(self, order):
+        """Price an order triggers at now, in quote per base (None for conditional orders)"""
+        if order['order_type'] == 'trailing_stop':
+            mark = self.trailing.mark(order['id']) or order['high_water']
+            if order.get('trail_percent') is not None:
+                return mark * (1 - order['trail_percent'] / 100)
+            return mark - order['trail_amount']
+        return order.get('limit_price') or order.get('stop_price')
+    
+    def _save_marks(self, force=False):
+        """Persist moved trailing-stop marks, at most every mark_save_interval seconds"""
+        if self.trailing.changed and (force or time.time() - self._marks_saved >= self.mark_save_interval):
+            self.logger.update_pending_orders(
+                {order_id: {'high_water': mark} for order_id, mark in self.trailing.marks().items()}
+            )
+            self._marks_saved = time.time()
+    
+    def _quote_pairs(self, pairs=None):
+        """One trigger price per pair with orders or grids to check (queries the node; call without the lock)"""
+        with self._lock:
+            wanted = {self._order_pair(o) for o in self.logger.get_pending_orders()}
+            wanted.update(grid.pair for grid in self._grids.values())
+        if pairs is not None:
+            wanted &= set(pairs)
+        prices = {}
+        for pair in wanted:
+            self._trigger_price(pair, prices)
+        return prices
+    
+    def _check_pending_orders(self, pairs, prices):
+        """Pick the orders and grid levels whose triggers the prices reached; returns their swaps"""
+        pending_orders = self.logger.get_pending_orders()
+        self._sync_conditions(pending_orders)
+        self._sync_trailing(pending_orders)
+        grids = list(self._grids.values())
+        if pairs is not None:
+            pending_orders = [o for o in pending_orders if self._order_pair(o) in pairs]
+            grids = [grid for grid in grids if grid.pair in pairs]
+        
+        swaps = []
+        filled_groups = set()  # OCO groups with a triggered leg this cycle
+        assets = self.client.assets
+        now = time.time()
+        
+        # Grids: each tick bisects for the crossed levels only
+        for grid in grids:
+            price_info = self._trigger_price(grid.pair, prices)
+            crossed = price_info and grid.crossed(price_info['base_per_quote'])
+            if crossed:
+                swap = self._plan_grid_fill(grid, *crossed, price_info)
+                if swap:
+                    swaps.append(swap)
+        
+        # Trailing stops: one tick per pair raises the high-water marks and
+        # returns only the stops it reached
+        reached = {}
+        for pair in {self._order_pair(o) for o in pending_orders if o['order_type'] == 'trailing_stop'}:
+            price_info = self._trigger_price(pair, prices)
+            if price_info is not None:
+                for order_id, mark, stop in self.trailing.update(pair, price_info['base_per_quote']):
+                    reached[order_id] = {'high_water': mark, 'stop_price': stop}
+        
+        # Conditional orders: one tick per pair updates the indicators and checks
+        # every order of a group at once; only those whose condition holds go on
+        conditional_pairs = {self._order_pair(o) for o in pending_orders if o['order_type'] == 'conditional'}
+        fired = set()
+        for pair in conditional_pairs:
+            price_info = self._trigger_price(pair, prices)
+            if price_info is not None:
+                fired.update(self.indicators.evaluate(pair, price_info['base_per_quote'], price_info['timestamp']))
+        
+        for order in pending_orders:
+            if order['order_type'] == 'conditional' and order['id'] not in fired:
+                continue
+            if order['order_type'] == 'trailing_stop':
+                if order['id'] not in reached:
+                    continue
+                order = {**order, **reached[order['id']]}
+            if order.get('oco') in filled_groups:
+                continue  # A sibling is already being filled
+            if self.deadlines.expired(order['id'], now):
+                continue  # Past its deadline; the expiry timer is about to remove it
+            try:
+                # Initialize swap to None for each order
+                swap = None
+                
+                # Don't spend a simulation and a fee on a swap the wallet can't cover
+                if not self.reservations.can_fill(BalanceReservations.key_for(order)):
+                    print(f"Skipping order {order['id']}: reserved funds no longer in wallet")
+                    continue
+                
+                # Exact amounts in base units for the trigger math
+                amount_in = assets.amount(order['amount'], order['from_token'])
+                to_asset = assets.by_symbol(order['to_token'])
+                
+                # -- LIMIT ORDERS --
+                if order['order_type'] in ["sell_limit", "buy_limit"]:
+                    # Determine the correct trading pair format
+                    if order['from_token'] in self.base_tokens and order['to_token'] == self.quote_token:
+                        # Selling base token for USDC (e.g., BTC->USDC, OSMO->USDC)
+                        pair = f"{order['from_token']}/{order['to_token']}"
+                        price_info = self._trigger_price(pair, prices)
+                        if price_info is None:
+                            continue
+                        current_price = price_info['base_per_quote']  # USDC per token
+                        current_ratio = price_info['base_per_quote_ratio']
+                        
+                        # Sell limit: execute if current price >= limit price
+                        if order['order_type'] == "sell_limit" and price_compare(current_ratio, price_ratio(order['limit_price'])) >= 0:
+                            amount_out_expected = amount_in.convert(current_ratio, to_asset)
+                            swap = (
+                                order['from_token'],
+                                order['to_token'],
+                                amount_in,
+                                amount_out_expected.apply_bps(order.get('slippage_bps', self.SLIPPAGE_BPS))
+                            )
+                    
+                    elif order['from_token'] == self.quote_token and order['to_token'] in self.base_tokens:
+                        # Buying base token with USDC (e.g., USDC->BTC, USDC->OSMO)
+                        pair = f"{order['to_token']}/{order['from_token']}"  # BTC/USDC format
+                        price_info = self._trigger_price(pair, prices)
+                        if price_info is None:
+                            continue
+                        current_price = price_info['base_per_quote']  # USDC per token
+                        current_ratio = price_info['base_per_quote_ratio']
+                        
+                        # Buy limit: execute if current price <= limit price
+                        if order['order_type'] == "buy_limit" and price_compare(current_ratio, price_ratio(order['limit_price'])) <= 0:
+                            amount_out_expected = amount_in.convert(current_ratio[::-1], to_asset)
+                            swap = (
+                                order['from_token'],
+                                order['to_token'],
+                                amount_in,
+                                amount_out_expected.apply_bps(order.get('slippage_bps', self.SLIPPAGE_BPS))
+                            )
+                
+                # -- STOP-LOSS ORDERS --
+                elif order['order_type'] == "stop_loss":
+                    # Stop-loss orders should always be selling base tokens for quote tokens
+                    if order['from_token'] in self.base_tokens and order['to_token'] == self.quote_token:
+                        pair = f"{order['from_token']}/{order['to_token']}"
+                        price_info = self._trigger_price(pair, prices)
+                        if price_info is None:
+                            continue
+                        current_price = price_info['base_per_quote']  # USDC per token
+                        current_ratio = price_info['base_per_quote_ratio']
+                        
+                        # Execute if current price <= stop price (price has fallen below threshold)
+                        if price_compare(current_ratio, price_ratio(order['stop_price'])) <= 0:
+                            # Calculate expected output with current price
+                            amount_out_expected = amount_in.convert(current_ratio, to_asset)
+                            
+                            # Execute the market swap
+                            swap = (
+                                order['from_token'],
+                                order['to_token'],
+                                amount_in,
+                                amount_out_expected.apply_bps(order.get('slippage_bps', self.SLIPPAGE_BPS))
+                            )
+                
+                # -- TRAILING STOPS (stop already reached, see above) --
+                elif order['order_type'] == "trailing_stop":
+                    price_info = prices[self._order_pair(order)]
+                    current_price = price_info['base_per_quote']  # USDC per token
+                    current_ratio = price_info['base_per_quote_ratio']
+                    amount_out_expected = amount_in.convert(current_ratio, to_asset)
+                    swap = (
+                        order['from_token'],
+                        order['to_token'],
+                        amount_in,
+                        amount_out_expected.apply_bps(order.get('slippage_bps', self.SLIPPAGE_BPS))
+                    )
+                
+                # -- CONDITIONAL ORDERS (condition already checked above) --
+                elif order['order_type'] == "conditional":
+                    price_info = prices[self._order_pair(order)]
+                    current_price = price_info['base_per_quote']  # USDC per token
+                    current_ratio = price_info['base_per_quote_ratio']
+                    if order['from_token'] == self.quote_token:
+                        current_ratio = current_ratio[::-1]
+                    amount_out_expected = amount_in.convert(current_ratio, to_asset)
+                    swap = (
+                        order['from_token'],
+                        order['to_token'],
+                        amount_in,
+                        amount_out_expected.apply_bps(order.get('slippage_bps', self.SLIPPAGE_BPS))
+                    )
+                
+                if swap:
+                    swaps.append({'order': order, 'args': swap, 'price': current_price})
+                    if order.get('oco'):
+                        filled_groups.add(order['oco'])
                     
-            quote_amount_factor = 10**quote_decimals  # 6 decimals for USDC
-            quote_amount = 1.0  # 1 USDC
+            except Exception as e:
+                print(f"Error checking order {order['id']}: {str(e)}")
+                continue
+        return swaps
+    
+    def _apply_swaps(self, swaps, prices, pairs):
+        """Book the sent swaps, then plan each quoted pair's next check"""
+        executed_orders = []
+        deltas = []
+        for swap in swaps:
+            result = swap['result']
+            if 'grid' in swap:
+                delta = self._book_grid_fill(swap, result)
+                if delta:
+                    deltas.append(delta)
+                continue
+            if not (result and result['success']):
+                continue
+            # Booked even if the order was cancelled while its swap was in flight
+            order = swap['order']
+            self._record_fill(order, result, swap['price'])
+            executed_orders.append(order['id'])
+            if order.get('oco'):
+                # One cancels the others: the fill and the cancels are a single write
+                siblings = [o['id'] for o in self.logger.get_pending_orders()
+                            if o.get('oco') == order['oco'] and o['id'] != order['id']]
+                self.logger.remove_pending_orders([order['id']] + siblings)
+                executed_orders.extend(siblings)
+                for sibling_id in siblings:
+                    self.trailing.remove(sibling_id)
+        
+        if deltas and self.logger.append_grid_deltas(deltas) >= self.GRID_COMPACT_EVERY:
+            # Fold the delta log into a fresh snapshot
+            self._save_grids()
+        
+        # Remove executed orders from pending list
+        if executed_orders:
+            self.logger.remove_pending_orders(executed_orders)
+            for order_id in executed_orders:
+                self.deadlines.remove(order_id)
             
-            # Calculate both price directions
-            base_per_quote = (base_to_quote_amount / quote_amount_factor) / base_amount  # USDC per base token
-            quote_per_base = (quote_to_base_amount / base_amount_factor) / quote_amount  # Base token per USDC
+        # Balances follow from the confirmed swap deltas (see confirm_transaction)
+        
+        self._save_marks()
+        
+        # Plan each quoted pair's next check from its remaining triggers
+        pending_orders = self.logger.get_pending_orders()
+        grids = list(self._grids.values())
+        if pairs is not None:
+            pending_orders = [o for o in pending_orders if self._order_pair(o) in pairs]
+            grids = [grid for grid in grids if grid.pair in pairs]
+        conditional_pairs = {self._order_pair(o) for o in pending_orders if o['order_type'] == 'conditional'}
+        triggers = {}
+        for order in pending_orders:
+            if order['order_type'] != 'trailing_stop':
+                triggers.setdefault(self._order_pair(order), []).append(
+                    order.get('limit_price') or order.get('stop_price')
+                )
+        for pair in prices:
+            # Only the highest trailing stop can be reached first
+            stop = self.trailing.highest_stop(pair)
+            if stop:
+                triggers.setdefault(pair, []).append(stop)
+        for grid in grids:
+            # Only the levels either side of the gap can fill next
+            triggers.setdefault(grid.pair, []).extend(grid.triggers())
+        for pair, price_info in prices.items():
+            # Indicators need regular ticks whatever the price triggers' distance
+            self._schedule_poll(pair, price_info, triggers.get(pair, ()),
+                                max_interval=self.default_poll_interval if pair in conditional_pairs else None)
+    
+    def _schedule_expiry(self):
+        """Arm the expiry timer for the earliest order deadline"""
+        deadline = self.deadlines.next_deadline()
+        if deadline is None or not self._polling:
+            return
+        # Re-armed at least hourly, since the scheduler's clock isn't the wall clock
+        delay = min(max(0.0, deadline - time.time()), 3600)
+        self.scheduler.call_later(delay, self._expire_orders, key='order_expiry')
+    
+    def _expire_orders(self):
+        """Expire the orders that are due, then wait for the next deadline"""
+        try:
+            with self._lock:
+                due = self.deadlines.pop_due(time.time())
+                if due:
+                    self.expire_orders(due)
+        except Exception as e:
+            print(f"Error expiring orders: {e}")
+        finally:
+            self._schedule_expiry()
+    
+    def expire_orders(self, order_ids):
+        """Move orders to history as 'expired' with one write of each store; returns them
+
+        An OCO group's shared reservation is released once none of its legs are left.
+        """
+        order_ids = set(order_ids)
+        with self._lock:
+            pending = self.logger.get_pending_orders()
+            expired = [o for o in pending if o['id'] in order_ids]
+            if not expired:
+                return []
+            live_groups = {o['oco'] for o in pending if o.get('oco') and o['id'] not in order_ids}
             
-            price_data = {
-                "base_per_quote": base_per_quote,  # e.g., USDC per BTC (number like 60000)
-                "quote_per_base": quote_per_base,  # e.g., BTC per USDC (small number like 0.000016)
-                "base_symbol": self._get_token_symbol(pool["base_denom"]),
-                "quote_symbol": self._get_token_symbol(pool["quote_denom"]),
-                "base_decimals": base_decimals,
-                "quote_decimals": quote_decimals
-            }
+            self.logger.remove_pending_orders(order_ids)
+            for key in {BalanceReservations.key_for(o) for o in expired} - live_groups:
+                self.reservations.release(key)
+            for order in expired:
+                self.trailing.remove(order['id'])
+                self.deadlines.remove(order['id'])
             
-            # Cache the successful price
-            self.price_cache[pair] = {
-                'data': price_data,
-                'timestamp': time.time()
-            }
+            now = datetime.now().isoformat()
+            records = []
+            for order in expired:
+                record = {name: value for name, value in order.items() if name not in ('id', 'status')}
+                record.update({
+                    'timestamp': now,
+                    'created': order['timestamp'],
+                    'tx_hash': order['id'],
+                    'order_id': order['id'],
+                    'amount_in': 0.0,
+                    'amount_requested': order['amount'],
+                    'status': 'expired'
+                })
+                records.append(record)
+            self.logger.log_transactions(records)
+        self._emit('expired', orders=expired)
+        return expired
+    
+    def _schedule_poll(self, pair, price_info, triggers, now=None, max_interval=None):
+        """Update a pair's volatility estimate and choose when to quote it next"""
+        now = now or time.time()
+        poll = self._polls.setdefault(pair, {
+            'interval': None, 'next': 0, 'distance': None, 'var_rate': None,
+            'price': None, 'time': None, 'polls': 0
+        })
+        poll['polls'] += 1
+        
+        if price_info is None:
+            # Degraded data: retry about a block later rather than a full interval
+            interval = self.MIN_POLL_INTERVAL
+        else:
+            price = price_info['base_per_quote']
             
-            return price_data
+            # EWMA of squared log returns per second (variance rate)
+            if poll['price'] and price and now > poll['time']:
+                r = math.log(price / poll['price'])
+                sample = r * r / (now - poll['time'])
+                poll['var_rate'] = sample if poll['var_rate'] is None else (
+                    self.VOLATILITY_ALPHA * sample + (1 - self.VOLATILITY_ALPHA) * poll['var_rate']
+                )
+            poll['price'], poll['time'] = price, now
             
-        except Exception as e:
-            print(f"Error getting pool price: {e}")
+            # Relative distance to the nearest trigger
+            distances = [abs(math.log(price / t)) for t in triggers if t and price]
+            poll['distance'] = min(distances) if distances else None
             
-            # Try to use cached price if available
-            if hasattr(self, 'price_cache') and pair in self.price_cache:
-                # Check if cache is not too old (e.g., less than 30 minutes)
-                if time.time() - self.price_cache[pair]['timestamp'] < 1800:
-                    print(f"Using cached price from {self.price_cache[pair]['timestamp']}")
-                    return self.price_cache[pair]['data']
+            if poll['distance'] is None:
+                interval = self.MAX_POLL_INTERVAL
+            elif not poll['var_rate']:
+                # No volatility estimate yet
+                interval = self.default_poll_interval
+            else:
+                sigma = math.sqrt(poll['var_rate'])
+                interval = (poll['distance'] / (self.POLL_SAFETY * sigma)) ** 2
             
-            # As a last resort, use hardcoded fallback values
-            if pair == "BTC/USDC":
-                return {
-                    "base_per_quote": 65000.0,
-                    "quote_per_base": 1/65000.0,
-                    "base_symbol": "BTC", 
-                    "quote_symbol": "USDC",
-                    "base_decimals": 8,
-                    "quote_decimals": 6
-                }
-            elif pair == "OSMO/USDC":
-                return {
-                    "base_per_quote": 0.80,
-                    "quote_per_base": 1.25,
-                    "base_symbol": "OSMO", 
-                    "quote_symbol": "USDC",
-                    "base_decimals": 6,
-                    "quote_decimals": 6
-                }
-            elif pair == "ETH/USDC":
-                return {
-                    "base_per_quote": 3500.0,
-                    "quote_per_base": 1/3500.0,
-                    "base_symbol": "ETH", 
-                    "quote_symbol": "USDC",
-                    "base_decimals": 18,
-                    "quote_decimals": 6
-                }
-            return {
-                "base_per_quote": 0.0,
-                "quote_per_base": 0.0,
-                "base_symbol": "",
-                "quote_symbol": "",
-                "base_decimals": 6,
-                "quote_decimals": 6
+            # Back off gradually: a few quiet samples understate volatility
+            if poll['interval']:
+                interval = min(interval, 2 * poll['interval'])
+        
+        poll['interval'] = min(max_interval or self.MAX_POLL_INTERVAL, max(self.MIN_POLL_INTERVAL, interval))
+        poll['next'] = now + poll['interval']
+    
+    def _poll_now(self, pair):
+        """Make a pair due on the next tick (pairs without a schedule yet already are)"""
+        if pair in self._polls:
+            self._polls[pair]['next'] = 0
+    
+    def _due_pairs(self, now):
+        """Pairs with resting orders whose next quote is due"""
+        pairs = {self._order_pair(order) for order in self.logger.get_pending_orders()}
+        pairs.update(grid.pair for grid in list(self._grids.values()))
+        for pair in list(self._polls):
+            if pair not in pairs:
+                del self._polls[pair]
+        return {pair for pair in pairs if self._polls.get(pair, {}).get('next', 0) <= now}
+    
+    def poll_metrics(self):
+        """Effective polling interval and its inputs for each pair with resting orders"""
+        now = time.time()
+        metrics = {}
+        for pair, poll in list(self._polls.items()):
+            metrics[pair] = {
+                'interval': poll['interval'],
+                'next_in': max(0.0, poll['next'] - now),
+                'trigger_distance_pct': poll['distance'] * 100 if poll['distance'] is not None else None,
+                'volatility_per_min_pct': math.sqrt(poll['var_rate'] * 60) * 100 if poll['var_rate'] else None,
+                'polls': poll['polls'],
+                'deferred': self.deferred_pairs.get(pair)
             }
+        return metrics
     
-    def _get_token_symbol(self, denom):
-        """Get a human-readable symbol from a token denomination"""
-        if denom == "uosmo":
-            return "OSMO"
-        elif "allBTC" in denom:
-            return "BTC"
-        elif "factory/osmo1k6c8jln7ejuqwtqmay3yvzrg3kueaczl96pk067ldg8u835w0yhsw27twm/alloyed/allETH" in denom:
-            return "ETH"
-        elif "498A0751C798A0D9A389AA3691123DADA57DAA4FE165D5C75894505B876BA6E4" in denom:
-            return "USDC"
-        return denom.split('/')[-1]
-
-    def execute_market_swap(self, from_token_symbol, to_token_symbol, amount_in: float, min_out: float = None):
-        """Execute a market swap with exact amount in"""
+    def _trigger_price(self, pair, prices):
+        """Quote a pair once per check cycle; None if the price is too degraded to trigger on"""
+        if pair not in prices:
+            price_info = self.client.get_pool_price(pair)
+            reason = self._degraded_reason(pair, price_info)
+            if reason:
+                if pair not in self.deferred_pairs:
+                    print(f"Deferring {pair} order checks: {reason}")
+                self.deferred_pairs[pair] = reason
+                price_info = None
+            else:
+                if self.deferred_pairs.pop(pair, None):
+                    print(f"Resuming {pair} order checks")
+                self._price_heights[pair] = max(self._price_heights.get(pair, 0), price_info['height'])
+            prices[pair] = price_info
+        return prices[pair]
+    
+    def _degraded_reason(self, pair, price_info):
+        """Why a price must not trigger orders, or None if it's usable"""
+        age = time.time() - price_info['timestamp']
+        if price_info['source'] != "live":
+            if price_info['source'] == "none":
+                return "no price available"
+            return f"{price_info['source']} price from {age:.0f}s ago"
+        if age > self.max_price_age:
+            return f"price is {age:.0f}s old"
+        # A lagging node (e.g. after failover) can quote an older block than we've seen
+        if price_info['height'] and price_info['height'] < self._price_heights.get(pair, 0):
+            return f"node is behind (height {price_info['height']} < {self._price_heights[pair]})"
+        return None
+    
+    def _record_fill(self, order, result, current_price):
+        """Log a triggered order's swap and start confirming it"""
+        # Calculate expected values based on order type
+        if order['order_type'] == 'sell_limit':
+            expected_price = order['limit_price']
+            expected_out = order['amount'] * expected_price
+        elif order['order_type'] == 'buy_limit':
+            expected_price = order['limit_price']
+            expected_out = order['amount'] / expected_price
+        elif order['order_type'] in ('stop_loss', 'trailing_stop'):
+            expected_price = current_price
+            expected_out = order['amount'] * current_price
+        elif order['order_type'] == 'conditional':
+            expected_price = current_price
+            if order['from_token'] == self.quote_token:
+                expected_out = order['amount'] / current_price
+            else:
+                expected_out = order['amount'] * current_price
+        else:
+            expected_price = None
+            expected_out = None
+        
+        # Build transaction data object with expected values
+        tx_data = {
+            'timestamp': datetime.now().isoformat(),
+            'tx_hash': result['tx_hash'],
+            'order_id': order['id'],
+            'from_token': order['from_token'],
+            'to_token': order['to_token'],
+            'amount_in': order['amount'],
+            'expected_amount_out': expected_out,
+            'actual_amount_out': None,  # Will be updated after query
+            'execution_price': None,    # Will be updated after query
+            'order_type': order['order_type'],
+            'status': 'executed'
+        }
+        
+        # Add order-specific price fields
+        if order['order_type'] == 'stop_loss':
+            tx_data['stop_price'] = order['stop_price']
+        elif order['order_type'] == 'trailing_stop':
+            # The stop that was reached, and the high it trailed
+            tx_data['stop_price'] = order['stop_price']
+            tx_data['high_water'] = order['high_water']
+        elif order['order_type'] == 'conditional':
+            tx_data['condition'] = order['condition']
+        else:  # limit orders
+            tx_data['limit_price'] = order['limit_price']
+        
+        if order.get('oco'):
+            tx_data['oco'] = order['oco']
+        
+        # Log the transaction
+        self.logger.log_transaction(tx_data)
+        
+        # Funds stay reserved until the ledger has the confirmed swap
+        self.reservations.hold_for_tx(BalanceReservations.key_for(order), result['tx_hash'])
+        
+        # Query actual transaction data in background
+        self.confirm_transaction(result['tx_hash'])
+        
+        self._emit('fill', order=order, tx_data=tx_data, price=current_price)
+    
+    def confirm_transaction(self, tx_hash):
+        """Query actual transaction details and update the transaction log"""
+        if tx_hash.startswith('order-'):
+            # Skip synthetic transactions
+            return
+            
+        # The fill was logged just before; an hour's slack covers a month change
+        since = (datetime.now() - timedelta(hours=1)).isoformat()
+        
+        # Give the transaction a few seconds to be confirmed
+        self.scheduler.start()
+        self.scheduler.call_later(3, self._confirm_attempt, tx_hash, 1, since, key=('confirm', tx_hash))
+    
+    def _confirm_attempt(self, tx_hash, attempt, since=None, max_attempts=3):
+        """One confirmation query; retries itself later with increasing delay"""
         try:
-            # Find matching pool and denoms from symbols
-            pair = None
-            token_in = None
-            token_out = None
-        
-            # Check each pool to find the right pair
-            for pool_pair, pool_info in self.pools.items():
-                base_symbol = self._get_token_symbol(pool_info["base_denom"])
-                quote_symbol = self._get_token_symbol(pool_info["quote_denom"])
-            
-                if (from_token_symbol == base_symbol and to_token_symbol == quote_symbol):
-                    pair = pool_pair
-                    token_in = pool_info["base_denom"]
-                    token_out = pool_info["quote_denom"]
-                    break
-                elif (from_token_symbol == quote_symbol and to_token_symbol == base_symbol):
-                    pair = pool_pair
-                    token_in = pool_info["quote_denom"]
-                    token_out = pool_info["base_denom"]
-                    break
+            tx_details = self.client.query_transaction_details(tx_hash)
             
-            if not pair or not token_in or not token_out:
-                raise ValueError(f"Could not find pool for {from_token_symbol} to {to_token_symbol}")
+            if tx_details:
+                # Update the transaction with actual values
+                updated_data = {
+                    'actual_amount_out': tx_details['amount_out'],
+                    'execution_price': tx_details['execution_price'],
+                    'token_out_denom': tx_details['denom_out'],
+                    'token_in_denom': tx_details['denom_in'],
+                    'amount_in_raw': tx_details['amount_in_raw'],
+                    'amount_out_raw': tx_details['amount_out_raw']
+                }
                 
-            pool = self.pools.get(pair)
-            
-            # Format the amount with proper denomination and decimals
-            if "allBTC" in token_in:
-                # allBTC uses 8 decimals
-                amount_in_tokens = int(amount_in * 100000000)
-            elif "factory/osmo1k6c8jln7ejuqwtqmay3yvzrg3kueaczl96pk067ldg8u835w0yhsw27twm/alloyed/allETH" in token_in:        
-                # ETH uses 18 decimals
-                amount_in_tokens = int(amount_in * 1000000000000000000)
-            else:
-                # Most tokens use 6 decimals on Osmosis
-                amount_in_tokens = int(amount_in * 1000000)
+                success = self.logger.update_transaction(tx_hash, updated_data, since)
                 
-            # Ensure no spaces between amount and denom - this is critical
-            amount_in_formatted = f"{amount_in_tokens}{token_in}"
-        
-            # Set minimum output if provided
-            min_amount_out = ""
-            if min_out:
-                if "allBTC" in token_out:
-                    # allBTC uses 8 decimals
-                    min_out_tokens = int(min_out * 100000000)
-                else:
-                    # Most tokens use 6 decimals
-                    min_out_tokens = int(min_out * 1000000)
-                    
-                # Again, ensure no spaces between amount and denom
-                min_amount_out = f"{min_out_tokens}"
+                # Apply the exact deltas to the balance ledger
+                self.client.apply_confirmed_swap(tx_hash, tx_details)
+                self.reservations.release_tx(tx_hash)
+                
+                self._emit('confirmed', tx_hash=tx_hash, details=tx_details, logged=success)
+                return
             
-            # Construct the command for a market swap with exact amount in
-            cmd = [
-                "osmosisd", "tx", "poolmanager", "swap-exact-amount-in",
-                amount_in_formatted,
-                min_amount_out,
-                "--swap-route-pool-ids", pool["pool_id"],
-                "--swap-route-denoms", token_out,
-                "--from", self.wallet_name,
-                "--chain-id", "osmosis-1",
-                "--gas", "auto",
-                "--gas-adjustment", "1.3",
-                "--gas-prices", "0.035uosmo",
-                "-y"
-            ]
+            if attempt < max_attempts:
+                # Increase delay with each attempt: 2s, 4s
+                self.scheduler.call_later(2 * attempt, self._confirm_attempt, tx_hash, attempt + 1, since,
+                                          key=('confirm', tx_hash))
+                return
             
-            # Execute the command
-            result = subprocess.run(cmd, capture_output=True, text=True)
+            # The ledger can't account for this swap, so re-sync on the next read
+            self.client.ledger.mark_drift(f"unconfirmed tx {tx_hash}")
+            self.reservations.release_tx(tx_hash)
             
-            if result.returncode != 0:
-                print(f"Error output: {result.stderr}")
-                return {
-                    "success": False,
-                    "error": result.stderr
-                }
+            self._emit('unconfirmed', tx_hash=tx_hash)
             
-            # Try to parse as JSON, but handle non-JSON responses
-            try:
-                response_data = json.loads(result.stdout)
-                tx_hash = response_data.get("txhash", "Unknown")
-                
-                return {
-                    "success": True,
-                    "tx_hash": tx_hash
-                }
-            except json.JSONDecodeError:
-                # Handle case where response is not valid JSON
-                import re
-                tx_hash_match = re.search(r'txhash:\s*([A-F0-9]+)', result.stdout)
-                if tx_hash_match:
-                    tx_hash = tx_hash_match.group(1)
-                    return {
-                        "success": True,
-                        "tx_hash": tx_hash
-                    }
-                
-                return {
-                    "success": True,
-                    "tx_hash": "Transaction submitted (hash not found in output)",
-                    "raw_output": result.stdout
-                }
-                    
         except Exception as e:
-            print(f"Exception during swap execution: {str(e)}")
-            return {
-                "success": False,
-                "error": str(e)
-            }
+            print(f"Error querying actual transaction details: {e}")
+    
+    def start_polling(self, check_interval=10):
+        """Schedule order checks on the scheduler
 
-class TransactionLogger:
-    """Handles logging and retrieval of transaction history with enhanced details"""
+        Each pair is re-checked on its own adaptive interval;
+        check_interval is used until a pair's volatility is known.
+        """
+        self.default_poll_interval = check_interval
+        self._polling = True
+        self.scheduler.start()
+        self.scheduler.call_later(0, self._poll_tick, key='order_poll', lane=self.LANE)
+        self.client.price_history.start(self.scheduler)
+        self._resume_parents()
+        self._resume_grids()
+        self._schedule_expiry()
+        self._schedule_dca()
+        # Pool discovery is slow and rarely changes; keep it out of startup
+        self.scheduler.call_every(3600, self._refresh_pools, key='pool_discovery', first_delay=30)
     
-    def __init__(self):
-        self.transactions_file = "transactions.json"
-        self.pending_orders_file = "pending_orders.json"
-        
-        # Create files if they don't exist
-        if not os.path.exists(self.transactions_file):
-            with open(self.transactions_file, 'w') as f:
-                json.dump([], f)
-                
-        if not os.path.exists(self.pending_orders_file):
-            with open(self.pending_orders_file, 'w') as f:
-                json.dump([], f)
+    def _refresh_pools(self):
+        """Re-discover on-chain pools once the cached set is too many blocks old"""
+        self.client.pool_registry.refresh(self.client.current_height())
     
-    def log_transaction(self, tx_data):
-        """Log a completed transaction"""
+    def _poll_tick(self):
+        """Check the pairs that are due, then schedule the next tick"""
+        if self._stop_event.is_set():
+            return
         try:
-            with open(self.transactions_file, 'r+') as f:
-                transactions = json.load(f)
-                transactions.append(tx_data)
-                f.seek(0)
-                json.dump(transactions, f, indent=2)
-        except Exception as e:
-            print(f"Error logging transaction: {e}")
+            # Cheap unless the balance ledger asks for a re-sync
+            self.client.get_wallet_balances()
+            
+            due = self._due_pairs(time.time())
+            if due:
+                self.check_pending_orders(due)
+                # Warm start for the next run
+                self.client.save_state_snapshot()
+        finally:
+            # Run again when the next pair is due (new orders pull this forward)
+            upcoming = [poll['next'] for poll in list(self._polls.values())]
+            delay = min(upcoming) - time.time() if upcoming else self.MAX_POLL_INTERVAL
+            self.scheduler.call_later(max(0.5, min(delay, self.MAX_POLL_INTERVAL)), self._poll_tick,
+                                      key='order_poll', lane=self.LANE)
+    
+    def run_forever(self, check_interval=10):
+        """Check orders until stop() is called (blocking)"""
+        self.start_polling(check_interval)
+        self._stop_event.wait()
+    
+    def stop(self):
+        self._stop_event.set()
+        self._polling = False
+        with self._lock:
+            self._save_marks(force=True)
+            if self._grids:
+                self._save_grids()
+        self.client.price_history.save()
+        self.scheduler.cancel('order_poll')
+        self.scheduler.cancel('order_expiry')
+        self.scheduler.cancel('dca')
+        if self._owns_scheduler:
+            self.scheduler.stop()
+
+
+class ControlAPIServer:
+    """Local JSON API for driving the order engine from other processes
+
+    Endpoints:
+      GET    /orders         pending orders, active TWAP/iceberg parents, DCA schedules and grids
+      POST   /orders         submit one order spec (see OrderEngine.create_orders)
+      POST   /orders/batch   submit a list of order specs
+      DELETE /orders/<id>    cancel an order
+      GET    /prices         last known price per pair (no node query)
+      GET    /balances       ledger balances, reserved and available amounts
+      GET    /metrics        adaptive polling interval per pair
+      GET    /jobs           scheduled jobs, soonest first
+      GET    /fills          stream of engine events, one JSON object per line
+
+    Served by an asyncio loop on its own thread, on 127.0.0.1:<port> or a
+    Unix socket. Submissions go through a bounded queue drained in batches
+    (one pending-order write per batch); when the queue is full the API
+    answers 429 so clients back off.
+    """
+    
+    def __init__(self, engine, host="127.0.0.1", port=8765, unix_socket=None,
+                 queue_size=10_000, batch_size=500):
+        self.engine = engine
+        self.host = host
+        self.port = port
+        self.unix_socket = unix_socket
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        
+        self._loop = None
+        self._submissions = None
+        self._streams = set()
+        self.dropped_events = 0
+        
+        engine.subscribe(self._on_engine_event)
+    
+    def start(self):
+        """Start serving on a daemon thread"""
+        ready = threading.Event()
+        threading.Thread(target=self._run, args=(ready,), daemon=True).start()
+        ready.wait(5)
+    
+    def _run(self, ready):
+        # Imported here: asyncio adds ~8 MB and most runs don't serve the API
+        import asyncio
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._submissions = asyncio.Queue(maxsize=self.queue_size)
+        
+        if self.unix_socket:
+            server = self._loop.run_until_complete(
+                asyncio.start_unix_server(self._handle_connection, path=self.unix_socket)
+            )
+            print(f"Control API listening on {self.unix_socket}")
+        else:
+            server = self._loop.run_until_complete(
+                asyncio.start_server(self._handle_connection, self.host, self.port)
+            )
+            print(f"Control API listening on http://{self.host}:{self.port}")
+        
+        self._loop.create_task(self._submission_worker())
+        ready.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            server.close()
+    
+    # -- Engine events -> fill streams --
+    
+    def _on_engine_event(self, event, data):
+        """Forward engine events (from engine threads) to streaming clients"""
+        if self._loop is None or not self._streams:
+            return
+        if event == 'fill':
+            payload = {'event': event, 'order': data['order'], 'tx': data['tx_data'], 'price': data['price']}
+        elif event == 'confirmed':
+            details = data['details']
+            payload = {'event': event, 'tx_hash': data['tx_hash'],
+                       'amount_out': details['amount_out'], 'token_out': details['token_out'],
+                       'execution_price': details['execution_price']}
+        else:
+            payload = {'event': event, **data}
+        line = (json.dumps(payload, default=str) + "\n").encode()
+        self._loop.call_soon_threadsafe(self._broadcast, line)
+    
+    def _broadcast(self, line):
+        for queue in self._streams:
+            if queue.full():
+                # Slow consumers lose their oldest events rather than stalling the engine
+                queue.get_nowait()
+                self.dropped_events += 1
+            queue.put_nowait(line)
+    
+    # -- Order submission --
+    
+    async def _submission_worker(self):
+        """Drain queued submissions in batches so each batch costs one write"""
+        import asyncio
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._submissions.get()]
+            while len(batch) < self.batch_size and not self._submissions.empty():
+                batch.append(self._submissions.get_nowait())
+            
+            specs = [spec for spec, _ in batch]
+            try:
+                results = await loop.run_in_executor(None, self.engine.create_orders, specs)
+            except Exception as e:
+                results = [(None, str(e))] * len(batch)
+            
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+    
+    async def _submit(self, specs):
+        """Queue order specs; None if the queue is full"""
+        import asyncio
+        if self._submissions.maxsize - self._submissions.qsize() < len(specs):
+            return None
+        loop = asyncio.get_running_loop()
+        futures = []
+        for spec in specs:
+            future = loop.create_future()
+            self._submissions.put_nowait((spec, future))
+            futures.append(future)
+        return await asyncio.gather(*futures)
+    
+    @staticmethod
+    def _result_payload(result):
+        order, error = result
+        return {'ok': True, 'order': order} if order else {'ok': False, 'error': error}
+    
+    # -- HTTP --
     
-    def update_transaction(self, tx_hash, updated_data):
-        """Update an existing transaction with actual execution data"""
+    async def _handle_connection(self, reader, writer):
+        """Serve HTTP/1.1 requests on one connection (keep-alive)"""
+        import asyncio
         try:
-            with open(self.transactions_file, 'r+') as f:
-                transactions = json.load(f)
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, _ = request_line.decode().split(" ", 2)
+                except ValueError:
+                    await self._respond(writer, 400, {'error': 'bad request line'})
+                    break
                 
-                # Find the transaction by hash
-                for tx in transactions:
-                    if tx.get('tx_hash') == tx_hash:
-                        tx.update(updated_data)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
                         break
+                    name, _, value = line.decode().partition(":")
+                    headers[name.strip().lower()] = value.strip()
                 
-                # Write back the updated transactions
-                f.seek(0)
-                json.dump(transactions, f, indent=2)
-                f.truncate()
+                body = None
+                length = int(headers.get("content-length", 0))
+                if length:
+                    raw = await reader.readexactly(length)
+                    try:
+                        body = json.loads(raw)
+                    except ValueError:
+                        await self._respond(writer, 400, {'error': 'invalid JSON body'})
+                        continue
                 
-            return True
+                path = target.split("?", 1)[0].rstrip("/") or "/"
+                if method == "GET" and path == "/fills":
+                    await self._stream_fills(writer)
+                    break
+                
+                status, payload = await self._route(method, path, body)
+                await self._respond(writer, status, payload,
+                                    keep_alive=headers.get("connection", "").lower() != "close")
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
         except Exception as e:
-            print(f"Error updating transaction: {e}")
-            return False
+            print(f"Control API error: {e}")
+        finally:
+            writer.close()
+    
+    async def _route(self, method, path, body):
+        """Dispatch a request to its handler; returns (status, payload)"""
+        import asyncio
+        loop = asyncio.get_running_loop()
+        
+        if path == "/orders" and method == "GET":
+            # These take the engine lock, which a check holds while its swaps broadcast
+            return 200, await loop.run_in_executor(None, self._orders_payload)
+        
+        if path in ("/orders", "/orders/batch") and method == "POST":
+            batch = path.endswith("/batch")
+            specs = body if batch else [body]
+            if not isinstance(specs, list) or not all(isinstance(spec, dict) for spec in specs):
+                return 400, {'error': 'expected an order object' if not batch else 'expected a list of orders'}
             
-    def get_transactions(self):
-        """Get all logged transactions"""
-        try:
-            with open(self.transactions_file, 'r') as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"Error reading transactions: {e}")
-            return []
+            results = await self._submit(specs)
+            if results is None:
+                return 429, {'error': 'submission queue full, retry later'}
+            
+            if batch:
+                return 200, {'results': [self._result_payload(r) for r in results]}
+            payload = self._result_payload(results[0])
+            return (201 if payload['ok'] else 400), payload
+        
+        if path.startswith("/orders/") and method == "DELETE":
+            order_id = path[len("/orders/"):]
+            cancelled = await loop.run_in_executor(None, self.engine.cancel_order, order_id)
+            return (200, {'cancelled': order_id}) if cancelled else (404, {'error': f'no pending order {order_id}'})
+        
+        if path == "/prices" and method == "GET":
+            client = self.engine.client
+            return 200, {'prices': {pair: client.cached_price(pair) for pair in list(client.price_cache)}}
+        
+        if path == "/balances" and method == "GET":
+            ledger = self.engine.client.ledger
+            reservations = self.engine.reservations
+            balances = {}
+            for symbol in self.engine.client.balances:
+                asset = self.engine.client.assets.by_symbol(symbol)
+                balances[symbol] = {
+                    'balance': str(ledger.amount(symbol)),
+                    'reserved': str(reservations.reserved(symbol)),
+                    'available': str(TokenAmount(reservations.available(asset.denom), asset))
+                }
+            return 200, {'balances': balances, 'last_sync': ledger.last_sync, 'height': ledger.height}
+        
+        if path == "/jobs" and method == "GET":
+            return 200, {'jobs': self.engine.scheduler.jobs()}
+        
+        if path == "/metrics" and method == "GET":
+            return 200, {'polling': self.engine.poll_metrics(), 'dropped_events': self.dropped_events}
+        
+        return 404, {'error': f'no route for {method} {path}'}
     
-    def add_pending_order(self, order_data):
-        """Add a new pending limit order"""
-        try:
-            with open(self.pending_orders_file, 'r+') as f:
-                orders = json.load(f)
-                orders.append(order_data)
-                f.seek(0)
-                json.dump(orders, f, indent=2)
-        except Exception as e:
-            print(f"Error adding pending order: {e}")
+    def _orders_payload(self):
+        engine = self.engine
+        return {'orders': engine.logger.get_pending_orders(), 'parents': engine.parent_orders(),
+                'schedules': engine.dca_schedules(), 'grids': engine.grid_strategies()}
     
-    def get_pending_orders(self):
-        """Get all pending limit orders"""
+    async def _respond(self, writer, status, payload, keep_alive=True):
+        reasons = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found", 429: "Too Many Requests"}
+        body = json.dumps(payload, default=str).encode()
+        headers = [
+            f"HTTP/1.1 {status} {reasons.get(status, 'OK')}",
+            "Content-Type: application/json",
+            f"Content-Length: {len(body)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        if status == 429:
+            headers.append("Retry-After: 1")
+        writer.write(("\r\n".join(headers) + "\r\n\r\n").encode() + body)
+        await writer.drain()
+    
+    async def _stream_fills(self, writer):
+        """Stream engine events as newline-delimited JSON until the client disconnects"""
+        import asyncio
+        events = asyncio.Queue(maxsize=1000)
+        self._streams.add(events)
         try:
-            with open(self.pending_orders_file, 'r') as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"Error reading pending orders: {e}")
-            return []
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\n"
+                         b"Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n")
+            await writer.drain()
+            while True:
+                line = await events.get()
+                writer.write(f"{len(line):X}\r\n".encode() + line + b"\r\n")
+                await writer.drain()
+        finally:
+            self._streams.discard(events)
+
+
+class UIDispatcher:
+    """Runs callbacks on the Tk thread on behalf of any thread
+
+    Tk must only be touched from the thread running mainloop. Worker threads
+    post callbacks here instead; the Tk thread drains them once per frame.
+    Appends to the deque and writes to the dict are atomic under the GIL,
+    so producers never take a lock.
+
+    Keyed posts coalesce: if the same key is posted several times within a
+    frame, only the latest callback runs. Use them for anything that just
+    redraws state (a variable, a list view), so a burst of fills costs one
+    redraw rather than one per fill.
+    """
     
-    def remove_pending_order(self, order_id):
-        """Remove a completed or canceled order"""
+    def __init__(self, root, fps=20, max_per_frame=500):
+        self.root = root
+        self.frame_ms = max(1, int(1000 / fps))
+        self.max_per_frame = max_per_frame
+        
+        self._queue = deque()   # (key, callback, args); key None = not coalesced
+        self._latest = {}       # key -> (callback, args) of the newest keyed post
+        
+        self.root.after(self.frame_ms, self._drain)
+    
+    def post(self, callback, *args):
+        """Run callback(*args) on the Tk thread"""
+        self._queue.append((None, callback, args))
+    
+    def post_keyed(self, key, callback, *args):
+        """Run callback(*args) on the Tk thread, replacing any pending post with the same key"""
+        # Write the value before queueing the key, so a drain that sees the key sees the value
+        self._latest[key] = (callback, args)
+        self._queue.append((key, None, None))
+    
+    def set_var(self, var, value):
+        """Set a Tk variable from any thread (coalesced per variable)"""
+        self.post_keyed(('var', str(var)), var.set, value)
+    
+    def _drain(self):
+        """Run up to max_per_frame queued callbacks, then schedule the next frame"""
+        queue = self._queue
+        ran = 0
+        while queue and ran < self.max_per_frame:
+            key, callback, args = queue.popleft()
+            if key is not None:
+                # Earlier duplicates of a key find nothing left and are skipped
+                entry = self._latest.pop(key, None)
+                if entry is None:
+                    continue
+                callback, args = entry
+            ran += 1
+            try:
+                callback(*args)
+            except Exception as e:
+                print(f"Error in UI callback {getattr(callback, '__name__', callback)}: {e}")
+        
         try:
-            with open(self.pending_orders_file, 'r+') as f:
-                orders = json.load(f)
-                orders = [o for o in orders if o['id'] != order_id]
-                f.seek(0)
-                json.dump(orders, f, indent=2)
-                f.truncate()
-        except Exception as e:
-            print(f"Error removing pending order: {e}")
+            self.root.after(self.frame_ms, self._drain)
+        except tk.TclError:
+            pass  # Window destroyed
+
+
+class PriceChart:
+    """Price history of one pair, drawn as a line on a Tk Canvas
+
+    The series is downsampled with Largest-Triangle-Three-Buckets to about
+    one point per pixel column, so a full redraw costs the same for a
+    thousand points as for a million. Between full redraws only the newest
+    point is drawn: the last segment is moved while its candle is still
+    forming and a new segment is added when the next one starts. The x axis
+    keeps some headroom on the right for those points; a point outside the
+    axes, a resize or a change of pair or resolution redraws everything.
+    Pending limit and stop prices are drawn as horizontal lines.
+    """
+    
+    RESOLUTIONS = ("ticks", "1m", "5m", "1h", "1d")
+    HEADROOM = 0.1          # Fraction of the x axis kept free for new points
+    MARGINS = (6, 8, 70, 8)  # Left, top, right (price labels), bottom in pixels
+    LINE_COLOR = "#0fabc9"
+    LEVEL_COLORS = {'sell_limit': "#4ade80", 'buy_limit': "#a78bfa", 'stop_loss': "#f87171", 'trailing_stop': "#fb923c"}
+    
+    def __init__(self, parent, history, height=150):
+        self.history = history
+        self.pair = None
+        self.resolution = "1m"
+        self.canvas = tk.Canvas(parent, height=height, background="#202442", highlightthickness=0)
+        self.canvas.bind("<Configure>", lambda event: self.redraw())
+        
+        canvas = self.canvas
+        self._line = canvas.create_line(0, 0, 0, 0, fill=self.LINE_COLOR, width=1.5, state='hidden')
+        self._tail = canvas.create_line(0, 0, 0, 0, fill=self.LINE_COLOR, width=1.5, state='hidden')
+        self._high_label = canvas.create_text(0, 0, anchor=tk.NE, fill="#E8EDDF", font=("Helvetica", 8))
+        self._low_label = canvas.create_text(0, 0, anchor=tk.SE, fill="#E8EDDF", font=("Helvetica", 8))
+        self._last_label = canvas.create_text(0, 0, anchor=tk.W, fill=self.LINE_COLOR, font=("Helvetica", 8, "bold"))
+        self._message = canvas.create_text(0, 0, fill="#E8EDDF", font=("Helvetica", 9))
+        
+        self._axes = None     # (x0, x1, y0, y1) data ranges of the plot area
+        self._tail_from = None  # (x, y) where the tail segment starts
+        self._last = None     # (x, y) newest point drawn
+        self._appended = 0    # Segments added since the last full redraw
+        self._levels = []     # [(price, order_type, order id)]
+    
+    @staticmethod
+    def downsample(xs, ys, threshold):
+        """Indices of at most threshold points that keep the series' shape (LTTB)
+
+        Keeps the first and last point and, from each of threshold - 2
+        equal buckets in between, the point forming the largest triangle
+        with the point kept before it and the next bucket's average. Takes
+        lists or NumPy arrays; with arrays each bucket is one vector op.
+        """
+        n = len(xs)
+        if threshold >= n or threshold < 3:
+            return list(range(n))
+        every = (n - 2) / (threshold - 2)
+        edges = [int(i * every) + 1 for i in range(threshold - 1)]
+        edges[-1] = n - 1
+        kept = [0]
+        a = 0
+        if hasattr(xs, 'shape') and n < 32 * threshold:
+            xs, ys = xs.tolist(), ys.tolist()  # Small buckets: per-bucket NumPy calls cost more than they save
+        if hasattr(xs, 'shape'):
+            import numpy as np
+            starts = np.array(edges[:-1])
+            counts = np.diff(edges)
+            # Average of each bucket; the one after the last bucket is the last point
+            next_x = np.append((np.add.reduceat(xs[:n - 1], starts) / counts)[1:], xs[n - 1])
+            next_y = np.append((np.add.reduceat(ys[:n - 1], starts) / counts)[1:], ys[n - 1])
+            for i in range(threshold - 2):
+                start, end = edges[i], edges[i + 1]
+                ax, ay = xs[a], ys[a]
+                areas = np.abs((ax - next_x[i]) * (ys[start:end] - ay) - (ax - xs[start:end]) * (next_y[i] - ay))
+                a = start + int(areas.argmax())
+                kept.append(a)
+        else:
+            for i in range(threshold - 2):
+                start, end = edges[i], edges[i + 1]
+                if i + 2 < threshold - 1:
+                    following = range(edges[i + 1], edges[i + 2])
+                    nx = sum(xs[j] for j in following) / len(following)
+                    ny = sum(ys[j] for j in following) / len(following)
+                else:
+                    nx, ny = xs[n - 1], ys[n - 1]
+                ax, ay = xs[a], ys[a]
+                best = -1.0
+                for j in range(start, end):
+                    area = abs((ax - nx) * (ys[j] - ay) - (ax - xs[j]) * (ny - ay))
+                    if area > best:
+                        best, a = area, j
+                kept.append(a)
+        kept.append(n - 1)
+        return kept
+    
+    def show(self, pair=None, resolution=None):
+        """Switch pair and/or resolution (redraws only if either changed)"""
+        pair = pair or self.pair
+        resolution = resolution or self.resolution
+        if resolution not in self.RESOLUTIONS:
+            raise ValueError(f"Unknown chart resolution {resolution}")
+        if (pair, resolution) != (self.pair, self.resolution) or self._axes is None:
+            self.pair, self.resolution = pair, resolution
+            self.redraw()
+    
+    def _series(self, limit=None):
+        """(times, prices) of the current pair and resolution, oldest first"""
+        if self.resolution == "ticks":
+            rows, column = self.history.ticks(self.pair, limit), 1
+        else:
+            rows, column = self.history.candles(self.pair, self.resolution, limit), 4
+        if hasattr(rows, 'shape'):
+            return rows[:, 0], rows[:, column]
+        return [row[0] for row in rows], [row[column] for row in rows]
+    
+    def _plot_area(self):
+        left, top, right, bottom = self.MARGINS
+        return left, top, max(self.canvas.winfo_width() - right, left + 10), max(self.canvas.winfo_height() - bottom, top + 10)
+    
+    def _to_pixels(self, x, y):
+        left, top, right, bottom = self._plot_area()
+        x0, x1, y0, y1 = self._axes
+        return left + (x - x0) * (right - left) / (x1 - x0), bottom - (y - y0) * (bottom - top) / (y1 - y0)
+    
+    def _in_axes(self, x, y):
+        x0, x1, y0, y1 = self._axes
+        return x0 <= x <= x1 and y0 <= y <= y1
+    
+    def redraw(self):
+        """Downsample the whole series to the canvas width and draw it"""
+        canvas = self.canvas
+        canvas.delete('appended')
+        self._appended = 0
+        self._axes = self._last = self._tail_from = None
+        xs, ys = self._series() if self.pair else ([], [])
+        if len(xs) < 2:
+            for item in (self._line, self._tail):
+                canvas.itemconfigure(item, state='hidden')
+            for item in (self._high_label, self._low_label, self._last_label):
+                canvas.itemconfigure(item, text="")
+            canvas.coords(self._message, canvas.winfo_width() / 2, canvas.winfo_height() / 2)
+            canvas.itemconfigure(self._message, text=f"No {self.pair or ''} price history yet")
+            self._draw_levels()
+            return
+        canvas.itemconfigure(self._message, text="")
+        
+        left, top, right, bottom = self._plot_area()
+        kept = self.downsample(xs, ys, max(3, int(right - left)))
+        low, high = (float(ys.min()), float(ys.max())) if hasattr(ys, 'shape') else (min(ys), max(ys))
+        pad = (high - low) * 0.05 or high * 0.001
+        x0, x1 = float(xs[0]), float(xs[-1])
+        span = (x1 - x0) or 1.0
+        self._axes = (x0, x1 + span * self.HEADROOM / (1 - self.HEADROOM), low - pad, high + pad)
+        
+        points = [self._to_pixels(float(xs[i]), float(ys[i])) for i in kept]
+        if len(points) > 2:
+            canvas.coords(self._line, *[v for point in points[:-1] for v in point])
+            canvas.itemconfigure(self._line, state='normal')
+        else:
+            canvas.itemconfigure(self._line, state='hidden')
+        canvas.coords(self._tail, *points[-2], *points[-1])
+        canvas.itemconfigure(self._tail, state='normal')
+        self._tail_from = (float(xs[kept[-2]]), float(ys[kept[-2]]))
+        self._last = (x1, float(ys[-1]))
+        
+        canvas.coords(self._high_label, canvas.winfo_width() - 2, top)
+        canvas.itemconfigure(self._high_label, text=f"{high:.6g}")
+        canvas.coords(self._low_label, canvas.winfo_width() - 2, bottom)
+        canvas.itemconfigure(self._low_label, text=f"{low:.6g}")
+        self._move_last_label()
+        self._draw_levels()
+    
+    def update(self):
+        """Draw points recorded since the last call, redrawing only if they leave the axes"""
+        if self._axes is None:
+            self.redraw()
+            return
+        xs, ys = self._series(limit=16)
+        last_x = self._last[0]
+        if not len(xs) or float(xs[0]) > last_x:
+            self.redraw()  # Gap larger than the fetched rows
+            return
+        canvas = self.canvas
+        for x, y in zip(xs, ys):
+            x, y = float(x), float(y)
+            if x < last_x:
+                continue
+            if not self._in_axes(x, y) or self._appended > self.canvas.winfo_width():
+                self.redraw()
+                return
+            if x > last_x:
+                # The previous tail becomes a fixed segment
+                canvas.create_line(*self._to_pixels(*self._tail_from), *self._to_pixels(*self._last),
+                                   fill=self.LINE_COLOR, width=1.5, tags='appended')
+                self._appended += 1
+                self._tail_from = self._last
+            self._last = (x, y)
+            last_x = x
+            canvas.coords(self._tail, *self._to_pixels(*self._tail_from), *self._to_pixels(x, y))
+        self._move_last_label()
+    
+    def _move_last_label(self):
+        x, y = self._to_pixels(*self._last)
+        self.canvas.coords(self._last_label, self._plot_area()[2] + 4, y)
+        self.canvas.itemconfigure(self._last_label, text=f"{self._last[1]:.6g}")
+    
+    def set_levels(self, levels):
+        """Pending order prices to overlay: [(price, order_type, order id)]"""
+        levels = sorted(levels)
+        if levels != self._levels:
+            self._levels = levels
+            self._draw_levels()
+    
+    def _draw_levels(self):
+        canvas = self.canvas
+        canvas.delete('level')
+        if self._axes is None:
+            return
+        left, top, right, bottom = self._plot_area()
+        y0, y1 = self._axes[2], self._axes[3]
+        for price, order_type, order_id in self._levels:
+            color = self.LEVEL_COLORS.get(order_type, "#E8EDDF")
+            label = f"{order_type.replace('_', ' ')} {order_id}"
+            if y0 <= price <= y1:
+                y = self._to_pixels(self._axes[0], price)[1]
+                canvas.create_line(left, y, right, y, fill=color, dash=(4, 3), tags='level')
+                canvas.create_text(left + 2, y - 1, anchor=tk.SW, text=f"{label} @ {price:.6g}",
+                                   fill=color, font=("Helvetica", 7), tags='level')
+            else:
+                # Off the chart: mark the edge it lies beyond
+                above = price > y1
+                canvas.create_text(left + 2, top if above else bottom, anchor=tk.NW if above else tk.SW,
+                                   text=f"{'▲' if above else '▼'} {label} @ {price:.6g}",
+                                   fill=color, font=("Helvetica", 7), tags='level')
+        canvas.tag_raise(self._tail)
+
 
 class OsmosisTraderUI:
+    # Time in force of resting orders: label -> seconds (None = good till cancelled)
+    VALIDITY_OPTIONS = {"GTC": None, "1 hour": 3600, "1 day": 86400, "1 week": 7 * 86400, "30 days": 30 * 86400}
+    # Market orders can repeat as a DCA schedule: label -> seconds between buys
+    REPEAT_OPTIONS = {"Once": None, "Every hour": 3600, "Every 6 hours": 6 * 3600, "Every day": 86400,
+                      "Every week": 7 * 86400}
+    
     def __init__(self, root):
         self.root = root
         self.root.title("Osmosis Trader")
-        self.root.geometry("600x500")
+        self.root.geometry("600x700")
         
         # Initialize Osmosis client and transaction logger
         self.client = OsmosisClient(root)
         self.logger = TransactionLogger()
+        
+        # Render from the last known state; live values are fetched in the background
+        self.snapshot_time = self.client.load_state_snapshot()
+        
+        # All UI updates from background threads go through here
+        self.ui = UIDispatcher(root)
 
         self.price_cache_limit = 10  # Maximum price cache entries
         self.menu_cache_limit = 5    # Maximum menu cache entries
         self.price_cache_ttl = 300 
 
-        self.order_id_counter = self._get_highest_order_id() + 1
-        
-        # Available tokens
-        self.base_tokens = ["BTC", "ETH", "OSMO"]
+        # Available tokens: every configured pair against the quote token
         self.quote_token = "USDC"
+        self.base_tokens = self.client.pool_registry.base_symbols(self.quote_token)
+        
+        # One scheduler runs every periodic and delayed job (see Scheduler.jobs())
+        self.scheduler = Scheduler(workers=3, name="ui").start()
+        
+        # Stop-loss and limit orders are run by the engine; the UI is a client
+        self.engine = OrderEngine(self.client, self.logger, self.base_tokens, self.quote_token,
+                                  scheduler=self.scheduler)
+        self.engine.subscribe(self._on_engine_event)
+        
+        # Size-aware output estimates for the min-out hint, re-quoted each block
+        self.client.impact_curves.start(
+            self.scheduler, on_update=lambda: self.ui.post_keyed('min_out_hint', self._update_min_out_hint_if_auto)
+        )
         
         # Track if the user has manually set the min_out value
         self.min_out_manually_set = False
@@ -540,13 +5799,21 @@ class OsmosisTraderUI:
         self._apply_osmosis_theme()
         
         self._create_ui()
-        self._update_balance_display(initial_load=True)
+        self._update_all_prices()
+        self._update_balance_display()
         
-        # Update price periodically
+        # Reserve funds for orders already on disk
+        self.engine.reservations.rebuild(self.logger.get_pending_orders())
+        
+        # Fetch live balances and prices now, then periodically
         self._start_price_updates()
         
         # Check pending orders periodically
         self._start_order_checker()
+        
+        # Flush engine state before the window goes away
+        self._closed = False
+        self.root.protocol("WM_DELETE_WINDOW", self._on_close)
 
     def _apply_osmosis_theme(self):
         """Apply Osmosis theme colors to the UI"""
@@ -672,6 +5939,21 @@ class OsmosisTraderUI:
         title_label = ttk.Label(self.main_frame, text="Osmosis Instant Swaps", style='Title.TLabel')
         title_label.pack(pady=(0, 20))
         
+        # Price chart of the selected pair, with pending order levels
+        self.chart_frame = ttk.LabelFrame(self.main_frame, text="Price", padding="5")
+        self.chart_frame.pack(fill=tk.X, pady=(0, 10))
+        chart_controls = ttk.Frame(self.chart_frame)
+        chart_controls.pack(fill=tk.X)
+        ttk.Label(chart_controls, text="Resolution:").pack(side=tk.LEFT, padx=(0, 5))
+        self.chart_resolution_var = tk.StringVar(value="1m")
+        chart_resolution = ttk.Combobox(chart_controls, textvariable=self.chart_resolution_var,
+                                        values=PriceChart.RESOLUTIONS, state="readonly", width=6)
+        chart_resolution.pack(side=tk.LEFT)
+        chart_resolution.bind("<<ComboboxSelected>>",
+                              lambda event: self.price_chart.show(resolution=self.chart_resolution_var.get()))
+        self.price_chart = PriceChart(self.chart_frame, self.client.price_history)
+        self.price_chart.canvas.pack(fill=tk.X, pady=(5, 0))
+        
         # Form frame
         form_frame = ttk.LabelFrame(self.main_frame, text="Swap Details", padding="10")
         form_frame.pack(fill=tk.BOTH, expand=True, pady=(0, 20))
@@ -704,15 +5986,11 @@ class OsmosisTraderUI:
         # Balances display (right column)
         ttk.Label(balances_column, text="Wallet Balances", style='Price.TLabel').pack(anchor=tk.E)
         
-        self.balance_vars = {
-            "BTC": tk.StringVar(value="BTC: -"),
-            "ETH": tk.StringVar(value="ETH: -"), 
-            "OSMO": tk.StringVar(value="OSMO: -"),
-            "USDC": tk.StringVar(value="USDC: -"),
-            "TOTAL": tk.StringVar(value="Total: $ -")
-        }
+        # One line per configured asset
+        self.balance_vars = {token: tk.StringVar(value=f"{token}: -") for token in self.client.balances}
+        self.balance_vars["TOTAL"] = tk.StringVar(value="Total: $ -")
         
-        for token in ["BTC", "ETH", "OSMO", "USDC"]:
+        for token in self.client.balances:
             ttk.Label(balances_column, 
                     textvariable=self.balance_vars[token],
                     style='Price.TLabel').pack(anchor=tk.E)
@@ -803,6 +6081,17 @@ class OsmosisTraderUI:
                                       values=["0.1", "0.5", "1.0", "2.0", "3.0", "5.0"], width=5)
         slippage_combo.pack(side=tk.LEFT)
         ttk.Label(self.slippage_frame, text="%").pack(side=tk.LEFT)
+        ttk.Label(self.slippage_frame, text="Repeat:").pack(side=tk.LEFT, padx=(15, 5))
+        self.repeat_var = tk.StringVar(value="Once")
+        ttk.Combobox(self.slippage_frame, textvariable=self.repeat_var, values=list(self.REPEAT_OPTIONS),
+                     width=12, state="readonly").pack(side=tk.LEFT)
+        
+        # Time in force of limit and stop-loss orders
+        self.validity_frame = ttk.Frame(form_frame)  # Note: Don't pack yet
+        ttk.Label(self.validity_frame, text="Valid for:").pack(side=tk.LEFT, padx=(0, 5))
+        self.validity_var = tk.StringVar(value="GTC")
+        ttk.Combobox(self.validity_frame, textvariable=self.validity_var, values=list(self.VALIDITY_OPTIONS),
+                     width=10, state="readonly").pack(side=tk.LEFT)
 
         self._update_order_type_ui() 
         
@@ -858,15 +6147,13 @@ class OsmosisTraderUI:
         self.limit_price_var.trace_add("write", self._debounce_limit_price_update)
         self.from_token_var.trace_add("write", lambda *args: self._update_min_out_hint_if_auto())
         self.to_token_var.trace_add("write", lambda *args: self._update_min_out_hint_if_auto())
+        self.to_token_var.trace_add("write", lambda *args: self.ui.post_keyed('price_chart', self._update_price_chart))
         
         # Initial setup of token dropdown values
         self._update_to_token_menu()
         
         # Update UI based on order type
         self._update_order_type_ui()
-        
-        # Schedule the initial price update
-        self.root.after(100, self._update_all_prices)
 
     def _cleanup_caches(self):
        """Remove old cache entries to prevent memory bloat"""
@@ -919,6 +6206,7 @@ class OsmosisTraderUI:
         if order_type == "market":
             self.limit_ui_frame.pack_forget()
             self.stop_loss_ui_frame.pack_forget()
+            self.validity_frame.pack_forget()
             self.market_ui_frame.pack(in_=self.to_token_menu.master, side=tk.TOP, fill=tk.X, pady=5)
             self.slippage_frame.pack(fill=tk.X, pady=5)
             self.min_out_hint_var.set("(optional)")
@@ -928,12 +6216,14 @@ class OsmosisTraderUI:
             self.stop_loss_ui_frame.pack_forget()
             self.slippage_frame.pack_forget()
             self.limit_ui_frame.pack(in_=self.to_token_menu.master, side=tk.TOP, fill=tk.X)
+            self.validity_frame.pack(fill=tk.X, pady=5)
             self.limit_hint_var.set("(enter amount and price to see estimate)")
         else:  # stop_loss
             self.market_ui_frame.pack_forget()
             self.limit_ui_frame.pack_forget()
             self.slippage_frame.pack_forget()
             self.stop_loss_ui_frame.pack(in_=self.to_token_menu.master, side=tk.TOP, fill=tk.X)
+            self.validity_frame.pack(fill=tk.X, pady=5)
             self.stop_loss_hint_var.set("(will sell when price falls below this level)")
     
         # Update the display
@@ -984,7 +6274,7 @@ class OsmosisTraderUI:
             list_frame,
             yscrollcommand=tree_scroll.set,
             selectmode="extended",
-            columns=("id", "created", "type", "pair", "amount", "price", "action"),
+            columns=("id", "created", "type", "pair", "amount", "price", "expires", "action"),
             show="headings"
         )
         self.pending_orders_tree.pack(fill=tk.BOTH, expand=True)
@@ -998,6 +6288,7 @@ class OsmosisTraderUI:
         self.pending_orders_tree.heading("pair", text="Pair", anchor=tk.W)
         self.pending_orders_tree.heading("amount", text="Amount", anchor=tk.W)
         self.pending_orders_tree.heading("price", text="Price", anchor=tk.W)
+        self.pending_orders_tree.heading("expires", text="Expires", anchor=tk.W)
         self.pending_orders_tree.heading("action", text="Action", anchor=tk.W)
         
         # Configure column widths
@@ -1007,6 +6298,7 @@ class OsmosisTraderUI:
         self.pending_orders_tree.column("pair", width=100, stretch=tk.NO)
         self.pending_orders_tree.column("amount", width=100, stretch=tk.NO)
         self.pending_orders_tree.column("price", width=100, stretch=tk.NO)
+        self.pending_orders_tree.column("expires", width=120, stretch=tk.NO)
         self.pending_orders_tree.column("action", width=100, stretch=tk.NO)
         
         # Add a frame for buttons at the bottom
@@ -1050,6 +6342,12 @@ class OsmosisTraderUI:
             if order['order_type'] == 'stop_loss':
                 price_value = order.get('stop_price', 0)
                 price_display = f"{price_value:.6f} (stop)"
+            elif order['order_type'] == 'trailing_stop':
+                trail = (f"{order['trail_percent']:g}%" if order.get('trail_percent') is not None
+                         else f"{order['trail_amount']:g}")
+                price_display = f"{self.engine.order_level(order):.6f} (trail {trail})"
+            elif order['order_type'] == 'conditional':
+                price_display = IndicatorBook.describe(order['condition'])
             else:  # limit orders
                 price_value = order.get('limit_price', 0)
                 price_display = f"{price_value:.6f}"
@@ -1058,10 +6356,39 @@ class OsmosisTraderUI:
             self.pending_orders_tree.insert("", tk.END, values=(
                 order['id'],
                 created,
-                order['order_type'].replace('_', ' ').title(),
+                order['order_type'].replace('_', ' ').title() + (" (OCO)" if order.get('oco') else ""),
                 pair,
                 f"{order['amount']:.6f}",
                 price_display,
+                (datetime.fromisoformat(order['expires_at']).strftime("%Y-%m-%d %H:%M")
+                 if order.get('expires_at') else "GTC"),
+                "Cancel"
+            ))
+        
+        # Recurring buys: the price column shows the cadence, the expiry column the next run
+        for schedule in self.engine.dca_schedules():
+            runs = f"{schedule['runs']}/{schedule['max_runs']}" if schedule['max_runs'] else str(schedule['runs'])
+            self.pending_orders_tree.insert("", tk.END, values=(
+                schedule['id'],
+                datetime.fromisoformat(schedule['timestamp']).strftime("%Y-%m-%d %H:%M"),
+                f"DCA ({runs} runs)",
+                f"{schedule['from_token']}/{schedule['to_token']}",
+                f"{schedule['amount']:.6f}",
+                f"every {schedule['interval'] / 3600:g}h",
+                "next " + datetime.fromtimestamp(schedule['next_run']).strftime("%Y-%m-%d %H:%M"),
+                "Cancel"
+            ))
+        
+        # Grids: the price column shows the bounds
+        for grid in self.engine.grid_strategies():
+            self.pending_orders_tree.insert("", tk.END, values=(
+                grid['id'],
+                datetime.fromisoformat(grid['timestamp']).strftime("%Y-%m-%d %H:%M"),
+                f"Grid ({grid['levels']} levels)",
+                f"{grid['base_token']}/{grid['quote_token']}",
+                f"{grid['amount']:.6f}",
+                f"{grid['lower']:.6f}-{grid['upper']:.6f}",
+                "GTC",
                 "Cancel"
             ))
         
@@ -1072,45 +6399,12 @@ class OsmosisTraderUI:
             self.status_var.set("No orders selected for cancellation")
             return
             
-        for item in selected_items:
-            order_id = self.pending_orders_tree.item(item, 'values')[0]
-            self.logger.remove_pending_order(order_id)
+        order_ids = [self.pending_orders_tree.item(item, 'values')[0] for item in selected_items]
+        self.engine.cancel_orders(order_ids)
         
         self._update_pending_orders_list()
         self.status_var.set(f"Cancelled {len(selected_items)} order(s)")
-
-    def _get_highest_order_id(self):
-        """Find the highest order ID from both completed transactions and pending orders"""
-        highest_id = 0
-    
-        # Check completed transactions
-        for tx in self.logger.get_transactions():
-            # Some older transactions might not have an ID field
-            if 'order_id' in tx:
-                try:
-                    # Extract numeric part of order ID
-                    order_num = int(tx['order_id'].split('-')[1])
-                    highest_id = max(highest_id, order_num)
-                except (IndexError, ValueError):
-                    pass
-            # Also check tx_hash field which might contain the old order ID format
-            elif 'tx_hash' in tx and tx['tx_hash'].startswith('order-'):
-                try:
-                    order_num = int(tx['tx_hash'].split('-')[1])
-                    highest_id = max(highest_id, order_num)
-                except (IndexError, ValueError):
-                    pass
-        
-        # Check pending orders
-        for order in self.logger.get_pending_orders():
-            try:
-                # Extract numeric part of order ID
-                order_num = int(order['id'].split('-')[1])
-                highest_id = max(highest_id, order_num)
-            except (IndexError, ValueError):
-                pass
-
-        return highest_id
+        self.ui.post_keyed('price_chart', self._update_price_chart)
 
     def _show_main_view(self):
         """Return to the main trading view"""
@@ -1255,59 +6549,66 @@ class OsmosisTraderUI:
             if self.to_token_var.get() not in to_token_values:
                 self.to_token_var.set(default_token)
         
-    def _update_balance_display(self, initial_load=False):
-        """Update the balance display with current values"""
-        # Force update on first load, otherwise use caching
-        balances = self.client.get_wallet_balances(force_update=initial_load)
-        
-        prices = {
-            "BTC": self._get_current_price("BTC"),
-            "ETH": self._get_current_price("ETH"), 
-            "OSMO": self._get_current_price("OSMO"),
-            "USDC": 1.0
-        }
+    def _update_balance_display(self):
+        """Update the balance display from the ledger and cached prices (no node queries)"""
+        balances = self.client.balances
         
         total_value = 0
         
         for token, amount in balances.items():
+            if token not in self.balance_vars:
+                continue
+            price = self._get_current_price(token)
+            # Cents are enough for cheap tokens; pricey ones need more places
             self.balance_vars[token].set(
-                f"{token}: {amount:.6f}" if token in ["BTC", "ETH"] else f"{token}: {amount:.2f}"
+                f"{token}: {amount:.6f}" if price > 100 else f"{token}: {amount:.2f}"
             )
-            total_value += amount * prices.get(token, 0)
+            total_value += float(amount) * price
         
-        self.balance_vars["TOTAL"].set(f"Total: ${total_value:,.2f}")
+        # Until the first chain query these are the snapshot's balances
+        stale = "" if self.client.ledger.last_sync else " (stale)"
+        self.balance_vars["TOTAL"].set(f"Total: ${total_value:,.2f}{stale}")
     
     def _get_current_price(self, token):
-        """Get current price of a token in USDC"""
+        """Last known price of a token in USDC (0 if never quoted)"""
         if token == "USDC":
             return 1.0
-            
-        pair = f"{token}/USDC"
-        price_info = self.client.get_pool_price(pair)
-        return price_info['base_per_quote']
+        
+        price_info = self.client.cached_price(f"{token}/USDC")
+        return price_info['base_per_quote'] if price_info else 0.0
+    
+    def _refresh_live_state(self, force_balances=False):
+        """Query balances and prices (worker thread), then render them on the Tk thread"""
+        self.client.get_wallet_balances(force_update=force_balances)
+        for base_token in self.base_tokens:
+            self.client.get_pool_price(f"{base_token}/{self.quote_token}")
+        self.client.save_state_snapshot()
+        self.ui.post_keyed('all_prices', self._update_all_prices)
+        self.ui.post_keyed('balance_display', self._update_balance_display)
+        self.ui.post_keyed('price_chart', self._update_price_chart)
 
     def _update_all_prices(self):
-        """Update all token prices display with minimal UI updates"""
+        """Update all token prices display with minimal UI updates (from the price cache)"""
         try:
             updated = False
         
-            # Get and update the price for each base token
+            # Update the price for each base token
             for base_token in self.base_tokens:
-                pair = f"{base_token}/{self.quote_token}"
-                price_info = self.client.get_pool_price(pair)
+                price_info = self.client.cached_price(f"{base_token}/{self.quote_token}")
+                if not price_info:
+                    continue
                 
                 # Only update if price changed
-                new_price_text = f"1 {base_token} = {price_info['base_per_quote']:.4f} {self.quote_token}"
+                fresh = price_info['source'] != "snapshot" and time.time() - price_info['timestamp'] < 120
+                stale = "" if fresh else " (stale)"
+                new_price_text = f"1 {base_token} = {price_info['base_per_quote']:.4f} {self.quote_token}{stale}"
                 if self.price_vars[base_token].get() != new_price_text:
                     self.price_vars[base_token].set(new_price_text)
                     updated = True
             
             if updated:
                 self.status_var.set("")
-                # Only update balance display occasionally (no need for constant updates)
-                if not hasattr(self, '_last_balance_update') or time.time() - self._last_balance_update > 30:
-                    self._update_balance_display()
-                    self._last_balance_update = time.time()
+                self._update_balance_display()
                 
                 # Update limit price hint if needed and visible
                 if self.order_type_var.get() == "limit" and self.limit_ui_frame.winfo_ismapped():
@@ -1317,6 +6618,30 @@ class OsmosisTraderUI:
             self.status_var.set(f"Error updating prices: {str(e)}")
             print(f"Error updating prices: {e}")
 
+    def _update_price_chart(self):
+        """Show the selected pair on the chart, append new prices and redraw order levels"""
+        from_token = self.from_token_var.get()
+        base_token = self.to_token_var.get() if from_token == self.quote_token else from_token
+        if base_token not in self.base_tokens:
+            return
+        pair = f"{base_token}/{self.quote_token}"
+        if pair != self.price_chart.pair:
+            self.chart_frame.configure(text=f"{pair} Price")
+            self.price_chart.show(pair)
+        else:
+            self.price_chart.update()
+        
+        levels = [
+            (self.engine.order_level(order), order['order_type'], order['id'])
+            for order in self.logger.get_pending_orders()
+            if base_token in (order['from_token'], order['to_token'])
+        ]
+        levels += [(parent['limit_price'], 'buy_limit' if parent['from_token'] == self.quote_token else 'sell_limit',
+                    parent['id'])
+                   for parent in self.engine.parent_orders()
+                   if 'limit_price' in parent and base_token in (parent['from_token'], parent['to_token'])]
+        self.price_chart.set_levels([level for level in levels if level[0]])
+    
     def _debounce_amount_update(self, *args):
         """Delay updates while typing amount"""
         if self.amount_in_typing_timer:
@@ -1427,33 +6752,28 @@ class OsmosisTraderUI:
                     self.min_out_hint_var.set(str(e))
                     return
                     
+            # Parse the entry straight into exact base units
             try:
-                amount = float(amount_str)
-            except ValueError:
+                amount = self.client.assets.amount(amount_str, from_token)
+            except (ArithmeticError, ValueError):
                 self.min_out_hint_var.set("Invalid amount")
                 return
                 
-            if amount <= 0:
+            if amount.raw <= 0:
                 self.min_out_hint_var.set("Amount must be positive")
                 return
-                
-            # Get from/to tokens
-            from_token = self.from_token_var.get()
-            to_token = self.to_token_var.get()
             
             # Calculate expected output based on direction
             if not is_reversed:
                 # Selling base for quote (e.g., selling BTC for USDC)
-                expected_out = amount * price_info['base_per_quote']
+                ratio = price_info['base_per_quote_ratio']
             else:
                 # Selling quote for base (e.g., selling USDC for BTC)
-                expected_out = amount * price_info['quote_per_base']
+                ratio = price_info['quote_per_base_ratio']
+            expected_out = amount.convert(ratio, self.client.assets.by_symbol(to_token))
             
             # Show estimated output without updating the min_out field
-            if to_token == "BTC":
-                self.min_out_hint_var.set(f"Est. output: {expected_out:.8f} {to_token}")
-            else:
-                self.min_out_hint_var.set(f"Est. output: {expected_out:.6f} {to_token}")
+            self.min_out_hint_var.set(f"Est. output: {expected_out} {to_token}")
             
         except Exception as e:
             self.min_out_hint_var.set("Calculation error")
@@ -1466,12 +6786,12 @@ class OsmosisTraderUI:
             to_token = self.to_token_var.get()
             amount_str = self.amount_in_var.get().strip()
             
-            # Get amount
+            # Get amount in exact base units
             try:
-                amount = float(amount_str)
-                if amount <= 0:
+                amount = self.client.assets.amount(amount_str, from_token)
+                if amount.raw <= 0:
                     raise ValueError("Amount must be positive")
-            except ValueError:
+            except (ArithmeticError, ValueError):
                 self.min_out_hint_var.set("Invalid amount")
                 return
         
@@ -1486,18 +6806,17 @@ class OsmosisTraderUI:
                         raise ValueError("Slippage must be positive")
                     
                     # Calculate expected output
-                    if not is_reversed:
-                        expected_out = amount * price_info['base_per_quote']
-                    else:
-                        expected_out = amount * price_info['quote_per_base']
+                    expected_out, route = self._expected_output(amount, to_token, price_info, is_reversed)
                     
-                    min_out = expected_out * (1 - slippage_pct/100)
-                    hint_text = f"Est. output: {expected_out:.8f} {to_token}" if to_token == "BTC" else f"Est. output: {expected_out:.6f} {to_token}"
+                    min_out = expected_out.apply_bps(int(round(slippage_pct * 100)))
+                    hint_text = f"Est. output: {expected_out} {to_token}"
                     hint_text += f" (with {slippage_pct}% slippage)"
+                    if route:
+                        hint_text += f" via pool{'s' if len(route['pools']) > 1 else ''} {RouteSelector.pool_ids(route)}"
                     
                     # Update the output field (only if not manually set)
                     if not self.min_out_manually_set:
-                        self.min_out_var.set(f"{min_out:.8f}" if to_token == "BTC" else f"{min_out:.6f}")
+                        self.min_out_var.set(str(min_out))
                     
                     self.min_out_hint_var.set(hint_text)
                     
@@ -1509,6 +6828,20 @@ class OsmosisTraderUI:
             self.min_out_hint_var.set("Calculation error")
             print(f"Error calculating min out: {e}")
                    
+    def _expected_output(self, amount, to_token, price_info, is_reversed):
+        """Expected output of a market swap of amount, and the route it assumes
+
+        Uses the size-aware impact curve when one covers the amount (no node
+        query; a miss schedules one and re-runs the hint), otherwise the mid
+        price, which ignores price impact. Returns (TokenAmount, route or None).
+        """
+        to_asset = self.client.assets.by_symbol(to_token)
+        estimate = self.client.impact_curves.estimate(amount.asset.denom, to_asset.denom, amount.raw)
+        if estimate:
+            return TokenAmount(estimate[0], to_asset), estimate[1]
+        ratio = price_info['quote_per_base_ratio'] if is_reversed else price_info['base_per_quote_ratio']
+        return amount.convert(ratio, to_asset), None
+    
     def _flip_tokens(self):
         """Swap the from and to tokens"""
         from_token = self.from_token_var.get()
@@ -1558,196 +6891,48 @@ class OsmosisTraderUI:
         self.last_manual_refresh = time.time()
         
         # Provide feedback to user
-        self.refresh_notify_var.set("✓ Price refreshed & output updated!")
-        self.root.after(2000, lambda: self.refresh_notify_var.set(""))
+        self._notify("✓ Price refreshed & output updated!", 2000)
 
     def _start_price_updates(self):
         """Start periodic price updates"""
-        def update_price_thread():
-            cleanup_counter = 0  # Add counter for periodic cleanup
-            
-            while True:
-                try:
-                    # Update all prices
-                    self.root.after(0, self._update_all_prices)
-                    
-                    # Check if it's been more than 1 minute since the last manual refresh
-                    # and update the expected output automatically if needed
-                    current_time = time.time()
-                    if current_time - self.last_manual_refresh > 60:  # 60 seconds = 1 minute
-                        self.root.after(0, self._auto_update_expected_output)
-                    
-                    # Perform memory cleanup every 5 price updates (2.5 minutes at 30-second intervals)
-                    cleanup_counter += 1
-                    if cleanup_counter >= 5:
-                        self.root.after(0, self._cleanup_caches)
-                        cleanup_counter = 0
-                        
-                except Exception as e:
-                    print(f"Error in price update thread: {e}")
-                    
-                time.sleep(30)  # Update every 30 seconds
-                    
-        # Start the update thread
-        thread = threading.Thread(target=update_price_thread, daemon=True)
-        thread.start()
+        # First run queries immediately and forces a balance sync
+        self.scheduler.call_every(30, self._price_update_tick, True, key='price_updates', first_delay=0, jitter=1)
+        
+        # Perform memory cleanup every 2.5 minutes
+        self.scheduler.call_every(150, self.ui.post_keyed, 'cleanup_caches', self._cleanup_caches,
+                                  key='cleanup_caches')
+    
+    def _price_update_tick(self, force_balances=False):
+        """Refresh prices and balances (scheduler worker)"""
+        # Query here; the display is updated on the Tk thread
+        self._refresh_live_state(force_balances=force_balances)
+        if force_balances:
+            # Later runs let the ledger decide when a full balance query is needed
+            self.scheduler.call_every(30, self._price_update_tick, key='price_updates', first_delay=30, jitter=1)
+        
+        # Check if it's been more than 1 minute since the last manual refresh
+        # and update the expected output automatically if needed
+        if time.time() - self.last_manual_refresh > 60:
+            self.ui.post_keyed('auto_expected_output', self._auto_update_expected_output)
         
     def _start_order_checker(self):
         """Start periodic checking of pending limit orders"""
-        def check_orders_thread():
-            while True:
-                try:
-                    # Check pending orders every 10 seconds for more responsiveness
-                    time.sleep(10)
-                    self.root.after(0, self._check_pending_orders)
-                except Exception as e:
-                    print(f"Error in order checker thread: {e}")
-                    
-        # Start the order checker thread
-        thread = threading.Thread(target=check_orders_thread, daemon=True)
-        thread.start()
+        # Order checks run as scheduler jobs, off the Tk thread
+        self.engine.start_polling(10)
+    
+    def shutdown(self):
+        """Stop the engine (flushing marks, grids and price history) and the scheduler; idempotent"""
+        if self._closed:
+            return
+        self._closed = True
+        self.engine.stop()
+        self.scheduler.stop()
+    
+    def _on_close(self):
+        """Window close: stop background work, then destroy the window"""
+        self.shutdown()
+        self.root.destroy()
     
-    def _check_pending_orders(self):
-        """Check pending orders for all supported trading pairs and order types"""
-        try:
-            pending_orders = self.logger.get_pending_orders()
-            if not pending_orders:
-                return
-                    
-            executed_orders = []
-            
-            for order in pending_orders:
-                try:
-                    # Initialize result to None for each order
-                    result = None
-                    
-                    # -- LIMIT ORDERS --
-                    if order['order_type'] in ["sell_limit", "buy_limit"]:
-                        # Determine the correct trading pair format
-                        if order['from_token'] in self.base_tokens and order['to_token'] == self.quote_token:
-                            # Selling base token for USDC (e.g., BTC->USDC, OSMO->USDC)
-                            pair = f"{order['from_token']}/{order['to_token']}"
-                            price_info = self.client.get_pool_price(pair)
-                            current_price = price_info['base_per_quote']  # USDC per token
-                            
-                            # Sell limit: execute if current price >= limit price
-                            if order['order_type'] == "sell_limit" and current_price >= order['limit_price']:
-                                amount_out_expected = order['amount'] * current_price
-                                result = self.client.execute_market_swap(
-                                    order['from_token'],
-                                    order['to_token'],
-                                    order['amount'],
-                                    amount_out_expected * 0.997  # 0.3% slippage
-                                )
-                        
-                        elif order['from_token'] == self.quote_token and order['to_token'] in self.base_tokens:
-                            # Buying base token with USDC (e.g., USDC->BTC, USDC->OSMO)
-                            pair = f"{order['to_token']}/{order['from_token']}"  # BTC/USDC format
-                            price_info = self.client.get_pool_price(pair)
-                            current_price = price_info['base_per_quote']  # USDC per token
-                            
-                            # Buy limit: execute if current price <= limit price
-                            if order['order_type'] == "buy_limit" and current_price <= order['limit_price']:
-                                amount_out_expected = order['amount'] / current_price
-                                result = self.client.execute_market_swap(
-                                    order['from_token'],
-                                    order['to_token'],
-                                    order['amount'],
-                                    amount_out_expected * 0.997  # 0.3% slippage
-                                )
-                    
-                    # -- STOP-LOSS ORDERS --
-                    elif order['order_type'] == "stop_loss":
-                        # Stop-loss orders should always be selling base tokens for quote tokens
-                        if order['from_token'] in self.base_tokens and order['to_token'] == self.quote_token:
-                            pair = f"{order['from_token']}/{order['to_token']}"
-                            price_info = self.client.get_pool_price(pair)
-                            current_price = price_info['base_per_quote']  # USDC per token
-                            
-                            # Execute if current price <= stop price (price has fallen below threshold)
-                            if current_price <= order['stop_price']:
-                                # Calculate expected output with current price
-                                amount_out_expected = order['amount'] * current_price
-                                
-                                # Execute the market swap
-                                result = self.client.execute_market_swap(
-                                    order['from_token'],
-                                    order['to_token'],
-                                    order['amount'],
-                                    amount_out_expected * 0.997  # 0.3% slippage for market execution
-                                )
-                    
-                    # Process result if the order was executed
-                    if result and result['success']:
-                        # Calculate expected values based on order type
-                        if order['order_type'] == 'sell_limit':
-                            expected_price = order['limit_price']
-                            expected_out = order['amount'] * expected_price
-                        elif order['order_type'] == 'buy_limit':
-                            expected_price = order['limit_price']
-                            expected_out = order['amount'] / expected_price
-                        elif order['order_type'] == 'stop_loss':
-                            expected_price = current_price
-                            expected_out = order['amount'] * current_price
-                        else:
-                            expected_price = None
-                            expected_out = None
-                        
-                        # Build transaction data object with expected values
-                        tx_data = {
-                            'timestamp': datetime.now().isoformat(),
-                            'tx_hash': result['tx_hash'],
-                            'order_id': order['id'],
-                            'from_token': order['from_token'],
-                            'to_token': order['to_token'],
-                            'amount_in': order['amount'],
-                            'expected_amount_out': expected_out,
-                            'actual_amount_out': None,  # Will be updated after query
-                            'execution_price': None,    # Will be updated after query
-                            'order_type': order['order_type'],
-                            'status': 'executed'
-                        }
-                        
-                        # Add order-specific price fields
-                        if order['order_type'] == 'stop_loss':
-                            tx_data['stop_price'] = order['stop_price']
-                        else:  # limit orders
-                            tx_data['limit_price'] = order['limit_price']
-                        
-                        # Log the transaction
-                        self.logger.log_transaction(tx_data)
-                        executed_orders.append(order['id'])
-                        
-                        # Query actual transaction data in background
-                        self._query_actual_transaction(result['tx_hash'])
-                        
-                        # Notification based on order type
-                        if order['order_type'] == 'stop_loss':
-                            self.refresh_notify_var.set(
-                                f"❗ Stop-loss triggered: Sold {order['amount']} {order['from_token']} at ~{current_price:.6f}"
-                            )
-                        else:
-                            self.refresh_notify_var.set(
-                                f"✓ {order['order_type'].replace('_', ' ').title()} order filled at ~{current_price:.6f} USDC"
-                            )
-                        self.root.after(3000, lambda: self.refresh_notify_var.set(""))
-                        
-                except Exception as e:
-                    print(f"Error checking order {order['id']}: {str(e)}")
-                    continue
-            
-            # Remove executed orders from pending list
-            for order_id in executed_orders:
-                self.logger.remove_pending_order(order_id)
-                
-            # Update balances if any orders were executed
-            if executed_orders:
-                self._update_balance_display(initial_load=True)
-                    
-        except Exception as e:
-            self.status_var.set(f"Order check error: {str(e)}")
-            print(f"Error checking pending orders: {str(e)}")
-                    
     def _get_price_info_for_tokens(self, force_query=False):
         from_token = self.from_token_var.get()
         to_token = self.to_token_var.get()
@@ -1776,6 +6961,8 @@ class OsmosisTraderUI:
         
         # Get price info
         price_info = self.client.get_pool_price(pair)
+        if price_info['source'] == "none":
+            raise ValueError(f"No price available for {pair}")
         
         return price_info, is_reversed
 
@@ -1785,13 +6972,10 @@ class OsmosisTraderUI:
         if self.order_type_var.get() == "market":
             if not self.min_out_manually_set and self.amount_in_var.get().strip():
                 # Temporarily set a flag to show we're doing an auto update
-                self.refresh_notify_var.set("Auto-updating output values...")
+                self._notify("Auto-updating output values...", 1500)
                 
                 # Update the min out calculation
                 self._update_min_out_hint()
-                
-                # Clear the notification after a short delay
-                self.root.after(1500, lambda: self.refresh_notify_var.set(""))
 
     def _execute_order(self):
         """Execute order based on selected type"""
@@ -1823,6 +7007,7 @@ class OsmosisTraderUI:
             
             # Get minimum output amount if specified
             min_out = None
+            min_out_amount = None
             if self.min_out_var.get().strip():
                 try:
                     min_out = float(self.min_out_var.get())
@@ -1837,24 +7022,49 @@ class OsmosisTraderUI:
                 try:
                     slippage_pct = float(self.slippage_var.get())
                     
-                    # Use the current market price to calculate expected output
+                    # Expected output for this size (impact curve, else mid price)
                     price_info, is_reversed = self._get_price_info_for_tokens()
+                    expected_out, _ = self._expected_output(
+                        self.client.assets.amount(amount, from_token), to_token, price_info, is_reversed
+                    )
                     
-                    if not is_reversed:
-                        # Selling base for quote (e.g., BTC → USDC)
-                        expected_out = amount * price_info['base_per_quote']
-                    else:
-                        # Selling quote for base (e.g., USDC → BTC)
-                        expected_out = amount * price_info['quote_per_base']
-                    
-                    # Apply slippage tolerance
-                    min_out = expected_out * (1 - slippage_pct/100)
+                    # Apply slippage tolerance, keeping the exact amount for the swap
+                    min_out_amount = expected_out.apply_bps(int(round(slippage_pct * 100)))
+                    min_out = float(min_out_amount)
                 except Exception as e:
-                    print(f"Error calculating min_out: {e}")
-                    # Continue without min_out
+                    # Without a price there's nothing to protect the swap with
+                    self.status_var.set(f"Error: cannot compute minimum output ({e}); enter it manually")
+                    return
+            
+            # Pre-trade check against funds not held by resting orders
+            try:
+                self.engine.check_funds(from_token, amount)
+            except ValueError as e:
+                self.status_var.set(f"Error: {e}")
+                return
+            
+            # A repeating buy becomes a DCA schedule; its first run is now
+            repeat = self.repeat_var.get()
+            interval = self.REPEAT_OPTIONS[repeat]
+            if interval:
+                schedule, error = self.engine.create_orders([{
+                    'order_type': 'dca',
+                    'from_token': from_token,
+                    'to_token': to_token,
+                    'amount': amount,
+                    'interval': interval,
+                    'slippage_bps': int(round(float(self.slippage_var.get()) * 100))
+                }])[0]
+                if error:
+                    self.status_var.set(f"Error: {error}")
+                    return
+                self.amount_in_var.set("")
+                self.repeat_var.set("Once")
+                self.status_var.set(f"DCA {schedule['id']} created: {amount} {from_token} -> {to_token} {repeat.lower()}")
+                return
             
             # Execute the swap
-            result = self.client.execute_market_swap(from_token, to_token, amount, min_out)
+            result = self.client.execute_market_swap(from_token, to_token, amount, min_out_amount or min_out)
             
             if result['success']:
                 # Create an initial transaction record with expected values
@@ -1884,9 +7094,6 @@ class OsmosisTraderUI:
                 
                 # Update status
                 self.status_var.set(f"Order executed - TX Hash: {result['tx_hash']}")
-                
-                # Force balance update
-                self.root.after(2000, lambda: self._update_balance_display(initial_load=True))
             else:
                 # Update status with error message
                 self.status_var.set(f"Error: {result.get('error', 'Unknown error')}")
@@ -1897,61 +7104,112 @@ class OsmosisTraderUI:
 
     def _query_actual_transaction(self, tx_hash):
         """Query actual transaction details and update the transaction log"""
-        if tx_hash.startswith('order-'):
-            # Skip synthetic transactions
-            return
+        self.engine.confirm_transaction(tx_hash)
+    
+    def _on_engine_event(self, event, data):
+        """Receive order engine events (on engine threads) and handle them on the Tk thread"""
+        self.ui.post(self._handle_engine_event, event, data)
+    
+    def _notify(self, text, clear_ms=3000):
+        """Show a transient notification (Tk thread only)"""
+        self.refresh_notify_var.set(text)
+        # A newer notification must not be cleared by an older one's timer
+        self.scheduler.cancel('notify_clear')
+        self.scheduler.call_later(clear_ms / 1000, self.ui.set_var, self.refresh_notify_var, "",
+                                  key='notify_clear')
+    
+    def _handle_engine_event(self, event, data):
+        """Update the UI for an order engine event"""
+        if event == 'fill':
+            order = data['order']
+            # Notification based on order type
+            if order['order_type'] == 'stop_loss':
+                self._notify(
+                    f"❗ Stop-loss triggered: Sold {order['amount']} {order['from_token']} at ~{data['price']:.6f}"
+                )
+            else:
+                self._notify(
+                    f"✓ {order['order_type'].replace('_', ' ').title()} order filled at ~{data['price']:.6f} USDC"
+                )
             
-        def query_and_update():
-            # Wait a few seconds for the transaction to be confirmed
-            time.sleep(3)
+            if self.current_view == 'pending_orders':
+                self.ui.post_keyed('pending_orders_list', self._update_pending_orders_list)
+            self.ui.post_keyed('price_chart', self._update_price_chart)
+        
+        elif event == 'confirmed':
+            tx_details = data['details']
             
-            try:
-                # Try up to 3 times with increasing delay to get tx details
-                max_attempts = 3
-                attempt = 0
-                
-                while attempt < max_attempts:
-                    # Query the transaction details
-                    tx_details = self.query_transaction_details(tx_hash)
-                    
-                    if tx_details:
-                        # Update the transaction with actual values
-                        updated_data = {
-                            'actual_amount_out': tx_details['amount_out'],
-                            'execution_price': tx_details['execution_price'],
-                            'token_out_denom': tx_details['denom_out'],
-                            'token_in_denom': tx_details['denom_in'],
-                            'amount_in_raw': tx_details['amount_in_raw'],
-                            'amount_out_raw': tx_details['amount_out_raw']
-                        }
-                        
-                        success = self.logger.update_transaction(tx_hash, updated_data)
-                        
-                        if success:
-                            # Update UI if transactions view is visible
-                            if self.current_view == 'transactions' and hasattr(self, 'transactions_tree'):
-                                self.root.after(0, self._update_transactions_list)
-                                
-                            # Show a notification if on main view
-                            if self.current_view == 'main':
-                                price_str = f"{tx_details['execution_price']:.6f}" if tx_details['execution_price'] else "unknown"
-                                self.refresh_notify_var.set(f"✓ Transaction updated with actual values: {tx_details['amount_out']:.6f} {tx_details['token_out']} at {price_str}")
-                                self.root.after(3000, lambda: self.refresh_notify_var.set(""))
-                                
-                            return
-                    
-                    # Increase delay with each attempt
-                    attempt += 1
-                    time.sleep(2 * attempt)  # 2s, 4s, 6s
+            # Balances come from the ledger the engine just updated
+            self.ui.post_keyed('balance_display', self._update_balance_display)
+            
+            if data['logged']:
+                # Update UI if transactions view is visible
+                if self.current_view == 'transactions' and hasattr(self, 'transactions_tree'):
+                    self.ui.post_keyed('transactions_list', self._update_transactions_list)
                     
-                # After all attempts, show a notification
-                self.status_var.set("Unable to get actual transaction details after multiple attempts")
-                
-            except Exception as e:
-                print(f"Error querying actual transaction details: {e}")
-        
-        # Run the query in a background thread
-        threading.Thread(target=query_and_update, daemon=True).start()
+                # Show a notification if on main view
+                if self.current_view == 'main':
+                    price_str = f"{tx_details['execution_price']:.6f}" if tx_details['execution_price'] else "unknown"
+                    self._notify(f"✓ Transaction updated with actual values: {tx_details['amount_out']:.6f} {tx_details['token_out']} at {price_str}")
+        
+        elif event == 'expired':
+            orders = data['orders']
+            self._notify(f"{len(orders)} order(s) expired: {', '.join(order['id'] for order in orders[:5])}"
+                         + (" ..." if len(orders) > 5 else ""))
+            if self.current_view == 'pending_orders':
+                self.ui.post_keyed('pending_orders_list', self._update_pending_orders_list)
+            elif self.current_view == 'transactions' and hasattr(self, 'transactions_tree'):
+                self.ui.post_keyed('transactions_list', self._update_transactions_list)
+            self.ui.post_keyed('price_chart', self._update_price_chart)
+        
+        elif event == 'dca':
+            tx = data['tx_data']
+            self._notify(f"✓ DCA bought with {tx['amount_in']} {tx['from_token']} at ~{data['price']:.6f} "
+                         f"({len(data['schedules'])} schedule(s))")
+            if self.current_view == 'pending_orders':
+                self.ui.post_keyed('pending_orders_list', self._update_pending_orders_list)
+        
+        elif event == 'dca_done':
+            self._notify(f"DCA {data['order']['id']} {data['status']} after {data['order']['runs']} run(s)")
+            if self.current_view == 'pending_orders':
+                self.ui.post_keyed('pending_orders_list', self._update_pending_orders_list)
+        
+        elif event == 'grid':
+            tx = data['tx_data']
+            self._notify(f"✓ Grid {data['order']['id']} {data['side']} {len(tx['level_prices'])} level(s): "
+                         f"{tx['amount_in']:.6f} {tx['from_token']} at ~{data['price']:.6f}")
+            if self.current_view == 'pending_orders':
+                self.ui.post_keyed('pending_orders_list', self._update_pending_orders_list)
+            elif self.current_view == 'transactions' and hasattr(self, 'transactions_tree'):
+                self.ui.post_keyed('transactions_list', self._update_transactions_list)
+        
+        elif event == 'grid_done':
+            order = data['order']
+            self._notify(f"Grid {order['id']} {data['status']} after {order['buys']} buy(s) and {order['sells']} sell(s)")
+            if self.current_view == 'pending_orders':
+                self.ui.post_keyed('pending_orders_list', self._update_pending_orders_list)
+        
+        elif event == 'slice':
+            order, tx = data['order'], data['tx_data']
+            self._notify(f"✓ {order['order_type'].upper()} {order['id']} slice {len(order['children'])}: "
+                         f"{tx['amount_in']:.6f} {tx['from_token']} at ~{data['price']:.6f}")
+            if self.current_view == 'pending_orders':
+                self.ui.post_keyed('pending_orders_list', self._update_pending_orders_list)
+            elif self.current_view == 'transactions' and hasattr(self, 'transactions_tree'):
+                self.ui.post_keyed('transactions_list', self._update_transactions_list)
+            self.ui.post_keyed('price_chart', self._update_price_chart)
+        
+        elif event == 'parent_done':
+            order = data['order']
+            self._notify(f"{order['order_type'].upper()} {order['id']} {data['status']}: "
+                         f"{len(order['children'])} slice(s) of {order['amount']} {order['from_token']}")
+            self.ui.post_keyed('price_chart', self._update_price_chart)
+        
+        elif event == 'unconfirmed':
+            self.status_var.set("Unable to get actual transaction details after multiple attempts")
+        
+        elif event == 'error':
+            self.status_var.set(data['message'])
     
     def _execute_stop_loss_order(self):
         """Create a stop-loss order"""
@@ -1959,12 +7217,6 @@ class OsmosisTraderUI:
             from_token = self.from_token_var.get()
             to_token = self.to_token_var.get()
             
-            # Validate that from_token is a base token (not USDC)
-            # Stop-loss orders should only be for selling assets when price drops
-            if from_token == self.quote_token:
-                self.status_var.set("Error: Stop-loss orders can only be used to sell assets when price drops")
-                return
-                
             # Validate amount
             try:
                 amount = float(self.amount_in_var.get())
@@ -1983,32 +7235,11 @@ class OsmosisTraderUI:
                 self.status_var.set("Error: Invalid stop price")
                 return
                 
-            # Validate that stop price is below current price
-            pair = f"{from_token}/{to_token}"
-            current_price_info = self.client.get_pool_price(pair)
-            current_price = current_price_info['base_per_quote']
-            
-            if stop_price >= current_price:
-                self.status_var.set(f"Error: Stop price ({stop_price}) must be below current price ({current_price:.6f})")
-                return
-                
-            # Create order
-            order_id = f"order-{self.order_id_counter}"
-            self.order_id_counter += 1
-            
-            order_data = {
-                'id': order_id,
-                'timestamp': datetime.now().isoformat(),
-                'from_token': from_token,
-                'to_token': to_token,
-                'amount': amount,
-                'stop_price': stop_price,
-                'order_type': 'stop_loss',
-                'status': 'pending'
-            }
-            
-            self.logger.add_pending_order(order_data)
-            self.status_var.set(f"Stop-loss order {order_id} created at {stop_price} {to_token}")
+            # Validates the stop against the current price and reserves funds
+            order_data = self.engine.create_order('stop_loss', from_token, to_token, amount, stop_price,
+                                                  expires_in=self.VALIDITY_OPTIONS[self.validity_var.get()])
+            self.status_var.set(f"Stop-loss order {order_data['id']} created at {stop_price} {to_token}")
+            self.ui.post_keyed('price_chart', self._update_price_chart)
             
             # Clear form
             self.amount_in_var.set("")
@@ -2051,33 +7282,11 @@ class OsmosisTraderUI:
                 self.status_var.set("Error: Invalid minimum output")
                 return
                 
-            # Determine order type
-            if from_token == self.quote_token and to_token in self.base_tokens:
-                order_type = "buy_limit"
-            elif from_token in self.base_tokens and to_token == self.quote_token:
-                order_type = "sell_limit"
-            else:
-                self.status_var.set("Error: Invalid pair for limit order")
-                return
-        
-            # Create order
-            order_id = f"order-{self.order_id_counter}"
-            self.order_id_counter += 1
-            
-            order_data = {
-                'id': order_id,
-                'timestamp': datetime.now().isoformat(),
-                'from_token': from_token,
-                'to_token': to_token,
-                'amount': amount,
-                'limit_price': limit_price,
-                'min_out': min_out,  # Store the min_out for execution
-                'order_type': order_type,
-                'status': 'pending'
-            }
-            
-            self.logger.add_pending_order(order_data)
-            self.status_var.set(f"Limit order {order_id} created")
+            # Determines buy/sell from the pair and reserves funds
+            order_data = self.engine.create_order('limit', from_token, to_token, amount, limit_price, min_out,
+                                                  expires_in=self.VALIDITY_OPTIONS[self.validity_var.get()])
+            self.status_var.set(f"Limit order {order_data['id']} created")
+            self.ui.post_keyed('price_chart', self._update_price_chart)
             
             # Clear form
             self.amount_in_var.set("")
@@ -2088,110 +7297,6 @@ class OsmosisTraderUI:
         except Exception as e:
             self.status_var.set(f"Error: {str(e)}")
 
-    def query_transaction_details(self, tx_hash):
-        """Query the blockchain for exact transaction details using REST API"""
-        try:
-            # Skip querying for synthetic transactions (like pending orders)
-            if tx_hash.startswith('order-'):
-                return None
-            
-            # Use requests library to query the Osmosis REST API
-            import requests
-            
-            # Base URL for Osmosis LCD API
-            base_url = "https://lcd.osmosis.zone"
-            
-            # Endpoint for transaction details
-            tx_url = f"{base_url}/cosmos/tx/v1beta1/txs/{tx_hash}"
-            
-            # Make the request
-            response = requests.get(tx_url)
-            
-            # Check if request was successful
-            if response.status_code != 200:
-                print(f"Error querying transaction {tx_hash}: HTTP {response.status_code}")
-                print(f"Response: {response.text}")
-                return None
-            
-            # Parse the response
-            tx_data = response.json()
-            
-            # Find token swap events
-            token_swapped_events = [
-                event for event in tx_data.get('tx_response', {}).get('events', [])
-                if event.get('type') == 'token_swapped'
-            ]
-            
-            # No swap events found
-            if not token_swapped_events:
-                print(f"No swap data found in transaction {tx_hash}")
-                return None
-            
-            # Process the first swap event
-            swap_result = token_swapped_events[0]
-            
-            # Extract attributes from the event
-            event_attrs = {attr['key']: attr['value'] for attr in swap_result.get('attributes', [])}
-            
-            # Identify tokens in and out
-            tokens_in = event_attrs.get('tokens_in', '')
-            tokens_out = event_attrs.get('tokens_out', '')
-            
-            # Use the client's method to parse token amounts
-            amount_in_parts = self.client._parse_token_amount(tokens_in)
-            amount_out_parts = self.client._parse_token_amount(tokens_out)
-            
-            if not amount_in_parts or not amount_out_parts:
-                print(f"Could not parse token amounts for {tx_hash}")
-                return None
-            
-            # Convert to human-readable amounts
-            amount_in = self.client._convert_to_human_readable(amount_in_parts['amount'], amount_in_parts['denom'])
-            amount_out = self.client._convert_to_human_readable(amount_out_parts['amount'], amount_out_parts['denom'])
-            
-            # Calculate execution price
-            execution_price = None
-            from_token = self.client._get_token_symbol(amount_in_parts['denom'])
-            to_token = self.client._get_token_symbol(amount_out_parts['denom'])
-            
-            # Check for base tokens 
-            base_tokens = ["BTC", "ETH", "OSMO"]
-            
-            if amount_in > 0:
-                if from_token in base_tokens and to_token == "USDC":
-                    # Selling base token for USDC (e.g., BTC/USDC)
-                    execution_price = amount_out / amount_in
-                elif from_token == "USDC" and to_token in base_tokens:
-                    # Buying base token with USDC (e.g., USDC/BTC)
-                    execution_price = amount_in / amount_out
-            
-            # Try to get original transaction message for additional context
-            original_msg = None
-            for msg in tx_data.get('tx', {}).get('body', {}).get('messages', []):
-                if msg.get('@type') == '/osmosis.poolmanager.v1beta1.MsgSwapExactAmountIn':
-                    original_msg = msg
-                    break
-            
-            return {
-                'amount_in_raw': amount_in_parts['amount'],
-                'denom_in': amount_in_parts['denom'],
-                'amount_out_raw': amount_out_parts['amount'],
-                'denom_out': amount_out_parts['denom'],
-                'amount_in': amount_in,
-                'amount_out': amount_out,
-                'token_in': from_token,
-                'token_out': to_token,
-                'execution_price': execution_price,
-                'pool_id': event_attrs.get('pool_id'),
-                'min_out_amount': original_msg.get('token_out_min_amount') if original_msg else None
-            }
-            
-        except Exception as e:
-            print(f"Error processing transaction {tx_hash}: {str(e)}")
-            return None
-                
-
-            
     def _show_transactions(self):
         """Show the transaction history view"""
         if self.current_view == 'transactions':
@@ -2221,8 +7326,7 @@ class OsmosisTraderUI:
             self.root.clipboard_append(tx_hash)
             
             # Visual feedback
-            self.refresh_notify_var.set(f"✓ Copied TX hash: {tx_hash[:10]}...")
-            self.root.after(3000, lambda: self.refresh_notify_var.set(""))
+            self._notify(f"✓ Copied TX hash: {tx_hash[:10]}...")
     
     def _create_transactions_view(self):
         """Create the transactions history view with enhanced display"""
@@ -2315,7 +7419,7 @@ class OsmosisTraderUI:
             self.transactions_tree.delete(*children)
         
         # Get only the MOST RECENT transactions
-        transactions = self.logger.get_transactions()[-50:]  # Limited to 50 most recent
+        transactions = self.logger.get_recent_transactions(50)  # Limited to 50 most recent
         
         # Sort newest first
         transactions.sort(key=lambda tx: tx['timestamp'], reverse=True)
@@ -2335,16 +7439,10 @@ class OsmosisTraderUI:
             
             if actual_amount is not None:
                 # Format with token-specific precision
-                if tx['to_token'] == "BTC":
-                    amount_out_display = f"{actual_amount:.8f}"
-                else:
-                    amount_out_display = f"{actual_amount:.6f}"
+                amount_out_display = self.client.assets.format_amount(actual_amount, tx['to_token'])
             elif amount_out_value is not None:
                 # Use expected with indication
-                if tx['to_token'] == "BTC":
-                    amount_out_display = f"{amount_out_value:.8f} (est)"
-                else:
-                    amount_out_display = f"{amount_out_value:.6f} (est)"
+                amount_out_display = f"{self.client.assets.format_amount(amount_out_value, tx['to_token'])} (est)"
             else:
                 amount_out_display = "N/A"
                 
@@ -2413,13 +7511,7 @@ class OsmosisTraderUI:
         tx_hash = self.transactions_tree.item(selected[0], 'values')[8]
         
         # Find the transaction in the log
-        transactions = self.logger.get_transactions()
-        tx_data = None
-        
-        for tx in transactions:
-            if tx.get('tx_hash') == tx_hash:
-                tx_data = tx
-                break
+        tx_data = self.logger.find_transaction(tx_hash)
                 
         if not tx_data:
             messagebox.showinfo("Transaction Details", "Transaction not found in logs")
@@ -2459,6 +7551,10 @@ class OsmosisTraderUI:
                 details.append(f"Slippage: {slippage_pct:.2f}%")
         elif tx_data.get('order_type') == 'limit' and tx_data.get('limit_price') is not None:
             details.append(f"Limit Price: {tx_data['limit_price']:.6f}")
+        if tx_data.get('condition'):
+            details.append(f"Condition: {IndicatorBook.describe(tx_data['condition'])}")
+        if tx_data.get('expires_at'):
+            details.append(f"Good till: {datetime.fromisoformat(tx_data['expires_at']).strftime('%Y-%m-%d %H:%M:%S')}")
         
         # Add raw blockchain data if available
         if tx_data.get('amount_in_raw') is not None:
@@ -2512,7 +7608,7 @@ class OsmosisTraderUI:
             refresh_button = ttk.Button(
                 button_frame,
                 text="Refresh Values",
-                command=lambda: self._refresh_tx_values_from_dialog(details_dialog, tx_hash)
+                command=lambda: self._refresh_tx_values_from_dialog(details_dialog, tx_hash, tx_data['timestamp'])
             )
             refresh_button.pack(side=tk.LEFT, padx=5)
         
@@ -2546,7 +7642,7 @@ class OsmosisTraderUI:
         label.pack(pady=5)
         dialog.after(2000, label.destroy)
     
-    def _refresh_tx_values_from_dialog(self, dialog, tx_hash):
+    def _refresh_tx_values_from_dialog(self, dialog, tx_hash, timestamp=None):
         """Refresh transaction values from the details dialog"""
         # Create a progress message
         progress_label = ttk.Label(
@@ -2558,9 +7654,11 @@ class OsmosisTraderUI:
         progress_label.pack(pady=5)
         
         def refresh_task():
-            # Query the transaction
+            # Query the transaction (worker thread; Tk work is posted back)
             tx_details = self.client.query_transaction_details(tx_hash)
-            
+            self.ui.post(apply_result, tx_details)
+        
+        def apply_result(tx_details):
             if tx_details:
                 # Update the transaction with actual values
                 updated_data = {
@@ -2572,7 +7670,7 @@ class OsmosisTraderUI:
                     'amount_out_raw': tx_details['amount_out_raw']
                 }
                 
-                success = self.logger.update_transaction(tx_hash, updated_data)
+                success = self.logger.update_transaction(tx_hash, updated_data, since=timestamp)
                 
                 if success:
                     # Update UI
@@ -2588,8 +7686,8 @@ class OsmosisTraderUI:
             progress_label.config(text="Error refreshing transaction details", foreground="#f87171")
             dialog.after(2000, progress_label.destroy)
         
-        # Run the refresh task in a background thread
-        threading.Thread(target=refresh_task, daemon=True).start()
+        # Run the refresh task on a scheduler worker
+        self.scheduler.call_later(0, refresh_task)
     
     def _refresh_transaction_actual_values(self):
         """Refresh actual values for the selected transaction"""
@@ -2624,11 +7722,9 @@ class OsmosisTraderUI:
             if not filename:
                 return  # User canceled
                 
-            # Get transactions
-            transactions = self.logger.get_transactions()
-            
-            # Sort by timestamp (newest first)
-            transactions.sort(key=lambda tx: tx['timestamp'], reverse=True)
+            # Streamed newest first, one monthly partition at a time
+            transactions = self.logger.iter_transactions(newest_first=True)
+            exported = 0
             
             # Define CSV headers
             headers = [
@@ -2678,8 +7774,9 @@ class OsmosisTraderUI:
                         tx.get('status', 'completed').capitalize(),
                         tx['tx_hash']
                     ])
+                    exported += 1
                     
-            self.status_var.set(f"Exported {len(transactions)} transactions to {filename}")
+            self.status_var.set(f"Exported {exported} transactions to {filename}")
             
         except Exception as e:
             self.status_var.set(f"Error exporting transactions: {str(e)}")
@@ -2704,7 +7801,117 @@ class OsmosisTraderUI:
         # Run cleanup when switching views
         self._cleanup_caches()
 
+def report_resource_usage(label):
+    """Print peak memory and CPU time of this process"""
+    try:
+        import resource  # Unix only
+    except ImportError:
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak_mb = usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    print(f"[{label}] peak RSS {peak_mb:.1f} MiB, CPU {usage.ru_utime + usage.ru_stime:.2f}s")
+
+
+def start_control_api(args, engine):
+    """Start the control API if --api or --api-socket was given"""
+    if not (args.api or args.api_socket):
+        return None
+    server = ControlAPIServer(engine, port=args.api or 8765, unix_socket=args.api_socket)
+    server.start()
+    return server
+
+
+def run_headless(args):
+    """Run the order engine without Tk until interrupted"""
+    client = OsmosisClient()
+    client.load_state_snapshot()
+    logger = TransactionLogger()
+    engine = OrderEngine(client, logger)
+    
+    def log_event(event, data):
+        if event == 'fill':
+            order = data['order']
+            print(f"{order['order_type']} {order['id']} filled at ~{data['price']:.6f} - TX {data['tx_data']['tx_hash']}")
+        elif event == 'slice':
+            tx = data['tx_data']
+            print(f"{tx['order_type']} {tx['order_id']}: {tx['amount_in']} {tx['from_token']} at ~{data['price']:.6f} - TX {tx['tx_hash']}")
+        elif event == 'parent_done':
+            print(f"{data['order']['order_type']} {data['order']['id']} {data['status']}")
+        elif event == 'expired':
+            print(f"Expired {', '.join(order['id'] for order in data['orders'])}")
+        elif event == 'dca':
+            tx = data['tx_data']
+            print(f"DCA {', '.join(data['schedules'])}: {tx['amount_in']} {tx['from_token']} at ~{data['price']:.6f} - TX {tx['tx_hash']}")
+        elif event == 'dca_done':
+            print(f"DCA {data['order']['id']} {data['status']} after {data['order']['runs']} run(s)")
+        elif event == 'grid':
+            tx = data['tx_data']
+            print(f"Grid {tx['order_id']} {data['side']} {len(tx['level_prices'])} level(s): {tx['amount_in']} {tx['from_token']} at ~{data['price']:.6f} - TX {tx['tx_hash']}")
+        elif event == 'grid_done':
+            print(f"Grid {data['order']['id']} {data['status']}")
+        elif event == 'confirmed':
+            details = data['details']
+            print(f"Confirmed {data['tx_hash']}: {details['amount_out']} {details['token_out']}")
+        elif event == 'unconfirmed':
+            print(f"Could not confirm {data['tx_hash']}; balances will be re-synced")
+        elif event == 'error':
+            print(data['message'])
+    
+    def on_sigterm(signum, frame):
+        # Unwind like Ctrl-C so the finally below flushes state under a service manager
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, on_sigterm)
+    
+    try:
+        engine.subscribe(log_event)
+        engine.start()
+        start_control_api(args, engine)
+        print(f"Order engine running headless with {len(logger.get_pending_orders())} pending order(s)")
+        
+        if args.stats:
+            engine.scheduler.call_every(args.stats, report_resource_usage, "headless", key='stats')
+        
+        engine.run_forever(args.check_interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        engine.stop()
+    report_resource_usage("headless")
+
+
 def main():
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Osmosis Trader")
+    parser.add_argument("--headless", action="store_true",
+                        help="run the stop-loss/limit order engine without the Tk UI")
+    parser.add_argument("--check-interval", type=float, default=10,
+                        help="seconds between checks of a pair until its volatility is known; "
+                             "afterwards each pair is polled adaptively (default: 10)")
+    parser.add_argument("--stats", type=float, default=0, metavar="SECONDS",
+                        help="print memory/CPU usage every SECONDS")
+    parser.add_argument("--api", type=int, default=0, metavar="PORT",
+                        help="serve the local control API on 127.0.0.1:PORT")
+    parser.add_argument("--api-socket", metavar="PATH",
+                        help="serve the local control API on a Unix socket")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="report time to first frame and profile UI construction")
+    args = parser.parse_args()
+    
+    if args.headless:
+        run_headless(args)
+        return
+    
+    if tk is None:
+        parser.error("tkinter is not available; use --headless to run the order engine only")
+    
+    profiler = None
+    if args.profile_startup:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    
     root = tk.Tk()
     root.update_idletasks()
     
@@ -2717,7 +7924,32 @@ def main():
         pass
     
     app = OsmosisTraderUI(root)
-    root.mainloop()
+    start_control_api(args, app.engine)
+    
+    if profiler:
+        ui_built = time.perf_counter()
+        
+        def first_frame():
+            # Idle callbacks run after the redraws queued while building the UI
+            profiler.disable()
+            now = time.perf_counter()
+            print(f"Startup: {(ui_built - _PROCESS_START) * 1000:.0f} ms to build the UI, "
+                  f"{(now - _PROCESS_START) * 1000:.0f} ms to first frame")
+            import pstats
+            pstats.Stats(profiler).sort_stats("cumulative").print_stats(15)
+        root.after_idle(first_frame)
+    
+    if args.stats:
+        app.scheduler.call_every(args.stats, report_resource_usage, "gui", key='stats')
+    
+    try:
+        root.mainloop()
+    finally:
+        # Covers Ctrl-C in the terminal; closing the window already did this
+        app.shutdown()
+    
+    if args.stats:
+        report_resource_usage("gui")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,98 @@
+"""Benchmark: split-route vs single-route output on simulated pools
+
+Run with `python tests/bench_split_routes.py`. USDC -> BTC over six
+constant-product pools (two direct BTC/USDC pools plus routes through OSMO
+and ETH), all priced consistently (BTC 60,000, ETH 3,000, OSMO 0.5 USDC).
+Node quotes are answered from the same reserves after NODE_LATENCY, so
+the timings include the concurrent quote round a split needs.
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from osmosistrader import AssetRegistry, OsmosisClient, PoolRegistry  # noqa: E402
+
+NODE_LATENCY = 0.05
+
+ASSETS = {asset["symbol"]: asset["denom"] for asset in AssetRegistry.DEFAULT_ASSETS}
+BTC, ETH, OSMO, USDC = (ASSETS[symbol] for symbol in ("BTC", "ETH", "OSMO", "USDC"))
+
+# pool id -> (denom a, reserve a, denom b, reserve b, spread factor)
+POOLS = {
+    "1943": (BTC, 50 * 10 ** 8, USDC, 3_000_000 * 10 ** 6, 0.002),
+    "2000": (BTC, 20 * 10 ** 8, USDC, 1_200_000 * 10 ** 6, 0.003),
+    "1464": (OSMO, 40_000_000 * 10 ** 6, USDC, 20_000_000 * 10 ** 6, 0.002),
+    "700": (BTC, 30 * 10 ** 8, OSMO, 3_600_000 * 10 ** 6, 0.002),
+    "1948": (ETH, 2000 * 10 ** 18, USDC, 6_000_000 * 10 ** 6, 0.002),
+    "701": (BTC, 25 * 10 ** 8, ETH, 500 * 10 ** 18, 0.003),
+}
+
+
+def hop(pool_id, denom_in, amount):
+    denom_a, reserve_a, denom_b, reserve_b, fee = POOLS[pool_id]
+    x, y, denom_out = (reserve_a, reserve_b, denom_b) if denom_in == denom_a else (reserve_b, reserve_a, denom_a)
+    amount = amount * (1 - fee)
+    return int(y * amount / (x + amount)), denom_out
+
+
+def simulated_client():
+    """An OsmosisClient whose pools and node quotes come from POOLS"""
+    client = OsmosisClient()
+    raw_pools = [
+        {"@type": "/osmosis.gamm.v1beta1.Pool", "id": pool_id, "pool_params": {"swap_fee": str(fee)},
+         "pool_assets": [{"token": {"denom": a, "amount": str(ra)}, "weight": "1"},
+                         {"token": {"denom": b, "amount": str(rb)}, "weight": "1"}]}
+        for pool_id, (a, ra, b, rb, fee) in POOLS.items()
+    ]
+    client.pool_registry._apply_discovered([PoolRegistry._parse_pool(raw) for raw in raw_pools], 1000)
+    
+    def estimate_swap(pool_id, amount_raw, denom_in, denom_out):
+        time.sleep(NODE_LATENCY)
+        return hop(pool_id, denom_in, amount_raw)[0]
+    
+    def estimate_route(pool_ids, denoms, amount_raw, denom_in):
+        time.sleep(NODE_LATENCY)
+        for pool_id in pool_ids.split(","):
+            amount_raw, denom_in = hop(pool_id, denom_in, amount_raw)
+        return amount_raw
+    
+    client.estimate_swap = estimate_swap
+    client.estimate_route = estimate_route
+    client.current_height = lambda max_age=5: 1000
+    return client
+
+
+def main():
+    os.chdir(tempfile.mkdtemp(prefix="bench-split-"))
+    client = simulated_client()
+    selector = client.route_selector
+    
+    print(f"{'size (USDC)':>12} | {'single route (BTC)':>18} | {'split (BTC)':>11} | gain      | time")
+    for usdc in (1_000, 10_000, 100_000, 1_000_000, 3_000_000):
+        amount = usdc * 10 ** 6
+        single = selector.best_route(USDC, BTC, amount)
+        start = time.perf_counter()
+        split = selector.split_route(USDC, BTC, amount, single)
+        elapsed = time.perf_counter() - start
+        single_out = single['amount_out'] / 10 ** 8
+        if split:
+            gain = (split['amount_out'] / single['amount_out'] - 1) * 10_000
+            print(f"{usdc:>12,} | {single_out:>18.5f} | {split['amount_out'] / 10 ** 8:>11.5f} | "
+                  f"+{gain:<5.0f} bps | {elapsed * 1e3:.0f} ms")
+        else:
+            print(f"{usdc:>12,} | {single_out:>18.5f} | {'no split':>11} | -         | {elapsed * 1e3:.1f} ms")
+    
+    routes = selector.candidates(USDC, BTC, 10 ** 12)[:4]
+    for name, fn in (("search", lambda: selector.search(USDC, BTC, 10 ** 12)),
+                     ("allocate (4 routes, 64 steps)", lambda: selector.allocate(routes, USDC, 10 ** 12))):
+        start = time.perf_counter()
+        for _ in range(200):
+            fn()
+        print(f"{name}: {(time.perf_counter() - start) / 200 * 1e6:.0f} us")
+
+
+if __name__ == "__main__":
+    main()
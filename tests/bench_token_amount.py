@@ -0,0 +1,48 @@
+"""Microbenchmark: float vs TokenAmount min-out math
+
+Run with `python tests/bench_token_amount.py`. Prints the cost per call of
+the old float path and the exact path for a 0.0123 BTC -> USDC minimum
+output at 0.3% slippage, and how often the float path gets 18-decimal ETH
+base units wrong.
+"""
+import os
+import random
+import sys
+import timeit
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from osmosistrader import AssetRegistry, TokenAmount, price_ratio  # noqa: E402
+
+
+def main(number=200_000):
+    assets = AssetRegistry(config_file="")  # Built-in assets only
+    btc, usdc, eth = (assets.by_symbol(symbol) for symbol in ("BTC", "USDC", "ETH"))
+    price = 97_123.456789
+    ratio = price_ratio(price)
+    
+    def float_path():
+        amount_out = 0.0123 * price * (1 - 0.003)
+        return str(int(amount_out * 1_000_000))
+    
+    def exact_path():
+        amount = TokenAmount.from_human("0.0123", btc)
+        return str(amount.convert(ratio, usdc).apply_bps(30).raw)
+    
+    for name, fn in (("float", float_path), ("exact", exact_path)):
+        per_call = min(timeit.repeat(fn, number=number, repeat=5)) / number
+        print(f"{name:5s} min_out: {per_call * 1e6:.2f} us per call")
+    
+    rng = random.Random(1)
+    wrong = 0
+    for _ in range(10_000):
+        text = f"{rng.randrange(10 ** 6)}.{rng.randrange(10 ** 18):018d}"
+        if int(float(text) * 10 ** 18) != TokenAmount.from_human(text, eth).raw:
+            wrong += 1
+        assert TokenAmount.from_human(text, eth).to_decimal() == Decimal(text)
+    print(f"float ETH base units wrong in {wrong}/10000 random amounts (exact path: 0)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import json
+import os
+import stat
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import osmosistrader  # noqa: E402
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """An OsmosisClient whose state files live in a temporary directory"""
+    monkeypatch.chdir(tmp_path)
+    return osmosistrader.OsmosisClient()
+
+
+@pytest.fixture
+def engine(client):
+    """An OrderEngine on its own scheduler, stopped after the test"""
+    engine = osmosistrader.OrderEngine(client, osmosistrader.TransactionLogger())
+    yield engine
+    engine.stop()
+
+
+class FakeNode:
+    """Controls tests/fake_osmosisd.py, which stands in for osmosisd on PATH"""
+    
+    def __init__(self, directory):
+        self.directory = directory
+        self.state_path = os.path.join(directory, "node.json")
+        self.update(height=1000, balances={}, pools={})
+    
+    def update(self, **state):
+        current = {}
+        if os.path.exists(self.state_path):
+            with open(self.state_path) as f:
+                current = json.load(f)
+        current.update(state)
+        with open(self.state_path, "w") as f:
+            json.dump(current, f)
+    
+    def calls(self, reset=False):
+        """Argument lines of the calls made so far"""
+        path = os.path.join(self.directory, "calls.log")
+        if not os.path.exists(path):
+            return []
+        with open(path) as f:
+            calls = f.read().splitlines()
+        if reset:
+            os.remove(path)
+        return calls
+
+
+@pytest.fixture
+def node(tmp_path, monkeypatch):
+    """A fake osmosisd first on PATH; configure it with node.update(...)"""
+    directory = tmp_path / "node"
+    directory.mkdir()
+    script = directory / "osmosisd"
+    script.write_text(f"#!/bin/sh\nexec {sys.executable} {os.path.join(os.path.dirname(__file__), 'fake_osmosisd.py')} \"$@\"\n")
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{directory}{os.pathsep}{os.environ['PATH']}")
+    fake = FakeNode(str(directory))
+    monkeypatch.setenv("FAKE_NODE_STATE", fake.state_path)
+    return fake
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""Stand-in for the osmosisd CLI, driven by the JSON state file in $FAKE_NODE_STATE
+
+State: {"height": N, "balances": {denom: amount}, "pools": {id: [denom_a,
+reserve_a, denom_b, reserve_b, spread_factor]}}. Pools are constant
+product. Every call is appended to calls.log next to the state file.
+"""
+import json
+import os
+import re
+import sys
+
+state_path = os.environ["FAKE_NODE_STATE"]
+with open(state_path) as f:
+    state = json.load(f)
+args = sys.argv[1:]
+with open(os.path.join(os.path.dirname(state_path), "calls.log"), "a") as f:
+    f.write(" ".join(args) + "\n")
+
+
+def coin(text):
+    amount, denom = re.match(r"(\d+)(.*)", text).groups()
+    return int(amount), denom
+
+
+def hop(pool_id, denom_in, amount):
+    denom_a, reserve_a, denom_b, reserve_b, fee = state["pools"][pool_id]
+    x, y = (reserve_a, reserve_b) if denom_in == denom_a else (reserve_b, reserve_a)
+    amount = amount * (1 - fee)
+    return int(y * amount / (x + amount)), denom_b if denom_in == denom_a else denom_a
+
+
+def option(name):
+    return args[args.index(name) + 1]
+
+
+if args[0] == "status":
+    print(json.dumps({"sync_info": {"latest_block_height": str(state["height"])}}))
+elif args[1:3] == ["bank", "balances"]:
+    print(json.dumps({"balances": [{"denom": d, "amount": str(a)} for d, a in state["balances"].items()]}))
+elif "estimate-single-pool-swap-exact-amount-in" in args:
+    i = args.index("estimate-single-pool-swap-exact-amount-in")
+    amount, denom_in = coin(args[i + 2])
+    print(json.dumps({"token_out_amount": str(hop(args[i + 1], denom_in, amount)[0])}))
+elif "estimate-swap-exact-amount-in" in args:
+    amount, denom = coin(args[args.index("estimate-swap-exact-amount-in") + 1])
+    for pool_id in option("--swap-route-pool-ids").split(","):
+        amount, denom = hop(pool_id, denom, amount)
+    print(json.dumps({"token_out_amount": str(amount)}))
+elif args[:2] == ["tx", "poolmanager"]:
+    state["txs"] = state.get("txs", 0) + 1
+    with open(state_path, "w") as f:
+        json.dump(state, f)
+    print(json.dumps({"txhash": f"TX{state['txs']:04d}"}))
+else:
+    sys.exit(1)
@@ -0,0 +1,99 @@
+"""Load test: order submissions per second through the control API
+
+Run with `python tests/load_control_api.py`. Starts an engine (unsynced
+ledger, so nothing is checked against the chain) and its control API in a
+temporary directory, then submits limit orders over loopback:
+
+  - one connection sending single POSTs back to back (round-trip bound),
+  - 50 concurrent connections sending single POSTs,
+  - 4 connections sending batches of 100,
+  - a burst of 50 connections of batches against a 200-order queue, which
+    must be answered with 429s rather than queued without bound.
+
+Exits non-zero if concurrent submission stays under TARGET orders/s.
+"""
+import asyncio
+import json
+import os
+import socket
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from osmosistrader import ControlAPIServer, OrderEngine, OsmosisClient, TransactionLogger  # noqa: E402
+
+TARGET = 1000
+SPEC = {"order_type": "limit", "from_token": "USDC", "to_token": "OSMO", "amount": "1", "price": "0.5"}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def submitter(port, count, batch):
+    """Send count requests on one keep-alive connection; returns (accepted, 429s)"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    path = "/orders/batch" if batch else "/orders"
+    body = json.dumps([SPEC] * batch if batch else SPEC).encode()
+    request = f"POST {path} HTTP/1.1\r\nHost: local\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body
+    accepted = rejected = 0
+    for _ in range(count):
+        writer.write(request)
+        await writer.drain()
+        status = int((await reader.readline()).split()[1])
+        length = 0
+        while (line := await reader.readline()) != b"\r\n":
+            name, _, value = line.decode().partition(":")
+            if name.lower() == "content-length":
+                length = int(value)
+        payload = json.loads(await reader.readexactly(length))
+        if status == 429:
+            rejected += 1
+        elif batch:
+            accepted += sum(result['ok'] for result in payload['results'])
+        else:
+            accepted += payload['ok']
+    writer.close()
+    return accepted, rejected
+
+
+async def run(port, connections, count, batch=0):
+    start = time.perf_counter()
+    results = await asyncio.gather(*(submitter(port, count, batch) for _ in range(connections)))
+    elapsed = time.perf_counter() - start
+    accepted = sum(a for a, _ in results)
+    rejected = sum(r for _, r in results)
+    print(f"{connections:>3} connection(s), {'batches of ' + str(batch) if batch else 'single POSTs':<15}: "
+          f"{accepted:>6} accepted, {rejected:>4} x 429 in {elapsed:.2f}s -> {accepted / elapsed:,.0f} orders/s")
+    return accepted / elapsed, rejected
+
+
+def main():
+    os.chdir(tempfile.mkdtemp(prefix="load-api-"))
+    engine = OrderEngine(OsmosisClient(), TransactionLogger())
+    port = free_port()
+    ControlAPIServer(engine, port=port).start()
+    
+    asyncio.run(run(port, 1, 200))
+    concurrent, _ = asyncio.run(run(port, 50, 100))
+    batched, _ = asyncio.run(run(port, 4, 20, batch=100))
+    
+    # Backpressure: a small queue must shed load with 429s
+    small_port = free_port()
+    ControlAPIServer(engine, port=small_port, queue_size=200, batch_size=50).start()
+    _, rejected = asyncio.run(run(small_port, 50, 5, batch=100))
+    print(f"pending orders written: {len(engine.logger.get_pending_orders())}")
+    
+    engine.stop()
+    if rejected == 0:
+        sys.exit("no 429s from a full submission queue")
+    if max(concurrent, batched) < TARGET:
+        sys.exit(f"under {TARGET} orders/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Asset registry lookups"""
+import json
+
+import pytest
+
+import osmosistrader
+from osmosistrader import AssetRegistry
+
+ATOM_DENOM = "ibc/27394FB092D2ECCD56123C74F36E4C1F926001CEADA9CA97EA622B25F41E5EB2"
+
+
+def write_assets(data):
+    with open("assets.json", "w") as f:
+        json.dump(data, f)
+
+
+def test_simple_config_adds_and_overrides_assets(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_assets({"assets": [
+        {"symbol": "ATOM", "denom": ATOM_DENOM, "decimals": 6, "price_probe": 0.1},
+        {"symbol": "ETH", "denom": "weth-wei", "decimals": 18, "display_decimals": 4},
+    ]})
+    assets = AssetRegistry()
+    
+    atom = assets.by_symbol("ATOM")
+    assert assets.by_denom(ATOM_DENOM) is atom
+    assert (atom.decimals, atom.display_decimals, atom.price_probe) == (6, 6, 0.1)
+    # The override replaces the default ETH denom rather than adding a second one
+    assert assets.by_denom("weth-wei") is assets.by_symbol("ETH")
+    assert assets.by_denom(osmosistrader.AssetRegistry.DEFAULT_ASSETS[2]["denom"]) is None
+    assert assets.display_decimals("ETH") == 4
+    assert assets.to_base_units("1.5", "weth-wei") == 15 * 10**17
+
+
+def test_chain_registry_assetlist_with_aliases(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_assets({"chain_name": "osmosis", "assets": [{
+        "base": ATOM_DENOM, "symbol": "ATOM", "display": "atom",
+        "denom_units": [
+            {"denom": ATOM_DENOM, "exponent": 0, "aliases": ["uatom"]},
+            {"denom": "atom", "exponent": 6},
+        ],
+    }]})
+    assets = AssetRegistry()
+    
+    atom = assets.by_symbol("ATOM")
+    assert atom.denom == ATOM_DENOM and atom.decimals == 6
+    assert assets.by_denom("uatom") is atom
+    assert assets.symbol("uatom") == "ATOM"
+    assert assets.to_human(2_500_000, "uatom") == 2.5
+    # The display unit is not a denom
+    assert assets.by_denom("atom") is None
+    
+    # Aliases in a pool config resolve to the on-chain denom
+    with open("pools.json", "w") as f:
+        json.dump({"pools": [{"pool_id": "1", "base_denom": "uatom", "quote": "USDC"}]}, f)
+    pools = osmosistrader.PoolRegistry(assets, cache_file="")
+    assert pools.pools["ATOM/USDC"]["base_denom"] == ATOM_DENOM
+
+
+def test_replacing_an_asset_drops_its_old_aliases(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assets = AssetRegistry()
+    assets.register(osmosistrader.Asset("ATOM", ATOM_DENOM, 6, aliases=["uatom"]))
+    assets.register(osmosistrader.Asset("ATOM", "atom-2", 6))
+    assert assets.by_denom("uatom") is None and assets.by_denom(ATOM_DENOM) is None
+    assert assets.by_denom("atom-2").symbol == "ATOM"
+
+
+def test_unknown_assets(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    write_assets({"assets": [{"symbol": "BAD", "denom": "ubad"}]})   # No decimals
+    assets = AssetRegistry()
+    assert "Error loading asset config" in capsys.readouterr().out
+    assert assets.by_symbol("BAD") is None
+    
+    with pytest.raises(ValueError, match="Unknown token: DOGE"):
+        assets.amount("1", "DOGE")
+    # Unknown denoms are still described, with the default precision
+    assert assets.by_denom("factory/osmo1xyz/doge") is None
+    assert assets.symbol("factory/osmo1xyz/doge") == "doge"
+    assert assets.decimals("factory/osmo1xyz/doge") == AssetRegistry.DEFAULT_DECIMALS
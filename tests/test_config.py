@@ -0,0 +1,59 @@
+"""Asset and pool configuration"""
+import json
+
+import pytest
+
+import osmosistrader
+
+ATOM_DENOM = "ibc/27394FB092D2ECCD56123C74F36E4C1F926001CEADA9CA97EA622B25F41E5EB2"
+
+
+def write_config(assets=None, pools=None):
+    if assets is not None:
+        with open("assets.json", "w") as f:
+            json.dump({"assets": assets}, f)
+    if pools is not None:
+        with open("pools.json", "w") as f:
+            json.dump({"pools": pools}, f)
+
+
+def test_bad_pool_entry_is_skipped_alone(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    write_config(pools=[
+        {"pair": "ATOM/USDC", "pool_id": "1282", "base": "ATOM", "quote": "USDC"},
+        {"pool_id": "2", "base_denom": "ibc/UNKNOWN", "quote": "USDC"},
+        {"base": "OSMO", "quote": "BTC"},
+        {"pair": "OSMO/BTC", "pool_id": "3", "base": "OSMO", "quote": "BTC"},
+    ])
+    client = osmosistrader.OsmosisClient()
+    
+    assert "ATOM/USDC" not in client.pools
+    assert "OSMO/BTC" in client.pools
+    out = capsys.readouterr().out
+    assert "unknown base asset ATOM" in out
+    assert "unknown base denom ibc/UNKNOWN" in out
+    assert "missing pool_id" in out
+
+
+def test_configured_assets_get_balances(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_config(
+        assets=[{"symbol": "ATOM", "denom": ATOM_DENOM, "decimals": 6}],
+        pools=[{"pair": "ATOM/USDC", "pool_id": "1282", "base": "ATOM", "quote": "USDC"}],
+    )
+    client = osmosistrader.OsmosisClient()
+    
+    assert "ATOM/USDC" in client.pools
+    assert set(client.balances) == {"OSMO", "BTC", "ETH", "ATOM", "USDC"}
+    client.ledger.sync({ATOM_DENOM: 2_500_000})
+    assert str(client.ledger.snapshot(client.balances)["ATOM"]) == "2.500000"
+
+
+def test_unknown_symbols_raise_value_errors(client):
+    with pytest.raises(ValueError, match="Unknown token: DOGE"):
+        client.ledger.amount("DOGE")
+    reservations = osmosistrader.BalanceReservations(client.ledger, client.assets)
+    with pytest.raises(ValueError, match="Unknown token: DOGE"):
+        reservations.reserve("order-1", "DOGE", 1)
+    with pytest.raises(ValueError, match="Unknown token: DOGE"):
+        reservations.reserved("DOGE")
@@ -0,0 +1,69 @@
+"""Reading confirmed swap amounts back from queried transactions"""
+
+SPLIT_MSG = '/osmosis.poolmanager.v1beta1.MsgSplitRouteSwapExactAmountIn'
+
+
+def swapped(pool_id, tokens_in, tokens_out):
+    return {'type': 'token_swapped', 'attributes': [
+        {'key': 'pool_id', 'value': pool_id},
+        {'key': 'tokens_in', 'value': tokens_in},
+        {'key': 'tokens_out', 'value': tokens_out},
+    ]}
+
+
+def split_tx(client, with_routes=True):
+    usdc = client.assets.by_symbol('USDC').denom
+    osmo = client.assets.by_symbol('OSMO').denom
+    btc = client.assets.by_symbol('BTC').denom
+    msg = {'@type': SPLIT_MSG, 'token_in_denom': usdc, 'token_out_min_amount': '90000'}
+    if with_routes:
+        msg['routes'] = [
+            {'pools': [{'pool_id': '1', 'token_out_denom': osmo}, {'pool_id': '2', 'token_out_denom': btc}],
+             'token_in_amount': '3000000'},
+            {'pools': [{'pool_id': '3', 'token_out_denom': osmo}, {'pool_id': '4', 'token_out_denom': btc}],
+             'token_in_amount': '2000000'},
+        ]
+    return {
+        'tx_response': {'height': '123', 'events': [
+            swapped('1', f'3000000{usdc}', f'7000000{osmo}'),
+            swapped('2', f'7000000{osmo}', f'60000{btc}'),
+            swapped('3', f'2000000{usdc}', f'4500000{osmo}'),
+            swapped('4', f'4500000{osmo}', f'39000{btc}'),
+        ]},
+        'tx': {'body': {'messages': [msg]},
+               'auth_info': {'fee': {'amount': [{'denom': 'uosmo', 'amount': '5000'}]}}},
+    }
+
+
+def test_split_route_sums_every_leg(client):
+    for with_routes in (True, False):
+        details = client._parse_swap_tx('ABC', split_tx(client, with_routes))
+        assert details['amount_in_raw'] == 5_000_000
+        assert details['denom_in'] == client.assets.by_symbol('USDC').denom
+        assert details['amount_out_raw'] == 99_000
+        assert details['denom_out'] == client.assets.by_symbol('BTC').denom
+        assert details['pool_id'] == "1,2;3,4"
+        assert details['min_out_amount'] == '90000'
+        assert details['fees'] == [('uosmo', 5000)]
+        assert details['height'] == 123
+
+
+def test_split_route_books_summed_amounts(client):
+    usdc = client.assets.by_symbol('USDC').denom
+    btc = client.assets.by_symbol('BTC').denom
+    client.ledger.sync({usdc: 10_000_000, btc: 0, 'uosmo': 100_000}, height=100)
+    assert client.apply_confirmed_swap('ABC', client._parse_swap_tx('ABC', split_tx(client)))
+    assert client.ledger.balance(usdc) == 5_000_000
+    assert client.ledger.balance(btc) == 99_000
+    assert client.ledger.balance('uosmo') == 95_000
+
+
+def test_single_route_multi_hop(client):
+    tx = split_tx(client)
+    tx['tx_response']['events'] = tx['tx_response']['events'][:2]
+    tx['tx']['body']['messages'] = [{'@type': '/osmosis.poolmanager.v1beta1.MsgSwapExactAmountIn',
+                                     'token_out_min_amount': '59000'}]
+    details = client._parse_swap_tx('ABC', tx)
+    assert (details['amount_in_raw'], details['amount_out_raw']) == (3_000_000, 60_000)
+    assert details['pool_id'] == "1,2"
+    assert details['min_out_amount'] == '59000'
@@ -0,0 +1,86 @@
+"""Control API behaviour under a busy engine"""
+import http.client
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+import osmosistrader
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def api(engine):
+    server = osmosistrader.ControlAPIServer(engine, port=free_port())
+    server.start()
+    return server
+
+
+def get(server, path, timeout=5):
+    conn = http.client.HTTPConnection(server.host, server.port, timeout=timeout)
+    try:
+        conn.request("GET", path)
+        response = conn.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        conn.close()
+
+
+def test_orders_listing_doesnt_block_the_loop(api, engine):
+    # A check holds the engine lock while its swaps broadcast
+    held, release = threading.Event(), threading.Event()
+    
+    def check():
+        with engine._lock:
+            held.set()
+            release.wait(10)
+    threading.Thread(target=check, daemon=True).start()
+    held.wait(5)
+    
+    listing = {}
+    thread = threading.Thread(target=lambda: listing.update(result=get(api, "/orders")), daemon=True)
+    thread.start()
+    time.sleep(0.2)
+    
+    # Other requests are still served while the listing waits for the lock
+    start = time.perf_counter()
+    status, payload = get(api, "/metrics", timeout=2)
+    assert status == 200 and time.perf_counter() - start < 1.0
+    assert 'result' not in listing
+    
+    release.set()
+    thread.join(5)
+    status, payload = listing['result']
+    assert status == 200
+    assert set(payload) == {'orders', 'parents', 'schedules', 'grids'}
+
+
+def post(server, path, body, timeout=5):
+    conn = http.client.HTTPConnection(server.host, server.port, timeout=timeout)
+    try:
+        conn.request("POST", path, body=json.dumps(body), headers={"Content-Type": "application/json"})
+        response = conn.getresponse()
+        return response.status, dict(response.getheaders()), json.loads(response.read())
+    finally:
+        conn.close()
+
+
+def test_full_submission_queue_answers_429(engine):
+    server = osmosistrader.ControlAPIServer(engine, port=free_port(), queue_size=5)
+    server.start()
+    spec = {"order_type": "limit", "from_token": "USDC", "to_token": "OSMO", "amount": "1", "price": "0.5"}
+    
+    status, headers, payload = post(server, "/orders/batch", [spec] * 6)
+    assert status == 429 and headers["Retry-After"] == "1"
+    assert engine.logger.get_pending_orders() == []
+    
+    status, _, payload = post(server, "/orders/batch", [spec] * 5)
+    assert status == 200 and all(result['ok'] for result in payload['results'])
+    assert len(engine.logger.get_pending_orders()) == 5
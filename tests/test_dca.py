@@ -0,0 +1,104 @@
+"""Recurring (DCA) buys: catch-up after downtime, batching and funding"""
+import time
+
+import pytest
+
+from test_engine_locking import lock_is_free
+
+USDC = "ibc/498A0751C798A0D9A389AA3691123DADA57DAA4FE165D5C75894505B876BA6E4"
+HOUR = 3600
+
+
+@pytest.fixture
+def market(node, client):
+    # 0.5 USDC per OSMO
+    node.update(balances={"uosmo": 10**9, USDC: 100 * 10**6},
+                pools={"1464": ["uosmo", 40_000_000 * 10**6, USDC, 20_000_000 * 10**6, 0.0]})
+    client.get_wallet_balances(force_update=True)
+    return node
+
+
+def dca(engine, amount, started_ago, **spec):
+    schedule, error = engine.create_orders([{'order_type': 'dca', 'from_token': 'USDC', 'to_token': 'OSMO',
+                                             'amount': amount, 'interval': HOUR,
+                                             'start_at': time.time() - started_ago, **spec}])[0]
+    assert error is None
+    return schedule
+
+
+def swaps(node):
+    """USDC base units sent by each swap so far"""
+    return [int(call.split()[3][:-len(USDC)]) for call in node.calls() if call.startswith("tx poolmanager")]
+
+
+@pytest.mark.parametrize("catch_up, bought, runs", [("once", 10, 1), ("all", 40, 4)])
+def test_missed_runs_catch_up(market, engine, catch_up, bought, runs):
+    # Down for three and a half intervals: four slots have passed
+    schedule = dca(engine, 10, 3.5 * HOUR, catch_up=catch_up)
+    next_run = schedule['next_run']
+    engine._run_dca()
+    
+    assert swaps(market) == [bought * 10**6]
+    schedule = engine.dca_schedules()[0]
+    assert (schedule['runs'], schedule['spent']) == (runs, bought)
+    # Either way the schedule stays on its original cadence
+    assert schedule['next_run'] == next_run + 4 * HOUR
+    assert engine._dca_due.next_deadline() == schedule['next_run']
+    
+    # Nothing else is due until then
+    engine._run_dca()
+    assert len(swaps(market)) == 1
+
+
+def test_catch_up_stops_at_max_runs(market, engine):
+    schedule = dca(engine, 10, 3.5 * HOUR, catch_up='all', max_runs=3)
+    engine._run_dca()
+    assert swaps(market) == [30 * 10**6]
+    assert engine.dca_schedules() == []
+    summary = [tx for tx in engine.logger.get_transactions() if tx.get('order_id') == schedule['id']]
+    assert [(tx['status'], tx['runs'], tx['amount_in']) for tx in summary] == [('completed', 3, 30.0)]
+
+
+def test_schedules_due_within_a_block_share_one_swap(market, engine):
+    first = dca(engine, 10, 60)
+    second = dca(engine, 5, -engine.DCA_BATCH_WINDOW / 2)   # Due a few seconds from now
+    later = dca(engine, 7, -HOUR / 2)
+    engine._run_dca()
+    
+    assert swaps(market) == [15 * 10**6]
+    tx = next(tx for tx in engine.logger.get_transactions() if tx.get('schedules'))
+    assert tx['schedules'] == {first['id']: 10.0, second['id']: 5.0}
+    runs = {s['id']: s['runs'] for s in engine.dca_schedules()}
+    assert runs == {first['id']: 1, second['id']: 1, later['id']: 0}
+
+
+def test_short_funds_buy_for_the_longest_waiting_first(market, engine):
+    # 100 USDC in the wallet: 60 + 30 fit, the newest 30 doesn't
+    oldest = dca(engine, 60, 3 * 60)
+    middle = dca(engine, 30, 2 * 60)
+    newest = dca(engine, 30, 60)
+    engine._run_dca()
+    
+    assert swaps(market) == [90 * 10**6]
+    schedules = {s['id']: s for s in engine.dca_schedules()}
+    assert (schedules[oldest['id']]['runs'], schedules[middle['id']]['runs']) == (1, 1)
+    # The unfunded one is retried shortly, keeping its slot
+    assert (schedules[newest['id']]['runs'], schedules[newest['id']]['failures']) == (0, 1)
+    assert schedules[newest['id']]['next_run'] == newest['next_run']
+    assert engine._dca_due.next_deadline() == pytest.approx(time.time() + engine.DCA_RETRY_DELAY, abs=5)
+    # The swap's funds stay reserved until it is confirmed
+    assert engine.reservations.reserved('USDC').raw == 90 * 10**6
+
+
+def test_the_swap_is_sent_without_the_lock(market, engine, monkeypatch):
+    dca(engine, 10, 60)
+    execute_market_swap = engine.client.execute_market_swap
+    seen = []
+    
+    def checked(*args):
+        # The funds are already promised to the swap, and another thread can use the engine
+        seen.append((lock_is_free(engine._lock), engine.reservations.reserved('USDC').raw))
+        return execute_market_swap(*args)
+    monkeypatch.setattr(engine.client, 'execute_market_swap', checked)
+    engine._run_dca()
+    assert seen == [(True, 10 * 10**6)]
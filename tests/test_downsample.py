@@ -0,0 +1,54 @@
+"""Largest-Triangle-Three-Buckets downsampling of chart series"""
+import math
+import random
+
+import pytest
+
+from osmosistrader import PriceChart
+
+
+def series(n, seed=1):
+    rng = random.Random(seed)
+    xs, ys, y = [], [], 1.0
+    for i in range(n):
+        y *= math.exp(rng.gauss(0, 0.01))
+        xs.append(1_700_000_000 + 60 * i)
+        ys.append(y)
+    return xs, ys
+
+
+@pytest.mark.parametrize("n, threshold", [(1000, 50), (1001, 3), (10, 9), (5000, 640)])
+def test_keeps_the_ends_and_one_point_per_bucket(n, threshold):
+    xs, ys = series(n)
+    kept = PriceChart.downsample(xs, ys, threshold)
+    assert len(kept) == threshold
+    assert kept[0] == 0 and kept[-1] == n - 1
+    # One point from each of the threshold - 2 equal buckets in between, in order
+    every = (n - 2) / (threshold - 2)
+    for i, index in enumerate(kept[1:-1]):
+        assert int(i * every) + 1 <= index < (int((i + 1) * every) + 1 if i < threshold - 3 else n - 1)
+
+
+def test_short_series_are_kept_whole():
+    xs, ys = series(20)
+    assert PriceChart.downsample(xs, ys, 20) == list(range(20))
+    assert PriceChart.downsample(xs, ys, 100) == list(range(20))
+    assert PriceChart.downsample(xs, ys, 2) == list(range(20))
+    assert PriceChart.downsample([], [], 10) == []
+
+
+def test_spikes_survive():
+    xs = list(range(1000))
+    ys = [1.0] * 1000
+    ys[321], ys[777] = 5.0, 0.2
+    kept = PriceChart.downsample(xs, ys, 10)
+    assert 321 in kept and 777 in kept
+
+
+def test_numpy_matches_the_list_version():
+    np = pytest.importorskip("numpy")
+    xs, ys = series(20_000)
+    # Large buckets take the vectorized path
+    assert PriceChart.downsample(np.array(xs), np.array(ys), 200) == PriceChart.downsample(xs, ys, 200)
+    # Small buckets convert to lists first
+    assert PriceChart.downsample(np.array(xs), np.array(ys), 5000) == PriceChart.downsample(xs, ys, 5000)
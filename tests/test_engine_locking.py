@@ -0,0 +1,78 @@
+"""The engine lock is never held across node queries or swaps"""
+import threading
+
+import pytest
+
+USDC = "ibc/498A0751C798A0D9A389AA3691123DADA57DAA4FE165D5C75894505B876BA6E4"
+
+
+def lock_is_free(lock):
+    """Whether another thread could take the lock right now"""
+    free = []
+    
+    def probe():
+        if lock.acquire(timeout=0.5):
+            lock.release()
+            free.append(True)
+    thread = threading.Thread(target=probe)
+    thread.start()
+    thread.join()
+    return bool(free)
+
+
+@pytest.fixture
+def quoting_node(node, client):
+    node.update(balances={"uosmo": 10**9, USDC: 10**9},
+                pools={"1464": ["uosmo", 40_000_000 * 10**6, USDC, 20_000_000 * 10**6, 0.0]})
+    client.get_wallet_balances(force_update=True)
+    return node
+
+
+def test_creating_orders_quotes_without_the_lock(quoting_node, engine, monkeypatch):
+    get_pool_price = engine.client.get_pool_price
+    held = []
+    
+    def checked(pair):
+        held.append(not lock_is_free(engine._lock))
+        return get_pool_price(pair)
+    monkeypatch.setattr(engine.client, 'get_pool_price', checked)
+    
+    results = engine.create_orders([
+        {'order_type': 'stop_loss', 'from_token': 'OSMO', 'to_token': 'USDC', 'amount': 1, 'price': 0.4},
+        {'order_type': 'grid', 'base_token': 'OSMO', 'lower': 0.4, 'upper': 0.6, 'levels': 5, 'amount': 1},
+    ])
+    assert [error for _, error in results] == [None, None]
+    assert held == [False]   # One quote for both, outside the lock
+
+
+def test_swaps_are_sent_without_the_lock(quoting_node, engine, monkeypatch):
+    (order, _), (other, _) = engine.create_orders([
+        {'order_type': 'limit', 'from_token': 'OSMO', 'to_token': 'USDC', 'amount': 1, 'price': 0.4},
+        {'order_type': 'limit', 'from_token': 'OSMO', 'to_token': 'USDC', 'amount': 2, 'price': 0.45},
+    ])
+    execute_market_swap = engine.client.execute_market_swap
+    in_flight, release = threading.Event(), threading.Event()
+    
+    def slow_swap(*args):
+        in_flight.set()
+        release.wait(5)
+        return execute_market_swap(*args)
+    monkeypatch.setattr(engine.client, 'execute_market_swap', slow_swap)
+    
+    check = threading.Thread(target=engine.check_pending_orders)
+    check.start()
+    assert in_flight.wait(5)
+    # While the first swap is in flight, orders can still be created and cancelled
+    assert lock_is_free(engine._lock)
+    assert engine.cancel_order(other['id'])
+    new, error = engine.create_orders([
+        {'order_type': 'limit', 'from_token': 'OSMO', 'to_token': 'USDC', 'amount': 1, 'price': 0.9}])[0]
+    assert error is None
+    release.set()
+    check.join(5)
+    
+    # Both picked orders were swapped; the one cancelled in flight is still booked as a fill
+    assert sum(call.startswith("tx poolmanager") for call in quoting_node.calls()) == 2
+    filled = {tx['order_id'] for tx in engine.logger.get_transactions() if tx.get('status') == 'executed'}
+    assert filled == {order['id'], other['id']}
+    assert [o['id'] for o in engine.logger.get_pending_orders()] == [new['id']]
@@ -0,0 +1,133 @@
+"""Grid strategies: level math, the delta log and its compaction"""
+import json
+import random
+
+import pytest
+
+from osmosistrader import OrderEngine, PriceGrid, TransactionLogger
+
+USDC = "ibc/498A0751C798A0D9A389AA3691123DADA57DAA4FE165D5C75894505B876BA6E4"
+
+
+def grid_record(lower, upper, count, spacing, gap, amount=2.0):
+    return {'id': 'grid-1', 'base_token': 'OSMO', 'quote_token': 'USDC', 'lower': lower, 'upper': upper,
+            'levels': count, 'spacing': spacing, 'gap': gap, 'amount': amount, 'seq': 0,
+            'buys': 0, 'sells': 0, 'quote_spent': 0.0, 'base_bought': 0.0, 'base_sold': 0.0, 'quote_received': 0.0}
+
+
+@pytest.mark.parametrize("spacing", ["arithmetic", "geometric"])
+def test_level_math_matches_brute_force(spacing):
+    rng = random.Random(3)
+    for _ in range(200):
+        lower = rng.uniform(0.1, 10)
+        upper = lower * rng.uniform(1.01, 5)
+        count = rng.randint(2, 40)
+        grid = PriceGrid(grid_record(lower, upper, count, spacing, rng.randrange(count)))
+        prices, gap = grid.prices, grid.record['gap']
+        assert len(prices) == count and prices == sorted(prices)
+        assert prices[0] == pytest.approx(lower) and prices[-1] == pytest.approx(upper)
+        
+        price = rng.uniform(lower * 0.8, upper * 1.2)
+        # The closest level, the upper one on a tie
+        assert grid.nearest(prices, price) == min(range(count), key=lambda i: (abs(prices[i] - price), -i))
+        # Every armed level the price has reached
+        buys = [i for i in range(gap) if prices[i] >= price]
+        sells = [i for i in range(gap + 1, count) if prices[i] <= price]
+        expected = ('buy', buys) if buys else ('sell', sells) if sells else None
+        crossed = grid.crossed(price)
+        assert (crossed and (crossed[0], list(crossed[1]))) == expected
+        
+        start = rng.randrange(count)
+        stop = rng.randint(start, count)
+        assert grid.buy_cost(range(start, stop)) == pytest.approx(2.0 * sum(prices[start:stop]))
+        assert grid.needs() == pytest.approx((2.0 * (count - 1 - gap), 2.0 * sum(prices[:gap])))
+
+
+def test_replayed_deltas_only_move_forward():
+    grid = PriceGrid(grid_record(0.4, 0.6, 5, 'arithmetic', 2))
+    first = grid.fill('buy', 1, 0.9, 2.0)
+    second = grid.fill('sell', 2, 4.0, 2.1)
+    assert (first['seq'], first['gap'], second['seq'], second['gap']) == (1, 1, 2, 3)
+    
+    restored = PriceGrid(grid_record(0.4, 0.6, 5, 'arithmetic', 2))
+    for delta in (first, second, first):   # A stale delta replayed late changes nothing
+        restored.apply(delta)
+    assert {name: restored.record[name] for name in PriceGrid.STATE_FIELDS} == second
+
+
+@pytest.fixture
+def market(node, client):
+    # 0.5 USDC per OSMO
+    node.update(balances={"uosmo": 10**9, USDC: 10**9},
+                pools={"1464": ["uosmo", 40_000_000 * 10**6, USDC, 20_000_000 * 10**6, 0.0]})
+    client.get_wallet_balances(force_update=True)
+    return node
+
+
+def move_price(node, engine, price):
+    node.update(pools={"1464": ["uosmo", 40_000_000 * 10**6, USDC, int(price * 40_000_000 * 10**6), 0.0]})
+    engine.check_pending_orders()
+
+
+def snapshot(logger):
+    with open(logger.grids_file) as f:
+        return {record['id']: record for record in json.load(f)}
+
+
+def delta_lines(logger):
+    with open(logger.grid_deltas_file) as f:
+        return f.read().splitlines()
+
+
+def create_grid(engine):
+    # Levels 0.40, 0.45, 0.50, 0.55, 0.60: the gap starts at 0.50
+    (grid, error), = engine.create_orders([
+        {'order_type': 'grid', 'base_token': 'OSMO', 'lower': 0.4, 'upper': 0.6, 'levels': 5, 'amount': 2}])
+    assert error is None and grid['gap'] == 2
+    return grid
+
+
+def test_restart_replays_the_delta_log(market, client, engine):
+    grid = create_grid(engine)
+    move_price(market, engine, 0.44)   # Buys at 0.45
+    move_price(market, engine, 0.56)   # Sells at 0.50 and 0.55
+    state = engine.grid_strategies()[0]
+    assert (state['gap'], state['buys'], state['sells'], state['seq']) == (3, 1, 2, 2)
+    
+    # The fills are only in the delta log, the last one half-written by a crash
+    assert snapshot(engine.logger)[grid['id']]['gap'] == 2
+    with open(engine.logger.grid_deltas_file, 'a') as f:
+        f.write('{"id": "' + grid['id'] + '", "seq": 3, "ga')
+    engine.stop()
+    
+    restarted = OrderEngine(client, TransactionLogger())
+    try:
+        assert restarted.grid_strategies() == [state]
+        # Loading folds the log into a fresh snapshot
+        assert snapshot(restarted.logger)[grid['id']] == state
+        assert delta_lines(restarted.logger) == []
+        # Buys at 0.40 to 0.50 and a sell at 0.60 are armed again, each side with its gas
+        restarted._resume_grids()
+        assert restarted.reservations.reserved('USDC').raw == 2_700_000
+        assert restarted.reservations.reserved('OSMO').raw == 2_000_000 + 2 * restarted.reservations.FEE_RESERVE_UOSMO
+    finally:
+        restarted.stop()
+
+
+def test_delta_log_is_compacted(market, engine, monkeypatch):
+    monkeypatch.setattr(engine, 'GRID_COMPACT_EVERY', 3)
+    grid = create_grid(engine)
+    
+    move_price(market, engine, 0.44)   # Buys at 0.45
+    move_price(market, engine, 0.51)   # Sells it back at 0.50
+    assert len(delta_lines(engine.logger)) == 2
+    assert snapshot(engine.logger)[grid['id']]['seq'] == 0
+    
+    # The third fill reaches the limit: the snapshot catches up and the log restarts
+    move_price(market, engine, 0.44)
+    assert delta_lines(engine.logger) == []
+    assert snapshot(engine.logger)[grid['id']] == engine.grid_strategies()[0]
+    assert snapshot(engine.logger)[grid['id']]['seq'] == 3
+    
+    move_price(market, engine, 0.51)
+    assert [json.loads(line)['seq'] for line in delta_lines(engine.logger)] == [4]
@@ -0,0 +1,99 @@
+"""Impact curves: interpolation, extension on demand and per-block refresh"""
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from osmosistrader import ImpactCurveCache
+
+USDC = "ibc/498A0751C798A0D9A389AA3691123DADA57DAA4FE165D5C75894505B876BA6E4"
+
+POINTS = [(1_000, 500), (4_000, 1_900), (16_000, 7_000)]
+
+
+def test_interpolate_boundaries():
+    interpolate = ImpactCurveCache._interpolate
+    assert interpolate([], 10) is None
+    assert interpolate(None, 10) is None
+    
+    # Below the first bucket: that bucket's rate
+    assert interpolate(POINTS, 10) == 5
+    assert interpolate(POINTS, 1_000) == 500
+    # On a bucket: its quote
+    assert interpolate(POINTS, 4_000) == 1_900
+    assert interpolate(POINTS, 16_000) == 7_000
+    # Beyond the last bucket there is nothing to extrapolate from
+    assert interpolate(POINTS, 16_001) is None
+
+
+def test_interpolate_is_linear_in_log_size():
+    # Halfway between 1000 and 4000 in log size is 2000; the rate is halfway too
+    rate = (500 / 1_000 + 1_900 / 4_000) / 2
+    assert ImpactCurveCache._interpolate(POINTS, 2_000) == int(2_000 * rate)
+    # The rate falls monotonically with size
+    sizes = [1_000 * 2 ** (k / 4) for k in range(17)]
+    rates = [ImpactCurveCache._interpolate(POINTS, size) / size for size in sizes]
+    assert all(a >= b - 1e-3 for a, b in zip(rates, rates[1:]))
+
+
+@pytest.fixture
+def curve_cache(node, client):
+    # 40M OSMO against 20M USDC
+    node.update(pools={"1464": ["uosmo", 40_000_000 * 10**6, USDC, 20_000_000 * 10**6, 0.0]})
+    jobs = []
+    scheduler = SimpleNamespace(call_later=lambda delay, *args, **kwargs: jobs.append((args, kwargs)),
+                                call_every=lambda *args, **kwargs: None)
+    return client.impact_curves.start(scheduler), jobs
+
+
+def test_miss_schedules_a_build_that_covers_the_amount(curve_cache):
+    curves, jobs = curve_cache
+    assert curves.estimate("uosmo", USDC, 10**6) is None
+    assert jobs == [((curves.build, "uosmo", USDC, True), {'key': ('impact_curve', ("uosmo", USDC))})]
+    
+    curves.build("uosmo", USDC)
+    out, route = curves.estimate("uosmo", USDC, 10**6)
+    assert out == pytest.approx(500_000, rel=1e-4)
+    assert route['pools'][0]["pool_id"] == "1464"
+    
+    # Above the largest bucket: no estimate, and a build that adds buckets up to the amount
+    largest = curves._curves[("uosmo", USDC)]['max_raw']
+    jobs.clear()
+    assert curves.estimate("uosmo", USDC, largest * 3) is None
+    assert len(jobs) == 1
+    curves.build("uosmo", USDC)
+    assert curves._curves[("uosmo", USDC)]['max_raw'] == largest * ImpactCurveCache.BUCKET_GROWTH
+    out, _ = curves.estimate("uosmo", USDC, largest * 3)
+    # Constant product: out = y * a / (x + a)
+    exact = 20_000_000 * 10**6 * largest * 3 / (40_000_000 * 10**6 + largest * 3)
+    assert out == pytest.approx(exact, rel=1e-3)
+
+
+def test_refresh_requotes_on_a_new_block_and_forgets_idle_pairs(curve_cache, node, client):
+    curves, _ = curve_cache
+    client.note_height(1000)
+    curves.build("uosmo", USDC)
+    node.calls(reset=True)
+    
+    # Same block: the curve stands
+    curves.refresh()
+    assert node.calls() == []
+    
+    # A new block re-quotes every bucket of every route
+    client.note_height(1001)
+    node.update(pools={"1464": ["uosmo", 40_000_000 * 10**6, USDC, 10_000_000 * 10**6, 0.0]})
+    curves.refresh()
+    assert curves._curves[("uosmo", USDC)]['height'] == 1001
+    assert curves.estimate("uosmo", USDC, 10**6)[0] == pytest.approx(250_000, rel=1e-4)
+    assert curves.route_estimate("1464", "uosmo", 10**6) == pytest.approx(250_000, rel=1e-4)
+    
+    # Node unreachable: the old curve is kept rather than dropped
+    client.note_height(1002)
+    node.update(pools={})
+    curves.refresh()
+    assert curves._curves[("uosmo", USDC)]['height'] == 1001
+    
+    # Nobody asked about the pair for idle_after seconds: it is dropped
+    curves._curves[("uosmo", USDC)]['used'] = time.time() - curves.idle_after - 1
+    curves.refresh()
+    assert ("uosmo", USDC) not in curves._curves
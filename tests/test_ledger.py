@@ -0,0 +1,35 @@
+"""Incremental balance ledger"""
+import osmosistrader
+
+
+def denoms(client):
+    return client.assets.by_symbol('USDC').denom, client.assets.by_symbol('BTC').denom
+
+
+def test_confirmed_swaps_apply_once(client):
+    usdc, btc = denoms(client)
+    ledger = client.ledger
+    ledger.sync({usdc: 10_000_000}, height=100)
+    
+    assert ledger.apply_swap("A", usdc, 4_000_000, btc, 6_000, fees=[('uosmo', 5_000)], height=101)
+    assert not ledger.apply_swap("A", usdc, 4_000_000, btc, 6_000, height=101)
+    # Already included in a query at or after its height
+    assert not ledger.apply_swap("B", usdc, 1_000_000, btc, 1_500, height=100)
+    
+    assert ledger.balance(usdc) == 6_000_000 and ledger.balance(btc) == 6_000
+    assert ledger.drift_reason == "negative OSMO balance after A"
+    assert ledger.needs_sync()
+
+
+def test_state_snapshot_round_trip(client):
+    usdc, btc = denoms(client)
+    client.ledger.sync({usdc: 10_000_000, btc: 25_000}, height=100)
+    client.ledger.apply_swap("A", usdc, 1_000_000, btc, 1_500, height=105)
+    client.save_state_snapshot()
+    
+    restarted = osmosistrader.OsmosisClient()
+    assert restarted.load_state_snapshot() is not None
+    assert restarted.ledger.raw_snapshot()[1] == {usdc: 9_000_000, btc: 26_500}
+    assert str(restarted.balances['BTC']) == "0.00026500"
+    # Warm-started balances are shown but still need the first chain sync
+    assert restarted.ledger.needs_sync()
@@ -0,0 +1,96 @@
+"""Good-till-time orders: the deadline heap and expiry"""
+import time
+
+import pytest
+
+from osmosistrader import OrderDeadlines
+
+USDC = "ibc/498A0751C798A0D9A389AA3691123DADA57DAA4FE165D5C75894505B876BA6E4"
+
+
+def test_deadlines_pop_in_order():
+    deadlines = OrderDeadlines()
+    for order_id, deadline in (("order-3", 300), ("order-1", 100), ("order-4", 300), ("order-2", 200)):
+        deadlines.add(order_id, deadline)
+    assert len(deadlines) == 4
+    assert deadlines.next_deadline() == 100
+    assert deadlines.pop_due(99) == []
+    assert deadlines.pop_due(200) == ["order-1", "order-2"]
+    assert deadlines.pop_due(1000) == ["order-3", "order-4"]
+    assert deadlines.next_deadline() is None and len(deadlines) == 0
+
+
+def test_forgotten_and_moved_deadlines_are_skipped():
+    deadlines = OrderDeadlines()
+    for i in range(1, 6):
+        deadlines.add(f"order-{i}", 100 * i)
+    deadlines.remove("order-1")   # Filled
+    deadlines.remove("order-3")   # Cancelled
+    deadlines.remove("order-3")   # Twice is harmless
+    deadlines.add("order-2", 450)  # Replaced with a later deadline
+    
+    assert deadlines.next_deadline() == 400
+    assert not deadlines.expired("order-1", 1000)
+    assert deadlines.expired("order-4", 400) and not deadlines.expired("order-4", 399)
+    assert deadlines.pop_due(450) == ["order-4", "order-2"]
+    assert deadlines.pop_due(1000) == ["order-5"]
+
+
+def test_sync_skips_good_till_cancelled_orders():
+    deadlines = OrderDeadlines()
+    deadlines.sync([
+        {'id': 'order-1', 'expires_at': '2030-01-01T00:00:00'},
+        {'id': 'order-2'},
+        {'id': 'order-3', 'expires_at': '2029-01-01T00:00:00'},
+    ])
+    assert len(deadlines) == 2
+    assert deadlines.pop_due(float('inf')) == ['order-3', 'order-1']
+
+
+@pytest.fixture
+def funded(node, client):
+    # 0.5 USDC per OSMO
+    node.update(balances={"uosmo": 10**9, USDC: 10**9},
+                pools={"1464": ["uosmo", 40_000_000 * 10**6, USDC, 20_000_000 * 10**6, 0.0]})
+    client.get_wallet_balances(force_update=True)
+    return node
+
+
+def test_only_orders_still_pending_expire(funded, engine):
+    def buy(expires_in):
+        return {'order_type': 'limit', 'from_token': 'USDC', 'to_token': 'OSMO', 'amount': 1, 'price': 0.1,
+                'expires_in': expires_in}
+    results = engine.create_orders([
+        buy(100), buy(200), buy(300),
+        {'order_type': 'limit', 'from_token': 'OSMO', 'to_token': 'USDC', 'amount': 1, 'price': 0.4, 'expires_in': 150},
+    ])
+    cancelled, expiring, later, filled = (order for order, _ in results)
+    assert engine.deadlines.next_deadline() == pytest.approx(time.time() + 100, abs=5)
+    
+    # Cancelled and filled orders leave the heap before their deadlines
+    assert engine.cancel_order(cancelled['id'])
+    engine.check_pending_orders()
+    assert [o['id'] for o in engine.logger.get_pending_orders()] == [expiring['id'], later['id']]
+    assert len(engine.deadlines) == 2
+    assert engine.deadlines.next_deadline() == pytest.approx(time.time() + 200, abs=5)
+    
+    # Past every deadline, only the two orders still pending expire, earliest first
+    due = engine.deadlines.pop_due(time.time() + 1000)
+    assert due == [expiring['id'], later['id']]
+    assert [o['id'] for o in engine.expire_orders(due)] == due
+    assert engine.logger.get_pending_orders() == []
+    statuses = {tx['order_id']: tx['status'] for tx in engine.logger.get_transactions()}
+    assert statuses == {expiring['id']: 'expired', later['id']: 'expired', filled['id']: 'executed'}
+    assert engine.reservations.reserved('USDC').raw == 0
+    
+    # Expiring again finds nothing
+    assert engine.expire_orders(due) == []
+
+
+def test_an_order_past_its_deadline_never_fills(funded, engine):
+    order = engine.create_order('limit', 'OSMO', 'USDC', 1, 0.4, expires_in=60)
+    # The expiry timer hasn't run yet, but the deadline has passed
+    engine.deadlines.add(order['id'], time.time() - 1)
+    engine.check_pending_orders()
+    assert not any(call.startswith("tx poolmanager") for call in funded.calls())
+    assert [o['id'] for o in engine.logger.get_pending_orders()] == [order['id']]
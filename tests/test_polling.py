@@ -0,0 +1,13 @@
+"""Adaptive order polling"""
+
+
+def test_poll_now_resets_scheduled_pair(engine):
+    engine._polls["OSMO/USDC"] = {'next': 1e12, 'interval': 60}
+    engine._poll_now("OSMO/USDC")
+    assert engine._polls["OSMO/USDC"]['next'] == 0
+
+
+def test_poll_now_leaves_unscheduled_pair_due(engine):
+    engine._poll_now("BTC/USDC")
+    # No partial entry: the first sample creates the full schedule
+    assert "BTC/USDC" not in engine._polls
@@ -0,0 +1,86 @@
+"""Price history rings: candle rollups, wraparound and reload"""
+import os
+
+import pytest
+
+from osmosistrader import PriceHistory
+
+DAY = 86400 * 20_000   # Aligned to every resolution
+
+
+def rows(array):
+    return [[float(x) for x in row] for row in array]
+
+
+@pytest.fixture
+def history(tmp_path):
+    return PriceHistory(str(tmp_path / "history"))
+
+
+def test_rollups_across_bucket_boundaries(history):
+    for offset, price, volume in ((10, 1.0, 0), (59, 2.0, 1), (60, 1.5, 0), (61, 0.5, 3), (3599, 0.8, 0), (3600, 0.9, 0)):
+        history.record("OSMO/USDC", price, DAY + offset, volume)
+    
+    assert rows(history.candles("OSMO/USDC", "1m")) == [
+        [DAY, 1.0, 2.0, 1.0, 2.0, 1],
+        [DAY + 60, 1.5, 1.5, 0.5, 0.5, 3],
+        [DAY + 3540, 0.8, 0.8, 0.8, 0.8, 0],
+        [DAY + 3600, 0.9, 0.9, 0.9, 0.9, 0],
+    ]
+    assert rows(history.candles("OSMO/USDC", "5m")) == [
+        [DAY, 1.0, 2.0, 0.5, 0.5, 4],
+        [DAY + 3300, 0.8, 0.8, 0.8, 0.8, 0],
+        [DAY + 3600, 0.9, 0.9, 0.9, 0.9, 0],
+    ]
+    assert rows(history.candles("OSMO/USDC", "1h")) == [[DAY, 1.0, 2.0, 0.5, 0.8, 4], [DAY + 3600, 0.9, 0.9, 0.9, 0.9, 0]]
+    assert rows(history.candles("OSMO/USDC", "1d")) == [[DAY, 1.0, 2.0, 0.5, 0.9, 4]]
+    
+    # A late tick is kept as a tick but can't reopen a closed candle
+    history.record("OSMO/USDC", 9.0, DAY + 30)
+    assert rows(history.candles("OSMO/USDC", "1m"))[0] == [DAY, 1.0, 2.0, 1.0, 2.0, 1]
+    assert rows(history.candles("OSMO/USDC", "1d"))[0][2] == 9.0   # The day is still forming
+    assert rows(history.ticks("OSMO/USDC"))[-1] == [DAY + 30, 9.0]
+    
+    with pytest.raises(ValueError, match="Unknown resolution"):
+        history.candles("OSMO/USDC", "2m")
+
+
+def test_rings_wrap_oldest_first(history):
+    history.RESOLUTIONS = (("1m", 60, 3),)
+    history.TICK_CAPACITY = 4
+    for minute in range(5):
+        history.record("OSMO/USDC", 1.0 + minute, DAY + 60 * minute)
+    
+    assert [row[0] for row in rows(history.candles("OSMO/USDC"))] == [DAY + 120, DAY + 180, DAY + 240]
+    assert [row[0] for row in rows(history.candles("OSMO/USDC", limit=2))] == [DAY + 180, DAY + 240]
+    assert [row[1] for row in rows(history.ticks("OSMO/USDC"))] == [2.0, 3.0, 4.0, 5.0]
+
+
+def test_reading_an_unknown_pair_creates_nothing(history):
+    assert len(history.candles("ATOM/USDC", "1h")) == 0
+    assert len(history.ticks("ATOM/USDC")) == 0
+    assert history.pairs() == []
+    assert not os.path.exists(history.directory)
+    
+    history.record("OSMO/USDC", 0.5, DAY)
+    assert history.pairs() == ["OSMO/USDC"]
+
+
+def test_restart_reloads_the_rings(tmp_path):
+    pytest.importorskip("numpy")
+    directory = str(tmp_path / "history")
+    history = PriceHistory(directory)
+    history.record("OSMO/USDC", 1.0, DAY + 10, 2)
+    history.record("OSMO/USDC", 1.2, DAY + 70)
+    history.save()
+    
+    reloaded = PriceHistory(directory)
+    assert reloaded.pairs() == ["OSMO/USDC"]
+    assert rows(reloaded.candles("OSMO/USDC")) == rows(history.candles("OSMO/USDC"))
+    assert rows(reloaded.ticks("OSMO/USDC")) == [[DAY + 10, 1.0], [DAY + 70, 1.2]]
+    
+    # The forming candle carries on where the last run left it
+    reloaded.record("OSMO/USDC", 1.5, DAY + 80)
+    assert rows(reloaded.candles("OSMO/USDC"))[-1] == [DAY + 60, 1.2, 1.5, 1.2, 1.5, 0]
+    assert sorted(os.listdir(directory)) == sorted(
+        ["index.json"] + [f"OSMO-USDC.{name}.npy" for name in ("ticks", "1m", "5m", "1h", "1d")])
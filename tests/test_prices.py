@@ -0,0 +1,63 @@
+"""Price snapshots: labels, heights and degraded-price gating"""
+import time
+
+import pytest
+
+USDC = "ibc/498A0751C798A0D9A389AA3691123DADA57DAA4FE165D5C75894505B876BA6E4"
+
+
+@pytest.fixture
+def quoting_node(node):
+    # 40M OSMO against 20M USDC: 0.5 USDC per OSMO
+    node.update(height=1000, balances={"uosmo": 5_000_000},
+                pools={"1464": ["uosmo", 40_000_000 * 10**6, USDC, 20_000_000 * 10**6, 0.0]})
+    return node
+
+
+def test_quotes_reuse_the_last_height(quoting_node, client):
+    price = client.get_pool_price("OSMO/USDC")
+    assert price['source'] == "live" and price['base_per_quote'] == pytest.approx(0.5, rel=1e-5)
+    assert price['height'] == 0
+    assert not any(call.startswith("status") for call in quoting_node.calls(reset=True))
+    
+    # A balance sync reads the height once; quotes after it are labelled with it
+    client.get_wallet_balances(force_update=True)
+    assert sum(call.startswith("status") for call in quoting_node.calls(reset=True)) == 1
+    quoting_node.update(height=1005)
+    assert client.get_pool_price("OSMO/USDC")['height'] == 1000
+    assert [call.split()[2] for call in quoting_node.calls()] == ["estimate-single-pool-swap-exact-amount-in"] * 2
+    
+    # Confirmed swaps move it forward, never back
+    client.note_height(1003)
+    client.note_height(1001)
+    assert client.get_pool_price("OSMO/USDC")['height'] == 1003
+
+
+def live(height=1000, age=0.0, source="live"):
+    return {'source': source, 'timestamp': time.time() - age, 'height': height, 'base_per_quote': 0.5}
+
+
+def test_degraded_reason(engine):
+    assert engine._degraded_reason("OSMO/USDC", live()) is None
+    assert engine._degraded_reason("OSMO/USDC", live(source="none")) == "no price available"
+    assert engine._degraded_reason("OSMO/USDC", live(age=12.4, source="cache")) == "cache price from 12s ago"
+    assert engine._degraded_reason("OSMO/USDC", live(age=61)) == "price is 61s old"
+    
+    engine._price_heights["OSMO/USDC"] = 1010
+    assert engine._degraded_reason("OSMO/USDC", live(height=1009)) == "node is behind (height 1009 < 1010)"
+    assert engine._degraded_reason("OSMO/USDC", live(height=1010)) is None
+    # Unknown heights aren't compared
+    assert engine._degraded_reason("OSMO/USDC", live(height=0)) is None
+    assert engine._degraded_reason("BTC/USDC", live(height=5)) is None
+
+
+def test_degraded_prices_defer_their_pair(quoting_node, engine, capsys):
+    engine.client.note_height(1000)
+    engine._price_heights["OSMO/USDC"] = 2000
+    assert engine._trigger_price("OSMO/USDC", {}) is None
+    assert engine.deferred_pairs["OSMO/USDC"].startswith("node is behind")
+    
+    engine._price_heights["OSMO/USDC"] = 0
+    assert engine._trigger_price("OSMO/USDC", {})['source'] == "live"
+    assert "OSMO/USDC" not in engine.deferred_pairs
+    assert "Resuming OSMO/USDC order checks" in capsys.readouterr().out
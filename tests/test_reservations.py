@@ -0,0 +1,88 @@
+"""Balance reservations for resting orders"""
+import threading
+
+import pytest
+
+from osmosistrader import BalanceReservations
+
+FEE = BalanceReservations.FEE_RESERVE_UOSMO
+
+
+@pytest.fixture
+def reservations(client):
+    usdc = client.assets.by_symbol('USDC').denom
+    client.ledger.sync({usdc: 100_000_000, 'uosmo': 1_000_000}, height=1)
+    return BalanceReservations(client.ledger, client.assets)
+
+
+def test_reserve_release_and_over_commit(reservations):
+    reservations.reserve("order-1", "USDC", "60")
+    assert str(reservations.reserved("USDC")) == "60.000000"
+    assert str(reservations.reserved("OSMO")) == f"{FEE / 1e6:.6f}"
+    
+    with pytest.raises(ValueError, match="Insufficient USDC: 20.000000 more needed"):
+        reservations.reserve("order-2", "USDC", "60")
+    with pytest.raises(ValueError, match="Insufficient USDC"):
+        reservations.check("USDC", "40.000001")
+    reservations.check("USDC", "40")
+    
+    reservations.release("order-1")
+    reservations.reserve("order-2", "USDC", "60")
+    assert str(reservations.reserved("USDC")) == "60.000000"
+    reservations.release("order-2")
+    reservations.release("order-2")   # Releasing twice is harmless
+    assert reservations.reserved("USDC").raw == 0 and reservations.reserved("OSMO").raw == 0
+
+
+def test_gas_allowance_counts_against_osmo(reservations):
+    # 1 OSMO covers at most 100 resting orders' gas
+    for i in range(1_000_000 // FEE):
+        reservations.reserve(f"order-{i}", "USDC", "0.01")
+    with pytest.raises(ValueError, match="Insufficient OSMO"):
+        reservations.reserve("one-more", "USDC", "0.01")
+
+
+def test_concurrent_orders_never_over_commit(reservations):
+    accepted, rejected = [], []
+    
+    def place(i):
+        try:
+            reservations.reserve(f"order-{i}", "USDC", "7")
+            accepted.append(i)
+        except ValueError:
+            rejected.append(i)
+    
+    threads = [threading.Thread(target=place, args=(i,)) for i in range(40)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert len(accepted) == 14 and len(rejected) == 26   # 14 x 7 <= 100 < 15 x 7
+    assert reservations.reserved("USDC").raw == 98_000_000
+    assert reservations.available(reservations.assets.by_symbol('USDC').denom) == 2_000_000
+
+
+def test_fill_holds_until_confirmed(reservations):
+    reservations.reserve("oco-1", "USDC", "50")
+    assert reservations.can_fill("oco-1")
+    reservations.hold_for_tx("oco-1", "TX")
+    assert reservations.reserved("USDC").raw == 50_000_000
+    reservations.release_tx("TX")
+    assert reservations.reserved("USDC").raw == 0
+    
+    # Once the wallet no longer holds the funds, the order can't fill
+    reservations.reserve("order-9", "USDC", "90")
+    reservations.ledger.sync({'uosmo': 1_000_000}, height=2)
+    assert not reservations.can_fill("order-9")
+
+
+def test_rebuild_shares_oco_reservations_and_never_rejects(reservations):
+    reservations.rebuild([
+        {'id': "order-1", 'oco': "oco-1", 'from_token': "USDC", 'amount': 30},
+        {'id': "order-2", 'oco': "oco-1", 'from_token': "USDC", 'amount': 40},
+        {'id': "order-3", 'from_token': "USDC", 'amount': 500},
+    ])
+    # The OCO legs hold their larger amount once; the oversized order is still tracked
+    assert reservations.reserved("USDC").raw == 540_000_000
+    assert reservations.reserved("OSMO").raw == 2 * FEE
@@ -0,0 +1,128 @@
+"""Route search, split allocation and swap tolerance"""
+import itertools
+
+import pytest
+
+USDC = "ibc/498A0751C798A0D9A389AA3691123DADA57DAA4FE165D5C75894505B876BA6E4"
+
+# A -> D directly through a shallow pool, or through B and C over deep ones
+FIXTURE_POOLS = [
+    ("1", "ua", 10**6, "ud", 10**6, "0.003"),
+    ("2", "ua", 10**9, "ub", 2 * 10**9, "0.002"),
+    ("3", "ub", 2 * 10**9, "ud", 10**9, "0.002"),
+    ("4", "ua", 10**9, "uc", 10**9, "0.001"),
+    ("5", "uc", 10**9, "ub", 2 * 10**9, "0.001"),
+    ("6", "uc", 5 * 10**8, "ud", 5 * 10**8, "0.003"),
+]
+
+
+@pytest.fixture
+def routes(client):
+    pools = [
+        {"pool_id": pool_id, "type": "balancer", "denoms": [denom_a, denom_b], "spread_factor": fee,
+         "reserves": {denom_a: reserve_a, denom_b: reserve_b}}
+        for pool_id, denom_a, reserve_a, denom_b, reserve_b, fee in FIXTURE_POOLS
+    ]
+    client.pool_registry._apply_discovered(pools, 1000)
+    return client.route_selector
+
+
+def brute_force(selector, denom_in, denom_out, amount, max_hops=3):
+    """Every simple path of up to max_hops pools with its offline estimate, best first"""
+    graph = selector.graph()
+    found = []
+    
+    def walk(denom, amount, pools, visited):
+        for other, edge_pools in graph.get(denom, {}).items():
+            if other in visited:
+                continue
+            for pool in edge_pools:
+                out = selector.estimate_hop(pool, denom, other, amount)
+                if other == denom_out:
+                    found.append((out, [p["pool_id"] for p in pools + [pool]]))
+                elif len(pools) + 1 < max_hops:
+                    walk(other, out, pools + [pool], visited | {other})
+    
+    walk(denom_in, float(amount), [], {denom_in})
+    return sorted(found, key=lambda path: path[0], reverse=True)
+
+
+def test_search_matches_brute_force(routes):
+    expected = brute_force(routes, "ua", "ud", 10**7)
+    found = routes.search("ua", "ud", 10**7, k=len(expected))
+    assert [[pool["pool_id"] for pool in pools] for _, pools, _ in found] == [ids for _, ids in expected]
+    assert [out for out, _, _ in found] == pytest.approx([out for out, _ in expected])
+    
+    # The default beam still finds the best route: the deep path, not the shallow direct pool
+    out, pools, denoms = routes.search("ua", "ud", 10**7)[0]
+    assert [pool["pool_id"] for pool in pools] == expected[0][1] == ["2", "3"]
+    assert denoms == ["ub", "ud"]
+    
+    # A one-hop search only sees the direct pool
+    assert [[p["pool_id"] for p in pools] for _, pools, _ in routes.search("ua", "ud", 10**7, max_hops=1)] == [["1"]]
+
+
+def test_allocate_matches_brute_force(routes):
+    candidates = [
+        {'pools': [routes.client.pool_registry._by_id[i] for i in ids], 'denoms': denoms}
+        for ids, denoms in ((["1"], ["ud"]), (["2", "3"], ["ub", "ud"]), (["4", "6"], ["uc", "ud"]))
+    ]
+    amount, steps = 3 * 10**8 + 7, 24
+    amounts, total = routes.allocate(candidates, "ua", amount, steps=steps)
+    assert sum(amounts) == amount
+    
+    chunk = amount / steps
+    best = max(
+        sum(routes.estimate_path(route, "ua", n * chunk) if n else 0 for route, n in zip(candidates, split))
+        for split in itertools.product(range(steps + 1), repeat=3) if sum(split) == steps
+    )
+    assert total == pytest.approx(best, rel=1e-12)
+    # Splitting beats putting everything on the best single route
+    assert total > max(routes.estimate_path(route, "ua", amount) for route in candidates)
+
+
+def test_triggered_orders_use_their_slippage(node, engine):
+    node.update(balances={"uosmo": 5_000_000},
+                pools={"1464": ["uosmo", 40_000_000 * 10**6, USDC, 20_000_000 * 10**6, 0.0]})
+    engine.client.get_wallet_balances(force_update=True)
+    specs = [{'order_type': 'limit', 'from_token': 'OSMO', 'to_token': 'USDC', 'amount': 1, 'price': 0.4}]
+    (default, _), (loose, _) = engine.create_orders([specs[0], {**specs[0], 'slippage_bps': 100}])
+    assert (default['slippage_bps'], loose['slippage_bps']) == (30, 100)
+    assert engine.create_orders([{**specs[0], 'slippage_bps': 10_000}])[0][1] == "slippage_bps must be between 0 and 9999"
+    
+    engine.check_pending_orders()
+    
+    # 1 OSMO at 0.5 USDC: min out is 0.5 USDC less each order's tolerance
+    min_outs = sorted(int(call.split()[4]) for call in node.calls() if call.startswith("tx poolmanager"))
+    assert min_outs[0] == pytest.approx(495_000, abs=2)
+    assert min_outs[1] == pytest.approx(498_500, abs=2)
+
+
+@pytest.fixture
+def twin_pools(node, client):
+    # Two equally deep OSMO/USDC pools: a large swap pays less spread split over both
+    reserves = [("1464", 10**12, 5 * 10**11), ("2000", 10**12, 5 * 10**11)]
+    node.update(pools={pool_id: ["uosmo", osmo, USDC, usdc, 0.002] for pool_id, osmo, usdc in reserves})
+    client.pool_registry._apply_discovered([
+        {"pool_id": pool_id, "type": "balancer", "denoms": ["uosmo", USDC], "spread_factor": "0.002",
+         "reserves": {"uosmo": osmo, USDC: usdc}}
+        for pool_id, osmo, usdc in reserves
+    ], 1000)
+    return node
+
+
+def test_split_route_quotes_legs_only_when_they_can_win(twin_pools, client):
+    selector = client.route_selector
+    amount = 10**11
+    single = selector.best_route("uosmo", USDC, amount)
+    twin_pools.calls(reset=True)
+    
+    plan = selector.split_route("uosmo", USDC, amount, single)
+    assert sorted(leg['pools'][0]["pool_id"] for leg in plan['legs']) == ["1464", "2000"]
+    assert sum(leg['amount_in'] for leg in plan['legs']) == amount
+    assert plan['amount_out'] > plan['single_out'] == single['amount_out']
+    assert len(twin_pools.calls(reset=True)) == 2   # One quote per leg
+    
+    # A single route already quoted above anything the split could reach: no node call at all
+    assert selector.split_route("uosmo", USDC, amount, dict(single, amount_out=2 * single['amount_out'])) is None
+    assert twin_pools.calls() == []
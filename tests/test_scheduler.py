@@ -0,0 +1,98 @@
+"""Heap scheduler: ordering, cancellation, coalescing, jitter and lanes"""
+import threading
+import time
+
+import pytest
+
+from osmosistrader import Scheduler
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = Scheduler(workers=1, name="test").start()
+    yield scheduler
+    scheduler.stop()
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def test_jobs_run_in_deadline_order(scheduler):
+    ran = []
+    for delay, name in [(0.06, "c"), (0.02, "a"), (0.04, "b"), (0.0, "first")]:
+        scheduler.call_later(delay, ran.append, name)
+    wait_for(lambda: len(ran) == 4)
+    assert ran == ["first", "a", "b", "c"]
+
+
+def test_cancel_and_rekey(scheduler):
+    ran = []
+    job = scheduler.call_later(0.05, ran.append, "cancelled")
+    assert scheduler.cancel(job)
+    assert not scheduler.cancel(job)
+    
+    # Same key: the earliest deadline wins and the newest callback runs, once
+    scheduler.call_later(0.2, ran.append, "old", key='refresh')
+    scheduler.call_later(0.03, ran.append, "new", key='refresh')
+    scheduler.call_later(0.5, ran.append, "later", key='refresh')
+    assert [job['key'] for job in scheduler.jobs()] == ['refresh']
+    wait_for(lambda: ran)
+    time.sleep(0.6)
+    assert ran == ["later"]
+    
+    scheduler.call_later(0.05, ran.append, "keyed", key='clear')
+    assert scheduler.cancel('clear') and not scheduler.cancel('clear')
+    time.sleep(0.1)
+    assert ran == ["later"]
+
+
+def test_periodic_jitter_stays_on_its_slots(scheduler):
+    runs = []
+    job = scheduler.call_every(0.05, lambda: runs.append(time.monotonic()), jitter=0.03, first_delay=0)
+    first_slot = job.slot
+    wait_for(lambda: len(runs) >= 8)
+    scheduler.cancel(job)
+    
+    # Each slot is a whole number of intervals from the first: jitter never accumulates
+    intervals = (job.slot - first_slot) / 0.05
+    assert intervals == pytest.approx(round(intervals), abs=1e-6)
+    assert job.slot <= job.deadline <= job.slot + 0.03
+    # Every run started within [slot, slot + jitter] of some slot (plus thread wake-up latency)
+    for started in runs:
+        offset = (started - first_slot) % 0.05
+        assert offset <= 0.03 + 0.01 or offset >= 0.05 - 0.002
+
+
+def test_slow_periodic_job_skips_missed_slots(scheduler):
+    runs = []
+    
+    def slow():
+        runs.append(time.monotonic())
+        time.sleep(0.12)
+    job = scheduler.call_every(0.05, slow, first_delay=0)
+    first_slot = job.slot
+    wait_for(lambda: len(runs) >= 3)
+    scheduler.cancel(job)
+    # Never back to back: the next run waits for the next whole slot
+    assert all(later - earlier >= 0.15 - 0.01 for earlier, later in zip(runs, runs[1:]))
+    intervals = (job.slot - first_slot) / 0.05
+    assert intervals == pytest.approx(round(intervals), abs=1e-6)
+
+
+def test_lane_jobs_dont_block_the_pool(scheduler):
+    release = threading.Event()
+    ran = []
+    scheduler.call_later(0, release.wait, 5, lane="orders")
+    scheduler.call_later(0.01, ran.append, "pool")
+    wait_for(lambda: ran)
+    
+    # A second lane job waits behind the first, not on the pool
+    scheduler.call_later(0, ran.append, "lane", lane="orders")
+    time.sleep(0.05)
+    assert ran == ["pool"]
+    release.set()
+    wait_for(lambda: ran == ["pool", "lane"])
@@ -0,0 +1,35 @@
+"""Stopping the engine when the process or the window goes away"""
+import os
+import signal
+import subprocess
+import sys
+from types import SimpleNamespace
+
+import osmosistrader
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "osmosistrader.py")
+
+
+def test_headless_flushes_on_sigterm(tmp_path):
+    process = subprocess.Popen([sys.executable, "-u", SCRIPT, "--headless", "--check-interval", "60"],
+                               cwd=tmp_path, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    try:
+        for line in process.stdout:
+            if "running headless" in line:
+                break
+        process.send_signal(signal.SIGTERM)
+        output, _ = process.communicate(timeout=30)
+    finally:
+        process.kill()
+    assert process.returncode == 0
+    # Printed after engine.stop() in the finally block
+    assert "[headless] peak RSS" in output
+
+
+def test_window_close_stops_engine_and_scheduler(engine):
+    app = SimpleNamespace(_closed=False, engine=engine, scheduler=engine.scheduler)
+    osmosistrader.OsmosisTraderUI.shutdown(app)
+    osmosistrader.OsmosisTraderUI.shutdown(app)   # mainloop's finally runs it again
+    
+    assert engine._stop_event.is_set()
+    assert engine.scheduler._stopped
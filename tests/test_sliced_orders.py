@@ -0,0 +1,77 @@
+"""Sliced (TWAP / iceberg) order sizing"""
+import time
+
+import pytest
+
+USDC = "ibc/498A0751C798A0D9A389AA3691123DADA57DAA4FE165D5C75894505B876BA6E4"
+
+
+@pytest.fixture
+def deep_pool(node, client):
+    # 40M OSMO against 20M USDC: slices of a few OSMO have no measurable impact
+    node.update(balances={"uosmo": 10**9},
+                pools={"1464": ["uosmo", 40_000_000 * 10**6, USDC, 20_000_000 * 10**6, 0.0]})
+    client.get_wallet_balances(force_update=True)
+    return node
+
+
+def twap(engine, amount, slices, interval=60):
+    parent = engine._build_parent({'order_type': 'twap', 'from_token': 'OSMO', 'to_token': 'USDC',
+                                   'amount': amount, 'duration': slices * interval, 'interval': interval})
+    return {'id': 'order-1', **parent}
+
+
+def slices_left(parent, n):
+    """Move the parent's end so that n slices are left from now"""
+    parent['end'] = time.time() + (n - 1) * parent['interval'] + parent['interval'] / 2
+
+
+def test_twap_spreads_the_remainder_and_rounds_up(deep_pool, engine):
+    parent = twap(engine, 1.000001, 3)
+    slices_left(parent, 3)
+    size, out, impact = engine._slice_size(parent, 1_000_001, "uosmo", USDC)
+    assert size == 333_334   # Rounded up, so the last slice is never the biggest
+    assert out == pytest.approx(size / 2, rel=1e-4) and impact < 1
+    
+    slices_left(parent, 2)
+    assert engine._slice_size(parent, 666_667, "uosmo", USDC)[0] == 333_334
+    # Past the end, whatever is left goes in one slice
+    parent['end'] = time.time() - 1
+    assert engine._slice_size(parent, 333_333, "uosmo", USDC)[0] == 333_333
+
+
+def test_iceberg_shows_at_most_its_slice(deep_pool, engine):
+    parent = engine._build_parent({'order_type': 'iceberg', 'from_token': 'OSMO', 'to_token': 'USDC',
+                                   'amount': 10, 'slice_amount': 4})
+    assert engine._slice_size(parent, 10_000_000, "uosmo", USDC)[0] == 4_000_000
+    assert engine._slice_size(parent, 2_000_001, "uosmo", USDC)[0] == 2_000_001
+
+
+def test_impact_cuts_the_slice_down_to_the_floor(node, client, engine):
+    # A shallow pool: 1000 OSMO is 10% of it, ~900 bps of impact
+    node.update(pools={"1464": ["uosmo", 10**10, USDC, 5 * 10**9, 0.0]})
+    parent = engine._build_parent({'order_type': 'iceberg', 'from_token': 'OSMO', 'to_token': 'USDC',
+                                   'amount': 1000, 'slice_amount': 1000, 'max_impact_bps': 50})
+    size, out, impact = engine._slice_size(parent, 10**9, "uosmo", USDC)
+    assert 10**9 // 8 <= size < 10**9
+    assert impact <= 50 or size == 10**9 // 8
+    
+    # A parent whose children measured high impact starts from a smaller size
+    parent['impact_bps'] = 400
+    assert engine._slice_size(parent, 10**9, "uosmo", USDC)[0] <= size
+
+
+def test_slices_add_up_to_the_order(deep_pool, engine):
+    parent = twap(engine, 1.000001, 3)
+    engine.reservations.reserve(parent['id'], 'OSMO', '1.000001')
+    for n in (3, 2, 1):
+        slices_left(parent, n)
+        engine._execute_slice(parent)
+    
+    sent = [int(call.split()[3][:-len("uosmo")]) for call in deep_pool.calls() if call.startswith("tx poolmanager")]
+    assert sent == [333_334, 333_334, 333_333]
+    assert parent['filled_raw'] == parent['amount_raw'] == 1_000_001
+    assert parent['status'] == 'completed'
+    assert parent['children'] == ['order-1-1', 'order-1-2', 'order-1-3']
+    # Nothing stays reserved for the parent; each child holds its own amount until confirmed
+    assert 'order-1' not in engine.reservations._by_key
@@ -0,0 +1,77 @@
+"""Property tests for TokenAmount: exact round trips and consistent equality/hashing"""
+import random
+from decimal import Decimal, ROUND_DOWN
+from fractions import Fraction
+
+import pytest
+
+from osmosistrader import Asset, AssetRegistry, TokenAmount
+
+ASSETS = [Asset(**entry) for entry in AssetRegistry.DEFAULT_ASSETS]
+
+
+def random_raws(rng, count):
+    for _ in range(count):
+        digits = rng.randint(1, 40)
+        yield rng.randrange(10 ** digits)
+
+
+@pytest.mark.parametrize("asset", ASSETS, ids=lambda a: a.symbol)
+def test_string_round_trip_is_exact(asset):
+    rng = random.Random(asset.symbol)
+    for raw in random_raws(rng, 5000):
+        amount = TokenAmount(raw, asset)
+        text = amount.format(asset.decimals)
+        assert TokenAmount.from_human(text, asset).raw == raw
+        assert TokenAmount.from_human(amount.to_decimal(), asset).raw == raw
+        assert Decimal(text) == amount.to_decimal()
+
+
+@pytest.mark.parametrize("asset", ASSETS, ids=lambda a: a.symbol)
+def test_typed_floats_truncate_their_shortest_form(asset):
+    rng = random.Random(asset.decimals)
+    for _ in range(5000):
+        value = round(rng.uniform(0, 10 ** rng.randint(0, 9)), rng.randint(0, 12))
+        expected = Decimal(str(value)).scaleb(asset.decimals).to_integral_value(rounding=ROUND_DOWN)
+        assert TokenAmount.from_human(value, asset).raw == int(expected)
+
+
+def test_arithmetic_stays_in_base_units():
+    eth = ASSETS[2]
+    rng = random.Random(3)
+    for a, b in zip(random_raws(rng, 2000), random_raws(rng, 2000)):
+        x, y = TokenAmount(a, eth), TokenAmount(b, eth)
+        assert (x + y).raw == a + b and (x - y).raw == a - b
+        assert x.apply_bps(30).raw == a * 9970 // 10000
+        assert x.scale(3, 7).raw == a * 3 // 7
+
+
+def test_equal_amounts_hash_alike():
+    rng = random.Random(4)
+    low, high = Asset("LOW", "ulow", 6), Asset("HIGH", "uhigh", 18)
+    for raw in random_raws(rng, 2000):
+        a, b = TokenAmount(raw, low), TokenAmount(raw * 10 ** 12, high)
+        assert a == b and hash(a) == hash(b)
+        exact = Fraction(raw, low.scale)
+        assert a == exact and hash(a) == hash(exact)
+        assert a == a.to_decimal() and hash(a) == hash(a.to_decimal())
+        if raw % low.scale == 0:
+            assert a == raw // low.scale and hash(a) == hash(raw // low.scale)
+    assert len({TokenAmount(1, low), TokenAmount(10 ** 12, high), Fraction(1, 10 ** 6)}) == 1
+
+
+def test_comparisons_with_numbers_are_exact():
+    usdc = ASSETS[3]
+    amount = TokenAmount(100_000, usdc)   # 0.1
+    assert amount == Decimal("0.1") and amount == Fraction(1, 10)
+    # The float 0.1 is a little more than 1/10, like Decimal("0.1") != 0.1
+    assert amount != 0.1 and amount < 0.1
+    assert amount > 0 and TokenAmount(0, usdc) == 0 and not TokenAmount(0, usdc)
+    rng = random.Random(5)
+    for a, b in zip(random_raws(rng, 2000), random_raws(rng, 2000)):
+        x, y = TokenAmount(a, usdc), TokenAmount(b, ASSETS[2])
+        assert (x < y) == (Fraction(a, usdc.scale) < Fraction(b, ASSETS[2].scale))
+        assert (x <= float(y)) == (Fraction(a, usdc.scale) <= Fraction(float(y)))
+    with pytest.raises(TypeError):
+        amount < "0.1"
+    assert amount != "0.1"
@@ -0,0 +1,53 @@
+"""TrailingStops against a brute-force model"""
+import random
+
+from osmosistrader import TrailingStops
+
+
+def test_highest_stop_ignores_removed_orders():
+    stops = TrailingStops()
+    stops.add("BTC/USDC", "order-1", 100.0, percent=1)    # stop 99
+    stops.add("BTC/USDC", "order-2", 100.0, percent=5)    # stop 95
+    stops.add("BTC/USDC", "order-3", 90.0, amount=2)      # stop 88
+    assert stops.highest_stop("BTC/USDC") == 99.0
+    stops.remove("order-1")
+    assert stops.highest_stop("BTC/USDC") == 95.0
+    stops.remove("order-2")
+    assert stops.highest_stop("BTC/USDC") == 88.0
+    stops.remove("order-3")
+    assert stops.highest_stop("BTC/USDC") is None
+
+
+def test_matches_brute_force():
+    rng = random.Random(7)
+    stops = TrailingStops()
+    model = {}   # order id -> [mark, kind, offset]
+    price, next_id = 100.0, 0
+    
+    def stop_of(order):
+        mark, kind, offset = order
+        return mark * (1 - offset / 100) if kind == 'percent' else mark - offset
+    
+    for _ in range(20000):
+        action = rng.random()
+        if action < 0.3:
+            next_id += 1
+            kind, offset = ('percent', rng.uniform(0.5, 10)) if rng.random() < 0.5 else ('absolute', rng.uniform(0.5, 10))
+            stops.add("P", next_id, price, **({'percent': offset} if kind == 'percent' else {'amount': offset}))
+            model[next_id] = [price, kind, offset]
+        elif action < 0.45 and model:
+            order_id = rng.choice(list(model))
+            stops.remove(order_id)
+            del model[order_id]
+        else:
+            price = round(price * rng.uniform(0.98, 1.02), 4)
+            for order in model.values():
+                order[0] = max(order[0], price)
+            fired = {order_id for order_id, _, _ in stops.update("P", price)}
+            expected = {order_id for order_id, order in model.items() if stop_of(order) >= price}
+            assert fired == expected
+            for order_id in fired:
+                del model[order_id]
+        highest = stops.highest_stop("P")
+        expected = max((stop_of(order) for order in model.values()), default=None)
+        assert highest == expected or abs(highest - expected) < 1e-9
@@ -0,0 +1,141 @@
+"""Partitioned transaction history"""
+import json
+import os
+import shutil
+from datetime import datetime, timedelta
+
+import pytest
+
+import osmosistrader
+from osmosistrader import TransactionLogger
+
+
+def legacy_history(months=6, per_month=20):
+    start = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    history = []
+    for month in range(months, 0, -1):
+        first = (start - timedelta(days=31 * month)).replace(day=1)
+        for i in range(per_month):
+            history.append({'timestamp': (first + timedelta(hours=i)).isoformat(), 'tx_hash': f"H{month}-{i}",
+                            'order_id': f"order-{month * 100 + i}", 'from_token': 'USDC', 'to_token': 'BTC',
+                            'amount_in': 1.0, 'status': 'executed'})
+    return history
+
+
+@pytest.fixture
+def history_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with open("transactions.json", "w") as f:
+        json.dump(legacy_history(), f)
+    return tmp_path
+
+
+def test_interrupted_migration_doesnt_duplicate(history_dir):
+    shutil.copy("transactions.json", "legacy-copy.json")
+    TransactionLogger()
+    # A crash before the rename leaves the legacy file in place
+    shutil.copy("legacy-copy.json", "transactions.json")
+    logger = TransactionLogger()
+    
+    transactions = logger.get_transactions()
+    assert len(transactions) == 120
+    assert len({tx['tx_hash'] for tx in transactions}) == 120
+    assert sum(p['count'] for p in logger.manifest['partitions'].values()) == 120
+
+
+def test_update_transaction_search_is_bounded(history_dir):
+    logger = TransactionLogger()
+    logger.log_transaction({'timestamp': datetime.now().isoformat(), 'tx_hash': 'NEW', 'from_token': 'USDC',
+                            'to_token': 'BTC', 'amount_in': 1.0})
+    since = (datetime.now() - timedelta(hours=1)).isoformat()
+    
+    assert logger.update_transaction('NEW', {'actual_amount_out': 2.0}, since)
+    assert logger.find_transaction('NEW')['actual_amount_out'] == 2.0
+    # An unknown hash doesn't pull the older months in
+    assert not logger.update_transaction('MISSING', {'actual_amount_out': 1.0}, since)
+    assert logger._partition_cache == {}
+    
+    old = logger.get_transactions()[0]
+    assert logger.update_transaction(old['tx_hash'], {'status': 'checked'}, since=old['timestamp'])
+    assert TransactionLogger().find_transaction(old['tx_hash'])['status'] == 'checked'
+
+
+def test_iter_transactions_streams_without_caching(history_dir):
+    logger = TransactionLogger()
+    newest_first = list(logger.iter_transactions(newest_first=True))
+    assert [tx['timestamp'] for tx in newest_first] == sorted((tx['timestamp'] for tx in newest_first), reverse=True)
+    assert len(newest_first) == 120
+    assert logger._partition_cache == {}
+    assert list(logger.iter_transactions()) == newest_first[::-1]
+
+
+def test_partition_cache_evicts_least_recently_used(history_dir):
+    logger = TransactionLogger()
+    keys = [key for key in logger._partition_keys() if key != logger.active_partition]
+    for key in keys[:3]:
+        logger._load_partition(key)
+    logger._load_partition(keys[0])   # A hit makes it the most recent
+    logger._load_partition(keys[3])
+    assert list(logger._partition_cache) == [keys[2], keys[0], keys[3]]
+
+
+def test_fills_are_appended_without_rewriting_the_manifest(history_dir):
+    logger = TransactionLogger()
+    manifest = open(logger.manifest_file).read()
+    path = logger._partition_path(logger.active_partition)
+    for i in range(3):
+        logger.log_transaction({'timestamp': datetime.now().isoformat(), 'tx_hash': f"A{i}",
+                                'order_id': f"order-{900 + i}", 'amount_in': 1.0})
+    assert open(logger.manifest_file).read() == manifest
+    assert len(open(path).read().splitlines()) == 3
+    
+    # A crash mid-append tears the last line; the next append starts a fresh one
+    with open(path, 'a') as f:
+        f.write('{"timestamp": "')
+    reopened = TransactionLogger()
+    assert [tx['tx_hash'] for tx in reopened.get_recent_transactions(3)] == ["A0", "A1", "A2"]
+    reopened.log_transaction({'timestamp': datetime.now().isoformat(), 'tx_hash': "A3", 'amount_in': 1.0})
+    assert [tx['tx_hash'] for tx in TransactionLogger().get_recent_transactions(2)] == ["A2", "A3"]
+    assert TransactionLogger().get_highest_order_number() == 902
+
+
+def test_new_month_indexes_the_finished_partition(history_dir, monkeypatch):
+    logger = TransactionLogger()
+    current = logger.active_partition
+    logger.log_transaction({'timestamp': datetime.now().isoformat(), 'tx_hash': "LAST",
+                            'order_id': "order-999", 'amount_in': 1.0})
+    assert current not in logger.manifest['partitions']
+    
+    # Restarted after the month ended
+    class NextMonth(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return datetime.now(tz) + timedelta(days=32)
+    monkeypatch.setattr(osmosistrader, "datetime", NextMonth)
+    logger = TransactionLogger()
+    assert logger.active_partition != current
+    entry = logger.manifest['partitions'][current]
+    assert entry['count'] == 1 and entry['max_order_num'] == 999
+    assert logger.get_highest_order_number() == 999
+    
+    # Rolled over while running
+    logger.log_transaction({'timestamp': NextMonth.now().isoformat(), 'tx_hash': "NEXT",
+                            'order_id': "order-1000", 'amount_in': 1.0})
+    later = f"{int(logger.active_partition[:4]) + 1}-01-01T00:00:00"
+    logger.log_transaction({'timestamp': later, 'tx_hash': "LATER", 'amount_in': 1.0})
+    assert TransactionLogger().manifest['partitions'][logger._partition_key(NextMonth.now().isoformat())]['count'] == 1
+
+
+def test_json_array_partitions_are_still_read(history_dir):
+    logger = TransactionLogger()
+    key = logger._partition_keys()[0]
+    transactions = logger._read_partition_file(key)
+    os.remove(logger._partition_path(key))
+    with open(os.path.join(logger.transactions_dir, f"{key}.json"), 'w') as f:
+        json.dump(transactions, f)
+    
+    logger = TransactionLogger()
+    assert logger._load_partition(key) == transactions
+    logger.log_transaction(dict(transactions[0], tx_hash="BACKDATED"))
+    assert [tx['tx_hash'] for tx in TransactionLogger()._read_partition_file(key)][-1] == "BACKDATED"
+    assert not os.path.exists(os.path.join(logger.transactions_dir, f"{key}.json"))
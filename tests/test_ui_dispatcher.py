@@ -0,0 +1,63 @@
+"""UI dispatcher coalescing and engine event handling (without a display)"""
+from types import SimpleNamespace
+
+from osmosistrader import OsmosisTraderUI, UIDispatcher
+
+
+class FrameClock:
+    """Records root.after() calls; frames are run by calling the dispatcher's _drain"""
+    
+    def __init__(self):
+        self.scheduled = []
+    
+    def after(self, ms, callback):
+        self.scheduled.append(ms)
+
+
+def test_keyed_posts_coalesce_to_the_latest():
+    dispatcher = UIDispatcher(FrameClock(), fps=20)
+    calls = []
+    for value in range(5):
+        dispatcher.post_keyed('balance', calls.append, ('balance', value))
+        dispatcher.post(calls.append, ('fill', value))
+    dispatcher.post_keyed('chart', calls.append, ('chart', 0))
+    dispatcher._drain()
+    
+    # Unkeyed posts all run in order; a key runs once, at its first position, with the newest args
+    assert calls == [('balance', 4)] + [('fill', value) for value in range(5)] + [('chart', 0)]
+    assert dispatcher.root.scheduled == [50, 50]
+    
+    calls.clear()
+    dispatcher._drain()
+    assert calls == []
+
+
+def test_drain_is_bounded_per_frame_and_survives_errors(capsys):
+    dispatcher = UIDispatcher(FrameClock(), max_per_frame=3)
+    calls = []
+    dispatcher.post(lambda: 1 / 0)
+    for value in range(4):
+        dispatcher.post(calls.append, value)
+    dispatcher._drain()
+    assert calls == [0, 1]
+    assert "Error in UI callback" in capsys.readouterr().out
+    dispatcher._drain()
+    assert calls == [0, 1, 2, 3]
+
+
+def test_slice_events_reach_the_gui():
+    dispatcher = UIDispatcher(FrameClock())
+    notices, redraws = [], []
+    app = SimpleNamespace(
+        ui=dispatcher, current_view='pending_orders', _notify=notices.append,
+        _update_pending_orders_list=lambda: redraws.append('pending'),
+        _update_price_chart=lambda: redraws.append('chart'),
+    )
+    parent = {'id': "order-7", 'order_type': 'twap', 'children': ["order-7-1", "order-7-2"]}
+    tx = {'amount_in': 12.5, 'from_token': "USDC"}
+    OsmosisTraderUI._handle_engine_event(app, 'slice', {'order': parent, 'tx_data': tx, 'price': 0.5})
+    OsmosisTraderUI._handle_engine_event(app, 'slice', {'order': parent, 'tx_data': tx, 'price': 0.5})
+    dispatcher._drain()
+    
+    assert notices[-1] == "✓ TWAP order-7 slice 2: 12.500000 USDC at ~0.500000"
+    assert redraws == ['pending', 'chart']